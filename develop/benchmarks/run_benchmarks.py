@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Brainview benchmark suite.
+
+Times performance-critical brainview functions on synthetic meshes with the sizes of the fsaverage5, fsaverage6 and fsaverage7 hemispheres, and writes the results to a JSON file. Results from different commits can be compared with the --compare option.
+
+Run from the repo root, with brainview installed in development mode:
+
+    python develop/benchmarks/run_benchmarks.py -o bench_results.json
+    python develop/benchmarks/run_benchmarks.py -o new.json --compare bench_results.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data as sd
+import brainview.export as bex
+import brainview.singleview as bsv
+import brainview.topology as btop
+import brainview.lod as blod
+
+
+def _time_function(func, repeat):
+    """
+    Run func repeat times and return the list of wall clock run times in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _get_benchmarks(vert_coords, faces, morphometry_data, vertex_labels, label_colors, label_names, tmp_dir):
+    """
+    Return the benchmarks for one mesh as a list of (name, function) tuples.
+    """
+    num_verts = vert_coords.shape[0]
+    obj_file = os.path.join(tmp_dir, 'mesh.obj')
+    ply_file = os.path.join(tmp_dir, 'mesh.ply')
+    return [
+        ('export_mesh_to_file_obj', lambda: bex.export_mesh_to_file(obj_file, vert_coords, faces)),
+        ('export_mesh_to_file_ply', lambda: bex.export_mesh_to_file(ply_file, vert_coords, faces, morphometry_data=morphometry_data)),
+        ('clip_data_at_percentiles', lambda: bex.clip_data_at_percentiles(morphometry_data, 5, 95)),
+        ('atlas_label_map', lambda: bsv._get_atlas_label_map_and_lut(num_verts, vertex_labels, label_colors, len(label_names))),
+        ('get_vertex_colors', lambda: bex._get_vertex_colors(morphometry_data, 'viridis', -1)),
+        ('mesh_adjacency', lambda: (btop.clear_topology_cache(), btop.mesh_adjacency(faces, num_verts=num_verts))),
+        ('parcel_boundaries', lambda: (btop.clear_topology_cache(), btop.parcel_boundaries(faces, vertex_labels))),
+        ('decimate_mesh_25pct', lambda: blod.decimate_mesh(vert_coords, faces, num_verts // 4)),
+        ('smooth_data_fwhm10', lambda: btop.smooth_data_fwhm(vert_coords, faces, morphometry_data, 10.0)),
+    ]
+
+
+def run_benchmarks(scales, repeat, selected=None):
+    """
+    Run all benchmarks for all requested mesh scales.
+
+    Parameters
+    ----------
+    scales: list of strings
+        The mesh scales, e.g., ['fsaverage5', 'fsaverage6'].
+
+    repeat: int
+        How often to run each benchmark.
+
+    selected: list of strings or None, optional
+        If given, only the benchmarks with these names are run.
+
+    Returns
+    -------
+    list of dictionaries
+        One result per benchmark and scale.
+    """
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for scale in scales:
+            vert_coords, faces = sd.fsaverage_like_mesh(scale)
+            morphometry_data = sd.random_morphometry_data(vert_coords)
+            vertex_labels, label_colors, label_names = sd.random_atlas(vert_coords)
+            for name, func in _get_benchmarks(vert_coords, faces, morphometry_data, vertex_labels, label_colors, label_names, tmp_dir):
+                if selected is not None and name not in selected:
+                    continue
+                timings = _time_function(func, repeat)
+                result = {'benchmark': name, 'scale': scale, 'num_verts': vert_coords.shape[0], 'num_faces': faces.shape[0], 'repeat': repeat, 'min_seconds': min(timings), 'median_seconds': float(np.median(timings)), 'mean_seconds': float(np.mean(timings)), 'timings': timings}
+                results.append(result)
+                print("%-28s %-12s %9d verts  min %9.4f s  median %9.4f s" % (name, scale, result['num_verts'], result['min_seconds'], result['median_seconds']))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def _get_git_commit():
+    """
+    Return the hash of the current git commit of the repo, or None if it cannot be determined.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old_results, new_results):
+    """
+    Print a comparison of the median run times of two benchmark runs.
+
+    Parameters
+    ----------
+    old_results: dictionary
+        The contents of an earlier results file.
+
+    new_results: dictionary
+        The contents of the current results file.
+    """
+    old_medians = dict(((r['benchmark'], r['scale']), r['median_seconds']) for r in old_results['results'])
+    print("Comparison against commit %s (ratio > 1 means slower now):" % old_results.get('git_commit'))
+    for result in new_results['results']:
+        key = (result['benchmark'], result['scale'])
+        if key in old_medians and old_medians[key] > 0:
+            print("%-28s %-12s old %9.4f s  new %9.4f s  ratio %6.2f" % (key[0], key[1], old_medians[key], result['median_seconds'], result['median_seconds'] / old_medians[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the brainview benchmarks on synthetic fsaverage-sized meshes.")
+    parser.add_argument("-o", "--outputfile", help="Output JSON file for the results. String, defaults to 'bench_results.json'.", default="bench_results.json")
+    parser.add_argument("-s", "--scales", help="Comma-separated list of mesh scales. Defaults to 'fsaverage5,fsaverage6,fsaverage7'.", default="fsaverage5,fsaverage6,fsaverage7")
+    parser.add_argument("-r", "--repeat", help="How often to run each benchmark. Integer, defaults to 5.", default=5, type=int)
+    parser.add_argument("-b", "--benchmarks", help="Comma-separated list of benchmark names to run. Defaults to all.", default=None)
+    parser.add_argument("-c", "--compare", help="A results file from an earlier run to compare against.", default=None)
+    args = parser.parse_args()
+
+    scales = args.scales.split(',')
+    selected = args.benchmarks.split(',') if args.benchmarks is not None else None
+    results = run_benchmarks(scales, args.repeat, selected=selected)
+    output = {'git_commit': _get_git_commit(), 'time': time.time(), 'python_version': platform.python_version(), 'numpy_version': np.__version__, 'platform': platform.platform(), 'results': results}
+    with open(args.outputfile, "w") as json_file:
+        json.dump(output, json_file, indent=2, sort_keys=True)
+    print("Benchmark results written to file '%s'." % args.outputfile)
+
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            compare_results(json.load(json_file), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Synthetic brain-like data for the brainview benchmarks.
+
+Generates meshes with the vertex and face counts of the FreeSurfer average subjects (fsaverage5/6/7 hemispheres are icospheres), plus random morphometry data and atlas labels. No real subject data is required.
+"""
+
+import numpy as np
+
+
+# Number of icosphere subdivisions that yields the vertex count of one hemisphere of the respective FreeSurfer average subject.
+FSAVERAGE_SUBDIVISIONS = {'fsaverage3': 3, 'fsaverage4': 4, 'fsaverage5': 5, 'fsaverage6': 6, 'fsaverage7': 7}
+
+
+def icosphere(num_subdivisions, radius=100.0):
+    """
+    Create an icosphere mesh.
+
+    Create an icosphere by repeated subdivision of the faces of an icosahedron. Each subdivision splits every triangle into 4. The result has `10 * 4^n + 2` vertices for n subdivisions, the same as the fsaverage surfaces.
+
+    Parameters
+    ----------
+    num_subdivisions: int
+        The number of subdivisions. 5, 6 and 7 give the sizes of fsaverage5, fsaverage6 and fsaverage (fsaverage7).
+
+    radius: float, optional
+        The radius of the sphere. Defaults to 100.0, which is roughly the size of a human brain hemisphere in mm.
+
+    Returns
+    -------
+    vert_coords: numpy 2D float array of shape (n_verts, 3)
+        The vertex coordinates.
+
+    faces: numpy 2D int array of shape (n_faces, 3)
+        The faces, as indices into vert_coords.
+    """
+    t = (1.0 + np.sqrt(5.0)) / 2.0
+    vert_coords = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t], [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=float)
+    faces = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]], dtype=np.int64)
+    vert_coords /= np.linalg.norm(vert_coords, axis=1)[:, np.newaxis]
+    for _ in range(num_subdivisions):
+        num_verts = vert_coords.shape[0]
+        edges = np.sort(np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]])), axis=1)
+        # Give each undirected edge a unique id, the new midpoint vertex of edge i gets index num_verts + i.
+        edge_keys = edges[:, 0] * num_verts + edges[:, 1]
+        unique_keys, edge_index = np.unique(edge_keys, return_inverse=True)
+        unique_edges = np.column_stack((unique_keys // num_verts, unique_keys % num_verts))
+        midpoints = vert_coords[unique_edges[:, 0]] + vert_coords[unique_edges[:, 1]]
+        midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+        vert_coords = np.vstack((vert_coords, midpoints))
+        mid = edge_index.reshape(3, -1) + num_verts
+        a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+        ab, bc, ca = mid[0], mid[1], mid[2]
+        faces = np.vstack((np.column_stack((a, ab, ca)), np.column_stack((b, bc, ab)), np.column_stack((c, ca, bc)), np.column_stack((ab, bc, ca))))
+    return vert_coords * radius, faces
+
+
+def fsaverage_like_mesh(name):
+    """
+    Create a mesh with the size of one hemisphere of a FreeSurfer average subject.
+
+    Parameters
+    ----------
+    name: string
+        One of the keys of FSAVERAGE_SUBDIVISIONS, e.g., 'fsaverage6'.
+
+    Returns
+    -------
+    vert_coords, faces: see `icosphere`.
+    """
+    if name not in FSAVERAGE_SUBDIVISIONS:
+        raise ValueError("ERROR: name must be one of %s but is '%s'." % (sorted(FSAVERAGE_SUBDIVISIONS.keys()), name))
+    return icosphere(FSAVERAGE_SUBDIVISIONS[name])
+
+
+def random_morphometry_data(vert_coords, seed=0):
+    """
+    Create smooth random morphometry data with some outliers.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (n_verts, 3)
+        The vertex coordinates, used to make the data spatially smooth.
+
+    seed: int, optional
+        The random seed. Defaults to 0.
+
+    Returns
+    -------
+    numpy 1D float array of shape (n_verts,)
+        Values in the typical range of cortical thickness (mm), with 1 percent outliers.
+    """
+    rng = np.random.RandomState(seed)
+    directions = rng.normal(size=(3, 3))
+    unit_coords = vert_coords / np.linalg.norm(vert_coords, axis=1)[:, np.newaxis]
+    data = 2.5 + 0.5 * np.sin(3.0 * unit_coords.dot(directions)).sum(axis=1) + rng.normal(scale=0.1, size=vert_coords.shape[0])
+    outliers = rng.choice(vert_coords.shape[0], size=max(1, vert_coords.shape[0] // 100), replace=False)
+    data[outliers] = rng.uniform(-10.0, 20.0, size=outliers.shape[0])
+    return data
+
+
+def random_atlas(vert_coords, num_labels=35, seed=0, unlabeled_fraction=0.01):
+    """
+    Create a random atlas with contiguous regions.
+
+    Each vertex gets the label of the closest of `num_labels` random seed directions, so the regions are contiguous patches like in a real cortical parcellation.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (n_verts, 3)
+        The vertex coordinates.
+
+    num_labels: int, optional
+        The number of regions. Defaults to 35, the number of regions in the Desikan atlas.
+
+    seed: int, optional
+        The random seed. Defaults to 0.
+
+    unlabeled_fraction: float, optional
+        The fraction of vertices that get no label (-1). Defaults to 0.01.
+
+    Returns
+    -------
+    vertex_labels: numpy 1D int array of shape (n_verts,)
+        The label index of each vertex, -1 for unlabeled vertices. Same format as returned by `brainload.annot` with `orig_ids=False`.
+
+    label_colors: numpy 2D int array of shape (n_labels, 5)
+        RGBT colors plus label id for each label.
+
+    label_names: list of strings
+        The label names.
+    """
+    rng = np.random.RandomState(seed)
+    seeds = rng.normal(size=(num_labels, 3))
+    seeds /= np.linalg.norm(seeds, axis=1)[:, np.newaxis]
+    unit_coords = vert_coords / np.linalg.norm(vert_coords, axis=1)[:, np.newaxis]
+    vertex_labels = np.argmax(unit_coords.dot(seeds.T), axis=1)
+    unlabeled = rng.rand(vert_coords.shape[0]) < unlabeled_fraction
+    vertex_labels[unlabeled] = -1
+    label_colors = np.zeros((num_labels, 5), dtype=np.int64)
+    label_colors[:, 0:3] = rng.randint(0, 256, size=(num_labels, 3))
+    label_colors[:, 4] = label_colors[:, 0] + label_colors[:, 1] * 256 + label_colors[:, 2] * 256 * 256
+    label_names = ['region%d' % idx for idx in range(num_labels)]
+    return vertex_labels, label_colors, label_names
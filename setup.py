@@ -29,13 +29,18 @@ setup(
     license='MIT',
     setup_requires=['pytest-runner'],
     tests_require=['pytest', 'pytest-cov', 'pytest-console-scripts'],
-    install_requires=['numpy', 'nibabel', 'matplotlib', 'mayavi', 'vtk', 'brainload>=0.3.2'],
+    install_requires=['numpy', 'scipy', 'nibabel', 'matplotlib', 'mayavi', 'vtk', 'brainload>=0.3.2'],
     package_dir = {'': 'src'},                               # The root directory that contains the source for the modules (relative to setup.py) is ./src/
     zip_safe=False,
     entry_points={
     'console_scripts': [
         'brainviewer = brainview.brainviewer:brainviewer',
         'atlasviewer = brainview.atlasviewer:atlasviewer',
+        'braingroup = brainview.braingroup:braingroup',
+        'brainbatch = brainview.brainbatch:brainbatch',
+        'brainexport = brainview.brainexport:brainexport',
+        'brainviewd = brainview.brainviewd:brainviewd',
+        'brainjobs = brainview.brainjobs:brainjobs',
     ],
 },
 )
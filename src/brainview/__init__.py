@@ -3,10 +3,83 @@ Brainview high-level API functions.
 """
 
 # The next line makes the listed functions show up in sphinx documentation directly under the package (they also show up under their real sub module, of course)
-__all__ = [ 'brain_morphometry_view', 'brain_label_view', 'brain_atlas_view', 'show', 'get_config', 'get_default_config_filename', 'cfg_getboolean', 'cfg_getint', 'cfg_get', 'cfg_getfloat', 'export_mesh_to_file' ]
+__all__ = [ 'brain_morphometry_view', 'brain_label_view', 'brain_atlas_view', 'brain_boundary_overlay', 'brain_rgba_view', 'brain_labelset_view', 'show', 'get_config', 'get_default_config_filename', 'cfg_getboolean', 'cfg_getint', 'cfg_get', 'cfg_getfloat', 'export_mesh_to_file', 'scalars_to_colors', 'smooth_data', 'smooth_data_fwhm' ]
 
 __version__ = '0.0.1'
 
-from .singleview import brain_morphometry_view, brain_label_view, brain_atlas_view, show
 from .util import get_config, get_default_config_filename, cfg_getboolean, cfg_getint, cfg_get, cfg_getfloat
 from .export import export_mesh_to_file
+from .colors import scalars_to_colors
+from .topology import smooth_data, smooth_data_fwhm
+
+# The rendering functions need mayavi and VTK, which take long to import and need a graphics stack. These wrappers import them on first use, so that the modules which do not render (e.g., brainview.export) can be used without them.
+
+
+def brain_morphometry_view(*args, **kwargs):
+    """
+    Create a surface from the mesh and morphometry data.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_morphometry_view` for the parameters.
+    """
+    from .singleview import brain_morphometry_view as func
+    return func(*args, **kwargs)
+
+
+def brain_label_view(*args, **kwargs):
+    """
+    View the vertices which are part of a label.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_label_view` for the parameters.
+    """
+    from .singleview import brain_label_view as func
+    return func(*args, **kwargs)
+
+
+def brain_atlas_view(*args, **kwargs):
+    """
+    View the vertices which are part of an annotation using the annotation colors.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_atlas_view` for the parameters.
+    """
+    from .singleview import brain_atlas_view as func
+    return func(*args, **kwargs)
+
+
+def brain_boundary_overlay(*args, **kwargs):
+    """
+    Draw region boundaries as lines on top of a surface.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_boundary_overlay` for the parameters.
+    """
+    from .singleview import brain_boundary_overlay as func
+    return func(*args, **kwargs)
+
+
+def brain_rgba_view(*args, **kwargs):
+    """
+    Create a surface that displays precomputed vertex colors.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_rgba_view` for the parameters.
+    """
+    from .singleview import brain_rgba_view as func
+    return func(*args, **kwargs)
+
+
+def brain_labelset_view(*args, **kwargs):
+    """
+    View many labels at once on a single surface.
+
+    Imports mayavi on first use, see `brainview.singleview.brain_labelset_view` for the parameters.
+    """
+    from .singleview import brain_labelset_view as func
+    return func(*args, **kwargs)
+
+
+def show(*args, **kwargs):
+    """
+    Display the currently active Mayavi scene in an interactive window.
+
+    Imports mayavi on first use, see `brainview.singleview.show` for the parameters.
+    """
+    from .singleview import show as func
+    return func(*args, **kwargs)
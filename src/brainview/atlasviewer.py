@@ -7,11 +7,23 @@ import brainload as bl
 import mayavi.mlab as mlab
 import brainview as bv
 import brainview.export as bex
+import brainview.profiling as bprof
+import brainview.lod as blod
+import brainview.spatialindex as bsi
+import brainview.topology as btop
+import brainview.parcels as bpar
+import brainview.labelset as bls
+import brainview.colors as bcol
 import argparse
 
 # To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
 # PYTHONPATH=./src/brainview python src/brainview/atlasviewer.py tim label Median_wall -d ~/data/tim_only/ -i
 # PYTHONPATH=./src/brainview python src/brainview/atlasviewer.py tim atlas aparc -d ~/data/tim_only/ -i
+# PYTHONPATH=./src/brainview python src/brainview/atlasviewer.py tim labels V1,V2,MT -d ~/data/tim_only/ -i
+
+# The color of vertices outside all atlas regions when a measure is aggregated within the regions, like the background of exported atlas and label meshes.
+UNLABELED_COLOR = (255, 255, 255, 255)
+
 
 def atlasviewer():
     """
@@ -23,17 +35,26 @@ def atlasviewer():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="View brain label data or brain annotation / atlas  data.")
     parser.add_argument("subject", help="The subject you want to load. String, a directory under the subjects_dir.")
-    parser.add_argument("mode", help="The mode. One of ('atlas', 'label').")
-    parser.add_argument("data", help="The data to load from the label dub dir of the subject, without the ?h part and the file extensions. If mode is 'atlas', something like 'aparc'. If mode is 'label', something like 'cortex'.")
+    parser.add_argument("mode", help="The mode. One of ('atlas', 'label', 'labels').")
+    parser.add_argument("data", help="The data to load from the label dub dir of the subject, without the ?h part and the file extensions. If mode is 'atlas', something like 'aparc'. If mode is 'label', something like 'cortex'. If mode is 'labels', several labels separated by commas, e.g., 'V1,V2,MT': they are loaded concurrently and displayed in one view, each in its own color, with overlapping parts in mixed colors.")
     parser.add_argument("-s", "--surface", help="The surface to load. String, defaults to 'white'.", default="white")
     parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subject. Defaults to environment variable SUBJECTS_DIR.", default="")
     parser.add_argument("-e", "--hemi", help="The hemisphere to load. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
+    parser.add_argument("-m", "--measure", help="A measure to aggregate within the atlas regions, e.g., 'thickness'. If given, each region is displayed in a color representing the value of the measure in the region, instead of the atlas colors. Ignored in label mode. Optional.", default=None)
+    parser.add_argument("-t", "--parcel-stat", help="The statistic used to aggregate the measure within each region. One of ('mean', 'median'). Defaults to 'mean'. Ignored unless -m is given.", default="mean", choices=['mean', 'median'])
+    parser.add_argument("-b", "--boundaries", help="Draw the borders between the atlas regions. Ignored in label mode.", action="store_true")
     parser.add_argument("-i", "--interactive", help="Display brain plot in an interactive window.", action="store_true")
+    parser.add_argument("--full-res", help="Use the full resolution mesh in the interactive window. By default, large meshes are replaced with a decimated version after the image file has been saved, to keep rotation smooth. See setting 'interactive_lod_num_verts' in section 'mesh' of the config file. Ignored unless -i is active.", action="store_true")
     parser.add_argument("-o", "--outputfile", help="Output image file name. String, defaults to 'brain_<mode>.png'.", default=None)
     parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
-    parser.add_argument("-x", "--mesh-export", help="Mesh export output filename. The file extension should be '.obj' or '.ply' to indicate the output format, otherwise obj is used. Optional, if not given at all, then no mesh will be exported.", default="")
+    parser.add_argument("-x", "--mesh-export", help="Mesh export output filename. The file extension should be '.obj' or '.ply' to indicate the output format, otherwise obj is used. Only PLY files contain the atlas or label colors. Optional, if not given at all, then no mesh will be exported.", default="")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format. Optional, if not given at all, no profiling is performed.", default="")
+    parser.add_argument("--cprofile", help="Also run the Python profiler cProfile and add the most expensive functions to the profiling output. Ignored unless -p is active.", action="store_true")
     args = parser.parse_args()
 
+    if args.profile != "":
+        bprof.start_profiling(use_cprofile=args.cprofile)
+
     verbose = False
     if args.verbose:
         verbose = True
@@ -48,7 +69,7 @@ def atlasviewer():
     mode = args.mode
     outputfile = args.outputfile
     if outputfile is None:
-        if mode == "label":
+        if mode == "label" or mode == "labels":
             outputfile = "brain_label.png"
         else:
             outputfile = "brain_atlas.png"
@@ -56,41 +77,122 @@ def atlasviewer():
     surface = args.surface
     hemi = args.hemi
     data = args.data
+    if mode == 'labels':
+        label_names = [label_name.strip() for label_name in data.split(",") if label_name.strip() != ""]
+        if not label_names:
+            parser.error("argument data: no label names given in '%s', expected label names separated by commas in mode 'labels'" % data)
 
     interactive = False
     if args.interactive:
         interactive = True
     mlab.options.offscreen = not interactive
 
-    vert_coords, faces, morphometry_data, morphometry_meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=surface, hemi=hemi, load_morphometry_data=False)
+    measure = args.measure if mode == 'atlas' else None
+    with bprof.stage('load'):
+        vert_coords, faces, morphometry_data, morphometry_meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=surface, hemi=hemi, measure=measure, load_morphometry_data=measure is not None)
     fig_title = 'Atlasviewer: %s: %s on surface %s' % (subject_id, data, surface)
     cfg, cfg_file = bv.get_config()
-    fig = mlab.figure(fig_title, bgcolor=(1, 1, 1), size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)))
 
     if mode == 'atlas':
         if verbose:
             print("Loading atlas %s for subject %s from subjects dir %s: displaying on surface %s for hemisphere %s." % (data, subject_id, subjects_dir, surface, hemi))
-        vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot(subject_id, subjects_dir, data, hemi=hemi, orig_ids=False)
-        brain_mesh = bv.brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names)
+        with bprof.stage('load_atlas'):
+            vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot(subject_id, subjects_dir, data, hemi=hemi, orig_ids=False)
+        if measure is not None:
+            with bprof.stage('parcels'):
+                parcel_values = bpar.parcel_aggregate(morphometry_data, vertex_labels, len(label_names), stat=args.parcel_stat)
+                # Vertices outside all regions, e.g., the medial wall, are NaN, so they are not mistaken for a region.
+                parcel_vertex_data = bpar.parcel_values_to_vertices(parcel_values, vertex_labels)
+            if verbose:
+                print("Aggregated measure %s within %d atlas regions using the %s." % (measure, len(label_names), args.parcel_stat))
+                for label_name, value in zip(label_names, parcel_values):
+                    print("  %s: %f" % (label_name, value))
+        if args.boundaries:
+            with bprof.stage('boundaries'):
+                boundary_vertices, boundary_edges = btop.parcel_boundaries(faces, vertex_labels)
+    elif mode == 'labels':
+        if verbose:
+            print("Loading %d labels for subject %s from subjects dir %s: displaying on surface %s for hemisphere %s." % (len(label_names), subject_id, subjects_dir, surface, hemi))
+        with bprof.stage('load_label'):
+            labelset = bls.load_labelset(subject_id, subjects_dir, label_names, morphometry_meta_data, hemi=hemi)
+        if verbose:
+            overlaps = bls.overlap_counts(labelset)
+            for label_index, label_name in enumerate(label_names):
+                overlap_info = ", ".join(["%d with %s" % (overlaps[label_index, other_index], label_names[other_index]) for other_index in range(len(label_names)) if other_index != label_index and overlaps[label_index, other_index] > 0])
+                print("  %s: %d vertices%s" % (label_name, labelset['sizes'][label_index], (", shared: " + overlap_info) if overlap_info else ""))
+            print("%d vertices are in at least one label, %d in more than one." % (np.count_nonzero(bls.labelset_union(labelset)), np.count_nonzero(bls.membership_counts(labelset) > 1)))
     else:
         if verbose:
             print("Loading label %s for subject %s from subjects dir %s: displaying on surface %s for hemisphere %s." % (data, subject_id, subjects_dir, surface, hemi))
-        verts_in_label, label_meta_data = bl.label(subject_id, subjects_dir, data, hemi=hemi, meta_data=morphometry_meta_data)
-        brain_mesh = bv.brain_label_view(fig, vert_coords, faces, verts_in_label)
+        with bprof.stage('load_label'):
+            verts_in_label, label_meta_data = bl.label(subject_id, subjects_dir, data, hemi=hemi, meta_data=morphometry_meta_data)
 
     if args.mesh_export != "":
-        colormap_name = bv.cfg_get('meshexport', 'colormap', 'viridis')
-        colormap_adjust_alpha_to = bv.cfg_getint('meshexport', 'colormap_adjust_alpha_to', -1)
+        export_args = {}
+        with bprof.stage('export_colors'):
+            if mode == 'atlas':
+                if measure is not None:
+                    export_args['vertex_colors'] = bv.scalars_to_colors(parcel_vertex_data, bv.cfg_get('meshexport', 'colormap', 'viridis'), alpha=bv.cfg_getint('meshexport', 'colormap_adjust_alpha_to', -1), nan_color=UNLABELED_COLOR)
+                else:
+                    export_args['vertex_colors'] = bex.atlas_vertex_colors(vertex_labels, label_colors)
+                if args.boundaries:
+                    export_args['boundary_vertices'] = boundary_vertices
+            elif mode == 'labels':
+                export_args['vertex_colors'] = bls.labelset_vertex_colors(labelset)
+            else:
+                export_args['vertex_colors'] = bex.label_vertex_colors(vert_coords.shape[0], verts_in_label)
         print("Exporting brain mesh to file '%s'..." % args.mesh_export)
-        bv.export_mesh_to_file(args.mesh_export, vert_coords, faces, morphometry_data=morphometry_data, colormap_name=colormap_name, colormap_adjust_alpha_to=colormap_adjust_alpha_to)
-
-
+        with bprof.stage('mesh_export'):
+            bv.export_mesh_to_file(args.mesh_export, vert_coords, faces, **export_args)
+
+    with bprof.stage('figure'):
+        fig = mlab.figure(fig_title, bgcolor=(1, 1, 1), size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)))
+    with bprof.stage('mesh'):
+        if measure is not None:
+            brain_mesh = bv.brain_morphometry_view(fig, vert_coords, faces, parcel_vertex_data, boundary_labels=vertex_labels if args.boundaries else None, colormap=bv.cfg_get('mesh', 'colormap', 'cool'))
+            lut_manager = brain_mesh.module_manager.scalar_lut_manager
+            lut_manager.lut.nan_color = tuple([channel / 255.0 for channel in UNLABELED_COLOR])
+            if np.any(np.isfinite(parcel_values)):
+                lut_manager.use_default_range = False
+                lut_manager.data_range = np.array(bcol.get_data_range(parcel_values), dtype=np.float64)
+        elif mode == 'atlas':
+            brain_mesh = bv.brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names, draw_boundaries=args.boundaries)
+        elif mode == 'labels':
+            brain_mesh = bv.brain_labelset_view(fig, vert_coords, faces, labelset)
+        else:
+            brain_mesh = bv.brain_label_view(fig, vert_coords, faces, verts_in_label)
 
     print("Saving brain view to file '%s'..." % (outputfile))
-    mlab.savefig(outputfile)
+    with bprof.stage('savefig'):
+        mlab.savefig(outputfile)
+
+    lod_num_verts = bv.cfg_getint('mesh', 'interactive_lod_num_verts', 100000)
+    if interactive and not args.full_res and 0 < lod_num_verts < vert_coords.shape[0]:
+        with bprof.stage('lod'):
+            # Atlas and label views display label indices or colors, and parcel values are constant within each region and NaN outside all regions. None of them must be averaged across the merged vertices.
+            lod = blod.set_surface_lod(brain_mesh, vert_coords, faces, lod_num_verts, mode='representative')
+        if verbose:
+            print("Using decimated mesh with %d vertices and %d faces in the interactive window." % (lod['vert_coords'].shape[0], lod['faces'].shape[0]))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
     if interactive:
         if verbose:
-            print("Interactive mode set, displaying brain plot in interactive window.")
+            print("Interactive mode set, displaying brain plot in interactive window. Click on the brain to print the vertex and its label.")
+        if mode == 'atlas':
+            bsi.add_vertex_picker(fig, vert_coords, morphometry_data=morphometry_data if measure is not None else None, vertex_labels=vertex_labels, label_names=label_names)
+        elif mode == 'labels':
+            def report_labels(vertex_index, description):
+                # A vertex can be in several labels, report all of them.
+                print("%s, labels: %s" % (description, ", ".join(bls.vertex_label_names(labelset, vertex_index)) or "none"))
+            bsi.add_vertex_picker(fig, vert_coords, callback=report_labels)
+        else:
+            in_label = np.full((vert_coords.shape[0], ), -1, dtype=int)
+            in_label[verts_in_label] = 0
+            bsi.add_vertex_picker(fig, vert_coords, vertex_labels=in_label, label_names=[data])
         bv.show()
 
     sys.exit(0)
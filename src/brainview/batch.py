@@ -0,0 +1,421 @@
+"""
+Pipelined batch rendering for brainview.
+
+These functions render the morphometry data of many subjects to image files. The work is split into three stages that overlap in time: the data of the next subjects is loaded in a background thread while the current subject is rendered, and the rendered images are encoded and written to disk in another background thread. Rendering itself has to happen in the calling thread, as VTK does not support rendering from other threads.
+"""
+from __future__ import print_function
+import os
+import time
+import collections
+import numpy as np
+import brainload as bl
+import matplotlib.image
+import mayavi.mlab as mlab
+from .profiling import stage
+from .export import as_float_data
+from .singleview import brain_morphometry_view
+from .groupstats import quantile_sketch_init, quantile_sketch_update, quantile_sketch_quantiles
+from .montage import new_montage, add_montage_tile, finish_montage, get_montage_output_pattern
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+BATCH_STAGES = ('load', 'render', 'write')
+
+
+def new_batch_stats():
+    """
+    Create a new, empty set of per-stage batch statistics.
+
+    Returns
+    -------
+    dictionary
+        Maps each stage name in `BATCH_STAGES` to a dictionary with keys `items` (the number of processed items) and `busy_seconds` (the time the stage spent working on them). The key `total_seconds` holds the wall clock time of the whole batch, which is less than the sum of the stage times when the stages overlap.
+    """
+    stats = dict((stage_name, {'items': 0, 'busy_seconds': 0.0}) for stage_name in BATCH_STAGES)
+    stats['total_seconds'] = 0.0
+    return stats
+
+
+def _timed(stats, stage_name, function, *args):
+    """
+    Run a function, adding its run time to the statistics of a stage. Each stage is only ever updated from a single thread, so no locking is needed.
+    """
+    start = time.time()
+    with stage('batch.' + stage_name):
+        result = function(*args)
+    stats[stage_name]['items'] += 1
+    stats[stage_name]['busy_seconds'] += time.time() - start
+    return result
+
+
+def format_batch_stats(stats):
+    """
+    Format batch statistics as a human readable text.
+
+    Parameters
+    ----------
+    stats: dictionary
+        The statistics, as returned by `batch_render`.
+
+    Returns
+    -------
+    string
+        One line per stage with its item count, busy time and throughput, and a final line for the whole batch.
+    """
+    lines = []
+    for stage_name in BATCH_STAGES:
+        stage_stats = stats[stage_name]
+        throughput = stage_stats['items'] / stage_stats['busy_seconds'] if stage_stats['busy_seconds'] > 0 else 0.0
+        lines.append("%-8s %5d items in %8.3f s busy, %8.2f items/s" % (stage_name, stage_stats['items'], stage_stats['busy_seconds'], throughput))
+    num_items = stats['render']['items']
+    throughput = num_items / stats['total_seconds'] if stats['total_seconds'] > 0 else 0.0
+    lines.append("%-8s %5d items in %8.3f s wall, %8.2f items/s" % ('total', num_items, stats['total_seconds'], throughput))
+    return "\n".join(lines)
+
+
+def prefetch(items, load_function, num_prefetch=1, stats=None):
+    """
+    Apply a load function to items in a background thread, ahead of their use.
+
+    Generator that yields the results in the order of the items. While the caller processes the result for one item, the next num_prefetch items are loaded in a background thread. Exceptions raised by the load function are re-raised in the calling thread when the result of the failed item is requested.
+
+    Parameters
+    ----------
+    items: iterable
+        The items to load, e.g., subject identifiers.
+
+    load_function: callable
+        Called with a single item, returns the loaded data.
+
+    num_prefetch: int, optional
+        The number of items to load ahead. 0 loads each item in the calling thread when it is requested. Defaults to 1.
+
+    stats: dictionary or None, optional
+        Batch statistics as returned by `new_batch_stats`. If given, the load times are added to the 'load' stage.
+
+    Yields
+    ------
+    item:
+        The item.
+
+    result:
+        The result of the load function for the item.
+    """
+    def load(item):
+        if stats is None:
+            return load_function(item)
+        return _timed(stats, 'load', load_function, item)
+
+    if num_prefetch <= 0 or cf is None:
+        for item in items:
+            yield item, load(item)
+        return
+
+    with cf.ThreadPoolExecutor(max_workers=1) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(load, item)))
+            if len(pending) > num_prefetch:
+                next_item, future = pending.popleft()
+                yield next_item, future.result()
+        while pending:
+            next_item, future = pending.popleft()
+            yield next_item, future.result()
+
+
+def start_image_writer(queue_size=4, stats=None):
+    """
+    Start a background thread that encodes and writes images.
+
+    Parameters
+    ----------
+    queue_size: int, optional
+        The maximal number of images waiting to be written. If the queue is full, `write_image_async` blocks until an image has been written, so the memory usage stays bounded if writing is slower than rendering. Defaults to 4.
+
+    stats: dictionary or None, optional
+        Batch statistics as returned by `new_batch_stats`. If given, the write times are added to the 'write' stage.
+
+    Returns
+    -------
+    dictionary
+        The writer state. Pass it to `write_image_async` and `stop_image_writer`.
+    """
+    if queue_size < 1:
+        raise ValueError("ERROR: queue_size must be at least 1, but is %d." % queue_size)
+    executor = cf.ThreadPoolExecutor(max_workers=1) if cf is not None else None
+    return {'executor': executor, 'pending': collections.deque(), 'queue_size': queue_size, 'stats': stats, 'written_files': []}
+
+
+def _write_image(filename, image):
+    """
+    Encode an RGB image and write it to a file. The format is derived from the file extension, see `matplotlib.image.imsave`.
+    """
+    matplotlib.image.imsave(filename, image)
+    return filename
+
+
+def write_image_async(writer, filename, image):
+    """
+    Queue an image for writing in the background.
+
+    Parameters
+    ----------
+    writer: dictionary
+        The writer state, as returned by `start_image_writer`.
+
+    filename: string
+        The output file name. The image format is derived from the file extension, e.g., '.png'.
+
+    image: numpy 3D uint8 array of shape (height, width, 3)
+        The image, e.g., from `mlab.screenshot`. It must not be modified after it has been queued.
+    """
+    stats = writer['stats']
+    if writer['executor'] is None:
+        writer['written_files'].append(_write_image(filename, image) if stats is None else _timed(stats, 'write', _write_image, filename, image))
+        return
+    while len(writer['pending']) >= writer['queue_size']:
+        writer['written_files'].append(writer['pending'].popleft().result())
+    if stats is None:
+        writer['pending'].append(writer['executor'].submit(_write_image, filename, image))
+    else:
+        writer['pending'].append(writer['executor'].submit(_timed, stats, 'write', _write_image, filename, image))
+
+
+def stop_image_writer(writer):
+    """
+    Wait until all queued images have been written and stop the writer thread.
+
+    Parameters
+    ----------
+    writer: dictionary
+        The writer state, as returned by `start_image_writer`.
+
+    Returns
+    -------
+    list of strings
+        The files written by the writer, in the order in which they were queued.
+    """
+    try:
+        while writer['pending']:
+            writer['written_files'].append(writer['pending'].popleft().result())
+    finally:
+        if writer['executor'] is not None:
+            writer['executor'].shutdown(wait=True)
+    return writer['written_files']
+
+
+def _show_subject_data(fig, surface, displayed_faces, vert_coords, faces, morphometry_data, colormap, data_range):
+    """
+    Display the data of a subject, reusing the surface of the previous subject if possible.
+
+    If the mesh is the same as the one currently displayed (e.g., the average subject in common subject mode), only the scalars are replaced. Otherwise, the mesh of the surface is replaced in place, which is still much cheaper than building a new pipeline.
+    """
+    if surface is None:
+        surface = brain_morphometry_view(fig, vert_coords, faces, morphometry_data, colormap=colormap)
+    else:
+        source = surface.mlab_source
+        if displayed_faces is faces:
+            source.scalars = morphometry_data
+        else:
+            source.reset(points=vert_coords, triangles=faces, scalars=morphometry_data)
+    lut_manager = surface.module_manager.scalar_lut_manager
+    lut_manager.use_default_range = False
+    lut_manager.data_range = np.array(data_range if data_range is not None else [np.min(morphometry_data), np.max(morphometry_data)], dtype=np.float64)
+    return surface
+
+
+def get_batch_output_file(output_dir, subject_id, measure, file_format='png'):
+    """
+    Return the image file name for a subject in a batch.
+
+    Examples
+    --------
+    >>> get_batch_output_file('/tmp/images', 'subject1', 'thickness')
+    '/tmp/images/subject1_thickness.png'
+    """
+    return os.path.join(output_dir, "%s_%s.%s" % (subject_id, measure, file_format))
+
+
+def _get_subject_data_loader(subjects_dir, measure, hemi, surf, common_subject_mode, fwhm, average_subject):
+    """
+    Return a function that loads only the morphometry data of a subject, without the mesh.
+    """
+    if common_subject_mode:
+        def load(subject_id):
+            return bl.subject_data_standard(subject_id, subjects_dir, measure, hemi, fwhm, average_subject=average_subject, surf=surf)[0]
+    else:
+        def load(subject_id):
+            return bl.subject_data_native(subject_id, subjects_dir, measure, hemi, surf=surf)[0]
+    return load
+
+
+def cohort_value_range(subjects_list, subjects_dir, measure, clip_percentiles=(5, 95), hemi='both', surf='white', common_subject_mode=False, fwhm='10', average_subject='fsaverage', num_prefetch=1, k=1024):
+    """
+    Compute a common color range for all subjects of a batch from cohort-wide percentiles.
+
+    Streams the data of all subjects through a quantile sketch (see `brainview.groupstats.quantile_sketch_init`), so only the data of the current and the prefetched subjects is held in memory. Pass the result as value_range to `batch_render` to render all subjects with the same color scale, which makes the images comparable.
+
+    Parameters
+    ----------
+    subjects_list, subjects_dir, measure, hemi, surf, common_subject_mode, fwhm, average_subject, num_prefetch:
+        See `batch_render`.
+
+    clip_percentiles: tuple of 2 numbers, optional
+        The percentiles of the values of all subjects that define the range. Defaults to (5, 95).
+
+    k: int, optional
+        The accuracy parameter of the quantile sketch. Defaults to 1024.
+
+    Returns
+    -------
+    tuple of 2 floats
+        The lower and upper bound of the range.
+
+    Examples
+    --------
+    >>> value_range = cohort_value_range(subjects_list, subjects_dir, 'thickness')
+    >>> output_files, stats = batch_render(subjects_list, subjects_dir, 'thickness', '/tmp/images', value_range=value_range)
+    """
+    sketch = quantile_sketch_init(k=k)
+    load = _get_subject_data_loader(subjects_dir, measure, hemi, surf, common_subject_mode, fwhm, average_subject)
+    for subject_id, morphometry_data in prefetch(subjects_list, load, num_prefetch=num_prefetch):
+        with stage('batch.sketch'):
+            quantile_sketch_update(sketch, morphometry_data)
+    lower_value, upper_value = quantile_sketch_quantiles(sketch, [clip_percentiles[0] / 100.0, clip_percentiles[1] / 100.0])
+    return float(lower_value), float(upper_value)
+
+
+def batch_render(subjects_list, subjects_dir, measure, output_dir, hemi='both', surf='white', common_subject_mode=False, fwhm='10', average_subject='fsaverage', clip_percentiles=(5, 95), colormap='cool', size=(800, 600), file_format='png', num_prefetch=1, queue_size=4, value_range=None, montage_grid=None, montage_tile_step=1, write_images=True, verbose=False):
+    """
+    Render the morphometry data of many subjects to image files.
+
+    Runs a pipeline of three overlapping stages: the data of the next subjects is loaded in a background thread (see `prefetch`) while the current subject is rendered offscreen, and the rendered images are written in another background thread (see `start_image_writer`). A single figure and surface are used for all subjects. In common subject mode, the mesh of the average subject is loaded only once and only the scalars are replaced for each subject.
+
+    Optionally, the rendered images are also tiled into labeled contact sheets (see `brainview.montage`) that are written page by page through the same background writer.
+
+    Parameters
+    ----------
+    subjects_list: list of strings
+        The subject identifiers.
+
+    subjects_dir: string
+        The directory containing the subjects.
+
+    measure: string
+        The measure to render, e.g., 'thickness'.
+
+    output_dir: string
+        The directory to write the images to. One file per subject is written, see `get_batch_output_file`.
+
+    hemi, surf: string, optional
+        The hemisphere and surface. Default to 'both' and 'white'.
+
+    common_subject_mode: bool, optional
+        Whether to render the data mapped to the average subject on the surface of the average subject. Defaults to False, which renders the native space data on the subject's own surface.
+
+    fwhm, average_subject: optional
+        The smoothing setting and the average subject for common subject mode. Ignored otherwise.
+
+    clip_percentiles: tuple of 2 numbers or None, optional
+        The data of each subject is clipped at these percentiles before rendering. Defaults to (5, 95). None disables clipping. Ignored if value_range is given.
+
+    colormap: string, optional
+        The mayavi colormap. Defaults to 'cool'.
+
+    size: tuple of 2 ints, optional
+        The image width and height in pixels. Defaults to (800, 600).
+
+    file_format: string, optional
+        The image format, used as the file extension. Defaults to 'png'.
+
+    num_prefetch: int, optional
+        The number of subjects to load ahead, see `prefetch`. Defaults to 1.
+
+    queue_size: int, optional
+        The maximal number of rendered images waiting to be written, see `start_image_writer`. Defaults to 4.
+
+    value_range: tuple of 2 floats or None, optional
+        A fixed color range for all subjects, e.g., from `cohort_value_range`. The data of each subject is clipped to it. Defaults to None, which uses the range of each subject's (clipped) data, so the colors of different images are not comparable.
+
+    montage_grid: tuple of 2 ints or None, optional
+        The number of columns and rows of the contact sheet pages. The pages are written to the output_dir, see `brainview.montage.get_montage_output_pattern`. Defaults to None, which creates no contact sheets.
+
+    montage_tile_step: int, optional
+        The factor by which the images are shrunk for the contact sheets, see `brainview.montage.new_montage`. Defaults to 1.
+
+    write_images: bool, optional
+        Whether to write one image file per subject. Set this to False to write only the contact sheets. Defaults to True.
+
+    verbose: bool, optional
+        Whether to print a line for each rendered subject. Defaults to False.
+
+    Returns
+    -------
+    output_files: list of strings
+        The written image files, in the order in which they were written. This includes the contact sheet pages.
+
+    stats: dictionary
+        The per-stage statistics, see `new_batch_stats`. Use `format_batch_stats` to print them.
+
+    Examples
+    --------
+    >>> output_files, stats = batch_render(['subject1', 'subject2'], subjects_dir, 'thickness', '/tmp/images')
+    >>> print(format_batch_stats(stats))
+    """
+    stats = new_batch_stats()
+    start = time.time()
+    if common_subject_mode:
+        with stage('batch.load_mesh'):
+            vert_coords, faces, _, _ = bl.subject(average_subject, subjects_dir=subjects_dir, surf=surf, hemi=hemi, load_morphometry_data=False)
+        load_data = _get_subject_data_loader(subjects_dir, measure, hemi, surf, common_subject_mode, fwhm, average_subject)
+
+        def load(subject_id):
+            return vert_coords, faces, load_data(subject_id)
+    else:
+        def load(subject_id):
+            subject_vert_coords, subject_faces, morphometry_data, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, measure=measure, surf=surf, hemi=hemi)
+            return subject_vert_coords, subject_faces, morphometry_data
+
+    def render(fig, displayed, subject_vert_coords, subject_faces, morphometry_data):
+        morphometry_data = as_float_data(morphometry_data)
+        if value_range is not None:
+            morphometry_data = np.clip(morphometry_data, value_range[0], value_range[1])
+        elif clip_percentiles is not None:
+            lower_value, upper_value = np.percentile(morphometry_data, clip_percentiles)
+            morphometry_data = np.clip(morphometry_data, float(lower_value), float(upper_value))
+        displayed['surface'] = _show_subject_data(fig, displayed['surface'], displayed['faces'], subject_vert_coords, subject_faces, morphometry_data, colormap, value_range)
+        displayed['faces'] = subject_faces
+        return mlab.screenshot(figure=fig, mode='rgb', antialiased=False)
+
+    offscreen = mlab.options.offscreen
+    mlab.options.offscreen = True
+    fig = mlab.figure(bgcolor=(1, 1, 1), size=size)
+    writer = start_image_writer(queue_size=queue_size, stats=stats)
+    write_function = lambda filename, image: write_image_async(writer, filename, image)
+    montage = None
+    if montage_grid is not None:
+        montage = new_montage(get_montage_output_pattern(output_dir, measure, file_format=file_format), size, num_columns=montage_grid[0], num_rows=montage_grid[1], tile_step=montage_tile_step)
+    displayed = {'surface': None, 'faces': None}
+    try:
+        for subject_id, (subject_vert_coords, subject_faces, morphometry_data) in prefetch(subjects_list, load, num_prefetch=num_prefetch, stats=stats):
+            image = _timed(stats, 'render', render, fig, displayed, subject_vert_coords, subject_faces, morphometry_data)
+            if write_images:
+                output_file = get_batch_output_file(output_dir, subject_id, measure, file_format=file_format)
+                write_image_async(writer, output_file, image)
+                if verbose:
+                    print("Rendered subject %s, queued image file '%s'." % (subject_id, output_file))
+            if montage is not None:
+                add_montage_tile(montage, image, subject_id, write_function=write_function)
+                if verbose and not write_images:
+                    print("Rendered subject %s into contact sheet page %d." % (subject_id, montage['page_index']))
+        if montage is not None:
+            finish_montage(montage, write_function=write_function)
+    finally:
+        output_files = stop_image_writer(writer)
+        mlab.close(fig)
+        mlab.options.offscreen = offscreen
+    stats['total_seconds'] = time.time() - start
+    return output_files, stats
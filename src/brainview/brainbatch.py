@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import argparse
+import brainload as bl
+import brainview as bv
+import brainview.batch as bb
+import brainview.montage as bmon
+import brainview.profiling as bprof
+
+# To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
+# PYTHONPATH=./src/brainview python src/brainview/brainbatch.py thickness -d ~/data/study1/ -o ~/data/study1/images
+
+def brainbatch():
+    """
+    Brain morphometry batch renderer.
+
+    Renders the morphometry data of many subjects to image files. Loading the data of the next subject and writing the images of the previous ones run in background threads while the current subject is rendered.
+    """
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Render brain morphometry data of many subjects to image files.")
+    parser.add_argument("measure", help="The measure to render. String, e.g., 'thickness' or 'area'.")
+    parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subjects. Defaults to environment variable SUBJECTS_DIR.", default="")
+    parser.add_argument("-l", "--subjects-file", help="Text file containing one subject id per line. Defaults to 'subjects.txt' in the subjects_dir.", default="")
+    parser.add_argument("-s", "--surface", help="The surface to render. String, defaults to 'white'.", default="white")
+    parser.add_argument("-e", "--hemi", help="The hemisphere to render. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
+    parser.add_argument("-c", "--common-subject-mode", help="Render data mapped to a common or average subject on the surface of that subject. The mesh is then loaded only once for all subjects.", action="store_true")
+    parser.add_argument("-a", "--average-subject", help="The common or average subject to use. String, defaults to 'fsaverage'. Ignored unless -c is active.", default="fsaverage")
+    parser.add_argument("-f", "--fwhm", help="The smoothing or fwhm setting to use for the common subject measure. String, defaults to '10'. Ignored unless -c is active.", default="10")
+    parser.add_argument("-o", "--output-dir", help="The directory to write the images to. One file named '<subject>_<measure>.<format>' is written per subject. Defaults to the current working directory.", default=".")
+    parser.add_argument("-t", "--format", help="The image file format. String, defaults to 'png'.", default="png")
+    parser.add_argument("-g", "--montage", help="Also tile the images into labeled contact sheets with this many columns and rows per page, e.g., '8x6'. The pages are named 'montage_<measure>_<page>.<format>' and written to the output directory as soon as they are full. Optional, defaults to no contact sheets.", default="")
+    parser.add_argument("--montage-step", help="Shrink the images by this factor for the contact sheets, by keeping every n-th pixel. Integer, defaults to 1. Ignored unless -g is active.", type=int, default=1)
+    parser.add_argument("--montage-only", help="Write only the contact sheets, no image file per subject. Ignored unless -g is active.", action="store_true")
+    parser.add_argument("-n", "--no-clip", help="Do not clip morphometry values.", action="store_true")
+    parser.add_argument("-u", "--shared-range", help="Use the same color range for all subjects, so the images are comparable. The range is computed from the percentiles of the values of all subjects in a first pass over the data, which streams the subjects through a quantile sketch. With -n, the range is the minimum and maximum over all subjects.", action="store_true")
+    parser.add_argument("-r", "--prefetch", help="The number of subjects to load ahead in the background while rendering. Integer, defaults to 1. Use 0 to load in the rendering thread.", type=int, default=1)
+    parser.add_argument("-q", "--queue-size", help="The maximal number of rendered images waiting to be written in the background. Integer, defaults to 4.", type=int, default=4)
+    parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format.", default="")
+    args = parser.parse_args()
+
+    montage_grid = None
+    if args.montage != "":
+        try:
+            montage_grid = bmon.parse_grid(args.montage)
+        except ValueError as err:
+            parser.error("argument -g/--montage: %s" % str(err))
+
+    if args.profile != "":
+        bprof.start_profiling()
+
+    cfg, cfg_file = bv.get_config()
+    verbose = False
+    if args.verbose:
+        verbose = True
+        print("Verbosity turned on.")
+
+    if args.subjects_dir == "":
+        subjects_dir = os.getenv('SUBJECTS_DIR')
+    else:
+        subjects_dir = args.subjects_dir
+
+    subjects_file = args.subjects_file
+    if subjects_file == "":
+        subjects_file = os.path.join(subjects_dir, 'subjects.txt')
+    subjects_list = [subject_id for subject_id in bl.read_subjects_file(subjects_file) if subject_id.strip() != ""]
+
+    clip_percentiles = None
+    if bv.cfg_getboolean('mesh', 'clip_values', True) and not args.no_clip:
+        clip_percentiles = (bv.cfg_getint('mesh', 'clip_values_lower', 5), bv.cfg_getint('mesh', 'clip_values_upper', 95))
+
+    value_range = None
+    if args.shared_range:
+        range_percentiles = clip_percentiles if clip_percentiles is not None else (0, 100)
+        if verbose:
+            print("Computing shared color range from percentiles %g and %g of the values of all %d subjects." % (range_percentiles[0], range_percentiles[1], len(subjects_list)))
+        with bprof.stage('shared_range'):
+            value_range = bb.cohort_value_range(subjects_list, subjects_dir, args.measure, clip_percentiles=range_percentiles, hemi=args.hemi, surf=args.surface, common_subject_mode=args.common_subject_mode, fwhm=args.fwhm, average_subject=args.average_subject, num_prefetch=args.prefetch)
+        print("Using shared color range %g to %g for all subjects." % value_range)
+
+    if verbose:
+        print("Rendering measure %s of surface %s for hemisphere %s for %d subjects from subjects dir '%s' to directory '%s', prefetching %d subjects." % (args.measure, args.surface, args.hemi, len(subjects_list), subjects_dir, args.output_dir, args.prefetch))
+    output_files, stats = bb.batch_render(subjects_list, subjects_dir, args.measure, args.output_dir, hemi=args.hemi, surf=args.surface, common_subject_mode=args.common_subject_mode, fwhm=args.fwhm, average_subject=args.average_subject, clip_percentiles=clip_percentiles, colormap=bv.cfg_get('mesh', 'colormap', 'cool'), size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)), file_format=args.format, num_prefetch=args.prefetch, queue_size=args.queue_size, value_range=value_range, montage_grid=montage_grid, montage_tile_step=args.montage_step, write_images=not (montage_grid is not None and args.montage_only), verbose=verbose)
+    print("Wrote %d image files to directory '%s'." % (len(output_files), args.output_dir))
+    print(bb.format_batch_stats(stats))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    brainbatch()
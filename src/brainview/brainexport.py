@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import argparse
+import brainload as bl
+import brainview as bv
+import brainview.export as bex
+import brainview.profiling as bprof
+
+# To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
+# PYTHONPATH=./src/brainview python src/brainview/brainexport.py morphometry thickness tim bert -d ~/data/study1/ -o ~/data/study1/meshes
+# PYTHONPATH=./src/brainview python src/brainview/brainexport.py morphometry thickness tim bert -d ~/data/study1/ -c -s inflated -j lateral,medial -t png -o ~/data/study1/snapshots
+
+def brainexport():
+    """
+    Brain mesh exporter.
+
+    Exports brain meshes colored by morphometry data, an atlas or a label to mesh files, or 2D projections of them to flat mesh or image files, for many subjects in a single run. This does not render anything with mayavi or VTK, so it works on machines without a graphics stack.
+    """
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Export brain meshes colored by morphometry, atlas or label data to mesh files.")
+    parser.add_argument("mode", help="The mode. One of ('morphometry', 'atlas', 'label').", choices=['morphometry', 'atlas', 'label'])
+    parser.add_argument("data", help="The data to color the mesh by. If mode is 'morphometry', the measure, e.g., 'thickness'. If mode is 'atlas', the atlas name without the ?h part and file extension, e.g., 'aparc'. If mode is 'label', the label name, e.g., 'cortex'.")
+    parser.add_argument("subjects", help="The subjects to export. Optional if -l is given.", nargs="*")
+    parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subjects. Defaults to environment variable SUBJECTS_DIR.", default="")
+    parser.add_argument("-l", "--subjects-file", help="Text file containing one subject id per line. The subjects are exported in addition to those given on the command line. Optional.", default="")
+    parser.add_argument("-s", "--surface", help="The surface to export. String, defaults to 'white'.", default="white")
+    parser.add_argument("-e", "--hemi", help="The hemisphere to export. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
+    parser.add_argument("-c", "--common-subject-mode", help="Export data mapped to a common or average subject, on the surface of that subject. The mesh is then loaded only once for all subjects. Ignored unless mode is 'morphometry'.", action="store_true")
+    parser.add_argument("-a", "--average-subject", help="The common or average subject to use. String, defaults to 'fsaverage'. Ignored unless -c is active.", default="fsaverage")
+    parser.add_argument("-f", "--fwhm", help="The smoothing or fwhm setting to use for the common subject measure. String, defaults to '10'. Ignored unless -c is active.", default="10")
+    parser.add_argument("-b", "--boundaries", help="Mark the borders between the atlas regions in the exported colors. Ignored unless mode is 'atlas'.", action="store_true")
+    parser.add_argument("-o", "--output-dir", help="The directory to write the mesh files to. One file named '<subject>_<data>.<format>' is written per subject, or '<subject>_<data>_<projection>.<format>' per subject and projection if -j is given. Defaults to the current working directory.", default=".")
+    parser.add_argument("-t", "--format", help="The output file format. One of ('ply', 'obj', 'png', 'svg', 'pdf'). Only PLY files contain the colors. The image formats 'png', 'svg' and 'pdf' require -j. SVG and PDF files are vector graphics that contain only the visible parts of the mesh, with neighboring faces of the same color merged. Defaults to 'ply'.", default="ply", choices=['ply', 'obj', 'png', 'svg', 'pdf'])
+    parser.add_argument("-j", "--projection", help="Export 2D projections of the mesh instead of the mesh, as flat meshes or images. A comma-separated list of projections from ('lateral', 'medial', 'dorsal', 'ventral', 'anterior', 'posterior', 'spherical'), e.g., 'lateral,medial'. Projections are computed once per mesh, so with -c they are shared by all subjects. Optional.", default="")
+    parser.add_argument("-n", "--no-clip", help="Do not clip morphometry values. Ignored unless mode is 'morphometry'.", action="store_true")
+    parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format.", default="")
+    args = parser.parse_args()
+
+    if args.profile != "":
+        bprof.start_profiling()
+
+    cfg, cfg_file = bv.get_config()
+    verbose = False
+    if args.verbose:
+        verbose = True
+        print("Verbosity turned on.")
+
+    if args.subjects_dir == "":
+        subjects_dir = os.getenv('SUBJECTS_DIR')
+    else:
+        subjects_dir = args.subjects_dir
+
+    subjects_list = list(args.subjects)
+    if args.subjects_file != "":
+        subjects_list.extend([subject_id for subject_id in bl.read_subjects_file(args.subjects_file) if subject_id.strip() != ""])
+    if not subjects_list:
+        parser.error("no subjects given, pass subject ids or a subjects file with -l")
+
+    projections = [projection.strip() for projection in args.projection.split(",") if projection.strip() != ""]
+    for projection in projections:
+        if projection not in bex.PROJECTIONS:
+            parser.error("argument -j/--projection: invalid projection '%s', must be one of %s" % (projection, str(bex.PROJECTIONS)))
+    if args.format in ('png', 'svg', 'pdf') and not projections:
+        parser.error("argument -t/--format: format '%s' requires argument -j/--projection" % args.format)
+
+    clip_percentiles = None
+    if args.mode == 'morphometry' and bv.cfg_getboolean('meshexport', 'clip_values', True) and not args.no_clip:
+        clip_percentiles = (bv.cfg_getint('meshexport', 'clip_values_lower', 5), bv.cfg_getint('meshexport', 'clip_values_upper', 95))
+        if verbose:
+            print("Clipping exported values below percentile %d and above %d." % clip_percentiles)
+
+    common_mesh = None
+    if args.mode == 'morphometry' and args.common_subject_mode:
+        with bprof.stage('load_mesh'):
+            vert_coords, faces, _, meta_data = bl.subject(args.average_subject, subjects_dir=subjects_dir, surf=args.surface, hemi=args.hemi, load_morphometry_data=False)
+        common_mesh = (vert_coords, faces, meta_data)
+
+    if verbose:
+        print("Exporting %s %s on surface %s for hemisphere %s for %d subjects from subjects dir '%s' to directory '%s'." % (args.mode, args.data, args.surface, args.hemi, len(subjects_list), subjects_dir, args.output_dir))
+    for subject_id in subjects_list:
+        mesh = common_mesh
+        if mesh is None and projections:
+            # The projections of both hemispheres need the number of lh vertices from the meta data, so load the mesh here.
+            with bprof.stage('load_mesh'):
+                vert_coords, faces, _, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=args.surface, hemi=args.hemi, load_morphometry_data=False)
+            mesh = (vert_coords, faces, meta_data)
+        with bprof.stage('load'):
+            vert_coords, faces, export_args = bex.load_export_data(subject_id, subjects_dir, args.mode, args.data, hemi=args.hemi, surf=args.surface, common_subject_mode=args.common_subject_mode, fwhm=args.fwhm, average_subject=args.average_subject, clip_percentiles=clip_percentiles, boundaries=args.boundaries, colormap_name=bv.cfg_get('meshexport', 'colormap', 'viridis'), colormap_adjust_alpha_to=bv.cfg_getint('meshexport', 'colormap_adjust_alpha_to', -1), mesh=mesh)
+        if not projections:
+            output_file = os.path.join(args.output_dir, "%s_%s.%s" % (subject_id, args.data, args.format))
+            with bprof.stage('mesh_export'):
+                bv.export_mesh_to_file(output_file, vert_coords, faces, **export_args)
+            if verbose:
+                print("Exported mesh of subject %s with %d vertices to file '%s'." % (subject_id, vert_coords.shape[0], output_file))
+            continue
+        num_lh_verts = mesh[2]['lh.num_vertices'] if args.hemi == 'both' else None
+        for projection in projections:
+            output_file = os.path.join(args.output_dir, "%s_%s_%s.%s" % (subject_id, args.data, projection, args.format))
+            with bprof.stage('projection'):
+                projected = bex.get_mesh_projection(vert_coords, faces, projection, hemi=args.hemi, num_lh_verts=num_lh_verts)
+            with bprof.stage('projection_export'):
+                # Atlas and label colors must not be mixed on region borders.
+                bex.export_projection_to_file(output_file, projected, size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)), face_color_mode='mean' if args.mode == 'morphometry' else 'majority', **export_args)
+            if verbose:
+                print("Exported %s projection of subject %s to file '%s'." % (projection, subject_id, output_file))
+    if projections:
+        print("Exported %d projections of %d meshes to directory '%s'." % (len(projections) * len(subjects_list), len(subjects_list), args.output_dir))
+    else:
+        print("Exported %d meshes to directory '%s'." % (len(subjects_list), args.output_dir))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    brainexport()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import argparse
+import brainload as bl
+import brainview.groupstats as bgs
+import brainview.datastack as bds
+import brainview.profiling as bprof
+
+# To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
+# PYTHONPATH=./src/brainview python src/brainview/braingroup.py stats thickness -d ~/data/study1/ -q 5,50,95
+# PYTHONPATH=./src/brainview python src/brainview/braingroup.py stack thickness -d ~/data/study1/ -o ~/data/study1/thickness_stack.npy
+
+def braingroup():
+    """
+    Brain group data tool.
+
+    Computes vertex-wise statistics across a group of subjects that have been mapped to a common subject like fsaverage. The results can be displayed with brainviewer.
+    """
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Compute vertex-wise statistics for a group of subjects.")
+    subparsers = parser.add_subparsers(dest="command", help="The command to run.")
+
+    stats_parser = subparsers.add_parser("stats", help="Compute vertex-wise mean, standard deviation and percentile maps of a measure, streaming the subjects one by one.")
+    stats_parser.add_argument("measure", help="The measure to load. String, e.g., 'thickness' or 'area'.")
+    stats_parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subjects. Defaults to environment variable SUBJECTS_DIR.", default="")
+    stats_parser.add_argument("-l", "--subjects-file", help="Text file containing one subject id per line. Defaults to 'subjects.txt' in the subjects_dir.", default="")
+    stats_parser.add_argument("-s", "--surface", help="The surface the measure was computed on. String, defaults to 'white'.", default="white")
+    stats_parser.add_argument("-e", "--hemi", help="The hemisphere to load. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
+    stats_parser.add_argument("-a", "--average-subject", help="The common or average subject the data was mapped to. String, defaults to 'fsaverage'.", default="fsaverage")
+    stats_parser.add_argument("-f", "--fwhm", help="The smoothing or fwhm setting of the data. String, defaults to '10'.", default="10")
+    stats_parser.add_argument("-q", "--percentiles", help="Comma-separated list of approximate percentiles to compute, e.g., '5,50,95'. Defaults to none.", default="")
+    stats_parser.add_argument("-r", "--range", help="Lower and upper bound of the value range used for the percentile computation. Values outside are clipped to the range. Defaults to a range derived from the first subject.", nargs=2, type=float, default=None)
+    stats_parser.add_argument("-b", "--bins", help="The number of histogram bins per vertex used for the percentile computation. Integer, defaults to 64.", type=int, default=64)
+    stats_parser.add_argument("-j", "--jobs", help="The number of threads used to load subject data in parallel. Integer, defaults to 1.", type=int, default=1)
+    stats_parser.add_argument("-o", "--output-dir", help="The directory to write the group maps to. Defaults to the subjects_dir, so that brainviewer can find the average subject.", default="")
+    stats_parser.add_argument("-g", "--group-id", help="The name of the pseudo subject under which the group maps are written. String, defaults to 'group'.", default="group")
+    stats_parser.add_argument("-k", "--stack", help="A data stack file created with the stack command. If given, the subject data is read from the stack instead of the per-subject files, and the subjects file is only used to select a subset of the subjects in the stack if given explicitly. Measure, hemi, fwhm, average subject and surface are taken from the stack.", default="")
+    stats_parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
+    stats_parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format.", default="")
+
+    stack_parser = subparsers.add_parser("stack", help="Collect the data of all subjects into a single memory-mapped subjects by vertices data stack file.")
+    stack_parser.add_argument("measure", help="The measure to load. String, e.g., 'thickness' or 'area'.")
+    stack_parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subjects. Defaults to environment variable SUBJECTS_DIR.", default="")
+    stack_parser.add_argument("-l", "--subjects-file", help="Text file containing one subject id per line. Defaults to 'subjects.txt' in the subjects_dir.", default="")
+    stack_parser.add_argument("-s", "--surface", help="The surface the measure was computed on. String, defaults to 'white'.", default="white")
+    stack_parser.add_argument("-e", "--hemi", help="The hemisphere to load. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
+    stack_parser.add_argument("-a", "--average-subject", help="The common or average subject the data was mapped to. String, defaults to 'fsaverage'.", default="fsaverage")
+    stack_parser.add_argument("-f", "--fwhm", help="The smoothing or fwhm setting of the data. String, defaults to '10'.", default="10")
+    stack_parser.add_argument("-j", "--jobs", help="The number of threads used to load subject data in parallel. Integer, defaults to 1.", type=int, default=1)
+    stack_parser.add_argument("-o", "--outputfile", help="The data stack file to write. A JSON index file with the same name but file extension '.json' is written next to it. String, defaults to '<measure>_stack.npy' in the subjects_dir.", default="")
+    stack_parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
+    stack_parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format.", default="")
+    args = parser.parse_args()
+
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    if args.profile != "":
+        bprof.start_profiling()
+
+    verbose = False
+    if args.verbose:
+        verbose = True
+        print("Verbosity turned on.")
+
+    if args.subjects_dir == "":
+        subjects_dir = os.getenv('SUBJECTS_DIR')
+    else:
+        subjects_dir = args.subjects_dir
+
+    if args.command == "stats":
+        _group_stats(args, subjects_dir, verbose)
+    elif args.command == "stack":
+        _data_stack(args, subjects_dir, verbose)
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
+    sys.exit(0)
+
+
+def _get_subjects_list(args, subjects_dir):
+    """
+    Read the list of subjects from the subjects file given on the command line.
+    """
+    subjects_file = args.subjects_file
+    if subjects_file == "":
+        subjects_file = os.path.join(subjects_dir, 'subjects.txt')
+    return [subject_id for subject_id in bl.read_subjects_file(subjects_file) if subject_id.strip() != ""]
+
+
+def _group_stats(args, subjects_dir, verbose):
+    """
+    Run the stats command.
+    """
+    quantiles = None
+    if args.percentiles != "":
+        quantiles = [float(p) / 100.0 for p in args.percentiles.split(',')]
+    output_dir = args.output_dir if args.output_dir != "" else subjects_dir
+
+    if args.stack != "":
+        with bprof.stage('load_stack'):
+            stack = bds.load_data_stack(args.stack)
+        index = stack['index']
+        measure, hemi, fwhm, average_subject, surface = index['measure'], index['hemi'], index['fwhm'], index['average_subject'], index['surf']
+        selected_subjects = _get_subjects_list(args, subjects_dir) if args.subjects_file != "" else None
+        subjects_list = selected_subjects if selected_subjects is not None else stack['subjects']
+        if verbose:
+            print("Computing group statistics for measure %s of surface %s for hemisphere %s at fwhm %s mapped to %s, for %d subjects from data stack '%s'." % (measure, surface, hemi, fwhm, average_subject, len(subjects_list), args.stack))
+        if measure != args.measure:
+            print("WARNING: The measure '%s' given on the command line differs from the measure '%s' of the data stack, using the latter." % (args.measure, measure))
+        rows = bds.iter_stack_rows(stack, subjects_list=selected_subjects)
+        maps = bgs.accumulate_group_stats(rows, quantiles=quantiles, value_range=args.range, num_bins=args.bins)
+        meta_data = index
+    else:
+        measure, hemi, fwhm, average_subject, surface = args.measure, args.hemi, args.fwhm, args.average_subject, args.surface
+        subjects_list = _get_subjects_list(args, subjects_dir)
+        if verbose:
+            print("Computing group statistics for measure %s of surface %s for hemisphere %s at fwhm %s mapped to %s, for %d subjects from subjects dir '%s' using %d loader threads." % (measure, surface, hemi, fwhm, average_subject, len(subjects_list), subjects_dir, args.jobs))
+        maps, meta_data = bgs.group_stats(subjects_list, subjects_dir, measure, hemi=hemi, fwhm=fwhm, average_subject=average_subject, surf=surface, quantiles=quantiles, value_range=args.range, num_bins=args.bins, num_workers=args.jobs)
+
+    with bprof.stage('write'):
+        written_files = bgs.write_group_maps(maps, meta_data, output_dir, args.group_id, measure, fwhm=fwhm, average_subject=average_subject, surf=surface)
+    if verbose:
+        for written_file in written_files:
+            print("Wrote group map file '%s'." % written_file)
+    print("Wrote %d group maps for %d subjects to '%s'. Display them with: brainviewer %s -d %s -c -a %s -f %s -m %s_mean" % (len(maps), len(subjects_list), os.path.join(output_dir, args.group_id), args.group_id, output_dir, average_subject, fwhm, measure))
+
+
+def _data_stack(args, subjects_dir, verbose):
+    """
+    Run the stack command.
+    """
+    subjects_list = _get_subjects_list(args, subjects_dir)
+    stack_file = args.outputfile if args.outputfile != "" else os.path.join(subjects_dir, "%s_stack.npy" % args.measure)
+    if verbose:
+        print("Building data stack for measure %s of surface %s for hemisphere %s at fwhm %s mapped to %s, for %d subjects from subjects dir '%s' using %d loader threads." % (args.measure, args.surface, args.hemi, args.fwhm, args.average_subject, len(subjects_list), subjects_dir, args.jobs))
+    index = bds.build_data_stack(stack_file, subjects_list, subjects_dir, args.measure, hemi=args.hemi, fwhm=args.fwhm, average_subject=args.average_subject, surf=args.surface, num_workers=args.jobs)
+    print("Wrote data stack for %d subjects and %d vertices to file '%s', index to file '%s'." % (len(index['subjects']), index['num_verts'], stack_file, bds.get_index_file_name(stack_file)))
+
+if __name__ == "__main__":
+    braingroup()
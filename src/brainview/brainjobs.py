@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import sys
+import argparse
+import brainview.jobs as bjobs
+import brainview.profiling as bprof
+
+# To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
+# PYTHONPATH=./src/brainview python src/brainview/brainjobs.py ~/data/study1/figures.ini -v
+
+def brainjobs():
+    """
+    Brain batch job runner.
+
+    Runs the export and render jobs described in a manifest file. The jobs are scheduled so that each mesh and each data file is loaded only once, and the loads run in parallel. Mayavi and VTK are only imported if a job renders a '3d' view.
+    """
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Run the brain export and render jobs described in a manifest file.")
+    parser.add_argument("manifest", help="The manifest file in INI format. It contains a section 'batch' with the settings of the run and the defaults of all jobs, and one section named 'job <name>' per job. The sections 'figure', 'mesh' and 'meshexport' override the settings of the brainview config file.")
+    parser.add_argument("-n", "--dry-run", help="Only print the schedule, i.e., how many loads, projections and renders the jobs need. Nothing is written.", action="store_true")
+    parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format.", default="")
+    args = parser.parse_args()
+
+    verbose = False
+    if args.verbose:
+        verbose = True
+        print("Verbosity turned on.")
+
+    try:
+        manifest = bjobs.read_manifest(args.manifest)
+        loads = bjobs.schedule_jobs(bjobs.expand_jobs(manifest))
+    except ValueError as err:
+        parser.error("argument manifest: %s" % str(err))
+
+    if args.dry_run or verbose:
+        print("Scheduled %s" % bjobs.format_job_stats(bjobs.schedule_summary(loads)))
+    if args.dry_run:
+        sys.exit(0)
+
+    if args.profile != "":
+        bprof.start_profiling()
+
+    output_files, stats = bjobs.run_jobs(manifest, loads=loads, verbose=verbose)
+    print("Wrote %d files." % len(output_files))
+    print("Ran %s" % bjobs.format_job_stats(stats))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    brainjobs()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import argparse
+import signal
+import brainview as bv
+import brainview.service as bs
+import brainview.profiling as bprof
+
+# To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
+# PYTHONPATH=./src/brainview python src/brainview/brainviewd.py -d ~/data/study1/ -t fsaverage
+
+def brainviewd():
+    """
+    Brain render service.
+
+    Runs a local HTTP service that renders brain morphometry data and exports brain meshes on request. The offscreen figure and the recently used meshes are kept in memory between requests, so each request only pays for loading the data of the subject and rendering it.
+    """
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Run a local service that renders brain morphometry data and exports brain meshes on request.")
+    parser.add_argument("-d", "--subjects_dir", help="The subjects_dir used for requests that do not contain one. Defaults to environment variable SUBJECTS_DIR.", default="")
+    parser.add_argument("-b", "--bind", help="The address to listen on. Defaults to '127.0.0.1', which only accepts local connections.", default="127.0.0.1")
+    parser.add_argument("-o", "--port", help="The port to listen on. Integer, defaults to 8642.", type=int, default=8642)
+    parser.add_argument("-w", "--workers", help="The number of worker threads that load data and write results. Rendering is always done in a single thread. Integer, defaults to 2.", type=int, default=2)
+    parser.add_argument("-q", "--queue-size", help="The maximal number of queued requests. Further requests are rejected with status 503. Integer, defaults to 32.", type=int, default=32)
+    parser.add_argument("-t", "--template", help="Load the mesh of this subject at startup, e.g., the average subject. Can be given several times. Optional.", action="append", default=[])
+    parser.add_argument("-s", "--surface", help="The surface of the meshes loaded at startup. String, defaults to 'white'. Ignored unless -t is given.", default="white")
+    parser.add_argument("-e", "--hemi", help="The hemisphere of the meshes loaded at startup. One of ('both', 'lh, 'rh'). Defaults to 'both'. Ignored unless -t is given.", default="both", choices=['lh', 'rh', 'both'])
+    parser.add_argument("-c", "--cache-size", help="The maximal number of meshes kept in memory. Integer, defaults to 8.", type=int, default=8)
+    parser.add_argument("-v", "--verbose", help="Increase output verbosity, log every request.", action="store_true")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage are measured and written to this file in JSON format when the service is stopped.", default="")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("argument -w/--workers: must be at least 1")
+
+    if args.profile != "":
+        bprof.start_profiling()
+
+    cfg, cfg_file = bv.get_config()
+    verbose = False
+    if args.verbose:
+        verbose = True
+        print("Verbosity turned on.")
+
+    if args.subjects_dir == "":
+        subjects_dir = os.getenv('SUBJECTS_DIR')
+    else:
+        subjects_dir = args.subjects_dir
+
+    clip_percentiles = None
+    if bv.cfg_getboolean('mesh', 'clip_values', True):
+        clip_percentiles = (bv.cfg_getint('mesh', 'clip_values_lower', 5), bv.cfg_getint('mesh', 'clip_values_upper', 95))
+
+    with bprof.stage('startup'):
+        service = bs.new_service(subjects_dir=subjects_dir, num_workers=args.workers, max_queue=args.queue_size, size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)), colormap=bv.cfg_get('mesh', 'colormap', 'cool'), clip_percentiles=clip_percentiles, export_colormap=bv.cfg_get('meshexport', 'colormap', 'viridis'), template_cache_size=max(args.cache_size, len(args.template)))
+        for template_subject in args.template:
+            vert_coords, faces, meta_data = bs.get_template_mesh(service, subjects_dir, template_subject, surf=args.surface, hemi=args.hemi)
+            if verbose:
+                print("Loaded mesh of subject %s with %d vertices." % (template_subject, vert_coords.shape[0]))
+        server = bs.start_server(service, host=args.bind, port=args.port, verbose=verbose)
+
+    print("Serving on http://%s:%d with %d workers and subjects dir '%s'. Press Ctrl+C to stop." % (server.server_address[0], server.server_address[1], args.workers, subjects_dir))
+    sys.stdout.flush()
+    signal.signal(signal.SIGTERM, _stop_on_signal)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        bs.stop_service(service)
+    metrics = bs.get_service_metrics(service)
+    print("Stopped after %d completed, %d failed and %d rejected requests." % (metrics['completed'], metrics['failed'], metrics['rejected']))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
+    sys.exit(0)
+
+
+def _stop_on_signal(signum, frame):
+    """
+    Stop the service on SIGTERM the same way as on Ctrl+C.
+    """
+    raise KeyboardInterrupt()
+
+
+if __name__ == "__main__":
+    brainviewd()
@@ -7,6 +7,14 @@ import brainload as bl
 import mayavi.mlab as mlab
 import brainview as bv
 import brainview.export as bex
+import brainview.profiling as bprof
+import brainview.lod as blod
+import brainview.spatialindex as bsi
+import brainview.datastack as bds
+import brainview.topology as btop
+import brainview.session as bvs
+import brainview.hemiview as bhv
+import brainview.statmap as bsm
 import argparse
 
 # To run this in dev mode (in virtual env, pip -e install of brainview active) from REPO_ROOT:
@@ -24,18 +32,38 @@ def brainviewer():
     parser.add_argument("subject", help="The subject you want to load. String, a directory under the subjects_dir.")
     parser.add_argument("-d", "--subjects_dir", help="The subjects_dir containing the subject. Defaults to environment variable SUBJECTS_DIR.", default="")
     parser.add_argument("-m", "--measure", help="The measure to load. String, defaults to None (no morphometry data). Examples: 'area' or 'thickness'.", default=None)
+    parser.add_argument("--measures", help="Several measures to load, separated by commas, e.g., 'thickness,area,volume'. The surface is loaded only once and the measures are loaded concurrently. One image file is saved per measure, with the measure name appended to the output file name. In interactive mode, press 'n' and 'b' to switch to the next or previous measure. String, optional. Cannot be combined with -m or -k.", default="")
     parser.add_argument("-s", "--surface", help="The surface to load. String, defaults to 'white'.", default="white")
     parser.add_argument("-e", "--hemi", help="The hemisphere to load. One of ('both', 'lh, 'rh'). Defaults to 'both'.", default="both", choices=['lh', 'rh', 'both'])
     parser.add_argument("-c", "--common-subject-mode", help="Load data mapped to a common or average subject.", action="store_true")
     parser.add_argument("-a", "--average-subject", help="The common or average subject to use. String, defaults to 'fsaverage'. Ignored unless -c is active.", default="fsaverage")
     parser.add_argument("-f", "--fwhm", help="The smoothing or fwhm setting to use for the common subject measure. String, defaults to '10'. Ignored unless -c is active.", default="10")
+    parser.add_argument("-k", "--stack", help="Data stack file created with 'braingroup stack'. If given, the morphometry data of the subject is read from the stack and displayed on the average subject of the stack. The measure, fwhm and average subject are taken from the stack. Optional.", default="")
+    parser.add_argument("--smooth", help="Smooth the morphometry data on the surface before displaying it, with an approximate Gaussian kernel of the given full width at half maximum in mm. The kernel is approximated by iterative nearest neighbor averaging on the loaded surface, as in FreeSurfer. Float, optional, defaults to no smoothing.", type=float, default=None)
+    parser.add_argument("-b", "--boundaries", help="Draw the borders between the regions of this atlas on top of the data. String, the atlas name without the ?h part and file extension, e.g., 'aparc'. The atlas is loaded for the subject whose mesh is displayed, i.e., for the average subject in common subject mode. Optional, defaults to no borders.", default="")
+    parser.add_argument("--hemi-gap", help="Display the hemispheres as separate objects, placed side by side with a gap of the given width in mm between them. Useful for inflated or sphere surfaces, where the hemispheres overlap. In interactive mode, press '1' and '2' to hide or show the left and right hemisphere. Float, optional. Requires '-e both', cannot be combined with --measures.", type=float, default=None)
+    parser.add_argument("--threshold", help="Display the data as a thresholded statistical map, e.g., of t values: only vertices whose absolute value is at least the threshold are colored, positive values from red to yellow and negative values from blue to green. Values are not clipped. In interactive mode, press ']' and '[' to raise and lower the threshold. Float, optional. Cannot be combined with --measures or --hemi-gap.", type=float, default=None)
     parser.add_argument("-i", "--interactive", help="Display brain plot in an interactive window.", action="store_true")
+    parser.add_argument("--full-res", help="Use the full resolution mesh in the interactive window. By default, large meshes are replaced with a decimated version after the image file has been saved, to keep rotation smooth. See setting 'interactive_lod_num_verts' in section 'mesh' of the config file. Ignored unless -i is active.", action="store_true")
     parser.add_argument("-o", "--outputfile", help="Output image file name. String, defaults to 'brain_morphometry.png'.", default="brain_morphometry.png")
     parser.add_argument("-n", "--no-clip", help="Do not clip morphometry values.", action="store_true")
     parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
     parser.add_argument("-x", "--mesh-export", help="Mesh export output filename. The file extension should be '.obj' or '.ply' to indicate the output format, otherwise obj is used. Optional, if not given at all, then no mesh will be exported.", default="")
+    parser.add_argument("-p", "--profile", help="Profiling output filename. If given, the time and peak memory usage of each stage of the run are measured and written to this file in JSON format. Optional, if not given at all, no profiling is performed.", default="")
+    parser.add_argument("--cprofile", help="Also run the Python profiler cProfile and add the most expensive functions to the profiling output. Ignored unless -p is active.", action="store_true")
     args = parser.parse_args()
 
+    measures = [m.strip() for m in args.measures.split(",") if m.strip() != ""]
+    if measures and (args.measure is not None or args.stack != ""):
+        parser.error("argument --measures: not allowed with argument -m/--measure or -k/--stack")
+    if args.hemi_gap is not None and (args.hemi != "both" or measures):
+        parser.error("argument --hemi-gap: requires '-e both' and not allowed with argument --measures")
+    if args.threshold is not None and (measures or args.hemi_gap is not None):
+        parser.error("argument --threshold: not allowed with argument --measures or --hemi-gap")
+
+    if args.profile != "":
+        bprof.start_profiling(use_cprofile=args.cprofile)
+
     cfg, cfg_file = bv.get_config()
     verbose = False
     if args.verbose:
@@ -61,40 +89,94 @@ def brainviewer():
         interactive = True
     mlab.options.offscreen = not interactive
 
-    load_morphometry_data = measure is not None
+    load_morphometry_data = measure is not None or args.stack != "" or len(measures) > 0
+    measure_data = None
 
-    if args.common_subject_mode:
-        fwhm = args.fwhm
-        average_subject = args.average_subject
-        if verbose:
-            print("Loading data mapped to common subject %s for subject %s from subjects dir '%s': measure %s of surface %s for hemisphere %s at fwhm %s." % (average_subject, subject_id, subjects_dir, measure, surface, hemi, fwhm))
-        vert_coords, faces, morphometry_data, meta_data = bl.subject_avg(subject_id, subjects_dir=subjects_dir, measure=measure, surf=surface, hemi=hemi, fwhm=fwhm, average_subject=average_subject, load_morphometry_data=load_morphometry_data)
-    else:
-        if verbose:
-            print("Loading data for subject %s from subjects dir '%s': measure %s of surface %s for hemisphere %s." % (subject_id, subjects_dir, measure, surface, hemi))
-        vert_coords, faces, morphometry_data, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, measure=measure, surf=surface, hemi=hemi, load_morphometry_data=load_morphometry_data)
+    with bprof.stage('load'):
+        if args.stack != "":
+            stack = bds.load_data_stack(args.stack)
+            measure = stack['index']['measure']
+            average_subject = stack['index']['average_subject']
+            if verbose:
+                print("Loading data for subject %s from data stack '%s': measure %s mapped to common subject %s at fwhm %s, displayed on surface %s of the common subject for hemisphere %s." % (subject_id, args.stack, measure, average_subject, stack['index']['fwhm'], surface, hemi))
+            vert_coords, faces, _, meta_data = bl.subject(average_subject, subjects_dir=subjects_dir, surf=surface, hemi=hemi, load_morphometry_data=False)
+            morphometry_data = bds.get_subject_data(stack, subject_id, hemi=hemi)
+            if morphometry_data.shape[0] != vert_coords.shape[0]:
+                raise ValueError("ERROR: Data stack '%s' has %d values for hemisphere %s, but the mesh of the common subject %s has %d vertices." % (args.stack, morphometry_data.shape[0], hemi, average_subject, vert_coords.shape[0]))
+            meta_data["lh.morphometry_file"] = meta_data["rh.morphometry_file"] = args.stack
+        elif args.common_subject_mode:
+            fwhm = args.fwhm
+            average_subject = args.average_subject
+            if verbose:
+                print("Loading data mapped to common subject %s for subject %s from subjects dir '%s': measure %s of surface %s for hemisphere %s at fwhm %s." % (average_subject, subject_id, subjects_dir, measure, surface, hemi, fwhm))
+            if measures:
+                if verbose:
+                    print("Loading measures %s for subject %s mapped to common subject %s concurrently." % (", ".join(measures), subject_id, average_subject))
+                vert_coords, faces, _, meta_data = bl.subject_avg(subject_id, subjects_dir=subjects_dir, surf=surface, hemi=hemi, fwhm=fwhm, average_subject=average_subject, load_morphometry_data=False)
+                measure_data = bvs.load_measures(subject_id, subjects_dir, measures, hemi=hemi, surf=surface, common_subject_mode=True, fwhm=fwhm, average_subject=average_subject)
+            else:
+                vert_coords, faces, morphometry_data, meta_data = bl.subject_avg(subject_id, subjects_dir=subjects_dir, measure=measure, surf=surface, hemi=hemi, fwhm=fwhm, average_subject=average_subject, load_morphometry_data=load_morphometry_data)
+        else:
+            if verbose:
+                print("Loading data for subject %s from subjects dir '%s': measure %s of surface %s for hemisphere %s." % (subject_id, subjects_dir, measure, surface, hemi))
+            if measures:
+                if verbose:
+                    print("Loading measures %s for subject %s concurrently." % (", ".join(measures), subject_id))
+                vert_coords, faces, _, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=surface, hemi=hemi, load_morphometry_data=False)
+                measure_data = bvs.load_measures(subject_id, subjects_dir, measures, hemi=hemi, surf=surface)
+            else:
+                vert_coords, faces, morphometry_data, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, measure=measure, surf=surface, hemi=hemi, load_morphometry_data=load_morphometry_data)
+
+    if measure_data is not None:
+        measure = measures[0]
+        morphometry_data = measure_data[measure]
 
     if not load_morphometry_data:
         if verbose:
             print("No morphometry data loaded, setting all values to zero.")
         morphometry_data = np.zeros((vert_coords.shape[0],), dtype=float)
 
-    morphometry_data = morphometry_data.astype(float)
+    morphometry_data = bex.as_float_data(morphometry_data)
+
+    if args.smooth is not None and load_morphometry_data:
+        with bprof.stage('smooth'):
+            num_iterations = btop.fwhm_to_num_iterations(vert_coords, faces, args.smooth)
+            if verbose:
+                print("Smoothing morphometry data with fwhm %g on surface %s, using %d nearest neighbor iterations." % (args.smooth, surface, num_iterations))
+            if measure_data is not None:
+                for smoothed_measure in measures:
+                    measure_data[smoothed_measure] = btop.smooth_data(faces, measure_data[smoothed_measure], num_iterations)
+                morphometry_data = measure_data[measure]
+            else:
+                morphometry_data = btop.smooth_data(faces, morphometry_data, num_iterations)
 
     if verbose:
         if hemi == "lh" or hemi == "both":
             print("Loaded lh surface mesh from file '%s'." % meta_data["lh.surf_file"])
-            if load_morphometry_data:
+            if load_morphometry_data and measure_data is None:
                 print("Loaded lh morphometry data from file '%s'." % meta_data["lh.morphometry_file"])
         if hemi == "rh" or hemi == "both":
             print("Loaded rh surface from file '%s'." % meta_data["rh.surf_file"])
-            if load_morphometry_data:
+            if load_morphometry_data and measure_data is None:
                 print("Loaded rh morphometry data from file '%s'." % meta_data["rh.morphometry_file"])
         print("Loaded mesh consisting of %d vertices and %d faces." % (vert_coords.shape[0], faces.shape[0]))
         if load_morphometry_data:
             print("Loaded morphometry data for %d vertices." % (morphometry_data.shape[0]))
+        if measure_data is not None:
+            print("Loaded %d measures: %s." % (len(measures), ", ".join(measures)))
+
+    boundary_vertices = boundary_labels = boundary_label_names = None
+    if args.boundaries != "":
+        mesh_subject_id = average_subject if (args.common_subject_mode or args.stack != "") else subject_id
+        if verbose:
+            print("Loading atlas %s for subject %s to draw region borders." % (args.boundaries, mesh_subject_id))
+        with bprof.stage('load_atlas'):
+            boundary_labels, _, boundary_label_names, _ = bl.annot(mesh_subject_id, subjects_dir, args.boundaries, hemi=hemi, orig_ids=False)
+        with bprof.stage('boundaries'):
+            boundary_vertices, boundary_edges = btop.parcel_boundaries(faces, boundary_labels)
 
-    fig_title = 'Brainviewer: %s: %s of surface %s' % (subject_id, measure, surface)
+    fig_title = 'Brainviewer: %s: %s of surface %s' % (subject_id, measure if measure_data is None else ", ".join(measures), surface)
+    export_measures = [measure] if measure_data is None else measures
 
     if args.mesh_export != "":
         colormap_name = bv.cfg_get('meshexport', 'colormap', 'viridis')
@@ -104,28 +186,108 @@ def brainviewer():
             clip_values_lower = bv.cfg_getint('meshexport', 'clip_values_lower', 5)
             clip_values_upper = bv.cfg_getint('meshexport', 'clip_values_upper', 95)
             print("Clipping exported values below percentile %d and above %d." % (clip_values_lower, clip_values_upper))
-            morphometry_data_for_export = bex.clip_data_at_percentiles(morphometry_data, lower=clip_values_lower, upper=clip_values_upper)
-        else:
-            morphometry_data_for_export = morphometry_data
-        print("Exporting brain mesh to file '%s'..." % args.mesh_export)
-        bv.export_mesh_to_file(args.mesh_export, vert_coords, faces, morphometry_data=morphometry_data_for_export, colormap_name=colormap_name, colormap_adjust_alpha_to=colormap_adjust_alpha_to)
+        for export_measure in export_measures:
+            export_data = morphometry_data if measure_data is None else measure_data[export_measure]
+            if clip_values_export and not args.no_clip:
+                with bprof.stage('clip'):
+                    morphometry_data_for_export = bex.clip_data_at_percentiles(export_data, lower=clip_values_lower, upper=clip_values_upper)
+            else:
+                morphometry_data_for_export = export_data
+            mesh_export_file = args.mesh_export if measure_data is None else bvs.measure_output_file(args.mesh_export, export_measure)
+            print("Exporting brain mesh to file '%s'..." % mesh_export_file)
+            with bprof.stage('mesh_export'):
+                bv.export_mesh_to_file(mesh_export_file, vert_coords, faces, morphometry_data=morphometry_data_for_export, colormap_name=colormap_name, colormap_adjust_alpha_to=colormap_adjust_alpha_to, boundary_vertices=boundary_vertices)
 
-    fig = mlab.figure(fig_title, bgcolor=(1, 1, 1), size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)))
+    with bprof.stage('figure'):
+        fig = mlab.figure(fig_title, bgcolor=(1, 1, 1), size=(bv.cfg_getint('figure', 'width', 800), bv.cfg_getint('figure', 'height', 600)))
     mesh_args = {'representation': bv.cfg_get('mesh', 'representation', 'surface'), 'colormap': bv.cfg_get('mesh', 'colormap', 'cool')}
     clip_values_live = bv.cfg_getboolean('mesh', 'clip_values', True)
-    if clip_values_live and not args.no_clip:
+    clip_ranges = None
+    if clip_values_live and not args.no_clip and args.threshold is None:
         clip_values_lower = bv.cfg_getint('mesh', 'clip_values_lower', 5)
         clip_values_upper = bv.cfg_getint('mesh', 'clip_values_upper', 95)
         print("Clipping visualized values below percentile %d and above %d." % (clip_values_lower, clip_values_upper))
-        morphometry_data_live = bex.clip_data_at_percentiles(morphometry_data, lower=clip_values_lower, upper=clip_values_upper)
+        with bprof.stage('clip'):
+            if measure_data is not None:
+                clip_ranges = bvs.compute_clip_ranges(measure_data, lower=clip_values_lower, upper=clip_values_upper)
+                morphometry_data_live = np.clip(morphometry_data, clip_ranges[measure][0], clip_ranges[measure][1])
+            else:
+                morphometry_data_live = bex.clip_data_at_percentiles(morphometry_data, lower=clip_values_lower, upper=clip_values_upper)
     else:
         morphometry_data_live = morphometry_data
-    brain_mesh = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data_live, **mesh_args)
-    print("Saving brain view to image file '%s'..." % (args.outputfile))
-    mlab.savefig(args.outputfile)
+    hemi_scene = statmap = None
+    with bprof.stage('mesh'):
+        if args.threshold is not None:
+            statmap = bsm.brain_statmap_view(fig, vert_coords, faces, morphometry_data_live, abs(args.threshold), boundary_labels=boundary_labels)
+            if verbose:
+                print("Displaying statistical map thresholded at %g: %d of %d vertices colored." % (abs(args.threshold), statmap['num_supra_threshold'], vert_coords.shape[0]))
+        elif args.hemi_gap is not None:
+            hemi_scene = bhv.brain_hemisphere_view(fig, vert_coords, faces, morphometry_data_live, meta_data, boundary_labels=boundary_labels, **mesh_args)
+            offsets = bhv.set_hemisphere_gap(hemi_scene, args.hemi_gap)
+            if verbose:
+                print("Displaying hemispheres side by side with a gap of %g mm, moved along the x axis by %g (lh) and %g (rh)." % (args.hemi_gap, offsets['lh'][0], offsets['rh'][0]))
+        else:
+            brain_mesh = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data_live, boundary_labels=boundary_labels, **mesh_args)
+    session = None
+    if measure_data is not None:
+        session = bvs.create_measure_session(brain_mesh, vert_coords, faces, measure_data, clip_ranges=clip_ranges)
+        for session_measure in measures:
+            with bprof.stage('switch_measure'):
+                bvs.show_measure(session, session_measure)
+            outputfile = bvs.measure_output_file(args.outputfile, session_measure)
+            print("Saving brain view of measure %s to image file '%s'..." % (session_measure, outputfile))
+            with bprof.stage('savefig'):
+                mlab.savefig(outputfile)
+        bvs.show_measure(session, measure)
+    else:
+        print("Saving brain view to image file '%s'..." % (args.outputfile))
+        with bprof.stage('savefig'):
+            mlab.savefig(args.outputfile)
+
+    lod_num_verts = bv.cfg_getint('mesh', 'interactive_lod_num_verts', 100000)
+    # The colors of a statistical map are updated in place when the threshold changes, so it keeps the full resolution mesh.
+    if interactive and not args.full_res and statmap is None and 0 < lod_num_verts < vert_coords.shape[0]:
+        with bprof.stage('lod'):
+            if session is not None:
+                lod = bvs.set_session_lod(session, lod_num_verts)
+            elif hemi_scene is not None:
+                # Decimate each hemisphere to its share of the vertex budget.
+                hemi_lods = [blod.set_surface_lod(hemi_scene['surfaces'][lod_hemi], hemi_scene['hemispheres'][lod_hemi]['vert_coords'], hemi_scene['hemispheres'][lod_hemi]['faces'], lod_num_verts // 2, mode='mean') for lod_hemi in bhv.HEMIS]
+                lod = {'vert_coords': np.concatenate([hemi_lod['vert_coords'] for hemi_lod in hemi_lods]), 'faces': np.concatenate([hemi_lod['faces'] for hemi_lod in hemi_lods])}
+            else:
+                lod = blod.set_surface_lod(brain_mesh, vert_coords, faces, lod_num_verts, mode='mean')
+        if verbose:
+            print("Using decimated mesh with %d vertices and %d faces in the interactive window." % (lod['vert_coords'].shape[0], lod['faces'].shape[0]))
+
+    if args.profile != "":
+        report = bprof.stop_profiling_to_file(args.profile, command=sys.argv)
+        print("Profiling information written to file '%s'." % args.profile)
+        if verbose:
+            print(bprof.format_profile_report(report))
+
     if interactive:
         if verbose:
-            print("Interactive mode set, displaying brain plot in interactive window.")
+            print("Interactive mode set, displaying brain plot in interactive window. Click on the brain to print the vertex and its data value.")
+        if session is not None:
+            # Report the values of all measures, not only the one that is currently displayed.
+            report_measures = lambda vertex_index, description: print("%s: %s" % (description, ", ".join(["%s %g" % (m, measure_data[m][vertex_index]) for m in measures])))
+            bsi.add_vertex_picker(fig, vert_coords, vertex_labels=boundary_labels, label_names=boundary_label_names, callback=report_measures)
+        else:
+            # Moved hemispheres are picked at their displayed position.
+            picker_coords = vert_coords if hemi_scene is None else bhv.get_displayed_coords(hemi_scene)
+            bsi.add_vertex_picker(fig, picker_coords, morphometry_data=morphometry_data if load_morphometry_data else None, vertex_labels=boundary_labels, label_names=boundary_label_names)
+        if session is not None:
+            if verbose:
+                print("Press 'n' and 'b' to display the next and previous measure.")
+            bvs.add_measure_key_bindings(fig, session, verbose=verbose)
+        if statmap is not None:
+            if verbose:
+                print("Press ']' and '[' to raise and lower the threshold.")
+            bsm.add_statmap_key_bindings(fig, statmap, verbose=verbose)
+        if hemi_scene is not None:
+            if verbose:
+                print("Press '1' and '2' to hide or show the left and right hemisphere.")
+            bhv.add_hemisphere_key_bindings(fig, hemi_scene, verbose=verbose)
         bv.show()
 
     sys.exit(0)
@@ -0,0 +1,226 @@
+"""
+Functions to map data to colors.
+
+These functions compute RGBA colors from per-vertex data with numpy only, they do not need a scene. The same color lookup tables are used to render surfaces (see `brainview.brain_morphometry_view` and `brainview.brain_rgba_view`) and to export colored meshes (see `brainview.export_mesh_to_file`), so a mesh colored once looks the same in both.
+"""
+import numpy as np
+import matplotlib
+import matplotlib.cm
+
+DEFAULT_NUM_COLORS = 256
+
+# The lookup tables computed so far, by (colormap_name, num_colors). They are read-only, so they can be shared.
+_COLORMAP_LUTS = {}
+
+
+def _get_matplotlib_colormap(colormap_name):
+    """
+    Return the matplotlib colormap with the given name, or None if there is no such colormap.
+    """
+    try:
+        colormaps = matplotlib.colormaps
+    except AttributeError:      # matplotlib < 3.5
+        colormaps = matplotlib.cm.cmap_d
+    if colormap_name not in colormaps:
+        return None
+    return colormaps[colormap_name]
+
+
+def has_colormap(colormap_name):
+    """
+    Check whether a colormap is known.
+
+    Parameters
+    ----------
+    colormap_name: string
+        The name of a matplotlib colormap, e.g., 'viridis'.
+
+    Returns
+    -------
+    bool
+        Whether `colormap_lut` can compute a lookup table for the colormap.
+    """
+    return _get_matplotlib_colormap(colormap_name) is not None
+
+
+def colormap_lut(colormap_name, num_colors=DEFAULT_NUM_COLORS):
+    """
+    Return the color lookup table of a colormap.
+
+    The table is computed once per colormap and number of colors and cached. It is the same table Mayavi uses for colormaps of the same name.
+
+    Parameters
+    ----------
+    colormap_name: string
+        The name of a matplotlib colormap, e.g., 'viridis' or 'cool'.
+
+    num_colors: int, optional
+        The number of colors in the table. Defaults to 256.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (num_colors, 4)
+        The RGBA colors, 0..255 per channel. The array is read-only, copy it before modifying it.
+
+    Examples
+    --------
+    >>> lut = colormap_lut('viridis')
+    >>> lut[0]
+    array([ 68,   1,  84, 255], dtype=uint8)
+    """
+    key = (colormap_name, int(num_colors))
+    lut = _COLORMAP_LUTS.get(key)
+    if lut is None:
+        colormap = _get_matplotlib_colormap(colormap_name)
+        if colormap is None:
+            raise ValueError("ERROR: Unknown colormap '%s'." % colormap_name)
+        if num_colors < 1:
+            raise ValueError("ERROR: num_colors must be at least 1, but is %d." % num_colors)
+        lut = np.round(colormap(np.linspace(0.0, 1.0, num_colors)) * 255.0).astype(np.uint8)
+        lut.setflags(write=False)
+        _COLORMAP_LUTS[key] = lut
+    return lut
+
+
+def annotation_lut(label_colors):
+    """
+    Return the color lookup table of an annotation.
+
+    Parameters
+    ----------
+    label_colors: ndarray, shape (n_labels, 4) or (n_labels, 5)
+        RGBT colortable array, as returned by `brainload.annot`. The first 4 values encode the label color: RGB from 0 to 255 and the transparency T, which is defined as 255 - alpha. All other values are ignored.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (n_labels, 4)
+        The RGBA color of each label.
+    """
+    label_colors = np.asarray(label_colors)
+    lut = np.empty((label_colors.shape[0], 4), dtype=np.uint8)
+    lut[:, 0:3] = label_colors[:, 0:3]
+    lut[:, 3] = 255 - label_colors[:, 3]        # The transparency is stored in the source data, convert it to alpha.
+    return lut
+
+
+def get_data_range(data, clip_percentiles=None):
+    """
+    Compute the data values mapped to the lowest and highest color.
+
+    Parameters
+    ----------
+    data: 1D numpy array
+        The data. Values which are not finite (NaN or inf) are ignored.
+
+    clip_percentiles: tuple of 2 numbers or None, optional
+        If given, the range is limited to these lower and upper percentiles of the data. Defaults to None, which uses the minimum and maximum.
+
+    Returns
+    -------
+    tuple of 2 floats
+        The lower and upper end of the range. (0.0, 0.0) if the data contains no finite values.
+    """
+    data = np.asarray(data)
+    finite = np.isfinite(data)
+    if not np.all(finite):
+        data = data[finite]
+    if data.size == 0:
+        return (0.0, 0.0)
+    if clip_percentiles is None:
+        return (float(np.min(data)), float(np.max(data)))
+    lower, upper = np.percentile(data, clip_percentiles)
+    return (float(lower), float(upper))
+
+
+def scalars_to_lut_indices(data, data_range, num_colors=DEFAULT_NUM_COLORS):
+    """
+    Compute the index into a color lookup table for each data value.
+
+    The range is divided into num_colors bins of equal width. Values outside the range are clipped to the first or last color. This is how VTK and matplotlib map data to colors.
+
+    Parameters
+    ----------
+    data: 1D numpy array
+        The data.
+
+    data_range: tuple of 2 floats
+        The data values mapped to the first and last color.
+
+    num_colors: int, optional
+        The number of colors in the lookup table. Defaults to 256.
+
+    Returns
+    -------
+    ndarray of dtype intp, same shape as data
+        The indices. Values which are not finite get index 0.
+    """
+    lower, upper = float(data_range[0]), float(data_range[1])
+    data = np.asarray(data, dtype=np.float64)
+    if upper <= lower:
+        return np.zeros(data.shape, dtype=np.intp)
+    positions = (data - lower) / (upper - lower)
+    positions *= num_colors
+    np.clip(positions, 0, num_colors - 1, out=positions)
+    positions[np.isnan(positions)] = 0
+    return positions.astype(np.intp)
+
+
+def scalars_to_colors(data, colormap_name='viridis', data_range=None, clip_percentiles=None, threshold=None, below_threshold_color=(255, 255, 255, 255), alpha=-1, nan_color=(0, 0, 0, 0), num_colors=DEFAULT_NUM_COLORS):
+    """
+    Compute the RGBA color of each data value.
+
+    Parameters
+    ----------
+    data: 1D numpy array of shape (n_verts, )
+        The data, e.g., morphometry data.
+
+    colormap_name: string, optional
+        The name of a matplotlib colormap. Defaults to 'viridis'.
+
+    data_range: tuple of 2 floats or None, optional
+        The data values mapped to the first and last color. Values outside the range get the first or last color. Defaults to None, which computes the range from the data, see `get_data_range`.
+
+    clip_percentiles: tuple of 2 numbers or None, optional
+        Passed to `get_data_range`. Ignored if data_range is given. Defaults to None.
+
+    threshold: float or None, optional
+        If given, values whose absolute value is below the threshold get the below_threshold_color, e.g., to hide insignificant values of a statistical map. Defaults to None.
+
+    below_threshold_color: tuple of 4 ints, optional
+        The RGBA color for values below the threshold. Defaults to white. Ignored unless threshold is given.
+
+    alpha: int, optional
+        If >= 0, the alpha channel of the colors from the colormap is set to this value (0..255). Defaults to -1, which keeps the alpha of the colormap.
+
+    nan_color: tuple of 4 ints, optional
+        The RGBA color for values which are NaN. Defaults to transparent black, like matplotlib.
+
+    num_colors: int, optional
+        The number of colors of the colormap, see `colormap_lut`. Defaults to 256.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (n_verts, 4)
+        The RGBA color of each value, 0..255 per channel.
+
+    Examples
+    --------
+    Compute the colors once, then display and export them:
+
+    >>> vertex_colors = scalars_to_colors(morphometry_data, 'viridis', clip_percentiles=(5, 95))
+    >>> surface = brainview.brain_rgba_view(fig, vert_coords, faces, vertex_colors)
+    >>> brainview.export_mesh_to_file('brain.ply', vert_coords, faces, vertex_colors=vertex_colors)
+    """
+    data = np.asarray(data)
+    lut = colormap_lut(colormap_name, num_colors=num_colors)
+    if alpha >= 0:
+        lut = lut.copy()
+        lut[:, 3] = alpha
+    if data_range is None:
+        data_range = get_data_range(data, clip_percentiles=clip_percentiles)
+    vertex_colors = lut[scalars_to_lut_indices(data, data_range, num_colors=num_colors)]
+    if threshold is not None:
+        vertex_colors[np.abs(data) < threshold] = below_threshold_color
+    if np.issubdtype(data.dtype, np.floating):
+        vertex_colors[np.isnan(data)] = nan_color
+    return vertex_colors
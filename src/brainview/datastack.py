@@ -0,0 +1,255 @@
+"""
+Subject by vertex data stacks for brainview.
+
+A data stack holds the standard space morphometry data of many subjects in a single contiguous float32 matrix file with one row per subject and one column per vertex of the common subject, plus a small JSON index file that maps subject ids to rows and describes the data. The matrix file is a standard numpy `.npy` file that is memory-mapped when loaded, so getting the data of a single subject or a subset of subjects does not require reading the whole file or re-parsing the per-subject MGH files.
+"""
+from __future__ import print_function
+import os
+import json
+import numpy as np
+import brainview.groupstats as bgs
+from .profiling import stage
+
+DATA_STACK_FORMAT_VERSION = 1
+
+
+def get_index_file_name(stack_file):
+    """
+    Return the name of the index file that belongs to a data stack file.
+
+    Parameters
+    ----------
+    stack_file: string
+        Path to the data stack matrix file, usually ending with '.npy'.
+
+    Returns
+    -------
+    string
+        The path of the JSON index file. The file extension of the stack_file is replaced with '.json'.
+
+    Examples
+    --------
+    >>> get_index_file_name('/data/study1/thickness_stack.npy')
+    '/data/study1/thickness_stack.json'
+    """
+    return os.path.splitext(stack_file)[0] + '.json'
+
+
+def build_data_stack(stack_file, subjects_list, subjects_dir, measure, hemi='both', fwhm='10', average_subject='fsaverage', surf='white', num_workers=1):
+    """
+    Build a data stack file from the standard space data of many subjects.
+
+    Loads the data of the subjects one by one and writes it into a memory-mapped float32 matrix of shape (num_subjects, num_verts), so the memory usage does not depend on the number of subjects. Also writes the JSON index file, see `get_index_file_name`.
+
+    Parameters
+    ----------
+    stack_file: string
+        Path of the matrix file to write. Should end with '.npy'. Existing files are overwritten.
+
+    subjects_list: list of strings
+        The subject identifiers. Defines the order of the rows.
+
+    subjects_dir, measure, hemi, fwhm, average_subject, surf, num_workers:
+        See `brainview.groupstats.iter_subjects_standard_data`.
+
+    Returns
+    -------
+    dictionary
+        The index of the new data stack, as stored in the index file.
+
+    Examples
+    --------
+    >>> subjects_list = ['subject1', 'subject2']
+    >>> build_data_stack('thickness_stack.npy', subjects_list, '/data/study1', 'thickness')
+    """
+    if len(subjects_list) == 0:
+        raise ValueError("ERROR: No subjects given, cannot build a data stack.")
+    data = None
+    index = None
+    for row, (subject_id, morphometry_data, meta_data) in enumerate(bgs.iter_subjects_standard_data(subjects_list, subjects_dir, measure, hemi=hemi, fwhm=fwhm, average_subject=average_subject, surf=surf, num_workers=num_workers)):
+        if data is None:
+            num_verts = morphometry_data.shape[0]
+            data = np.lib.format.open_memmap(stack_file, mode='w+', dtype=np.float32, shape=(len(subjects_list), num_verts))
+            index = {'format_version': DATA_STACK_FORMAT_VERSION, 'subjects': list(subjects_list), 'num_verts': num_verts, 'measure': measure, 'hemi': hemi, 'fwhm': fwhm, 'average_subject': average_subject, 'surf': surf}
+            if hemi == 'both':
+                index['lh.num_data_points'] = int(meta_data['lh.num_data_points'])
+        elif morphometry_data.shape[0] != data.shape[1]:
+            raise ValueError("ERROR: Data of subject '%s' has %d values, but the first subject had %d. All subjects must be mapped to the same common subject." % (subject_id, morphometry_data.shape[0], data.shape[1]))
+        with stage('datastack.write'):
+            data[row, :] = morphometry_data
+    data.flush()
+    del data
+    with open(get_index_file_name(stack_file), 'w') as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    return index
+
+
+def load_data_stack(stack_file, mmap_mode='r'):
+    """
+    Load a data stack.
+
+    The matrix is memory-mapped, so this takes constant time no matter how large the stack is. The data is only read from disk when it is accessed.
+
+    Parameters
+    ----------
+    stack_file: string
+        Path of the matrix file, as given to `build_data_stack`.
+
+    mmap_mode: string or None, optional
+        Passed on to `numpy.load`. Defaults to 'r' (read-only memory map). Use None to read the whole matrix into memory.
+
+    Returns
+    -------
+    dictionary
+        The data stack, with keys `data` (the matrix of shape (num_subjects, num_verts)), `subjects` (the list of subject ids in row order), `subject_rows` (dictionary mapping subject ids to row indices) and `index` (the contents of the index file).
+    """
+    index_file_name = get_index_file_name(stack_file)
+    if not os.path.isfile(index_file_name):
+        raise ValueError("ERROR: Index file '%s' for data stack '%s' not found." % (index_file_name, stack_file))
+    with open(index_file_name) as index_file:
+        index = json.load(index_file)
+    data = np.load(stack_file, mmap_mode=mmap_mode)
+    if data.ndim != 2 or data.shape[0] != len(index['subjects']):
+        raise ValueError("ERROR: Data stack '%s' has shape %s, which does not match the %d subjects in its index file." % (stack_file, str(data.shape), len(index['subjects'])))
+    subject_rows = dict((subject_id, row) for row, subject_id in enumerate(index['subjects']))
+    return {'data': data, 'subjects': index['subjects'], 'subject_rows': subject_rows, 'index': index}
+
+
+def get_hemi_slice(stack, hemi):
+    """
+    Return the slice of the vertex columns that belong to a hemisphere.
+
+    Parameters
+    ----------
+    stack: dictionary
+        A data stack, as returned by `load_data_stack`.
+
+    hemi: string
+        One of 'lh', 'rh' or 'both'. Must be the hemisphere of the stack, or one of the hemispheres of a stack for both hemispheres.
+
+    Returns
+    -------
+    slice
+        The column slice.
+    """
+    stack_hemi = stack['index']['hemi']
+    if hemi == stack_hemi:
+        return slice(None)
+    if stack_hemi == 'both' and hemi in ('lh', 'rh'):
+        num_lh = stack['index']['lh.num_data_points']
+        return slice(0, num_lh) if hemi == 'lh' else slice(num_lh, None)
+    raise ValueError("ERROR: Cannot get data for hemisphere '%s' from a data stack for hemisphere '%s'." % (hemi, stack_hemi))
+
+
+def get_subject_data(stack, subject_id, hemi=None):
+    """
+    Get the data of a single subject from a data stack.
+
+    Parameters
+    ----------
+    stack: dictionary
+        A data stack, as returned by `load_data_stack`.
+
+    subject_id: string
+        The subject identifier.
+
+    hemi: string or None, optional
+        If given, only the data of this hemisphere is returned, see `get_hemi_slice`. Defaults to None, which returns the data for all vertices in the stack.
+
+    Returns
+    -------
+    numpy 1D float32 array
+        The data of the subject. This is a read-only view into the memory-mapped stack, copy it if you need to modify it.
+    """
+    if subject_id not in stack['subject_rows']:
+        raise ValueError("ERROR: Subject '%s' not found in data stack." % subject_id)
+    row = stack['data'][stack['subject_rows'][subject_id]]
+    if hemi is not None:
+        row = row[get_hemi_slice(stack, hemi)]
+    return row
+
+
+def get_subjects_data(stack, subjects_list):
+    """
+    Get the data of a subset of subjects from a data stack.
+
+    Parameters
+    ----------
+    stack: dictionary
+        A data stack, as returned by `load_data_stack`.
+
+    subjects_list: list of strings
+        The subject identifiers.
+
+    Returns
+    -------
+    numpy 2D float32 array of shape (len(subjects_list), num_verts)
+        The data of the subjects, in the given order. This is a copy.
+    """
+    missing = [subject_id for subject_id in subjects_list if subject_id not in stack['subject_rows']]
+    if missing:
+        raise ValueError("ERROR: Subjects not found in data stack: %s." % ", ".join(missing))
+    rows = np.array([stack['subject_rows'][subject_id] for subject_id in subjects_list], dtype=np.int64)
+    return stack['data'][rows]
+
+
+def get_vertex_data(stack, vertex_index):
+    """
+    Get the data of all subjects at a single vertex from a data stack.
+
+    Parameters
+    ----------
+    stack: dictionary
+        A data stack, as returned by `load_data_stack`.
+
+    vertex_index: int or array-like of ints
+        The vertex index or indices, i.e., the column(s) of the stack.
+
+    Returns
+    -------
+    numpy float32 array
+        The values of all subjects, in the row order of the stack. 1D of length num_subjects for a single vertex index, 2D of shape (num_subjects, num_indices) otherwise.
+    """
+    return np.array(stack['data'][:, vertex_index])
+
+
+def iter_stack_rows(stack, subjects_list=None, chunk_size=64):
+    """
+    Iterate over the subject rows of a data stack.
+
+    Reads the stack in chunks of consecutive rows, so that a file that does not fit into memory can be processed sequentially. Can be used as the data_iter for `brainview.groupstats.accumulate_group_stats`.
+
+    Parameters
+    ----------
+    stack: dictionary
+        A data stack, as returned by `load_data_stack`.
+
+    subjects_list: list of strings or None, optional
+        If given, only the rows of these subjects are returned, in the given order. Defaults to None, which returns all rows in stack order.
+
+    chunk_size: int, optional
+        The number of rows to read at once. Defaults to 64.
+
+    Yields
+    ------
+    numpy 1D float32 array
+        The data of one subject.
+
+    Examples
+    --------
+    >>> stack = load_data_stack('thickness_stack.npy')
+    >>> maps = bgs.accumulate_group_stats(iter_stack_rows(stack), quantiles=[0.5])
+    """
+    data = stack['data']
+    if subjects_list is None:
+        for start in range(0, data.shape[0], chunk_size):
+            with stage('datastack.read'):
+                chunk = np.array(data[start:start + chunk_size])
+            for row in chunk:
+                yield row
+    else:
+        for start in range(0, len(subjects_list), chunk_size):
+            with stage('datastack.read'):
+                chunk = get_subjects_data(stack, subjects_list[start:start + chunk_size])
+            for row in chunk:
+                yield row
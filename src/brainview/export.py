@@ -1,15 +1,18 @@
 """
 Export functions for brainview.
 
-These functions allow one to export brain meshes, e.g., for loading into standard 3D modeling software.
+These functions allow one to export brain meshes, e.g., for loading into standard 3D modeling software, and 2D projections of them, e.g., lateral and medial snapshots or flat maps for publications.
 """
 
 
 import brainload as bl
 import os
+import weakref
 import matplotlib
-import brainload.meshexport as me
 import numpy as np
+from .profiling import stage
+from .topology import parcel_boundaries, _get_topology_cache
+from .colors import scalars_to_colors, annotation_lut
 
 
 def clip_data_at_percentiles(data, lower=5, upper=95):
@@ -38,48 +41,315 @@ def clip_data_at_percentiles(data, lower=5, upper=95):
     --------
     >>> clipped_data = clip_data_at_percentiles(raw_data)
     """
-    return np.clip(data, np.percentile(data, lower), np.percentile(data, upper))
+    # Python floats as bounds keep float32 data in float32.
+    return np.clip(data, float(np.percentile(data, lower)), float(np.percentile(data, upper)))
 
 
-def export_mesh_to_file(filename, vertex_coords, faces, morphometry_data=None, colormap_name='viridis', colormap_adjust_alpha_to=-1, clip_data_perc=None):
+def as_float_data(data):
+    """
+    Return per-vertex data as a float array, without a copy if it already is one.
+
+    Float32 data, like the morphometry data loaded by brainload, stays float32, so it needs half the memory of a float64 copy. Other data, e.g., integer data, is converted to float64.
+
+    Parameters
+    ----------
+    data: numpy 1D array
+        The data.
+
+    Returns
+    -------
+    numpy 1D float array
+        The data, or a float64 copy of it.
+
+    Examples
+    --------
+    >>> morphometry_data = as_float_data(morphometry_data)
+    """
+    data = np.asarray(data)
+    if data.dtype in (np.float32, np.float64):
+        return data
+    return data.astype(np.float64)
+
+
+def export_mesh_to_file(filename, vertex_coords, faces, morphometry_data=None, colormap_name='viridis', colormap_adjust_alpha_to=-1, clip_data_perc=None, vertex_colors=None, boundary_vertices=None, boundary_color=(0, 0, 0, 255)):
+    """
+    Export a mesh to a file.
+
+    Export a mesh, optionally with per-vertex colors, to a file in a standard mesh format. The format is determined from the file extension, see `_mesh_export_format_from_filename`. Vertex colors are only supported by the PLY format, they are ignored for OBJ.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the output file. The extension determines the format: '.ply' or '.obj'. Defaults to OBJ for unknown extensions.
+
+    vertex_coords: 2D numpy array of shape (n_verts, 3)
+        The vertex coordinates.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        The faces, as indices into vertex_coords.
+
+    morphometry_data: 1D numpy array of shape (n_verts, ) or None, optional
+        Data that is mapped to vertex colors using the colormap. Ignored if vertex_colors is given. Defaults to None.
+
+    colormap_name: string, optional
+        The name of the matplotlib colormap used to map the morphometry_data to colors. Defaults to 'viridis'.
+
+    colormap_adjust_alpha_to: int, optional
+        If >= 0, the alpha channel of the computed colors is set to this value (0..255). Defaults to -1, which leaves alpha unchanged.
+
+    clip_data_perc: pair of ints or None, optional
+        If given, the morphometry_data is clipped at these lower and upper percentiles before it is mapped to colors. Defaults to None.
+
+    vertex_colors: 2D numpy array of shape (n_verts, 4) or None, optional
+        Precomputed RGBA colors (0..255 per channel) for the vertices, e.g., from `atlas_vertex_colors` or `label_vertex_colors`. If given, these are exported instead of colors computed from the morphometry_data. Defaults to None.
+
+    boundary_vertices: 1D numpy bool array of shape (n_verts, ) or None, optional
+        If given, the vertices for which this is True are exported with the boundary_color, e.g., to show the borders of atlas regions computed with `brainview.topology.parcel_boundaries`. Only supported by the PLY format. Defaults to None.
+
+    boundary_color: tuple of 4 ints, optional
+        The RGBA color for boundary vertices. Defaults to black. Ignored unless boundary_vertices is given.
+
+    Examples
+    --------
+    Export an atlas with its colors, without rendering it first:
+
+    >>> vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', subjects_dir, 'aparc')
+    >>> vertex_colors = atlas_vertex_colors(vertex_labels, label_colors)
+    >>> export_mesh_to_file('atlas.ply', vert_coords, faces, vertex_colors=vertex_colors)
+    """
     export_format, matched = _mesh_export_format_from_filename(filename)
-    if clip_data_perc is not None:
-        morphometry_data = clip_data_at_percentiles(morphometry_data, clip_data_perc[0], clip_data_perc[1])
-    export_string = _get_export_string(export_format, vertex_coords, faces, morphometry_data, colormap_name, colormap_adjust_alpha_to)
+    if clip_data_perc is not None and vertex_colors is None:
+        with stage('export.clip'):
+            morphometry_data = clip_data_at_percentiles(morphometry_data, clip_data_perc[0], clip_data_perc[1])
+    with stage('export.format'):
+        export_string = _get_export_string(export_format, vertex_coords, faces, morphometry_data, colormap_name, colormap_adjust_alpha_to, vertex_colors=vertex_colors, boundary_vertices=boundary_vertices, boundary_color=boundary_color)
 
-    with open(filename, "w") as text_file:
-        text_file.write(export_string)
+    with stage('export.write'):
+        with open(filename, "w") as text_file:
+            text_file.write(export_string)
 
 
-def _get_export_string(export_format, vertex_coords, faces, morphometry_data, colormap_name, colormap_adjust_alpha_to):
+def _get_export_string(export_format, vertex_coords, faces, morphometry_data, colormap_name, colormap_adjust_alpha_to, vertex_colors=None, boundary_vertices=None, boundary_color=(0, 0, 0, 255)):
     if export_format not in ('obj', 'ply'):
         raise ValueError("ERROR: export_format must be one of {'obj', 'ply'} but is '%s'." % export_format)
 
     if export_format == 'obj':
         return bl.mesh_to_obj(vertex_coords, faces)
     else:
-        vertex_colors = _get_vertex_colors(morphometry_data, colormap_name, colormap_adjust_alpha_to)
+        if vertex_colors is None:
+            vertex_colors = _get_vertex_colors(morphometry_data, colormap_name, colormap_adjust_alpha_to)
+        if boundary_vertices is not None:
+            if vertex_colors is None:
+                vertex_colors = np.full((vertex_coords.shape[0], 4), 255, dtype=np.uint8)
+            vertex_colors = mark_boundary_vertex_colors(vertex_colors, boundary_vertices, boundary_color=boundary_color)
         return bl.mesh_to_ply(vertex_coords, faces, vertex_colors=vertex_colors)
 
 
+def atlas_vertex_colors(vertex_labels, label_colors, unlabeled_color=(255, 255, 255, 255)):
+    """
+    Compute per-vertex colors from an annotation.
+
+    Compute the RGBA color of each vertex from the label it belongs to and the color table of an annotation (brain atlas). This is a single lookup into a color table, it does not require a scene or a colormap.
+
+    Parameters
+    ----------
+    vertex_labels: ndarray, shape (n_vertices,)
+        The index into label_colors for each vertex, -1 for vertices without a label. This is what `brainload.annot` returns with `orig_ids=False`.
+
+    label_colors: ndarray, shape (n_labels, 4) or (n_labels, 5)
+        RGBT colortable array. The first 4 values encode the label color: RGB from 0 to 255 and the transparency T, which is defined as 255 - alpha. All other values are ignored.
+
+    unlabeled_color: tuple of 4 ints, optional
+        The RGBA color to use for vertices without a label. Defaults to white.
+
+    Returns
+    -------
+    ndarray, shape (n_vertices, 4), dtype uint8
+        The RGBA color of each vertex.
+
+    Examples
+    --------
+    >>> vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', subjects_dir, 'aparc')
+    >>> vertex_colors = atlas_vertex_colors(vertex_labels, label_colors)
+    """
+    label_colors = np.asarray(label_colors)
+    vertex_labels = np.asarray(vertex_labels)
+    num_labels = label_colors.shape[0]
+    if vertex_labels.size > 0 and (vertex_labels.min() < -1 or vertex_labels.max() >= num_labels):
+        raise ValueError("ERROR: vertex_labels must be in range -1..%d for %d labels, but range is %d..%d." % (num_labels - 1, num_labels, vertex_labels.min(), vertex_labels.max()))
+    # The color for unlabeled vertices goes into the last row, so the label -1 selects it.
+    lut = np.empty((num_labels + 1, 4), dtype=np.uint8)
+    lut[:num_labels] = annotation_lut(label_colors)
+    lut[num_labels] = unlabeled_color
+    return lut[vertex_labels]
+
+
+def label_vertex_colors(num_verts, verts_in_label, label_color=(255, 0, 0, 255), background_color=(255, 255, 255, 255)):
+    """
+    Compute per-vertex colors for a label.
+
+    Parameters
+    ----------
+    num_verts: int
+        The total number of vertices of the mesh.
+
+    verts_in_label: ndarray, shape (m_vertices,)
+        The indices of all vertices which are part of the label.
+
+    label_color: tuple of 4 ints, optional
+        The RGBA color for vertices in the label. Defaults to red.
+
+    background_color: tuple of 4 ints, optional
+        The RGBA color for all other vertices. Defaults to white.
+
+    Returns
+    -------
+    ndarray, shape (n_vertices, 4), dtype uint8
+        The RGBA color of each vertex.
+    """
+    lut = np.array([background_color, label_color], dtype=np.uint8)
+    in_label = np.zeros((num_verts, ), dtype=np.uint8)
+    in_label[verts_in_label] = 1
+    return lut[in_label]
+
+
+def mark_boundary_vertex_colors(vertex_colors, boundary_vertices, boundary_color=(0, 0, 0, 255)):
+    """
+    Set the color of boundary vertices.
+
+    Parameters
+    ----------
+    vertex_colors: ndarray, shape (n_vertices, 4)
+        The RGBA color of each vertex.
+
+    boundary_vertices: ndarray of bools, shape (n_vertices,)
+        Whether each vertex is a boundary vertex, see `brainview.topology.parcel_boundaries`.
+
+    boundary_color: tuple of 4 ints, optional
+        The RGBA color for boundary vertices. Defaults to black.
+
+    Returns
+    -------
+    ndarray, shape (n_vertices, 4)
+        A copy of the vertex_colors with the boundary vertices set to the boundary_color.
+
+    Examples
+    --------
+    >>> boundary_vertices, boundary_edges = parcel_boundaries(faces, vertex_labels)
+    >>> vertex_colors = mark_boundary_vertex_colors(atlas_vertex_colors(vertex_labels, label_colors), boundary_vertices)
+    """
+    vertex_colors = np.array(vertex_colors)
+    vertex_colors[np.asarray(boundary_vertices, dtype=bool)] = boundary_color
+    return vertex_colors
+
+
+def load_export_data(subject_id, subjects_dir, mode, data, hemi='both', surf='white', common_subject_mode=False, fwhm='10', average_subject='fsaverage', clip_percentiles=None, boundaries=False, colormap_name='viridis', colormap_adjust_alpha_to=-1, mesh=None):
+    """
+    Load the mesh and colors of a subject for export.
+
+    Loads everything that is needed to export the mesh of a subject colored by morphometry data, an atlas or a label. Nothing is rendered.
+
+    Parameters
+    ----------
+    subject_id: string
+        The subject identifier.
+
+    subjects_dir: string
+        The directory containing the subjects.
+
+    mode: string
+        What to color the mesh by. One of ('morphometry', 'atlas', 'label').
+
+    data: string
+        The measure, atlas or label name, depending on the mode. E.g., 'thickness', 'aparc' or 'cortex'.
+
+    hemi, surf: string, optional
+        The hemisphere and surface. Default to 'both' and 'white'.
+
+    common_subject_mode: bool, optional
+        Whether to load the morphometry data mapped to the average subject, on the surface of the average subject. Ignored unless mode is 'morphometry'. Defaults to False.
+
+    fwhm, average_subject: optional
+        The smoothing setting and the average subject for common subject mode. Ignored otherwise.
+
+    clip_percentiles: tuple of 2 numbers or None, optional
+        The morphometry data is clipped at these percentiles. Defaults to None, which disables clipping.
+
+    boundaries: bool, optional
+        Whether to mark the borders between the atlas regions. Ignored unless mode is 'atlas'. Defaults to False.
+
+    colormap_name, colormap_adjust_alpha_to: optional
+        See `export_mesh_to_file`.
+
+    mesh: tuple or None, optional
+        The vertex coordinates, faces and meta data of the surface, as returned by `brainload.subject` with `load_morphometry_data=False`. This is the surface of the average subject in common subject mode. Pass it to reuse an already loaded mesh. Defaults to None, which loads the mesh.
+
+    Returns
+    -------
+    vertex_coords: 2D numpy array of shape (n_verts, 3)
+        The vertex coordinates.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        The faces.
+
+    export_args: dictionary
+        The keyword arguments for `export_mesh_to_file`.
+
+    Examples
+    --------
+    >>> vert_coords, faces, export_args = load_export_data('subject1', subjects_dir, 'atlas', 'aparc', boundaries=True)
+    >>> export_mesh_to_file('/tmp/subject1_aparc.ply', vert_coords, faces, **export_args)
+    """
+    common_subject_mode = common_subject_mode and mode == 'morphometry'
+    if mesh is None:
+        with stage('export.load_mesh'):
+            vertex_coords, faces, _, meta_data = bl.subject(average_subject if common_subject_mode else subject_id, subjects_dir=subjects_dir, surf=surf, hemi=hemi, load_morphometry_data=False)
+    else:
+        vertex_coords, faces, meta_data = mesh
+
+    if mode == 'morphometry':
+        with stage('export.load_data'):
+            if common_subject_mode:
+                morphometry_data = bl.subject_data_standard(subject_id, subjects_dir, data, hemi, fwhm, average_subject=average_subject, surf=surf)[0]
+            else:
+                morphometry_data = bl.subject_data_native(subject_id, subjects_dir, data, hemi, surf=surf)[0]
+        if clip_percentiles is not None:
+            morphometry_data = clip_data_at_percentiles(morphometry_data, lower=clip_percentiles[0], upper=clip_percentiles[1])
+        return vertex_coords, faces, {'morphometry_data': morphometry_data, 'colormap_name': colormap_name, 'colormap_adjust_alpha_to': colormap_adjust_alpha_to}
+
+    if mode == 'atlas':
+        with stage('export.load_data'):
+            vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot(subject_id, subjects_dir, data, hemi=hemi, orig_ids=False)
+        export_args = {'vertex_colors': atlas_vertex_colors(vertex_labels, label_colors)}
+        if boundaries:
+            export_args['boundary_vertices'] = parcel_boundaries(faces, vertex_labels)[0]
+        return vertex_coords, faces, export_args
+
+    if mode == 'label':
+        with stage('export.load_data'):
+            # Copy the meta data, brainload adds the label information to it and the mesh may be shared.
+            verts_in_label, label_meta_data = bl.label(subject_id, subjects_dir, data, hemi=hemi, meta_data=dict(meta_data))
+        return vertex_coords, faces, {'vertex_colors': label_vertex_colors(vertex_coords.shape[0], verts_in_label)}
+
+    raise ValueError("ERROR: mode must be one of ('morphometry', 'atlas', 'label'), but is '%s'." % mode)
+
+
 def _get_vertex_colors(morphometry_data, colormap_name, colormap_adjust_alpha_to):
     """
     Determine vertex colors based on the data.
 
-    Determine vertex colors based on the data. Note that is can happen that None is returned if the data does not contain the information required to determine vertex colors.
+    Determine vertex colors based on the data, see `brainview.colors.scalars_to_colors`. Note that is can happen that None is returned if the data does not contain the information required to determine vertex colors.
 
     Returns
     -------
     numpy array or None
-        The vertex colors. If a color array is returned, it has dimensions (n, 4) if the given morphometry_data had length n. The 4 values per data point represent an RGBA color.
+        The vertex colors. If a color array is returned, it has dimensions (n, 4) and dtype uint8 if the given morphometry_data had length n. The 4 values per data point represent an RGBA color.
     """
     if morphometry_data is None or colormap_name is None:
         return None
     else:
-        vertex_colors = me.scalars_to_colors_matplotlib(morphometry_data, colormap_name)
-        if colormap_adjust_alpha_to >= 0:
-            vertex_colors[:,3] = colormap_adjust_alpha_to
-        return vertex_colors
+        with stage('export.colors'):
+            return scalars_to_colors(morphometry_data, colormap_name, alpha=colormap_adjust_alpha_to)
 
 
 
@@ -108,3 +378,260 @@ def _mesh_export_format_from_filename(filename):
         return 'obj', True
     else:
         return 'obj', False
+
+
+# The orthographic projections, by view: the direction the camera looks in and the up direction of the image, for the left hemisphere. For the right hemisphere, the lateral and medial views are swapped.
+_PROJECTION_VIEWS = {'lateral': ((1.0, 0.0, 0.0), (0.0, 0.0, 1.0)), 'medial': ((-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)), 'dorsal': ((0.0, 0.0, -1.0), (0.0, 1.0, 0.0)), 'ventral': ((0.0, 0.0, 1.0), (0.0, 1.0, 0.0)), 'anterior': ((0.0, -1.0, 0.0), (0.0, 0.0, 1.0)), 'posterior': ((0.0, 1.0, 0.0), (0.0, 0.0, 1.0))}
+
+PROJECTIONS = ('lateral', 'medial', 'dorsal', 'ventral', 'anterior', 'posterior', 'spherical')
+
+
+def project_mesh(vertex_coords, faces, projection='lateral', hemi='lh', num_lh_verts=None, hemi_gap=0.1):
+    """
+    Compute a 2D projection of a mesh.
+
+    The orthographic projections show the mesh as seen from one side, like a snapshot of the view with the same name. The 'spherical' projection flattens the mesh: each vertex is mapped to its longitude and latitude as seen from the center of the hemisphere, so the whole surface is visible in one map, with the lateral side in the middle and the cut along the medial side. It works best on the sphere or inflated surface, but does not require the sphere. Faces that cross the cut are removed.
+
+    Parameters
+    ----------
+    vertex_coords: 2D numpy array of shape (n_verts, 3)
+        The vertex coordinates.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        The faces.
+
+    projection: string, optional
+        One of the `PROJECTIONS`: ('lateral', 'medial', 'dorsal', 'ventral', 'anterior', 'posterior', 'spherical'). Defaults to 'lateral'.
+
+    hemi: string, optional
+        The hemisphere of the mesh, one of ('lh', 'rh', 'both'). Determines which side is lateral. For 'both', the hemispheres are projected separately and placed next to each other, the left hemisphere on the left. Defaults to 'lh'.
+
+    num_lh_verts: int or None, optional
+        The number of vertices of the left hemisphere, which come first in the mesh. Required if hemi is 'both', ignored otherwise. This is the 'lh.num_vertices' entry of the meta data returned by `brainload.subject`.
+
+    hemi_gap: float, optional
+        The gap between the hemispheres if hemi is 'both', relative to the width of the left hemisphere. Defaults to 0.1.
+
+    Returns
+    -------
+    dictionary
+        The projection, with the keys 'projection', 'hemi', 'coords' (2D numpy float array of shape (n_verts, 2), the position of each vertex in the image, x to the right and y up), 'depth' (1D numpy float array of shape (n_verts, ), the distance of each vertex from the viewer, all zeros for the spherical projection) and 'faces' (the faces to draw, ordered from back to front).
+
+    Examples
+    --------
+    >>> vert_coords, faces, _, meta_data = bl.subject('fsaverage', subjects_dir=subjects_dir, surf='inflated', load_morphometry_data=False)
+    >>> projection = project_mesh(vert_coords, faces, 'lateral', hemi='both', num_lh_verts=meta_data['lh.num_vertices'])
+    """
+    if projection not in PROJECTIONS:
+        raise ValueError("ERROR: projection must be one of %s, but is '%s'." % (str(PROJECTIONS), projection))
+    if hemi not in ('lh', 'rh', 'both'):
+        raise ValueError("ERROR: hemi must be one of ('lh', 'rh', 'both'), but is '%s'." % hemi)
+    vertex_coords = np.asarray(vertex_coords, dtype=np.float64)
+    faces = np.asarray(faces)
+    num_verts = vertex_coords.shape[0]
+    with stage('export.project'):
+        coords = np.zeros((num_verts, 2))
+        depth = np.zeros((num_verts, ))
+        keep_faces = np.ones((faces.shape[0], ), dtype=bool)
+        if hemi == 'both':
+            if num_lh_verts is None:
+                raise ValueError("ERROR: num_lh_verts is required for hemi 'both'.")
+            hemi_verts = {'lh': np.arange(0, num_lh_verts), 'rh': np.arange(num_lh_verts, num_verts)}
+        else:
+            hemi_verts = {hemi: np.arange(num_verts)}
+        for mesh_hemi in ('lh', 'rh'):
+            if mesh_hemi not in hemi_verts or hemi_verts[mesh_hemi].size == 0:
+                continue
+            verts = hemi_verts[mesh_hemi]
+            if projection == 'spherical':
+                coords[verts], radius = _spherical_projection(vertex_coords[verts], mesh_hemi)
+                # Remove the faces that cross the cut, they would span the whole map.
+                hemi_faces = (faces[:, 0] >= verts[0]) & (faces[:, 0] <= verts[-1])
+                face_width = np.ptp(coords[faces, 0], axis=1)
+                keep_faces[hemi_faces & (face_width > np.pi * radius)] = False
+            else:
+                coords[verts], depth[verts] = _orthographic_projection(vertex_coords[verts], projection, mesh_hemi)
+        if hemi == 'both' and hemi_verts['lh'].size > 0 and hemi_verts['rh'].size > 0:
+            lh_coords, rh_coords = coords[hemi_verts['lh']], coords[hemi_verts['rh']]
+            lh_width = np.ptp(lh_coords[:, 0])
+            coords[hemi_verts['rh'], 0] += lh_coords[:, 0].max() + hemi_gap * lh_width - rh_coords[:, 0].min()
+        kept_faces = faces[keep_faces]
+        # Draw the faces far from the viewer first, so the ones in front cover them (painter's algorithm).
+        face_order = np.argsort(-depth[kept_faces].mean(axis=1), kind='mergesort')
+    return {'projection': projection, 'hemi': hemi, 'coords': coords, 'depth': depth, 'faces': kept_faces[face_order]}
+
+
+def get_mesh_projection(vertex_coords, faces, projection='lateral', hemi='lh', num_lh_verts=None, hemi_gap=0.1):
+    """
+    Get a 2D projection of a mesh, using the cache if possible.
+
+    Like `project_mesh`, but the result is cached per mesh (i.e., per pair of vertex_coords and faces arrays) and projection settings. The projection does not depend on the data displayed on the mesh, so it is computed once and reused for all measures, atlases and subjects on the same template mesh, e.g., fsaverage. The arrays must not be modified in place after they have been used with this function, otherwise the cached projection is outdated.
+
+    Parameters
+    ----------
+    vertex_coords, faces, projection, hemi, num_lh_verts, hemi_gap:
+        See `project_mesh`.
+
+    Returns
+    -------
+    dictionary
+        The projection, see `project_mesh`.
+    """
+    cache = _get_topology_cache(faces)
+    key = ('projection', id(vertex_coords), projection, hemi, num_lh_verts, hemi_gap)
+    entry = cache.get(key)
+    if entry is not None and entry[0]() is vertex_coords:
+        return entry[1]
+    projected = project_mesh(vertex_coords, faces, projection=projection, hemi=hemi, num_lh_verts=num_lh_verts, hemi_gap=hemi_gap)
+    try:
+        cache[key] = (weakref.ref(vertex_coords), projected)
+    except TypeError:
+        pass        # Not weak-referencable, do not cache.
+    return projected
+
+
+def _orthographic_projection(vertex_coords, view, hemi):
+    """
+    Project vertices orthographically onto the image plane of a view. Returns the 2D coordinates and the depth of the vertices.
+    """
+    if hemi == 'rh' and view in ('lateral', 'medial'):
+        view = 'medial' if view == 'lateral' else 'lateral'
+    view_direction, up = _PROJECTION_VIEWS[view]
+    right = np.cross(view_direction, up)
+    return np.column_stack((vertex_coords.dot(right), vertex_coords.dot(up))), vertex_coords.dot(view_direction)
+
+
+def _spherical_projection(vertex_coords, hemi):
+    """
+    Map vertices to longitude and latitude around the center of a hemisphere, scaled by its mean radius. Returns the 2D coordinates and the radius.
+    """
+    relative_coords = vertex_coords - vertex_coords.mean(axis=0)
+    distance = np.sqrt(np.sum(relative_coords ** 2, axis=1))
+    radius = float(distance.mean()) if distance.size > 0 else 1.0
+    # The longitude is 0 on the lateral side and increases towards anterior, like in the lateral view.
+    lateral_sign = -1.0 if hemi == 'lh' else 1.0
+    longitude = np.arctan2(relative_coords[:, 1], lateral_sign * relative_coords[:, 0])
+    latitude = np.arcsin(np.clip(relative_coords[:, 2] / np.maximum(distance, 1e-12), -1.0, 1.0))
+    return np.column_stack((lateral_sign * longitude * radius, latitude * radius)), radius
+
+
+def export_projection_to_file(filename, projected, morphometry_data=None, colormap_name='viridis', colormap_adjust_alpha_to=-1, clip_data_perc=None, vertex_colors=None, boundary_vertices=None, boundary_color=(0, 0, 0, 255), size=(800, 600), background_color=(255, 255, 255, 255), face_color_mode='mean'):
+    """
+    Export a 2D projection of a mesh to a file.
+
+    The format is determined from the file extension. For '.ply' and '.obj', the projection is written as a flat mesh with the 2D coordinates in x and y and z set to 0, with all faces. For '.png', an image of the projection is drawn with matplotlib, which does not need a graphics stack. For '.svg' and '.pdf', only the visible faces are written as vector graphics, with adjacent faces of the same color merged, see `brainview.vectorexport.export_vector_graphics`.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the output file. The extension determines the format: '.ply', '.obj', '.png', '.svg' or '.pdf'.
+
+    projected: dictionary
+        The projection, as returned by `get_mesh_projection` or `project_mesh`.
+
+    morphometry_data, colormap_name, colormap_adjust_alpha_to, clip_data_perc, vertex_colors, boundary_vertices, boundary_color: optional
+        The colors, see `export_mesh_to_file`. If neither morphometry_data nor vertex_colors is given, the mesh is drawn in light gray.
+
+    size: tuple of 2 ints, optional
+        The width and height of images in pixels. Ignored for mesh formats. Defaults to (800, 600).
+
+    background_color: tuple of 4 ints, optional
+        The RGBA background color of images. Ignored for mesh formats. Defaults to white.
+
+    face_color_mode: string, optional
+        How the color of each face in an image is computed from the colors of its vertices, see `projection_face_colors`. Ignored for mesh formats. Defaults to 'mean'.
+
+    Examples
+    --------
+    Export the lateral views of several measures, the projection is computed only once:
+
+    >>> for measure in ['thickness', 'area']:
+    ...     morphometry_data, _ = bl.subject_data_standard(subject_id, subjects_dir, measure, 'both', '10')
+    ...     projected = get_mesh_projection(vert_coords, faces, 'lateral', hemi='both', num_lh_verts=meta_data['lh.num_vertices'])
+    ...     export_projection_to_file('%s_lateral.png' % measure, projected, morphometry_data=morphometry_data)
+    """
+    export_format = os.path.splitext(filename)[1].lower().lstrip('.')
+    if export_format in ('ply', 'obj'):
+        flat_coords = np.column_stack((projected['coords'], np.zeros((projected['coords'].shape[0], ))))
+        export_mesh_to_file(filename, flat_coords, projected['faces'], morphometry_data=morphometry_data, colormap_name=colormap_name, colormap_adjust_alpha_to=colormap_adjust_alpha_to, clip_data_perc=clip_data_perc, vertex_colors=vertex_colors, boundary_vertices=boundary_vertices, boundary_color=boundary_color)
+        return
+    if export_format in ('svg', 'pdf'):
+        from .vectorexport import export_vector_graphics
+        export_vector_graphics(filename, projected, morphometry_data=morphometry_data, colormap_name=colormap_name, colormap_adjust_alpha_to=colormap_adjust_alpha_to, clip_data_perc=clip_data_perc, vertex_colors=vertex_colors, boundary_vertices=boundary_vertices, boundary_color=boundary_color, size=size, background_color=background_color, face_color_mode=face_color_mode)
+        return
+    if export_format != 'png':
+        raise ValueError("ERROR: The file extension of a projection must be one of ('.ply', '.obj', '.png', '.svg', '.pdf'), but file name is '%s'." % filename)
+
+    if vertex_colors is None and morphometry_data is not None:
+        if clip_data_perc is not None:
+            morphometry_data = clip_data_at_percentiles(morphometry_data, clip_data_perc[0], clip_data_perc[1])
+        vertex_colors = _get_vertex_colors(morphometry_data, colormap_name, colormap_adjust_alpha_to)
+    if vertex_colors is None:
+        vertex_colors = np.full((projected['coords'].shape[0], 4), 200, dtype=np.uint8)
+        vertex_colors[:, 3] = 255
+    if boundary_vertices is not None:
+        vertex_colors = mark_boundary_vertex_colors(vertex_colors, boundary_vertices, boundary_color=boundary_color)
+    with stage('export.colors'):
+        face_colors = projection_face_colors(projected, vertex_colors, mode=face_color_mode)
+    with stage('export.draw'):
+        _draw_projection(filename, projected['coords'], projected['faces'], face_colors, size, background_color)
+
+
+def projection_face_colors(projected, vertex_colors, mode='mean'):
+    """
+    Compute the color of each face of a projection from the colors of its vertices.
+
+    Parameters
+    ----------
+    projected: dictionary
+        The projection, see `project_mesh`.
+
+    vertex_colors: 2D numpy array of shape (n_verts, 4)
+        The RGBA color of each vertex, 0..255 per channel.
+
+    mode: string, optional
+        One of ('mean', 'majority'). With 'mean', each face gets the mean color of its vertices. With 'majority', it gets the color of at least 2 of its vertices, or of its first vertex if all 3 differ, so there are no mixed colors on the borders of atlas regions. Defaults to 'mean'.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (n_faces, 4)
+        The color of each face, in the order of the faces of the projection.
+    """
+    vertex_colors = np.asarray(vertex_colors)
+    if vertex_colors.shape != (projected['coords'].shape[0], 4):
+        raise ValueError("ERROR: vertex_colors must have shape (%d, 4), but has shape %s." % (projected['coords'].shape[0], str(vertex_colors.shape)))
+    if mode == 'mean':
+        return np.round(vertex_colors[projected['faces']].mean(axis=1, dtype=np.float64)).astype(np.uint8)
+    if mode == 'majority':
+        corner_colors = vertex_colors[projected['faces']]
+        face_colors = corner_colors[:, 0].astype(np.uint8)
+        second_and_third_agree = np.all(corner_colors[:, 1] == corner_colors[:, 2], axis=1) & np.any(corner_colors[:, 0] != corner_colors[:, 1], axis=1)
+        face_colors[second_and_third_agree] = corner_colors[second_and_third_agree, 1]
+        return face_colors
+    raise ValueError("ERROR: mode must be one of ('mean', 'majority'), but is '%s'." % mode)
+
+
+def _draw_projection(filename, coords, faces, face_colors, size, background_color):
+    """
+    Draw the faces of a projection with matplotlib and save the image. The faces are drawn in the given order.
+    """
+    # Use the figure and canvas classes directly, so no GUI backend is needed and the pyplot state is not touched.
+    import matplotlib.figure
+    import matplotlib.collections
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    dpi = 100.0
+    fig = matplotlib.figure.Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    background = tuple(np.asarray(background_color, dtype=np.float64) / 255.0)
+    fig.patch.set_facecolor(background)
+    ax = fig.add_axes([0.0, 0.0, 1.0, 1.0])
+    ax.set_axis_off()
+    ax.set_aspect('equal')
+    face_rgba = face_colors / 255.0
+    # Draw the edges in the face color, otherwise the antialiased faces leave visible gaps between them.
+    collection = matplotlib.collections.PolyCollection(coords[faces], facecolors=face_rgba, edgecolors=face_rgba, linewidths=0.25)
+    ax.add_collection(collection)
+    if coords.shape[0] > 0:
+        ax.set_xlim(coords[:, 0].min(), coords[:, 0].max())
+        ax.set_ylim(coords[:, 1].min(), coords[:, 1].max())
+    fig.savefig(filename, dpi=dpi, facecolor=background)
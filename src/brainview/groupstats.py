@@ -0,0 +1,589 @@
+"""
+Vertex-wise group statistics for brainview.
+
+These functions compute statistics like the mean, standard deviation and percentiles at each vertex across many subjects that have been mapped to a common template like fsaverage. The subjects are streamed one by one, so the memory usage does not depend on the number of subjects.
+"""
+from __future__ import print_function
+import os
+import collections
+import numpy as np
+import brainload as bl
+import brainload.brainwrite as bw
+import brainload.freesurferdata as fsd
+from .profiling import stage
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+
+def welford_init(num_verts):
+    """
+    Create a new, empty running mean and variance accumulator.
+
+    The accumulator uses Welford's algorithm, which is numerically stable and needs a single pass over the data. It holds 3 arrays of length num_verts, no matter how many subjects are added.
+
+    Parameters
+    ----------
+    num_verts: int
+        The number of vertices, i.e., the length of the data array of each subject.
+
+    Returns
+    -------
+    dictionary
+        The accumulator state, with keys `count`, `mean` and `m2`. Pass it to `welford_update`, `welford_merge` and `welford_finalize`.
+    """
+    return {'count': np.zeros((num_verts, ), dtype=np.int64), 'mean': np.zeros((num_verts, ), dtype=np.float64), 'm2': np.zeros((num_verts, ), dtype=np.float64)}
+
+
+def welford_update(state, data):
+    """
+    Add the data of one subject to a running mean and variance accumulator.
+
+    Parameters
+    ----------
+    state: dictionary
+        The accumulator state, as returned by `welford_init`. Modified in place.
+
+    data: numpy 1D array of length num_verts
+        The data of one subject. Non-finite values (NaN, inf) are ignored, so the count may differ between vertices.
+
+    Returns
+    -------
+    dictionary
+        The updated accumulator state (the same object that was passed in).
+    """
+    data = np.asarray(data, dtype=np.float64)
+    valid = np.isfinite(data)
+    state['count'] += valid
+    delta = np.where(valid, data - state['mean'], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        state['mean'] += np.where(valid, delta / state['count'], 0.0)
+    state['m2'] += np.where(valid, delta * (data - state['mean']), 0.0)
+    return state
+
+
+def welford_merge(state_a, state_b):
+    """
+    Merge two running mean and variance accumulators.
+
+    Merge the accumulators of two disjoint sets of subjects, e.g., from chunks that were processed in parallel. Uses the pairwise update formula of Chan et al.
+
+    Parameters
+    ----------
+    state_a: dictionary
+        An accumulator state, as returned by `welford_init`.
+
+    state_b: dictionary
+        Another accumulator state for the same number of vertices.
+
+    Returns
+    -------
+    dictionary
+        A new accumulator state that represents the union of both subject sets.
+    """
+    count = state_a['count'] + state_b['count']
+    delta = state_b['mean'] - state_a['mean']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_b = np.where(count > 0, state_b['count'] / count.astype(np.float64), 0.0)
+        mean = state_a['mean'] + delta * weight_b
+        m2 = state_a['m2'] + state_b['m2'] + delta * delta * state_a['count'] * weight_b
+    return {'count': count, 'mean': mean, 'm2': m2}
+
+
+def welford_finalize(state, ddof=1):
+    """
+    Compute the mean and standard deviation from a running accumulator.
+
+    Parameters
+    ----------
+    state: dictionary
+        The accumulator state, as returned by `welford_init`.
+
+    ddof: int, optional
+        Delta degrees of freedom for the standard deviation. Defaults to 1, which gives the sample standard deviation.
+
+    Returns
+    -------
+    mean: numpy 1D float array
+        The mean at each vertex. NaN for vertices without any valid data.
+
+    std: numpy 1D float array
+        The standard deviation at each vertex. NaN for vertices with no more than ddof valid values.
+
+    count: numpy 1D int array
+        The number of valid values at each vertex.
+    """
+    count = state['count']
+    mean = np.where(count > 0, state['mean'], np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.where(count > ddof, np.sqrt(state['m2'] / (count - ddof)), np.nan)
+    return mean, std, count
+
+
+def histogram_sketch_init(num_verts, value_range, num_bins=64):
+    """
+    Create a new, empty per-vertex histogram for approximate percentiles.
+
+    The sketch counts the values at each vertex in num_bins equally sized bins over value_range. Values outside of the range are counted in the first or last bin. Percentiles computed from the sketch are accurate to about one bin width. Sketches of different subject sets can be merged by adding their counts, see `histogram_sketch_merge`.
+
+    Parameters
+    ----------
+    num_verts: int
+        The number of vertices.
+
+    value_range: pair of floats
+        The lower and upper bound of the histogram range.
+
+    num_bins: int, optional
+        The number of bins. The memory usage is num_verts * num_bins * 4 bytes. Defaults to 64.
+
+    Returns
+    -------
+    dictionary
+        The sketch state, with keys `lower`, `upper` and `counts`.
+    """
+    lower, upper = float(value_range[0]), float(value_range[1])
+    if not upper > lower:
+        raise ValueError("ERROR: value_range must be a pair (lower, upper) with upper > lower, but is (%f, %f)." % (lower, upper))
+    return {'lower': lower, 'upper': upper, 'counts': np.zeros((num_verts, num_bins), dtype=np.uint32)}
+
+
+def histogram_sketch_update(sketch, data):
+    """
+    Add the data of one subject to a per-vertex histogram sketch.
+
+    Parameters
+    ----------
+    sketch: dictionary
+        The sketch state, as returned by `histogram_sketch_init`. Modified in place.
+
+    data: numpy 1D array of length num_verts
+        The data of one subject. Non-finite values are ignored.
+
+    Returns
+    -------
+    dictionary
+        The updated sketch (the same object that was passed in).
+    """
+    counts = sketch['counts']
+    num_verts, num_bins = counts.shape
+    data = np.asarray(data, dtype=np.float64)
+    valid = np.isfinite(data)
+    bin_width = (sketch['upper'] - sketch['lower']) / num_bins
+    bins = np.clip(np.floor((data[valid] - sketch['lower']) / bin_width), 0, num_bins - 1).astype(np.int64)
+    # Each vertex occurs once, so the flat indices are unique and a simple in-place add is safe.
+    counts.ravel()[np.flatnonzero(valid) * num_bins + bins] += 1
+    return sketch
+
+
+def histogram_sketch_merge(sketch_a, sketch_b):
+    """
+    Merge two per-vertex histogram sketches with identical range and bins.
+
+    Returns
+    -------
+    dictionary
+        A new sketch that represents the union of both subject sets.
+    """
+    if sketch_a['lower'] != sketch_b['lower'] or sketch_a['upper'] != sketch_b['upper'] or sketch_a['counts'].shape != sketch_b['counts'].shape:
+        raise ValueError("ERROR: Sketches can only be merged if they have the same range, number of vertices and number of bins.")
+    return {'lower': sketch_a['lower'], 'upper': sketch_a['upper'], 'counts': sketch_a['counts'] + sketch_b['counts']}
+
+
+def histogram_sketch_quantiles(sketch, quantiles):
+    """
+    Compute approximate per-vertex quantiles from a histogram sketch.
+
+    Parameters
+    ----------
+    sketch: dictionary
+        The sketch state, as returned by `histogram_sketch_init`.
+
+    quantiles: list of floats
+        The quantiles to compute, in range 0.0 to 1.0. E.g., 0.5 for the median.
+
+    Returns
+    -------
+    numpy 2D float array of shape (len(quantiles), num_verts)
+        The quantile values. Values are interpolated linearly within a bin. NaN for vertices without any data.
+    """
+    counts = sketch['counts']
+    num_verts, num_bins = counts.shape
+    bin_width = (sketch['upper'] - sketch['lower']) / num_bins
+    cumulative = np.cumsum(counts, axis=1, dtype=np.int64)
+    total = cumulative[:, -1]
+    vertex_indices = np.arange(num_verts)
+    result = np.empty((len(quantiles), num_verts), dtype=np.float64)
+    for q_idx, quantile in enumerate(quantiles):
+        target = quantile * total
+        bin_index = np.minimum((cumulative < target[:, np.newaxis]).sum(axis=1), num_bins - 1)
+        below = np.where(bin_index > 0, cumulative[vertex_indices, bin_index - 1], 0)
+        in_bin = counts[vertex_indices, bin_index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(in_bin > 0, (target - below) / in_bin, 0.5)
+        result[q_idx] = np.where(total > 0, sketch['lower'] + (bin_index + np.clip(fraction, 0.0, 1.0)) * bin_width, np.nan)
+    return result
+
+
+def quantile_sketch_init(k=1024):
+    """
+    Create a new, empty streaming quantile sketch over all values.
+
+    Unlike the per-vertex histogram sketch, this sketch summarizes all values it is given, e.g., all vertices of all subjects, and needs no value range in advance. It is a KLL-style sketch: a stack of compactors, where level h holds sorted values that each stand for 2^h original values. When a level gets too full, every other of its sorted values is promoted to the next level. The memory usage is about 3 * k values no matter how many values are added, and quantiles are accurate to a rank error of roughly 1 / k. Sketches can be merged, see `quantile_sketch_merge`.
+
+    Parameters
+    ----------
+    k: int, optional
+        The capacity of the top level compactor. Higher values are more accurate. Defaults to 1024, which keeps the rank error below about 0.1 percent.
+
+    Returns
+    -------
+    dictionary
+        The sketch state, with keys `k`, `count`, `min`, `max`, `levels` and `num_compactions`. Pass it to `quantile_sketch_update`, `quantile_sketch_merge` and `quantile_sketch_quantiles`.
+    """
+    if k < 2:
+        raise ValueError("ERROR: k must be at least 2, but is %d." % k)
+    return {'k': int(k), 'count': 0, 'min': np.inf, 'max': -np.inf, 'levels': [np.empty((0, ), dtype=np.float64)], 'num_compactions': 0}
+
+
+def _quantile_sketch_capacity(sketch, level):
+    """
+    Return the capacity of a compactor level. The top level has capacity k, lower levels get exponentially smaller capacities.
+    """
+    depth = len(sketch['levels']) - 1 - level
+    return max(2, int(np.ceil(sketch['k'] * (2.0 / 3.0) ** depth)))
+
+
+def _quantile_sketch_compress(sketch):
+    """
+    Compact all levels of a sketch that exceed their capacity, from the bottom up.
+    """
+    level = 0
+    while level < len(sketch['levels']):
+        values = sketch['levels'][level]
+        if values.shape[0] > _quantile_sketch_capacity(sketch, level):
+            values = np.sort(values)
+            if values.shape[0] % 2 == 1:
+                kept, values = values[-1:], values[:-1]
+            else:
+                kept = values[:0]
+            # Alternate between the even and odd positions, which keeps the rank error unbiased without random numbers.
+            offset = sketch['num_compactions'] % 2
+            sketch['num_compactions'] += 1
+            promoted = values[offset::2]
+            if level + 1 == len(sketch['levels']):
+                sketch['levels'].append(np.empty((0, ), dtype=np.float64))
+            sketch['levels'][level] = kept
+            sketch['levels'][level + 1] = np.concatenate((sketch['levels'][level + 1], promoted))
+        level += 1
+    return sketch
+
+
+def quantile_sketch_update(sketch, data):
+    """
+    Add values to a streaming quantile sketch.
+
+    Parameters
+    ----------
+    sketch: dictionary
+        The sketch state, as returned by `quantile_sketch_init`. Modified in place.
+
+    data: numpy array
+        The values, e.g., the data of one subject. Non-finite values are ignored.
+
+    Returns
+    -------
+    dictionary
+        The updated sketch (the same object that was passed in).
+    """
+    data = np.asarray(data, dtype=np.float64).ravel()
+    data = data[np.isfinite(data)]
+    if data.shape[0] == 0:
+        return sketch
+    sketch['count'] += data.shape[0]
+    sketch['min'] = min(sketch['min'], float(data.min()))
+    sketch['max'] = max(sketch['max'], float(data.max()))
+    sketch['levels'][0] = np.concatenate((sketch['levels'][0], data))
+    return _quantile_sketch_compress(sketch)
+
+
+def quantile_sketch_merge(sketch_a, sketch_b):
+    """
+    Merge two streaming quantile sketches.
+
+    Use this to combine sketches computed in parallel, e.g., for different subject sets.
+
+    Returns
+    -------
+    dictionary
+        A new sketch that represents the values of both sketches. It has the larger k of both.
+    """
+    num_levels = max(len(sketch_a['levels']), len(sketch_b['levels']))
+    levels = []
+    for level in range(num_levels):
+        parts = [sketch['levels'][level] for sketch in (sketch_a, sketch_b) if level < len(sketch['levels'])]
+        levels.append(np.concatenate(parts))
+    merged = {'k': max(sketch_a['k'], sketch_b['k']), 'count': sketch_a['count'] + sketch_b['count'], 'min': min(sketch_a['min'], sketch_b['min']), 'max': max(sketch_a['max'], sketch_b['max']), 'levels': levels, 'num_compactions': sketch_a['num_compactions'] + sketch_b['num_compactions']}
+    return _quantile_sketch_compress(merged)
+
+
+def quantile_sketch_quantiles(sketch, quantiles):
+    """
+    Compute approximate quantiles from a streaming quantile sketch.
+
+    Parameters
+    ----------
+    sketch: dictionary
+        The sketch state, as returned by `quantile_sketch_init`.
+
+    quantiles: list of floats
+        The quantiles to compute, in range 0.0 to 1.0. E.g., [0.05, 0.95] for the 5th and 95th percentiles.
+
+    Returns
+    -------
+    numpy 1D float array of length len(quantiles)
+        The quantile values. The quantiles 0.0 and 1.0 are the exact minimum and maximum. NaN if the sketch is empty.
+
+    Examples
+    --------
+    >>> sketch = quantile_sketch_init()
+    >>> for subject_id, morphometry_data, meta_data in iter_subjects_standard_data(subjects_list, subjects_dir, 'thickness'):
+    ...     quantile_sketch_update(sketch, morphometry_data)
+    >>> lower, upper = quantile_sketch_quantiles(sketch, [0.05, 0.95])
+    """
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    if sketch['count'] == 0:
+        return np.full(quantiles.shape, np.nan)
+    values = np.concatenate(sketch['levels'])
+    weights = np.concatenate([np.full(level_values.shape, 2.0 ** level) for level, level_values in enumerate(sketch['levels'])])
+    order = np.argsort(values, kind='mergesort')
+    values = values[order]
+    # The rank of each stored value is the midpoint of the weight it stands for.
+    cumulative = np.cumsum(weights[order])
+    ranks = (cumulative - 0.5 * weights[order]) / cumulative[-1]
+    result = np.interp(quantiles, ranks, values)
+    result[quantiles <= 0.0] = sketch['min']
+    result[quantiles >= 1.0] = sketch['max']
+    return result
+
+
+def iter_subjects_standard_data(subjects_list, subjects_dir, measure, hemi='both', fwhm='10', average_subject='fsaverage', surf='white', num_workers=1):
+    """
+    Load the standard space morphometry data of many subjects, one at a time.
+
+    Generator that loads the data of the subjects in the given order, each with `brainload.subject_data_standard`. If num_workers is greater than 1, the next subjects are loaded in background threads while the current one is processed. At most 2 * num_workers subjects are held in memory at any time.
+
+    Parameters
+    ----------
+    subjects_list: list of strings
+        The subject identifiers.
+
+    subjects_dir: string
+        The directory containing the subjects.
+
+    measure, hemi, fwhm, average_subject, surf:
+        Passed on to `brainload.subject_data_standard`.
+
+    num_workers: int, optional
+        The number of loader threads. Defaults to 1, which loads in the calling thread.
+
+    Yields
+    ------
+    subject_id: string
+        The subject identifier.
+
+    morphometry_data: numpy 1D array
+        The data of the subject.
+
+    meta_data: dictionary
+        The meta data returned by brainload.
+    """
+    def load(subject_id):
+        with stage('groupstats.load'):
+            morphometry_data, meta_data = bl.subject_data_standard(subject_id, subjects_dir, measure, hemi, fwhm, average_subject=average_subject, surf=surf)
+        return subject_id, morphometry_data, meta_data
+
+    if num_workers <= 1 or cf is None:
+        for subject_id in subjects_list:
+            yield load(subject_id)
+        return
+
+    with cf.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = collections.deque()
+        subjects_iter = iter(subjects_list)
+        for subject_id in subjects_iter:
+            pending.append(executor.submit(load, subject_id))
+            if len(pending) >= 2 * num_workers:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for subject_id in subjects_iter:
+                pending.append(executor.submit(load, subject_id))
+                break
+            yield result
+
+
+def accumulate_group_stats(data_iter, quantiles=None, value_range=None, num_bins=64):
+    """
+    Compute vertex-wise group statistics from a stream of subject data.
+
+    Parameters
+    ----------
+    data_iter: iterable of numpy 1D arrays
+        The data of the subjects, all of the same length. Only one array is used at a time, so this can be a generator that loads the subjects on demand.
+
+    quantiles: list of floats or None, optional
+        Approximate quantiles to compute, in range 0.0 to 1.0. Requires a histogram sketch, see `histogram_sketch_init`. Defaults to None, which computes no quantiles.
+
+    value_range: pair of floats or None, optional
+        The range of the histogram sketch used for the quantiles. If None, it is derived from the first subject: its 0.5 to 99.5 percentile range, widened by half of that range on both sides. Ignored if quantiles is None.
+
+    num_bins: int, optional
+        The number of histogram bins per vertex. Ignored if quantiles is None. Defaults to 64.
+
+    Returns
+    -------
+    dictionary
+        Maps statistic names to numpy 1D arrays with one value per vertex. Always contains the keys `mean`, `std` and `count`. For each requested quantile, there is a key like `p50` (for quantile 0.5) or `p2.5` (for quantile 0.025).
+
+    Examples
+    --------
+    >>> data_iter = (data for subject_id, data, meta_data in iter_subjects_standard_data(subjects_list, subjects_dir, 'thickness'))
+    >>> maps = accumulate_group_stats(data_iter, quantiles=[0.05, 0.5, 0.95])
+    >>> print(maps['p50'].shape)
+    """
+    welford_state = None
+    sketch = None
+    for data in data_iter:
+        if welford_state is None:
+            welford_state = welford_init(data.shape[0])
+            if quantiles:
+                if value_range is None:
+                    value_range = _default_value_range(data)
+                sketch = histogram_sketch_init(data.shape[0], value_range, num_bins=num_bins)
+        with stage('groupstats.accumulate'):
+            welford_update(welford_state, data)
+            if sketch is not None:
+                histogram_sketch_update(sketch, data)
+    if welford_state is None:
+        raise ValueError("ERROR: No subject data given, cannot compute group statistics.")
+    mean, std, count = welford_finalize(welford_state)
+    maps = {'mean': mean, 'std': std, 'count': count}
+    if sketch is not None:
+        for quantile, values in zip(quantiles, histogram_sketch_quantiles(sketch, quantiles)):
+            maps[quantile_map_name(quantile)] = values
+    return maps
+
+
+def group_stats(subjects_list, subjects_dir, measure, hemi='both', fwhm='10', average_subject='fsaverage', surf='white', quantiles=None, value_range=None, num_bins=64, num_workers=1):
+    """
+    Compute vertex-wise group statistics for standard space data of many subjects.
+
+    Loads the data of the subjects one by one (or in parallel with num_workers threads) and accumulates the statistics, so that the memory usage does not depend on the number of subjects.
+
+    Parameters
+    ----------
+    subjects_list, subjects_dir, measure, hemi, fwhm, average_subject, surf, num_workers:
+        See `iter_subjects_standard_data`.
+
+    quantiles, value_range, num_bins:
+        See `accumulate_group_stats`.
+
+    Returns
+    -------
+    maps: dictionary
+        The statistic maps, see `accumulate_group_stats`.
+
+    meta_data: dictionary
+        The meta data of the first subject, which describes the layout of the data (e.g., `lh.num_data_points`).
+    """
+    first_meta_data = {}
+    def data_iter():
+        for subject_id, morphometry_data, meta_data in iter_subjects_standard_data(subjects_list, subjects_dir, measure, hemi=hemi, fwhm=fwhm, average_subject=average_subject, surf=surf, num_workers=num_workers):
+            if not first_meta_data:
+                first_meta_data.update(meta_data)
+            yield morphometry_data
+    maps = accumulate_group_stats(data_iter(), quantiles=quantiles, value_range=value_range, num_bins=num_bins)
+    return maps, first_meta_data
+
+
+def quantile_map_name(quantile):
+    """
+    Return the name of the map for a quantile.
+
+    Parameters
+    ----------
+    quantile: float
+        A quantile in range 0.0 to 1.0.
+
+    Returns
+    -------
+    string
+        The name, e.g., 'p50' for 0.5 or 'p2.5' for 0.025.
+    """
+    return 'p%g' % round(quantile * 100.0, 6)
+
+
+def write_group_maps(maps, meta_data, output_dir, group_id, measure, fwhm='10', average_subject='fsaverage', surf='white'):
+    """
+    Write group statistic maps as standard space morphometry files.
+
+    Writes one MGH file per map and hemisphere, with the same naming scheme FreeSurfer uses for standard space data of a subject. The group is treated like a subject named group_id, so that the maps can be displayed with brainviewer in common subject mode. E.g., the mean thickness is written to `<output_dir>/<group_id>/surf/lh.thickness_mean.fwhm10.fsaverage.mgh` and can be displayed with `brainviewer <group_id> -d <output_dir> -c -m thickness_mean`. This requires that the average subject can be found in the output_dir, so using your subjects_dir as the output_dir is the easiest option.
+
+    Parameters
+    ----------
+    maps: dictionary
+        The statistic maps, as returned by `accumulate_group_stats`.
+
+    meta_data: dictionary
+        Meta data describing the data layout, as returned by `group_stats`. Must contain the key `hemi`, and `lh.num_data_points` if hemi is 'both'.
+
+    output_dir: string
+        The directory to which the group directory is written.
+
+    group_id: string
+        The name of the pseudo subject directory for the group.
+
+    measure: string
+        The measure name, e.g., 'thickness'. The map name is appended to it.
+
+    fwhm, average_subject, surf:
+        Used for the file names, see `brainload.freesurferdata.get_standard_space_morphometry_file_path`.
+
+    Returns
+    -------
+    list of strings
+        The files that were written.
+    """
+    hemi = meta_data.get('hemi', 'both')
+    if hemi == 'both':
+        num_lh = meta_data['lh.num_data_points']
+        hemi_slices = [('lh', slice(0, num_lh)), ('rh', slice(num_lh, None))]
+    else:
+        hemi_slices = [(hemi, slice(None))]
+    surf_dir = os.path.join(output_dir, group_id, 'surf')
+    if not os.path.isdir(surf_dir):
+        os.makedirs(surf_dir)
+    written_files = []
+    for map_name, map_data in sorted(maps.items()):
+        for hemi_label, hemi_slice in hemi_slices:
+            output_file = fsd.get_standard_space_morphometry_file_path(output_dir, group_id, hemi_label, measure + '_' + map_name, fwhm=fwhm, average_subject=average_subject, surf=surf)
+            bw.write_voldata_to_mgh_file(output_file, map_data[hemi_slice].astype(np.float32).reshape((-1, 1, 1)), affine=np.eye(4))
+            written_files.append(output_file)
+    return written_files
+
+
+def _default_value_range(data):
+    """
+    Guess a histogram range that should contain nearly all values of a group from the data of a single subject.
+    """
+    finite_data = data[np.isfinite(data)]
+    if finite_data.size == 0:
+        return (0.0, 1.0)
+    lower, upper = np.percentile(finite_data, [0.5, 99.5])
+    margin = (upper - lower) * 0.5
+    if margin <= 0:
+        margin = max(abs(lower), 1.0)
+    return (lower - margin, upper + margin)
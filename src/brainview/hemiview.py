@@ -0,0 +1,309 @@
+"""
+Functions to display the two hemispheres of a brain as separate objects in one scene.
+
+Brainload returns the meshes of both hemispheres concatenated into a single mesh. Displayed as one surface, the hemispheres cannot be hidden or moved independently. These functions display each hemisphere as a surface of its own. The vertex coordinates and the data of both surfaces are views into a single buffer each, so nothing is copied per hemisphere and new data for the whole brain is written into the buffer once. The hemispheres can be moved apart with actor offsets, e.g., to show inflated surfaces side by side without reloading them.
+"""
+from __future__ import print_function
+import numpy as np
+from .profiling import stage
+from .singleview import brain_morphometry_view, brain_boundary_overlay, _get_points_array, _get_compact_scalars
+from .topology import parcel_boundaries
+
+HEMIS = ('lh', 'rh')
+
+
+def split_hemispheres(vert_coords, faces, meta_data):
+    """
+    Split a mesh of both hemispheres into the meshes of the hemispheres.
+
+    Parameters
+    ----------
+    vert_coords: 2D numpy array of shape (n_verts, 3)
+        The vertex coordinates of both hemispheres, lh first, as returned by `brainload.subject` with hemi 'both'.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        The faces of both hemispheres, lh first.
+
+    meta_data: dictionary
+        The meta data returned by brainload with the mesh. Must contain the keys 'lh.num_vertices' and 'lh.num_faces'.
+
+    Returns
+    -------
+    dictionary
+        Maps 'lh' and 'rh' to a dictionary with the keys 'vertices' (the slice of the hemisphere's vertices in the mesh of both hemispheres), 'vert_coords' (a view into vert_coords) and 'faces' (the faces, as indices into the hemisphere's vert_coords).
+
+    Examples
+    --------
+    >>> vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=subjects_dir, hemi='both')
+    >>> hemispheres = split_hemispheres(vert_coords, faces, meta_data)
+    >>> rh_thickness = morphometry_data[hemispheres['rh']['vertices']]
+    """
+    try:
+        num_lh_verts = int(meta_data['lh.num_vertices'])
+        num_lh_faces = int(meta_data['lh.num_faces'])
+    except KeyError:
+        raise ValueError("ERROR: meta_data must contain the keys 'lh.num_vertices' and 'lh.num_faces' of a mesh of both hemispheres.")
+    faces = np.asarray(faces)
+    lh_faces = faces[:num_lh_faces]
+    rh_faces = faces[num_lh_faces:] - num_lh_verts
+    if (lh_faces.size > 0 and lh_faces.max() >= num_lh_verts) or (rh_faces.size > 0 and rh_faces.min() < 0):
+        raise ValueError("ERROR: The faces of the mesh do not match %d lh vertices and %d lh faces." % (num_lh_verts, num_lh_faces))
+    lh_vertices = slice(0, num_lh_verts)
+    rh_vertices = slice(num_lh_verts, vert_coords.shape[0])
+    return {'lh': {'vertices': lh_vertices, 'vert_coords': vert_coords[lh_vertices], 'faces': lh_faces}, 'rh': {'vertices': rh_vertices, 'vert_coords': vert_coords[rh_vertices], 'faces': rh_faces}}
+
+
+def brain_hemisphere_view(fig, vert_coords, faces, morphometry_data, meta_data, boundary_labels=None, boundary_color=(0.0, 0.0, 0.0), **kwargs):
+    """
+    Display the morphometry data of both hemispheres as two separate surfaces.
+
+    Like `brainview.brain_morphometry_view`, but the hemispheres are separate objects that can be hidden (see `set_hemisphere_visible`) and moved (see `set_hemisphere_offset` and `set_hemisphere_gap`) independently. Both surfaces use the same color range.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The figure the surfaces should be added to.
+
+    vert_coords, faces, morphometry_data: numpy arrays
+        The mesh and data of both hemispheres, see `split_hemispheres`. The vertex coordinates are converted to float32 once (see `brainview.brain_morphometry_view`), and the data is copied once into the data buffer of the scene.
+
+    meta_data: dictionary
+        The meta data of the mesh, see `split_hemispheres`.
+
+    boundary_labels: 1D numpy array of shape (n_verts, ) or None, optional
+        If given, the borders between the regions defined by these per-vertex labels are drawn on top of the data. The borders move with their hemisphere. Defaults to None, which draws no borders.
+
+    boundary_color: tuple of 3 floats, optional
+        The RGB color of the boundary lines. Defaults to black. Ignored unless boundary_labels is given.
+
+    kwargs: extra keyword arguments
+        Passed on to `brainview.brain_morphometry_view` for both hemispheres, e.g., colormap.
+
+    Returns
+    -------
+    dictionary
+        The scene. Contains the keys 'vert_coords' and 'data' (the buffers shared by both surfaces), 'hemispheres' (see `split_hemispheres`), 'surfaces' and 'boundaries' (mapping 'lh' and 'rh' to their surface and border lines or None), 'offsets' (the current offset of each hemisphere) and 'data_range'.
+
+    Examples
+    --------
+    >>> vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=subjects_dir, surf='inflated', measure='thickness')
+    >>> scene = brain_hemisphere_view(fig, vert_coords, faces, morphometry_data, meta_data)
+    >>> set_hemisphere_gap(scene, 20.0)                   # side by side, 20 mm apart
+    >>> set_hemisphere_visible(scene, 'rh', False)        # lh only
+    """
+    with stage('hemiview.split'):
+        vert_coords = _get_points_array(vert_coords)
+        data = _get_compact_scalars(morphometry_data)
+        if data.shape[0] != vert_coords.shape[0]:
+            raise ValueError("ERROR: morphometry_data must contain one value per vertex (%d), but contains %d." % (vert_coords.shape[0], data.shape[0]))
+        # The scene owns its data buffer, as `set_scene_data` writes into it.
+        data = np.array(data, copy=True)
+        hemispheres = split_hemispheres(vert_coords, faces, meta_data)
+    scene = {'vert_coords': vert_coords, 'data': data, 'hemispheres': hemispheres, 'surfaces': {}, 'boundaries': {}, 'offsets': {'lh': (0.0, 0.0, 0.0), 'rh': (0.0, 0.0, 0.0)}, 'data_range': None}
+    for hemi in HEMIS:
+        hemisphere = hemispheres[hemi]
+        with stage('hemiview.surface'):
+            scene['surfaces'][hemi] = brain_morphometry_view(fig, hemisphere['vert_coords'], hemisphere['faces'], data[hemisphere['vertices']], **kwargs)
+        scene['boundaries'][hemi] = None
+        if boundary_labels is not None:
+            boundary_vertices, boundary_edges = parcel_boundaries(hemisphere['faces'], np.asarray(boundary_labels)[hemisphere['vertices']])
+            scene['boundaries'][hemi] = brain_boundary_overlay(fig, hemisphere['vert_coords'], boundary_edges, color=boundary_color)
+    set_scene_data_range(scene)
+    return scene
+
+
+def set_scene_data_range(scene, data_range=None):
+    """
+    Set the color range of both hemispheres.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    data_range: tuple of 2 floats or None, optional
+        The data values mapped to the lowest and highest color. Defaults to None, which uses the minimum and maximum of the data of both hemispheres, so the colors of the hemispheres are comparable.
+    """
+    if data_range is None:
+        data_range = (float(np.min(scene['data'])), float(np.max(scene['data'])))
+    for hemi in HEMIS:
+        lut_manager = scene['surfaces'][hemi].module_manager.scalar_lut_manager
+        lut_manager.use_default_range = False
+        lut_manager.data_range = np.array(data_range, dtype=np.float64)
+    scene['data_range'] = data_range
+
+
+def set_scene_data(scene, morphometry_data, data_range=None):
+    """
+    Display new data for both hemispheres.
+
+    The data is copied into the data buffer of the scene, which both surfaces display, so the surfaces are not rebuilt.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    morphometry_data: 1D numpy array of shape (n_verts, )
+        The new data for the vertices of both hemispheres. It is converted to the dtype of the data buffer.
+
+    data_range: tuple of 2 floats or None, optional
+        See `set_scene_data_range`.
+    """
+    morphometry_data = np.asarray(morphometry_data)
+    if morphometry_data.shape != scene['data'].shape:
+        raise ValueError("ERROR: morphometry_data must have shape %s, but has shape %s." % (str(scene['data'].shape), str(morphometry_data.shape)))
+    with stage('hemiview.set_data'):
+        np.copyto(scene['data'], morphometry_data, casting='unsafe')
+        for hemi in HEMIS:
+            source = scene['surfaces'][hemi].mlab_source
+            source.dataset.point_data.scalars.modified()
+            source.update()
+        set_scene_data_range(scene, data_range=data_range)
+
+
+def set_hemisphere_visible(scene, hemi, visible):
+    """
+    Show or hide a hemisphere, including its border lines.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    hemi: string
+        One of 'lh' or 'rh'.
+
+    visible: bool
+        Whether the hemisphere should be visible.
+    """
+    _check_hemi(hemi)
+    scene['surfaces'][hemi].visible = visible
+    if scene['boundaries'][hemi] is not None:
+        scene['boundaries'][hemi].visible = visible
+
+
+def set_hemisphere_offset(scene, hemi, offset):
+    """
+    Move a hemisphere, including its border lines.
+
+    Only the position of the actors changes, the vertex coordinates are not modified.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    hemi: string
+        One of 'lh' or 'rh'.
+
+    offset: tuple of 3 floats
+        The translation along the x, y and z axes, relative to the original position of the hemisphere.
+    """
+    _check_hemi(hemi)
+    offset = tuple(float(value) for value in offset)
+    scene['surfaces'][hemi].actor.actor.position = offset
+    if scene['boundaries'][hemi] is not None:
+        scene['boundaries'][hemi].actor.actor.position = offset
+    scene['offsets'][hemi] = offset
+
+
+def set_hemisphere_gap(scene, gap):
+    """
+    Place the hemispheres side by side along the x axis.
+
+    Moves the left hemisphere to the left and the right hemisphere to the right until there is a gap of the given width between them. This is useful for inflated or sphere surfaces, where the hemispheres overlap at their original position.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    gap: float
+        The distance between the hemispheres along the x axis, in the units of the vertex coordinates (mm for FreeSurfer surfaces).
+
+    Returns
+    -------
+    dictionary
+        The offset of each hemisphere, see `set_hemisphere_offset`.
+    """
+    lh_max_x = float(np.max(scene['hemispheres']['lh']['vert_coords'][:, 0]))
+    rh_min_x = float(np.min(scene['hemispheres']['rh']['vert_coords'][:, 0]))
+    center = (lh_max_x + rh_min_x) / 2.0
+    set_hemisphere_offset(scene, 'lh', (center - gap / 2.0 - lh_max_x, 0.0, 0.0))
+    set_hemisphere_offset(scene, 'rh', (center + gap / 2.0 - rh_min_x, 0.0, 0.0))
+    return dict(scene['offsets'])
+
+
+def get_displayed_coords(scene):
+    """
+    Return the vertex coordinates of both hemispheres at their displayed positions.
+
+    Use these instead of the original vertex coordinates to map positions in the scene, e.g., picked points, to vertices after the hemispheres have been moved.
+
+    Parameters
+    ----------
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    Returns
+    -------
+    2D numpy array of shape (n_verts, 3)
+        The coordinates, with the offset of each hemisphere applied. This is the vert_coords buffer of the scene itself if no hemisphere has been moved.
+
+    Examples
+    --------
+    >>> set_hemisphere_gap(scene, 20.0)
+    >>> brainview.spatialindex.add_vertex_picker(fig, get_displayed_coords(scene), morphometry_data=morphometry_data)
+    """
+    if all(scene['offsets'][hemi] == (0.0, 0.0, 0.0) for hemi in HEMIS):
+        return scene['vert_coords']
+    displayed_coords = scene['vert_coords'].copy()
+    for hemi in HEMIS:
+        displayed_coords[scene['hemispheres'][hemi]['vertices']] += np.array(scene['offsets'][hemi], dtype=displayed_coords.dtype)
+    return displayed_coords
+
+
+def add_hemisphere_key_bindings(fig, scene, lh_key='1', rh_key='2', verbose=True):
+    """
+    Show and hide the hemispheres with keyboard shortcuts in an interactive figure.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The mayavi figure.
+
+    scene: dictionary
+        The scene, as returned by `brain_hemisphere_view`.
+
+    lh_key, rh_key: string, optional
+        The keys that toggle the visibility of the left and right hemisphere. Default to '1' and '2'.
+
+    verbose: bool, optional
+        Whether to print the new state when a hemisphere is shown or hidden. Defaults to True.
+
+    Returns
+    -------
+    int or None
+        The observer id, or None if the figure has no interactor.
+    """
+    interactor = fig.scene.interactor
+    if interactor is None:
+        return None
+
+    def on_key_press(obj, event):
+        key = obj.GetKeySym()
+        if key in (lh_key, rh_key):
+            hemi = 'lh' if key == lh_key else 'rh'
+            visible = not scene['surfaces'][hemi].visible
+            set_hemisphere_visible(scene, hemi, visible)
+            fig.scene.render()
+            if verbose:
+                print("%s hemisphere %s." % (hemi, "shown" if visible else "hidden"))
+
+    return interactor.add_observer('KeyPressEvent', on_key_press)
+
+
+def _check_hemi(hemi):
+    if hemi not in HEMIS:
+        raise ValueError("ERROR: hemi must be one of ('lh', 'rh'), but is '%s'." % hemi)
@@ -0,0 +1,457 @@
+"""
+Manifest-driven batch jobs for brainview.
+
+A manifest is a file in INI format that describes a set of export and render jobs, so a batch run does not have to be written as a shell loop over command line calls. It extends the brainview configuration (see `brainview.util.get_config`): its sections 'figure', 'mesh' and 'meshexport' override the settings of the same name for the run. The section 'batch' holds the settings of the run and the defaults of all jobs, and each section named 'job <name>' describes one job:
+
+    [figure]
+    width = 400
+    height = 300
+
+    [batch]
+    subjects_dir = /data/study1
+    output_dir = /data/study1/figures
+    subjects_file = /data/study1/subjects.txt
+    num_workers = 4
+
+    [job thickness_snapshots]
+    data = thickness, area
+    common_subject_mode = true
+    surface = inflated
+    views = lateral, medial, 3d
+    outputs = png
+
+    [job aparc_meshes]
+    mode = atlas
+    data = aparc
+    outputs = ply
+
+The job options are 'mode' (one of `JOB_MODES`, defaults to 'morphometry'), 'data' (the measures, atlases or labels, depending on the mode), 'subjects' and 'subjects_file', 'subjects_dir', 'output_dir', 'surface', 'hemi', 'common_subject_mode', 'average_subject', 'fwhm', 'boundaries', 'no_clip', 'views' (from `JOB_VIEWS`) and 'outputs' (from `JOB_FORMATS`). A job option that is not set in the job section is taken from the section 'batch'. Without views, the meshes are exported; with views, each view is written in each output format, see `expand_jobs`. The view '3d' is rendered with mayavi and written as 'png' only.
+
+The jobs are expanded into tasks, one per job, subject and data, and the tasks are scheduled so that each mesh and each data file is loaded only once, no matter how many jobs, views and formats use it (see `schedule_jobs`). The loads run in a pool of worker threads, while the '3d' views are rendered in the calling thread, as VTK does not support rendering from other threads. Mayavi is only imported if a job renders a '3d' view.
+"""
+from __future__ import print_function
+import os
+import time
+import collections
+import numpy as np
+import brainload as bl
+from .profiling import stage
+from .util import get_config, cfg_get, cfg_getint, cfg_getboolean, _cfg_get_any
+from .export import PROJECTIONS, export_mesh_to_file, export_projection_to_file, get_mesh_projection, load_export_data, clip_data_at_percentiles, as_float_data
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+JOB_MODES = ('morphometry', 'atlas', 'label')
+JOB_VIEWS = PROJECTIONS + ('3d', )
+JOB_FORMATS = ('ply', 'obj', 'png', 'svg', 'pdf')
+
+_MESH_FORMATS = ('ply', 'obj')
+
+
+def read_manifest(manifest_file):
+    """
+    Read a job manifest.
+
+    Parameters
+    ----------
+    manifest_file: string
+        Path to the manifest file in INI format, see the module documentation.
+
+    Returns
+    -------
+    configparser
+        The brainview configuration (see `brainview.util.get_config`), with the sections of the manifest added or overriding the settings of the same name. Pass it to the `brainview.util.cfg_get` functions to read the settings of the run.
+
+    Examples
+    --------
+    >>> manifest = read_manifest('/data/study1/figures.ini')
+    >>> output_files, stats = run_jobs(manifest)
+    """
+    if not os.path.isfile(manifest_file):
+        raise ValueError("ERROR: Manifest file '%s' does not exist. Must be a readable file in INI format." % manifest_file)
+    manifest, config_file = get_config()
+    manifest.read(manifest_file)
+    if not manifest.has_section('batch'):
+        manifest.add_section('batch')
+    return manifest
+
+
+def _job_option(manifest, section, option, default_value, return_type='string'):
+    """
+    Return an option of a job, falling back to the section 'batch' and then to the default.
+    """
+    for source_section in (section, 'batch'):
+        if manifest.has_option(source_section, option):
+            return _cfg_get_any(source_section, option, default_value, return_type, config=manifest)
+    return default_value
+
+
+def _split_list(value):
+    """
+    Split a comma-separated manifest value into a list of stripped, non-empty strings.
+    """
+    return [item.strip() for item in value.split(",") if item.strip() != ""]
+
+
+def _job_subjects(manifest, section, subjects_dir):
+    """
+    Return the subjects of a job: those listed in the option 'subjects', followed by those in the 'subjects_file'. Without both, the file 'subjects.txt' in the subjects_dir is used.
+    """
+    subjects_list = _split_list(_job_option(manifest, section, 'subjects', ''))
+    subjects_file = _job_option(manifest, section, 'subjects_file', '')
+    if subjects_file == '' and not subjects_list:
+        subjects_file = os.path.join(subjects_dir, 'subjects.txt')
+    if subjects_file != '':
+        subjects_list.extend([subject_id for subject_id in bl.read_subjects_file(os.path.expanduser(subjects_file)) if subject_id.strip() != ""])
+    return subjects_list
+
+
+def expand_jobs(manifest):
+    """
+    Expand the jobs of a manifest into tasks.
+
+    Parameters
+    ----------
+    manifest: configparser
+        The manifest, as returned by `read_manifest`.
+
+    Returns
+    -------
+    list of dictionaries
+        One task per job, subject and data, in the order of the job sections. Each task contains the job options and the key 'output_files', a list of dictionaries with the keys 'view' (None for a mesh export), 'format' and 'file'. Mesh exports are named '<subject>_<data>.<format>' and views '<subject>_<data>_<view>.<format>', in the output_dir of the job.
+
+    Examples
+    --------
+    >>> tasks = expand_jobs(read_manifest('/data/study1/figures.ini'))
+    >>> print("%d tasks write %d files." % (len(tasks), sum([len(task['output_files']) for task in tasks])))
+    """
+    tasks = []
+    output_file_jobs = {}
+    for section in manifest.sections():
+        if not section.startswith('job '):
+            continue
+        job_name = section[4:].strip()
+        mode = _job_option(manifest, section, 'mode', 'morphometry')
+        if mode not in JOB_MODES:
+            raise ValueError("ERROR: Option 'mode' of job '%s' must be one of %s, but is '%s'." % (job_name, str(JOB_MODES), mode))
+        data_list = _split_list(_job_option(manifest, section, 'data', ''))
+        if not data_list:
+            raise ValueError("ERROR: Job '%s' has no option 'data'." % job_name)
+        views = _split_list(_job_option(manifest, section, 'views', ''))
+        for view in views:
+            if view not in JOB_VIEWS:
+                raise ValueError("ERROR: Invalid view '%s' in job '%s', must be one of %s." % (view, job_name, str(JOB_VIEWS)))
+        file_formats = _split_list(_job_option(manifest, section, 'outputs', 'png' if views else 'ply'))
+        for file_format in file_formats:
+            if file_format not in JOB_FORMATS:
+                raise ValueError("ERROR: Invalid output format '%s' in job '%s', must be one of %s." % (file_format, job_name, str(JOB_FORMATS)))
+            if not views and file_format not in _MESH_FORMATS:
+                raise ValueError("ERROR: Output format '%s' of job '%s' requires option 'views'." % (file_format, job_name))
+        if '3d' in views:
+            if mode != 'morphometry':
+                raise ValueError("ERROR: View '3d' of job '%s' requires mode 'morphometry', but mode is '%s'." % (job_name, mode))
+            if 'png' not in file_formats:
+                raise ValueError("ERROR: View '3d' of job '%s' requires output format 'png'." % job_name)
+
+        subjects_dir = os.path.expanduser(_job_option(manifest, section, 'subjects_dir', os.getenv('SUBJECTS_DIR', '')))
+        output_dir = os.path.expanduser(_job_option(manifest, section, 'output_dir', '.'))
+        job = {'job': job_name, 'mode': mode, 'subjects_dir': subjects_dir, 'output_dir': output_dir, 'surface': _job_option(manifest, section, 'surface', 'white'), 'hemi': _job_option(manifest, section, 'hemi', 'both'), 'common_subject_mode': _job_option(manifest, section, 'common_subject_mode', False, 'boolean') and mode == 'morphometry', 'average_subject': _job_option(manifest, section, 'average_subject', 'fsaverage'), 'fwhm': _job_option(manifest, section, 'fwhm', '10'), 'boundaries': _job_option(manifest, section, 'boundaries', False, 'boolean') and mode == 'atlas', 'no_clip': _job_option(manifest, section, 'no_clip', False, 'boolean')}
+        if job['hemi'] not in ('lh', 'rh', 'both'):
+            raise ValueError("ERROR: Option 'hemi' of job '%s' must be one of ('lh', 'rh', 'both'), but is '%s'." % (job_name, job['hemi']))
+
+        for subject_id in _job_subjects(manifest, section, subjects_dir):
+            for data in data_list:
+                output_files = []
+                if views:
+                    for view in views:
+                        for file_format in (('png', ) if view == '3d' else file_formats):
+                            output_files.append({'view': view, 'format': file_format, 'file': os.path.join(output_dir, "%s_%s_%s.%s" % (subject_id, data, view, file_format))})
+                else:
+                    for file_format in file_formats:
+                        output_files.append({'view': None, 'format': file_format, 'file': os.path.join(output_dir, "%s_%s.%s" % (subject_id, data, file_format))})
+                for output_file in output_files:
+                    if output_file['file'] in output_file_jobs:
+                        raise ValueError("ERROR: Jobs '%s' and '%s' both write file '%s'." % (output_file_jobs[output_file['file']], job_name, output_file['file']))
+                    output_file_jobs[output_file['file']] = job_name
+                task = dict(job)
+                task.update({'subject': subject_id, 'data': data, 'output_files': output_files})
+                tasks.append(task)
+    if not tasks:
+        raise ValueError("ERROR: Manifest contains no jobs with subjects, add a section named 'job <name>'.")
+    return tasks
+
+
+def schedule_jobs(tasks):
+    """
+    Schedule tasks so that each mesh and each data file is loaded only once.
+
+    Tasks of different jobs that use the same data of a subject, e.g., a mesh export and a projection of the same measure, share one load. All loads that use the same mesh, e.g., the average subject in common subject mode, are grouped, so the mesh and its projections are computed only once and can be dropped once the group is done.
+
+    Parameters
+    ----------
+    tasks: list of dictionaries
+        The tasks, as returned by `expand_jobs`.
+
+    Returns
+    -------
+    list of dictionaries
+        The loads, grouped by mesh in the order in which the meshes are first used. Each load contains the keys 'mesh_key' (a tuple of the subjects_dir, the subject that owns the mesh, the surface and the hemi), 'subject', 'subjects_dir', 'mode', 'data', 'surface', 'hemi', 'common_subject_mode', 'average_subject', 'fwhm' and 'outputs'. The outputs are the output files of all tasks that share the load, with the task options 'job', 'boundaries' and 'no_clip' added.
+    """
+    groups = collections.OrderedDict()
+    for task in tasks:
+        mesh_subject_id = task['average_subject'] if task['common_subject_mode'] else task['subject']
+        mesh_key = (task['subjects_dir'], mesh_subject_id, task['surface'], task['hemi'])
+        load_key = (task['subject'], task['mode'], task['data'], task['common_subject_mode'], task['fwhm'] if task['common_subject_mode'] else None)
+        group = groups.setdefault(mesh_key, collections.OrderedDict())
+        if load_key not in group:
+            group[load_key] = {'mesh_key': mesh_key, 'subject': task['subject'], 'subjects_dir': task['subjects_dir'], 'mode': task['mode'], 'data': task['data'], 'surface': task['surface'], 'hemi': task['hemi'], 'common_subject_mode': task['common_subject_mode'], 'average_subject': task['average_subject'], 'fwhm': task['fwhm'], 'outputs': []}
+        for output_file in task['output_files']:
+            output = dict(output_file)
+            output.update({'job': task['job'], 'boundaries': task['boundaries'], 'no_clip': task['no_clip']})
+            group[load_key]['outputs'].append(output)
+    return [load for group in groups.values() for load in group.values()]
+
+
+def schedule_summary(loads):
+    """
+    Count the work of a schedule.
+
+    Parameters
+    ----------
+    loads: list of dictionaries
+        The loads, as returned by `schedule_jobs`.
+
+    Returns
+    -------
+    dictionary
+        The keys 'num_jobs', 'num_mesh_loads', 'num_data_loads', 'num_projections' (distinct views of distinct meshes), 'num_renders' and 'num_outputs' (the number of files to write).
+    """
+    jobs = set()
+    projections = set()
+    num_renders = 0
+    num_outputs = 0
+    for load in loads:
+        render_variants = set()
+        for output in load['outputs']:
+            jobs.add(output['job'])
+            num_outputs += 1
+            if output['view'] == '3d':
+                render_variants.add(output['no_clip'])
+            elif output['view'] is not None:
+                projections.add((load['mesh_key'], output['view']))
+        num_renders += len(render_variants)
+    return {'num_jobs': len(jobs), 'num_mesh_loads': len(set([load['mesh_key'] for load in loads])), 'num_data_loads': len(loads), 'num_projections': len(projections), 'num_renders': num_renders, 'num_outputs': num_outputs}
+
+
+def format_job_stats(stats):
+    """
+    Format the statistics of a job run as a human readable text.
+
+    Parameters
+    ----------
+    stats: dictionary
+        The statistics, as returned by `schedule_summary` or `run_jobs`.
+
+    Returns
+    -------
+    string
+        A single line.
+    """
+    text = "%d jobs: %d mesh loads, %d data loads, %d projections and %d renders for %d output files" % (stats['num_jobs'], stats['num_mesh_loads'], stats['num_data_loads'], stats['num_projections'], stats['num_renders'], stats['num_outputs'])
+    if 'total_seconds' in stats:
+        text += " in %.3f s" % stats['total_seconds']
+    return text + "."
+
+
+def _get_settings(manifest):
+    """
+    Read the settings of a run from the sections 'figure', 'mesh' and 'meshexport' of a manifest.
+    """
+    settings = {'size': (cfg_getint('figure', 'width', 800, config=manifest), cfg_getint('figure', 'height', 600, config=manifest)), 'colormap': cfg_get('mesh', 'colormap', 'cool', config=manifest), 'export_colormap': cfg_get('meshexport', 'colormap', 'viridis', config=manifest), 'export_alpha': cfg_getint('meshexport', 'colormap_adjust_alpha_to', -1, config=manifest)}
+    settings['clip_percentiles'] = None
+    if cfg_getboolean('mesh', 'clip_values', True, config=manifest):
+        settings['clip_percentiles'] = (cfg_getint('mesh', 'clip_values_lower', 5, config=manifest), cfg_getint('mesh', 'clip_values_upper', 95, config=manifest))
+    settings['export_clip_percentiles'] = None
+    if cfg_getboolean('meshexport', 'clip_values', True, config=manifest):
+        settings['export_clip_percentiles'] = (cfg_getint('meshexport', 'clip_values_lower', 5, config=manifest), cfg_getint('meshexport', 'clip_values_upper', 95, config=manifest))
+    return settings
+
+
+def _load_mesh(mesh_key):
+    """
+    Load the mesh of a mesh group.
+    """
+    subjects_dir, subject_id, surf, hemi = mesh_key
+    with stage('jobs.load_mesh'):
+        vert_coords, faces, _, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=surf, hemi=hemi, load_morphometry_data=False)
+    return vert_coords, faces, meta_data
+
+
+def _process_load(settings, load, get_mesh):
+    """
+    Load the data of a load and write all its mesh and projection outputs. Runs in a worker thread. The '3d' outputs are left to the calling thread, the result contains the data they need.
+    """
+    mesh = get_mesh()
+    boundaries = any([output['boundaries'] for output in load['outputs']])
+    with stage('jobs.load'):
+        vert_coords, faces, export_args = load_export_data(load['subject'], load['subjects_dir'], load['mode'], load['data'], hemi=load['hemi'], surf=load['surface'], common_subject_mode=load['common_subject_mode'], fwhm=load['fwhm'], average_subject=load['average_subject'], boundaries=boundaries, colormap_name=settings['export_colormap'], colormap_adjust_alpha_to=settings['export_alpha'], mesh=mesh)
+    num_lh_verts = mesh[2]['lh.num_vertices'] if load['hemi'] == 'both' else None
+    clipped_data = None
+    written_files = []
+    for output in load['outputs']:
+        if output['view'] == '3d':
+            continue
+        output_args = dict(export_args)
+        if not output['boundaries']:
+            output_args.pop('boundary_vertices', None)
+        if 'morphometry_data' in output_args and not output['no_clip'] and settings['export_clip_percentiles'] is not None:
+            if clipped_data is None:
+                clipped_data = clip_data_at_percentiles(export_args['morphometry_data'], lower=settings['export_clip_percentiles'][0], upper=settings['export_clip_percentiles'][1])
+            output_args['morphometry_data'] = clipped_data
+        with stage('jobs.export'):
+            if output['view'] is None:
+                export_mesh_to_file(output['file'], vert_coords, faces, **output_args)
+            else:
+                projected = get_mesh_projection(vert_coords, faces, output['view'], hemi=load['hemi'], num_lh_verts=num_lh_verts)
+                # Atlas and label colors must not be mixed on region borders.
+                export_projection_to_file(output['file'], projected, size=settings['size'], face_color_mode='mean' if load['mode'] == 'morphometry' else 'majority', **output_args)
+        written_files.append(output['file'])
+    return {'vert_coords': vert_coords, 'faces': faces, 'morphometry_data': export_args.get('morphometry_data'), 'written_files': written_files}
+
+
+def _submit(executor, function, *args):
+    """
+    Run a function in the executor, or right away if there is none. Returns a function that returns the result.
+    """
+    if executor is None:
+        result = function(*args)
+        return lambda: result
+    return executor.submit(function, *args).result
+
+
+def _start_renderer(settings):
+    """
+    Create the offscreen figure and the image writer for the '3d' outputs. Imports mayavi.
+    """
+    import mayavi.mlab as mlab
+    from . import batch
+    renderer = {'mlab': mlab, 'batch': batch, 'offscreen': mlab.options.offscreen, 'displayed': {'surface': None, 'faces': None}}
+    mlab.options.offscreen = True
+    renderer['fig'] = mlab.figure(bgcolor=(1, 1, 1), size=settings['size'])
+    renderer['writer'] = batch.start_image_writer()
+    return renderer
+
+
+def _stop_renderer(renderer):
+    """
+    Wait for the image writer and close the figure. Returns the written files.
+    """
+    try:
+        return renderer['batch'].stop_image_writer(renderer['writer'])
+    finally:
+        renderer['mlab'].close(renderer['fig'])
+        renderer['mlab'].options.offscreen = renderer['offscreen']
+
+
+def _render_outputs(renderer, settings, load, result):
+    """
+    Render the '3d' outputs of a load and queue them for writing. Outputs that only differ in their file are rendered once.
+    """
+    displayed = renderer['displayed']
+    images = {}
+    for output in load['outputs']:
+        if output['view'] != '3d':
+            continue
+        if output['no_clip'] not in images:
+            morphometry_data = as_float_data(result['morphometry_data'])
+            if settings['clip_percentiles'] is not None and not output['no_clip']:
+                lower_value, upper_value = np.percentile(morphometry_data, settings['clip_percentiles'])
+                morphometry_data = np.clip(morphometry_data, float(lower_value), float(upper_value))
+            with stage('jobs.render'):
+                # Within a mesh group, the faces are the same object, so only the scalars of the surface are replaced.
+                displayed['surface'] = renderer['batch']._show_subject_data(renderer['fig'], displayed['surface'], displayed['faces'], result['vert_coords'], result['faces'], morphometry_data, settings['colormap'], None)
+                displayed['faces'] = result['faces']
+                images[output['no_clip']] = renderer['mlab'].screenshot(figure=renderer['fig'], mode='rgb', antialiased=False)
+        renderer['batch'].write_image_async(renderer['writer'], output['file'], images[output['no_clip']])
+
+
+def run_jobs(manifest, loads=None, verbose=False):
+    """
+    Run the jobs of a manifest.
+
+    The loads are processed by a pool of `num_workers` threads (option of the section 'batch', defaults to 1), which load the mesh and data and write the mesh and projection outputs. The mesh of a mesh group is loaded once and shared by all loads of the group, and it is dropped as soon as the group is done. At most twice as many loads as there are workers are in progress at any time, so the memory usage does not grow with the number of subjects. The '3d' views are rendered in the calling thread, reusing a single figure and surface, and written in a background thread.
+
+    Parameters
+    ----------
+    manifest: configparser
+        The manifest, as returned by `read_manifest`.
+
+    loads: list of dictionaries or None, optional
+        The loads, as returned by `schedule_jobs`. Defaults to None, which expands and schedules the jobs of the manifest.
+
+    verbose: bool, optional
+        Whether to print a line for each load. Defaults to False.
+
+    Returns
+    -------
+    output_files: list of strings
+        The written files.
+
+    stats: dictionary
+        The schedule statistics (see `schedule_summary`) and the key 'total_seconds', the wall clock time of the run. Use `format_job_stats` to print them.
+
+    Examples
+    --------
+    >>> output_files, stats = run_jobs(read_manifest('/data/study1/figures.ini'))
+    >>> print(format_job_stats(stats))
+    """
+    start = time.time()
+    if loads is None:
+        loads = schedule_jobs(expand_jobs(manifest))
+    num_workers = cfg_getint('batch', 'num_workers', 1, config=manifest)
+    if num_workers < 1:
+        raise ValueError("ERROR: Option 'num_workers' of section 'batch' must be at least 1, but is %d." % num_workers)
+    settings = _get_settings(manifest)
+    remaining_loads = collections.Counter([load['mesh_key'] for load in loads])
+    meshes = {}
+    pending = collections.deque()
+    output_files = []
+    state = {'renderer': None}
+    executor = cf.ThreadPoolExecutor(max_workers=num_workers) if cf is not None else None
+
+    def finish_next():
+        load, get_result = pending.popleft()
+        result = get_result()
+        output_files.extend(result['written_files'])
+        if any([output['view'] == '3d' for output in load['outputs']]):
+            if state['renderer'] is None:
+                state['renderer'] = _start_renderer(settings)
+            _render_outputs(state['renderer'], settings, load, result)
+        if verbose:
+            print("Processed %s %s of subject %s for %d outputs." % (load['mode'], load['data'], load['subject'], len(load['outputs'])))
+        remaining_loads[load['mesh_key']] -= 1
+        if remaining_loads[load['mesh_key']] == 0:
+            del meshes[load['mesh_key']]
+
+    try:
+        for load in loads:
+            mesh_key = load['mesh_key']
+            if mesh_key not in meshes:
+                # The executor runs the jobs in the order of submission, so the mesh is being loaded or done before a load waits for it.
+                meshes[mesh_key] = _submit(executor, _load_mesh, mesh_key)
+            pending.append((load, _submit(executor, _process_load, settings, load, meshes[mesh_key])))
+            while len(pending) > 2 * num_workers:
+                finish_next()
+        while pending:
+            finish_next()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if state['renderer'] is not None:
+            output_files.extend(_stop_renderer(state['renderer']))
+    stats = schedule_summary(loads)
+    stats['total_seconds'] = time.time() - start
+    return output_files, stats
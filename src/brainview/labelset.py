@@ -0,0 +1,349 @@
+"""
+Label sets: the vertex membership of many labels, stored as a packed bitmask.
+
+A label is a set of vertices. A label set stores which of up to thousands of labels each vertex belongs to in a single array with one bit per vertex and label, so 30 labels of a mesh with 300,000 vertices need 1.2 MB. Labels may overlap. Set operations like unions, intersections and overlap counts work on the packed bits, and the vertex colors of all labels are computed in one pass, so the labels can be displayed on a single mesh (see `brainview.singleview.brain_labelset_view`) or exported.
+"""
+import numpy as np
+import brainload as bl
+from .profiling import stage
+from .colors import colormap_lut
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+# The number of set bits in each byte value.
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def new_labelset(num_verts, label_vertices, names):
+    """
+    Create a label set from the vertices of each label.
+
+    Parameters
+    ----------
+    num_verts: int
+        The number of vertices of the mesh.
+
+    label_vertices: list of 1D numpy int arrays
+        The indices of the vertices in each label, e.g., from `brainload.label`.
+
+    names: list of strings
+        The name of each label. Must have the same length as label_vertices and contain no duplicates.
+
+    Returns
+    -------
+    dictionary
+        The label set, with the keys 'names', 'num_verts', 'bits' (numpy uint8 array of shape (num_verts, ceil(num_labels / 8)): bit i of a vertex is set if it belongs to label i, in the bit order of `numpy.packbits`) and 'sizes' (the number of vertices in each label).
+
+    Examples
+    --------
+    >>> labelset = new_labelset(vert_coords.shape[0], [verts_in_roi1, verts_in_roi2], ['roi1', 'roi2'])
+    """
+    names = list(names)
+    if len(names) != len(label_vertices):
+        raise ValueError("ERROR: Got %d label names for %d labels." % (len(names), len(label_vertices)))
+    if len(set(names)) != len(names):
+        raise ValueError("ERROR: Label names must be unique.")
+    with stage('labelset.pack'):
+        bits = np.zeros((num_verts, (len(names) + 7) // 8), dtype=np.uint8)
+        for label_index, vertices in enumerate(label_vertices):
+            vertices = np.asarray(vertices, dtype=np.intp)
+            if vertices.size > 0 and (vertices.min() < 0 or vertices.max() >= num_verts):
+                raise ValueError("ERROR: The vertices of label '%s' must be in range 0..%d." % (names[label_index], num_verts - 1))
+            bits[vertices, label_index // 8] |= np.uint8(128 >> (label_index % 8))
+    labelset = {'names': names, 'num_verts': num_verts, 'bits': bits}
+    labelset['sizes'] = label_sizes(labelset)
+    return labelset
+
+
+def load_labelset(subject_id, subjects_dir, label_names, meta_data, hemi='both', num_workers=None):
+    """
+    Load several labels of a subject concurrently into a label set.
+
+    Parameters
+    ----------
+    subject_id: string
+        The subject identifier.
+
+    subjects_dir: string
+        The directory containing the subject.
+
+    label_names: list of strings
+        The labels to load, without the ?h part and the file extension, e.g., ['cortex', 'V1'].
+
+    meta_data: dictionary
+        The meta data of the mesh, as returned by `brainload.subject`. It is needed to place the rh vertices after the lh vertices if hemi is 'both', and is not modified.
+
+    hemi: string, optional
+        The hemisphere, one of 'lh', 'rh' or 'both'. Defaults to 'both'.
+
+    num_workers: int or None, optional
+        The number of loader threads. Defaults to None, which uses one thread per label, up to 16.
+
+    Returns
+    -------
+    dictionary
+        The label set, see `new_labelset`.
+
+    Examples
+    --------
+    >>> vert_coords, faces, _, meta_data = bl.subject('subject1', subjects_dir=subjects_dir, load_morphometry_data=False)
+    >>> labelset = load_labelset('subject1', subjects_dir, ['roi1', 'roi2', 'cortex'], meta_data)
+    """
+    num_verts = 0
+    for mesh_hemi in (('lh', 'rh') if hemi == 'both' else (hemi, )):
+        num_verts += int(meta_data['%s.num_vertices' % mesh_hemi])
+
+    def load(label_name):
+        with stage('labelset.load_label'):
+            # Each thread gets its own copy of the meta data, brainload adds the label information to it.
+            return bl.label(subject_id, subjects_dir, label_name, hemi=hemi, meta_data=dict(meta_data))[0]
+
+    if cf is None or len(label_names) < 2 or num_workers == 1:
+        label_vertices = [load(label_name) for label_name in label_names]
+    else:
+        with cf.ThreadPoolExecutor(max_workers=num_workers or min(len(label_names), 16)) as executor:
+            label_vertices = list(executor.map(load, label_names))
+    return new_labelset(num_verts, label_vertices, label_names)
+
+
+def _label_indices(labelset, names):
+    """
+    Return the indices of the named labels in a label set.
+    """
+    indices = []
+    for name in names:
+        if name not in labelset['names']:
+            raise ValueError("ERROR: Label set contains no label '%s'." % name)
+        indices.append(labelset['names'].index(name))
+    return indices
+
+
+def _query_bits(labelset, names):
+    """
+    Return the bitmask of the named labels, in the layout of the bits of a vertex.
+    """
+    query = np.zeros((labelset['bits'].shape[1], ), dtype=np.uint8)
+    for label_index in _label_indices(labelset, names):
+        query[label_index // 8] |= np.uint8(128 >> (label_index % 8))
+    return query
+
+
+def label_mask(labelset, name):
+    """
+    Return which vertices belong to a label.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    name: string
+        The label name.
+
+    Returns
+    -------
+    1D numpy bool array of shape (num_verts, )
+        Whether each vertex is in the label. Use `np.flatnonzero` to get the vertex indices.
+    """
+    label_index = _label_indices(labelset, [name])[0]
+    return (labelset['bits'][:, label_index // 8] & np.uint8(128 >> (label_index % 8))) != 0
+
+
+def vertex_label_names(labelset, vertex_index):
+    """
+    Return the names of the labels a vertex belongs to.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    vertex_index: int
+        The vertex.
+
+    Returns
+    -------
+    list of strings
+        The names, in the order of the label set.
+    """
+    membership = np.unpackbits(labelset['bits'][vertex_index])[:len(labelset['names'])]
+    return [labelset['names'][label_index] for label_index in np.flatnonzero(membership)]
+
+
+def labelset_union(labelset, names=None):
+    """
+    Return which vertices belong to at least one of the given labels.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    names: list of strings or None, optional
+        The label names. Defaults to None, which uses all labels.
+
+    Returns
+    -------
+    1D numpy bool array of shape (num_verts, )
+        Whether each vertex is in the union of the labels.
+    """
+    query = _query_bits(labelset, labelset['names'] if names is None else names)
+    return np.any(labelset['bits'] & query, axis=1)
+
+
+def labelset_intersection(labelset, names=None):
+    """
+    Return which vertices belong to all of the given labels.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    names: list of strings or None, optional
+        The label names. Defaults to None, which uses all labels.
+
+    Returns
+    -------
+    1D numpy bool array of shape (num_verts, )
+        Whether each vertex is in the intersection of the labels.
+    """
+    query = _query_bits(labelset, labelset['names'] if names is None else names)
+    return np.all((labelset['bits'] & query) == query, axis=1)
+
+
+def membership_counts(labelset):
+    """
+    Return the number of labels each vertex belongs to.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    Returns
+    -------
+    1D numpy int array of shape (num_verts, )
+        The number of labels of each vertex. Vertices with a count larger than 1 are in overlapping labels.
+    """
+    return _POPCOUNT[labelset['bits']].sum(axis=1, dtype=np.intp)
+
+
+def label_sizes(labelset):
+    """
+    Return the number of vertices in each label.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    Returns
+    -------
+    1D numpy int array of shape (num_labels, )
+        The size of each label, in the order of the names.
+    """
+    num_labels = len(labelset['names'])
+    sizes = np.zeros((num_labels, ), dtype=np.intp)
+    for label_index in range(num_labels):
+        sizes[label_index] = np.count_nonzero(labelset['bits'][:, label_index // 8] & np.uint8(128 >> (label_index % 8)))
+    return sizes
+
+
+def overlap_counts(labelset):
+    """
+    Return the number of vertices shared by each pair of labels.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    Returns
+    -------
+    2D numpy int array of shape (num_labels, num_labels)
+        Entry (i, j) is the number of vertices in both label i and label j. The diagonal contains the label sizes.
+    """
+    with stage('labelset.overlap_counts'):
+        # Only vertices in at least two labels contribute to the off-diagonal entries, unpack those only.
+        overlapping = membership_counts(labelset) > 1
+        membership = np.unpackbits(labelset['bits'][overlapping], axis=1)[:, :len(labelset['names'])].astype(np.intp)
+        counts = membership.T.dot(membership)
+        counts[np.diag_indices_from(counts)] = labelset['sizes']
+    return counts
+
+
+def labelset_vertex_colors(labelset, label_colors=None, background_color=(255, 255, 255, 255), overlap_color=None):
+    """
+    Compute the RGBA color of each vertex from the labels it belongs to.
+
+    Parameters
+    ----------
+    labelset: dictionary
+        The label set, see `new_labelset`.
+
+    label_colors: 2D numpy array of shape (num_labels, 4) or None, optional
+        The RGBA color of each label, 0..255 per channel. Defaults to None, which uses the colors of the qualitative colormap 'tab20', repeated for more than 20 labels.
+
+    background_color: tuple of 4 ints, optional
+        The color of vertices in no label. Defaults to white.
+
+    overlap_color: tuple of 4 ints or None, optional
+        The color of vertices in more than one label. Defaults to None, which mixes the colors of their labels, so each combination of labels gets its own color.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (num_verts, 4)
+        The RGBA color of each vertex.
+
+    Examples
+    --------
+    >>> vertex_colors = labelset_vertex_colors(labelset)
+    >>> brainview.export_mesh_to_file('labels.ply', vert_coords, faces, vertex_colors=vertex_colors)
+    """
+    num_labels = len(labelset['names'])
+    if label_colors is None:
+        label_colors = default_label_colors(num_labels)
+    label_colors = np.asarray(label_colors, dtype=np.uint8)
+    if label_colors.shape != (num_labels, 4):
+        raise ValueError("ERROR: label_colors must have shape (%d, 4), but has shape %s." % (num_labels, str(label_colors.shape)))
+    with stage('labelset.colors'):
+        vertex_colors = np.empty((labelset['num_verts'], 4), dtype=np.uint8)
+        vertex_colors[:] = background_color
+        counts = membership_counts(labelset)
+        # Vertices in exactly one label get its color, the label is the index of the only set bit.
+        single = np.flatnonzero(counts == 1)
+        if single.size > 0:
+            single_labels = np.argmax(np.unpackbits(labelset['bits'][single], axis=1), axis=1)
+            vertex_colors[single] = label_colors[single_labels]
+        overlapping = np.flatnonzero(counts > 1)
+        if overlap_color is not None:
+            vertex_colors[overlapping] = overlap_color
+        elif overlapping.size > 0:
+            membership = np.unpackbits(labelset['bits'][overlapping], axis=1)[:, :num_labels]
+            mixed = membership.dot(label_colors.astype(np.float64)) / counts[overlapping][:, np.newaxis]
+            vertex_colors[overlapping] = np.round(mixed).astype(np.uint8)
+    return vertex_colors
+
+
+def default_label_colors(num_labels):
+    """
+    Return distinct RGBA colors for the given number of labels.
+
+    The colors of the qualitative colormap 'tab20' are used, in the order dark and light blue, dark and light orange, and so on. They are repeated for more than 20 labels.
+
+    Parameters
+    ----------
+    num_labels: int
+        The number of labels.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (num_labels, 4)
+        The RGBA color of each label.
+    """
+    lut = colormap_lut('tab20', num_colors=20)
+    return lut[np.arange(num_labels) % 20]
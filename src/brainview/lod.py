@@ -0,0 +1,169 @@
+"""
+Level of detail functions for brainview.
+
+These functions compute decimated (coarse) versions of a brain mesh by vertex clustering, and carry per-vertex data over to them. A coarse mesh renders much faster, which keeps interactive rotation smooth on machines with slow (e.g., software) OpenGL. Decimated meshes are cached per mesh, so switching back and forth is cheap.
+"""
+import weakref
+import numpy as np
+from .profiling import stage
+from .topology import _get_topology_cache, mesh_area, mesh_components
+
+
+def decimate_mesh(vert_coords, faces, target_num_verts):
+    """
+    Compute a decimated version of a mesh by vertex clustering.
+
+    The space is divided into cubic grid cells, and all vertices in a cell are merged into one vertex at their centroid. The cell size is chosen so that the result has roughly target_num_verts vertices. Vertices of different connected components of the mesh (e.g., the 2 hemispheres) are never merged. Faces that collapse to an edge or point are removed.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates.
+
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    target_num_verts: int
+        The approximate number of vertices of the result. If the mesh does not have more vertices than this, it is returned unchanged.
+
+    Returns
+    -------
+    dictionary
+        The level of detail, with keys `vert_coords` and `faces` (the decimated mesh), `vertex_mapping` (numpy 1D int array of length num_verts, the index of the coarse vertex each original vertex was merged into) and `representative_vertices` (numpy 1D int array of length num_coarse_verts, one original vertex for each coarse vertex).
+
+    Examples
+    --------
+    >>> lod = decimate_mesh(vert_coords, faces, 50000)
+    >>> print(lod['vert_coords'].shape)
+    """
+    num_verts = vert_coords.shape[0]
+    if target_num_verts <= 0:
+        raise ValueError("ERROR: target_num_verts must be positive, but is %d." % target_num_verts)
+    if num_verts <= target_num_verts:
+        return {'vert_coords': vert_coords, 'faces': faces, 'vertex_mapping': np.arange(num_verts), 'representative_vertices': np.arange(num_verts)}
+    with stage('lod.decimate'):
+        num_components, component_labels = mesh_components(faces, num_verts=num_verts)
+        # The vertices of a surface lie on a 2D manifold, so the number of occupied cells scales with area / cell_size^2.
+        cell_size = np.sqrt(mesh_area(vert_coords, faces) / target_num_verts)
+        cells = np.floor((vert_coords - vert_coords.min(axis=0)) / cell_size).astype(np.int64)
+        dims = cells.max(axis=0) + 1
+        keys = ((component_labels.astype(np.int64) * dims[0] + cells[:, 0]) * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        unique_keys, representative_vertices, vertex_mapping = np.unique(keys, return_index=True, return_inverse=True)
+        num_coarse_verts = unique_keys.shape[0]
+        counts = np.bincount(vertex_mapping, minlength=num_coarse_verts).astype(np.float64)
+        coarse_coords = np.column_stack([np.bincount(vertex_mapping, weights=vert_coords[:, dim], minlength=num_coarse_verts) / counts for dim in range(3)])
+
+        coarse_faces = vertex_mapping[faces]
+        not_degenerate = (coarse_faces[:, 0] != coarse_faces[:, 1]) & (coarse_faces[:, 1] != coarse_faces[:, 2]) & (coarse_faces[:, 0] != coarse_faces[:, 2])
+        coarse_faces = coarse_faces[not_degenerate]
+        # Several original faces can collapse to the same coarse face, keep one of them with its original orientation.
+        sorted_faces = np.sort(coarse_faces, axis=1)
+        face_keys = (sorted_faces[:, 0] * num_coarse_verts + sorted_faces[:, 1]) * num_coarse_verts + sorted_faces[:, 2]
+        unique_face_keys, first_faces = np.unique(face_keys, return_index=True)
+        coarse_faces = coarse_faces[np.sort(first_faces)]
+    return {'vert_coords': coarse_coords, 'faces': coarse_faces, 'vertex_mapping': vertex_mapping, 'representative_vertices': representative_vertices}
+
+
+def get_lod(vert_coords, faces, target_num_verts):
+    """
+    Get a decimated version of a mesh, using the cache if possible.
+
+    Like `decimate_mesh`, but the result is cached per mesh (i.e., per pair of vert_coords and faces arrays) and target_num_verts. The arrays must not be modified in place after they have been used with this function, otherwise the cached data is outdated.
+
+    Parameters
+    ----------
+    vert_coords, faces, target_num_verts:
+        See `decimate_mesh`.
+
+    Returns
+    -------
+    dictionary
+        The level of detail, see `decimate_mesh`.
+    """
+    cache = _get_topology_cache(faces)
+    key = ('lod', id(vert_coords), target_num_verts)
+    entry = cache.get(key)
+    if entry is not None and entry[0]() is vert_coords:
+        return entry[1]
+    lod = decimate_mesh(vert_coords, faces, target_num_verts)
+    try:
+        cache[key] = (weakref.ref(vert_coords), lod)
+    except TypeError:
+        pass        # Not weak-referencable, do not cache.
+    return lod
+
+
+def lod_vertex_data(lod, data, mode='mean'):
+    """
+    Carry per-vertex data over to a decimated mesh.
+
+    Parameters
+    ----------
+    lod: dictionary
+        A level of detail, as returned by `decimate_mesh` or `get_lod`.
+
+    data: numpy 1D array of length num_verts
+        The data for the vertices of the full mesh.
+
+    mode: string, optional
+        How to combine the values of the original vertices that were merged into one coarse vertex. 'mean' uses their mean, which is best for continuous data like morphometry values. 'representative' uses the value of one of them, which is required for categorical data like atlas labels. Defaults to 'mean'.
+
+    Returns
+    -------
+    numpy 1D array of length num_coarse_verts
+        The data for the vertices of the coarse mesh.
+    """
+    data = np.asarray(data)
+    if mode == 'representative':
+        return data[lod['representative_vertices']]
+    elif mode == 'mean':
+        num_coarse_verts = lod['representative_vertices'].shape[0]
+        counts = np.bincount(lod['vertex_mapping'], minlength=num_coarse_verts)
+        return np.bincount(lod['vertex_mapping'], weights=data.astype(np.float64), minlength=num_coarse_verts) / counts
+    else:
+        raise ValueError("ERROR: mode must be one of {'mean', 'representative'}, but is '%s'." % mode)
+
+
+def set_surface_lod(surface, vert_coords, faces, target_num_verts, mode='mean'):
+    """
+    Replace the mesh of a mayavi surface with a decimated version.
+
+    Replaces the mesh and scalars of a surface created with `brain_morphometry_view` (or any of the other view functions) in place, keeping its color map and scalar range. Call this after saving images at full resolution and before displaying the figure interactively.
+
+    Parameters
+    ----------
+    surface: mayavi.modules.surface.Surface
+        The surface, as returned by the view functions. Its current scalars must belong to the vert_coords.
+
+    vert_coords, faces:
+        The full resolution mesh of the surface.
+
+    target_num_verts: int
+        The approximate number of vertices of the decimated mesh. If the mesh does not have more vertices, the surface is not changed.
+
+    mode: string, optional
+        How to carry the scalars over, see `lod_vertex_data`. Use 'representative' for atlas views. Defaults to 'mean'.
+
+    Returns
+    -------
+    dictionary
+        The level of detail that is now displayed, see `decimate_mesh`.
+
+    Examples
+    --------
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data)
+    >>> mlab.savefig('brain.png')                                       # full resolution
+    >>> lod = set_surface_lod(surface, vert_coords, faces, 50000)      # coarse mesh for interaction
+    >>> bv.show()
+    """
+    lod = get_lod(vert_coords, faces, target_num_verts)
+    if lod['vert_coords'] is vert_coords:
+        return lod
+    with stage('lod.set_surface'):
+        lut_manager = surface.module_manager.scalar_lut_manager
+        data_range = lut_manager.data_range.copy()
+        scalars = lod_vertex_data(lod, surface.mlab_source.scalars, mode=mode)
+        surface.mlab_source.reset(points=lod['vert_coords'], triangles=lod['faces'], scalars=scalars)
+        lut_manager.use_default_range = False
+        lut_manager.data_range = data_range
+    return lod
@@ -0,0 +1,214 @@
+"""
+Contact sheet (montage) functions for brainview.
+
+These functions tile many rendered brain views into labeled grid images, e.g., for visual quality control of all subjects of a study. The tiles are copied into a preallocated page buffer as they are rendered, and each page is written as soon as it is full, so only a single page is held in memory no matter how many subjects there are, and no image has to be read back from disk.
+"""
+from __future__ import print_function
+import os
+import numpy as np
+import matplotlib.image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import Bbox
+from .profiling import stage
+
+
+def parse_grid(grid):
+    """
+    Parse a montage grid specification.
+
+    Parameters
+    ----------
+    grid: string
+        The number of columns and rows, separated by an 'x', e.g., '8x6'.
+
+    Returns
+    -------
+    tuple of 2 ints
+        The number of columns and rows.
+    """
+    try:
+        num_columns, num_rows = [int(part) for part in grid.lower().split('x')]
+    except ValueError:
+        raise ValueError("ERROR: grid must have the format '<columns>x<rows>', e.g., '8x6', but is '%s'." % grid)
+    if num_columns < 1 or num_rows < 1:
+        raise ValueError("ERROR: grid must have at least 1 column and row, but is '%s'." % grid)
+    return num_columns, num_rows
+
+
+def new_montage(output_pattern, tile_size, num_columns=8, num_rows=6, tile_step=1, label_height=20, background_color=(255, 255, 255), label_color=(0, 0, 0)):
+    """
+    Create a new, empty montage.
+
+    Parameters
+    ----------
+    output_pattern: string
+        The file name pattern for the pages, with a %d placeholder for the page number, e.g., 'qc_%03d.png'. The image format is derived from the file extension.
+
+    tile_size: tuple of 2 ints
+        The width and height of the images that will be added, in pixels. Usually the figure size.
+
+    num_columns: int, optional
+        The number of tiles per row. Defaults to 8.
+
+    num_rows: int, optional
+        The number of rows per page. Defaults to 6.
+
+    tile_step: int, optional
+        Only every tile_step-th pixel of each image is used in both directions, which shrinks the tiles by this factor. Defaults to 1, which uses the full images.
+
+    label_height: int, optional
+        The height of the label strip below each tile, in pixels. 0 disables the labels. Defaults to 20.
+
+    background_color: tuple of 3 ints, optional
+        The RGB color of empty space. Defaults to white.
+
+    label_color: tuple of 3 ints, optional
+        The RGB color of the labels. Defaults to black.
+
+    Returns
+    -------
+    dictionary
+        The montage state. Pass it to `add_montage_tile` and `finish_montage`.
+
+    Examples
+    --------
+    >>> montage = new_montage('/tmp/qc_%03d.png', (800, 600), num_columns=10, num_rows=8, tile_step=4)
+    >>> for subject_id in subjects_list:
+    ...     add_montage_tile(montage, mlab.screenshot(figure=fig, mode='rgb'), subject_id)
+    >>> pages = finish_montage(montage)
+    """
+    if tile_step < 1:
+        raise ValueError("ERROR: tile_step must be at least 1, but is %d." % tile_step)
+    tile_width = (tile_size[0] + tile_step - 1) // tile_step
+    tile_height = (tile_size[1] + tile_step - 1) // tile_step
+    cell_height = tile_height + label_height
+    page = np.empty((num_rows * cell_height, num_columns * tile_width, 3), dtype=np.uint8)
+    page[:] = background_color
+    return {'output_pattern': output_pattern, 'page': page, 'tile_width': tile_width, 'tile_height': tile_height, 'cell_height': cell_height, 'num_columns': num_columns, 'num_rows': num_rows, 'tile_step': tile_step, 'label_height': label_height, 'background_color': background_color, 'label_color': label_color, 'labels': [], 'page_index': 0, 'written_files': []}
+
+
+def add_montage_tile(montage, image, label="", write_function=None):
+    """
+    Copy an image into the next free tile of a montage.
+
+    If the page is full afterwards, it is written and the page buffer is cleared for the next page.
+
+    Parameters
+    ----------
+    montage: dictionary
+        The montage state, as returned by `new_montage`.
+
+    image: numpy 3D uint8 array of shape (height, width, 3)
+        The image, e.g., from `mlab.screenshot`. Images larger than the tile size are cropped, smaller ones are padded with the background color.
+
+    label: string, optional
+        The label to draw below the tile, e.g., the subject id. Defaults to no label.
+
+    write_function: callable or None, optional
+        Called with the arguments (filename, image) to write full pages. Use this to write pages in the background, see `brainview.batch.write_image_async`. Defaults to None, which writes them in the calling thread with `matplotlib.image.imsave`.
+    """
+    tile_index = len(montage['labels'])
+    row, column = divmod(tile_index, montage['num_columns'])
+    top = row * montage['cell_height']
+    left = column * montage['tile_width']
+    tile = image[::montage['tile_step'], ::montage['tile_step'], :3][:montage['tile_height'], :montage['tile_width']]
+    montage['page'][top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+    montage['labels'].append(label)
+    if len(montage['labels']) == montage['num_columns'] * montage['num_rows']:
+        write_montage_page(montage, write_function=write_function)
+
+
+def _draw_labels(montage):
+    """
+    Return a copy of the page of a montage with the tile labels drawn into the label strips, using the matplotlib Agg renderer.
+    """
+    page = montage['page']
+    if montage['label_height'] <= 0 or not any(montage['labels']):
+        return page.copy()
+    dpi = 100.0
+    height, width = page.shape[:2]
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    fig.figimage(page, origin='upper')
+    font_size = 0.6 * montage['label_height'] * 72.0 / dpi
+    color = tuple(c / 255.0 for c in montage['label_color'])
+    for tile_index, label in enumerate(montage['labels']):
+        row, column = divmod(tile_index, montage['num_columns'])
+        x = (column + 0.5) * montage['tile_width']
+        y = (row + 1) * montage['cell_height'] - 0.5 * montage['label_height']
+        text = fig.text(x / width, 1.0 - y / height, label, fontsize=font_size, color=color, horizontalalignment='center', verticalalignment='center')
+        # Long labels are cut off at the border of their tile instead of running into the neighbor tiles.
+        bottom = height - (row + 1) * montage['cell_height']
+        text.set_clip_box(Bbox.from_extents(column * montage['tile_width'], bottom, (column + 1) * montage['tile_width'], bottom + montage['label_height']))
+        text.set_clip_on(True)
+    canvas.draw()
+    return np.array(np.asarray(canvas.buffer_rgba())[:, :, :3])
+
+
+def write_montage_page(montage, write_function=None):
+    """
+    Write the current page of a montage and start a new one.
+
+    Does nothing if the current page is empty. This is called automatically when a page is full, use `finish_montage` to write the last, partially filled page.
+
+    Parameters
+    ----------
+    montage: dictionary
+        The montage state, as returned by `new_montage`.
+
+    write_function: callable or None, optional
+        See `add_montage_tile`.
+
+    Returns
+    -------
+    string or None
+        The file name of the page, or None if the page was empty.
+    """
+    if not montage['labels']:
+        return None
+    with stage('montage.page'):
+        labeled_page = _draw_labels(montage)
+        filename = montage['output_pattern'] % montage['page_index']
+        montage['page'][:] = montage['background_color']
+        montage['labels'] = []
+        montage['page_index'] += 1
+    if write_function is None:
+        matplotlib.image.imsave(filename, labeled_page)
+    else:
+        write_function(filename, labeled_page)
+    montage['written_files'].append(filename)
+    return filename
+
+
+def finish_montage(montage, write_function=None):
+    """
+    Write the last page of a montage.
+
+    Parameters
+    ----------
+    montage: dictionary
+        The montage state, as returned by `new_montage`.
+
+    write_function: callable or None, optional
+        See `add_montage_tile`.
+
+    Returns
+    -------
+    list of strings
+        The file names of all pages of the montage.
+    """
+    write_montage_page(montage, write_function=write_function)
+    return montage['written_files']
+
+
+def get_montage_output_pattern(output_dir, measure, file_format='png'):
+    """
+    Return the page file name pattern for the montage of a batch.
+
+    Examples
+    --------
+    >>> get_montage_output_pattern('/tmp/images', 'thickness')
+    '/tmp/images/montage_thickness_%03d.png'
+    """
+    return os.path.join(output_dir, "montage_%s_%%03d.%s" % (measure, file_format))
@@ -0,0 +1,174 @@
+"""
+Parcel-wise aggregation functions for brainview.
+
+These functions reduce per-vertex data to one value per region (parcel) of a brain atlas, e.g., the mean thickness in each region of the Desikan atlas, and map region values back to the vertices for display. All reductions are vectorized with `np.bincount`, there are no loops over regions or vertices.
+"""
+import numpy as np
+from .profiling import stage
+
+PARCEL_STATS = ('mean', 'median', 'count', 'sum')
+
+
+def _flat_group_indices(data, vertex_labels, num_labels):
+    """
+    Compute flat group indices for 1D or 2D data.
+
+    For 2D data of shape (num_subjects, num_verts), each subject gets its own range of num_labels groups, so a single bincount computes the result for all subjects. Vertices without a label (label < 0) and non-finite values are dropped.
+
+    Returns
+    -------
+    groups: numpy 1D int array
+        The group index of each kept value.
+
+    values: numpy 1D float array
+        The kept values.
+
+    num_groups: int
+        The total number of groups.
+    """
+    vertex_labels = np.asarray(vertex_labels, dtype=np.int64)
+    if vertex_labels.size > 0 and vertex_labels.max() >= num_labels:
+        raise ValueError("ERROR: vertex_labels must be smaller than the number of labels %d, but maximum is %d." % (num_labels, vertex_labels.max()))
+    if data.shape[-1] != vertex_labels.shape[0]:
+        raise ValueError("ERROR: data has %d values per subject, but there are %d vertex labels." % (data.shape[-1], vertex_labels.shape[0]))
+    if data.ndim == 1:
+        groups = vertex_labels
+        num_groups = num_labels
+    else:
+        groups = (vertex_labels[np.newaxis, :] + num_labels * np.arange(data.shape[0])[:, np.newaxis]).ravel()
+        groups[np.tile(vertex_labels < 0, data.shape[0])] = -1
+        num_groups = num_labels * data.shape[0]
+    values = np.asarray(data, dtype=np.float64).ravel()
+    keep = (groups >= 0) & np.isfinite(values)
+    return groups[keep], values[keep], num_groups
+
+
+def _group_medians(groups, values, num_groups):
+    """
+    Compute the median of the values in each group with a single sort.
+    """
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=num_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has_data = counts > 0
+    lower = starts + (counts - 1) // 2
+    upper = starts + counts // 2
+    medians = np.full((num_groups, ), np.nan)
+    medians[has_data] = 0.5 * (sorted_values[lower[has_data]] + sorted_values[upper[has_data]])
+    return medians
+
+
+def parcel_aggregate(data, vertex_labels, num_labels, stat='mean'):
+    """
+    Aggregate per-vertex data within the regions of an atlas.
+
+    Parameters
+    ----------
+    data: numpy 1D array of shape (num_verts, ) or 2D array of shape (num_subjects, num_verts)
+        The per-vertex data. For 2D data, e.g., a data stack from `brainview.datastack`, each row is aggregated separately. Non-finite values are ignored.
+
+    vertex_labels: numpy 1D int array of shape (num_verts, )
+        The region index of each vertex, -1 for vertices without a region. This is what `brainload.annot` returns with `orig_ids=False`.
+
+    num_labels: int
+        The number of regions, i.e., the length of the label_names list of the atlas.
+
+    stat: string, optional
+        The statistic to compute, one of 'mean', 'median', 'count' or 'sum'. Defaults to 'mean'.
+
+    Returns
+    -------
+    numpy array of shape (num_labels, ) for 1D data, or (num_subjects, num_labels) for 2D data
+        The statistic for each region. For 'mean' and 'median', regions without any valid value are NaN.
+
+    Examples
+    --------
+    >>> vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', subjects_dir, 'aparc')
+    >>> region_means = parcel_aggregate(morphometry_data, vertex_labels, len(label_names))
+    """
+    if stat not in PARCEL_STATS:
+        raise ValueError("ERROR: stat must be one of %s, but is '%s'." % (str(PARCEL_STATS), stat))
+    data = np.asarray(data)
+    with stage('parcels.aggregate'):
+        groups, values, num_groups = _flat_group_indices(data, vertex_labels, num_labels)
+        if stat == 'median':
+            result = _group_medians(groups, values, num_groups)
+        else:
+            counts = np.bincount(groups, minlength=num_groups)
+            if stat == 'count':
+                result = counts
+            else:
+                sums = np.bincount(groups, weights=values, minlength=num_groups)
+                if stat == 'sum':
+                    result = sums
+                else:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        result = np.where(counts > 0, sums / counts, np.nan)
+    if data.ndim == 1:
+        return result
+    return result.reshape((data.shape[0], num_labels))
+
+
+def parcel_stats(data, vertex_labels, label_names, stats=('mean', 'median', 'count')):
+    """
+    Compute several statistics for each region of an atlas.
+
+    Parameters
+    ----------
+    data, vertex_labels:
+        See `parcel_aggregate`.
+
+    label_names: list of strings
+        The names of the regions, as returned by `brainload.annot`.
+
+    stats: tuple of strings, optional
+        The statistics to compute, see `parcel_aggregate`. Defaults to ('mean', 'median', 'count').
+
+    Returns
+    -------
+    dictionary
+        Maps each statistic name to its result array, see `parcel_aggregate`. The key `label_names` holds the region names in the same order.
+
+    Examples
+    --------
+    >>> result = parcel_stats(morphometry_data, vertex_labels, label_names)
+    >>> for name, mean in zip(result['label_names'], result['mean']):
+    ...     print("%s: %f" % (name, mean))
+    """
+    result = {'label_names': list(label_names)}
+    for stat in stats:
+        result[stat] = parcel_aggregate(data, vertex_labels, len(label_names), stat=stat)
+    return result
+
+
+def parcel_values_to_vertices(parcel_values, vertex_labels, fill_value=np.nan):
+    """
+    Broadcast per-region values back to the vertices.
+
+    Parameters
+    ----------
+    parcel_values: numpy 1D array of shape (num_labels, ) or 2D array of shape (num_subjects, num_labels)
+        One value per region, e.g., from `parcel_aggregate`.
+
+    vertex_labels: numpy 1D int array of shape (num_verts, )
+        The region index of each vertex, -1 for vertices without a region.
+
+    fill_value: float, optional
+        The value for vertices without a region. Defaults to NaN.
+
+    Returns
+    -------
+    numpy float array of shape (num_verts, ) or (num_subjects, num_verts)
+        The value of the region of each vertex. Can be displayed with `brain_morphometry_view`.
+
+    Examples
+    --------
+    >>> region_means = parcel_aggregate(morphometry_data, vertex_labels, len(label_names))
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, parcel_values_to_vertices(region_means, vertex_labels, fill_value=0.0))
+    """
+    parcel_values = np.asarray(parcel_values, dtype=np.float64)
+    # The fill value goes into the last column, so the label -1 selects it.
+    fill_column = np.full(parcel_values.shape[:-1] + (1, ), fill_value)
+    lut = np.concatenate((parcel_values, fill_column), axis=-1)
+    return lut[..., np.asarray(vertex_labels, dtype=np.int64)]
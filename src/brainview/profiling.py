@@ -0,0 +1,300 @@
+"""
+Timing and profiling instrumentation for brainview.
+
+These functions allow one to find out which stage of a brainview run (loading, clipping, mesh export, rendering, ...) takes the time and memory. Stages are recorded only while a profiling session is active, so the hooks placed in the library code are cheap no-ops otherwise.
+"""
+from __future__ import print_function
+import sys
+import time
+import json
+import threading
+import contextlib
+import functools
+import cProfile
+import pstats
+try:
+    import resource         # Not available under Windows.
+except ImportError:
+    resource = None
+
+
+_session = None
+_session_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+def start_profiling(use_cprofile=False):
+    """
+    Start a profiling session.
+
+    Start a profiling session. While the session is active, all stages entered with the `stage` context manager are timed and recorded. This includes the stages in the brainview library functions, so you can use this to profile your own scripts as well. Only a single session can be active at any time, starting a new one discards the current one.
+
+    Parameters
+    ----------
+    use_cprofile: boolean, optional
+        Whether to additionally run the Python profiler `cProfile` during the session. This has a noticeable overhead, so only use it when the stage timings are not detailed enough. Defaults to False.
+
+    Examples
+    --------
+    Find out how long the creation of a surface takes:
+
+    >>> import brainview.profiling as bp
+    >>> bp.start_profiling()
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data)
+    >>> report = bp.stop_profiling()
+    >>> bp.write_profile_report(report, 'profile.json')
+    """
+    global _session
+    profiler = None
+    if use_cprofile:
+        profiler = cProfile.Profile()
+    with _session_lock:
+        # Only a single profiler can be active, so stop the one of a discarded session before enabling the new one.
+        if _session is not None and _session['cprofile'] is not None:
+            _session['cprofile'].disable()
+        _session = {'start_time': time.time(), 'start_counter': _timer(), 'stages': {}, 'stage_order': [], 'cprofile': profiler}
+    if profiler is not None:
+        profiler.enable()
+
+
+def stop_profiling(num_cprofile_entries=30):
+    """
+    Stop the active profiling session and return its report.
+
+    Stop the active profiling session and return the report, a dictionary that can be written to a JSON file using `write_profile_report`.
+
+    Parameters
+    ----------
+    num_cprofile_entries: int, optional
+        The number of functions to include in the cProfile part of the report, sorted by cumulative time. Ignored if the session was started without cProfile. Defaults to 30.
+
+    Returns
+    -------
+    dictionary or None
+        The report. None if no session was active. The report contains the following keys:
+            - `total_seconds` : wall clock time between start and stop of the session
+            - `peak_rss_kb` : the peak resident set size of the process at the end of the session, in kilobytes. None if this is not supported on the platform.
+            - `stages` : a list of dictionaries, one per stage, in the order in which the stages were first entered. Each has the keys `name`, `calls`, `total_seconds`, `mean_seconds`, `max_seconds` and `peak_rss_kb`. Nested stages are named after their full path, separated by a slash, e.g., 'mesh/singleview.triangular_mesh'.
+            - `cprofile` : only present if cProfile was used. A list of dictionaries with the keys `function`, `calls`, `total_seconds` and `cumulative_seconds`.
+    """
+    global _session
+    with _session_lock:
+        session = _session
+        _session = None
+    if session is None:
+        return None
+    total_seconds = _timer() - session['start_counter']
+    report = {'start_time': session['start_time'], 'total_seconds': total_seconds, 'peak_rss_kb': get_peak_rss_kb()}
+    stages = []
+    for name in session['stage_order']:
+        stage_info = session['stages'][name]
+        if stage_info['calls'] == 0:        # Still running when the session was stopped.
+            continue
+        stages.append({'name': name, 'calls': stage_info['calls'], 'total_seconds': stage_info['total_seconds'], 'mean_seconds': stage_info['total_seconds'] / stage_info['calls'], 'max_seconds': stage_info['max_seconds'], 'peak_rss_kb': stage_info['peak_rss_kb']})
+    report['stages'] = stages
+    profiler = session['cprofile']
+    if profiler is not None:
+        profiler.disable()
+        report['cprofile'] = _cprofile_entries(profiler, num_cprofile_entries)
+    return report
+
+
+def is_profiling():
+    """
+    Determine whether a profiling session is active.
+
+    Returns
+    -------
+    boolean
+        True if a session has been started with `start_profiling` and not stopped yet, False otherwise.
+    """
+    return _session is not None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Time a named stage of the computation.
+
+    Context manager that records the wall clock time spent in the enclosed block under the given stage name, and samples the peak memory usage after the block. Does nothing (except for running the block) if no profiling session is active. Stages can be nested, the recorded name of an inner stage is prefixed with the names of the enclosing stages of the same thread.
+
+    Parameters
+    ----------
+    name: string
+        The name of the stage, e.g., 'load' or 'savefig'. Library functions use names prefixed with their module name, like 'export.write'.
+
+    Examples
+    --------
+    >>> import brainview.profiling as bp
+    >>> with bp.stage('load'):
+    ...     vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1')
+    """
+    if _session is None:
+        yield
+        return
+    stack = getattr(_thread_state, 'stack', None)
+    if stack is None:
+        stack = []
+        _thread_state.stack = stack
+    stack.append(name)
+    full_name = '/'.join(stack)
+    _register_stage(full_name)
+    start = _timer()
+    try:
+        yield
+    finally:
+        elapsed = _timer() - start
+        stack.pop()
+        _record_stage(full_name, elapsed)
+
+
+def profiled(name):
+    """
+    Decorator that runs the decorated function as a named stage.
+
+    Parameters
+    ----------
+    name: string
+        The stage name, see `stage`.
+
+    Examples
+    --------
+    >>> @profiled('my_module.compute')
+    ... def compute(data):
+    ...     return data * 2
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_peak_rss_kb():
+    """
+    Return the peak resident set size of the current process.
+
+    Returns
+    -------
+    int or None
+        The peak resident set size (the maximal amount of physical memory used so far), in kilobytes. None if the information is not available on this platform (e.g., under Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak = peak // 1024     # MacOS reports bytes, Linux reports kilobytes.
+    return int(peak)
+
+
+def write_profile_report(report, filename):
+    """
+    Write a profiling report to a JSON file.
+
+    Parameters
+    ----------
+    report: dictionary
+        A report as returned by `stop_profiling`.
+
+    filename: string
+        Path to the output file. Will be overwritten if it exists.
+    """
+    with open(filename, "w") as json_file:
+        json.dump(report, json_file, indent=2, sort_keys=True)
+
+
+def stop_profiling_to_file(filename, command=None):
+    """
+    Stop the active profiling session and write its report to a JSON file.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the output file. Will be overwritten if it exists.
+
+    command: list of strings, optional
+        The command line of the profiled run, e.g., `sys.argv`. Stored in the report under the key `command` if given.
+
+    Returns
+    -------
+    dictionary or None
+        The report that was written, see `stop_profiling`. None if no session was active, in that case nothing is written.
+    """
+    report = stop_profiling()
+    if report is None:
+        return None
+    if command is not None:
+        report['command'] = list(command)
+    write_profile_report(report, filename)
+    return report
+
+
+def format_profile_report(report):
+    """
+    Format a profiling report as a human-readable table.
+
+    Parameters
+    ----------
+    report: dictionary
+        A report as returned by `stop_profiling`.
+
+    Returns
+    -------
+    string
+        The per-stage breakdown, one line per stage.
+    """
+    lines = ["%-40s %6s %10s %12s" % ('stage', 'calls', 'seconds', 'peak_rss_kb')]
+    for stage_info in report['stages']:
+        lines.append("%-40s %6d %10.4f %12s" % (stage_info['name'], stage_info['calls'], stage_info['total_seconds'], stage_info['peak_rss_kb']))
+    lines.append("%-40s %6s %10.4f %12s" % ('total', '', report['total_seconds'], report['peak_rss_kb']))
+    return "\n".join(lines)
+
+
+def _timer():
+    """
+    Return the value of the most precise clock available for measuring durations, in seconds.
+    """
+    if hasattr(time, 'perf_counter'):
+        return time.perf_counter()
+    return time.time()      # Python 2
+
+
+def _register_stage(full_name):
+    """
+    Make sure the active session has an entry for the stage. Done on entering a stage, so that the stages are reported in the order they were entered.
+    """
+    with _session_lock:
+        session = _session
+        if session is not None and full_name not in session['stages']:
+            session['stages'][full_name] = {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'peak_rss_kb': None}
+            session['stage_order'].append(full_name)
+
+
+def _record_stage(full_name, elapsed):
+    """
+    Add a single timing for a stage to the active session.
+    """
+    peak_rss_kb = get_peak_rss_kb()
+    with _session_lock:
+        session = _session
+        if session is None or full_name not in session['stages']:     # The session was stopped or restarted while the stage was running.
+            return
+        stage_info = session['stages'][full_name]
+        stage_info['calls'] += 1
+        stage_info['total_seconds'] += elapsed
+        stage_info['max_seconds'] = max(stage_info['max_seconds'], elapsed)
+        stage_info['peak_rss_kb'] = peak_rss_kb
+
+
+def _cprofile_entries(profiler, num_entries):
+    """
+    Extract the functions with the highest cumulative time from a cProfile profiler.
+    """
+    stats = pstats.Stats(profiler)
+    entries = []
+    for func, (primitive_calls, num_calls, total_time, cumulative_time, callers) in stats.stats.items():
+        entries.append({'function': "%s:%d(%s)" % func, 'calls': num_calls, 'total_seconds': total_time, 'cumulative_seconds': cumulative_time})
+    entries.sort(key=lambda entry: entry['cumulative_seconds'], reverse=True)
+    return entries[:num_entries]
@@ -0,0 +1,544 @@
+"""
+Render service for brainview.
+
+These functions run brainview as a long-running local service that answers render and export requests, e.g., from a web dashboard that shows brain images on demand. Starting a new process for each image pays the import of mayavi and VTK, the creation of a render window and the loading of the mesh every time. The service pays this once: it keeps a single offscreen figure alive and the recently used meshes (e.g., the average subject) in a cache.
+
+Requests are dictionaries (JSON over HTTP, see `start_server`) with the same parameters as the command line tools. They are queued and processed by a pool of worker threads, which load the data and write the results. All rendering is done in a single dedicated render thread, as VTK does not support rendering from several threads.
+"""
+from __future__ import print_function
+import io
+import json
+import time
+import threading
+import collections
+import numpy as np
+import brainload as bl
+import matplotlib.image
+import mayavi.mlab as mlab
+from .profiling import stage
+from .batch import _show_subject_data
+from .export import export_mesh_to_file, load_export_data, as_float_data
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler     # Python 3
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+try:
+    _STRING_TYPES = (str, unicode)      # Python 2, JSON strings are unicode
+except NameError:
+    _STRING_TYPES = (str, )
+
+SERVICE_COMMANDS = ('render', 'export')
+SERVICE_STAGES = ('queue', 'load', 'render_wait', 'render', 'write', 'total')
+
+# The request parameters and their defaults. The names are those of the long command line options, with underscores.
+REQUEST_DEFAULTS = {'subjects_dir': None, 'surface': 'white', 'hemi': 'both', 'common_subject_mode': False, 'average_subject': 'fsaverage', 'fwhm': '10', 'no_clip': False, 'value_range': None, 'output_file': None, 'boundaries': False}
+
+
+def new_service(subjects_dir=None, num_workers=2, max_queue=32, size=(800, 600), colormap='cool', clip_percentiles=(5, 95), export_colormap='viridis', template_cache_size=8, num_latency_samples=1000):
+    """
+    Create and start a new render service.
+
+    Starts the worker threads and the render thread, and creates the offscreen figure in the render thread.
+
+    Parameters
+    ----------
+    subjects_dir: string or None, optional
+        The subjects_dir used for requests that do not contain one. Defaults to None, which requires all requests to contain one.
+
+    num_workers: int, optional
+        The number of worker threads that load data and write results. Rendering is always done in a single thread. Defaults to 2.
+
+    max_queue: int, optional
+        The maximal number of requests that are queued or in progress. Further requests are rejected until some are done, see `submit_request`. Defaults to 32.
+
+    size: tuple of 2 ints, optional
+        The image width and height in pixels. Defaults to (800, 600).
+
+    colormap: string, optional
+        The mayavi colormap for rendering. Defaults to 'cool'.
+
+    clip_percentiles: tuple of 2 numbers or None, optional
+        The morphometry data is clipped at these percentiles unless a request sets 'no_clip' or a 'value_range'. Defaults to (5, 95). None disables clipping.
+
+    export_colormap: string, optional
+        The matplotlib colormap for mesh exports. Defaults to 'viridis'.
+
+    template_cache_size: int, optional
+        The maximal number of meshes kept in memory. The least recently used mesh is dropped when the cache is full. Defaults to 8.
+
+    num_latency_samples: int, optional
+        The number of most recent requests the latency statistics are computed from, see `get_service_metrics`. Defaults to 1000.
+
+    Returns
+    -------
+    dictionary
+        The service state. Pass it to `submit_request`, `get_service_metrics` and `stop_service`.
+
+    Examples
+    --------
+    >>> service = new_service(subjects_dir, num_workers=4)
+    >>> result = submit_request(service, {'command': 'render', 'subject': 'subject1', 'measure': 'thickness', 'output_file': '/tmp/subject1.png'}).result()
+    >>> stop_service(service)
+    """
+    if cf is None:
+        raise ValueError("ERROR: The render service requires the concurrent.futures module.")
+    if num_workers < 1:
+        raise ValueError("ERROR: num_workers must be at least 1, but is %d." % num_workers)
+    service = {'subjects_dir': subjects_dir, 'num_workers': num_workers, 'max_queue': max_queue, 'size': size, 'colormap': colormap, 'clip_percentiles': clip_percentiles, 'export_colormap': export_colormap}
+    service['worker_executor'] = cf.ThreadPoolExecutor(max_workers=num_workers)
+    service['render_executor'] = cf.ThreadPoolExecutor(max_workers=1)
+    service['lock'] = threading.Lock()
+    service['num_pending'] = 0
+    service['counts'] = {'completed': 0, 'failed': 0, 'rejected': 0}
+    service['latencies'] = dict((stage_name, collections.deque(maxlen=num_latency_samples)) for stage_name in SERVICE_STAGES)
+    service['template_cache'] = collections.OrderedDict()
+    service['template_cache_size'] = template_cache_size
+    service['template_cache_stats'] = {'hits': 0, 'misses': 0}
+    service['template_loads'] = {}
+    service['displayed'] = {'surface': None, 'faces': None}
+    service['start_time'] = time.time()
+    service['fig'] = service['render_executor'].submit(_create_figure, size).result()
+    return service
+
+
+def _create_figure(size):
+    """
+    Create the offscreen figure. Runs in the render thread.
+    """
+    mlab.options.offscreen = True
+    return mlab.figure(bgcolor=(1, 1, 1), size=size)
+
+
+def stop_service(service):
+    """
+    Stop a render service.
+
+    Waits for all queued requests to finish, then closes the figure and stops the threads.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+    """
+    service['worker_executor'].shutdown(wait=True)
+    service['render_executor'].submit(mlab.close, service['fig']).result()
+    service['render_executor'].shutdown(wait=True)
+
+
+def get_template_mesh(service, subjects_dir, subject_id, surf='white', hemi='both'):
+    """
+    Return the mesh of a subject, from the template cache if possible.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    subjects_dir, subject_id, surf, hemi: string
+        Identify the mesh, see `brainload.subject`.
+
+    Returns
+    -------
+    tuple
+        The vertex coordinates, faces and meta data of the mesh. The same objects are returned for all requests for the mesh while it is cached, they must not be modified.
+
+    Examples
+    --------
+    >>> vert_coords, faces, meta_data = get_template_mesh(service, subjects_dir, 'fsaverage')
+    """
+    key = (subjects_dir, subject_id, surf, hemi)
+    with service['lock']:
+        mesh = service['template_cache'].get(key)
+        if mesh is not None:
+            service['template_cache'].pop(key)
+            service['template_cache'][key] = mesh
+            service['template_cache_stats']['hits'] += 1
+            return mesh
+        # If another request is already loading the mesh, wait for its result instead of loading it again.
+        pending_load = service['template_loads'].get(key)
+        if pending_load is None:
+            service['template_cache_stats']['misses'] += 1
+            own_load = service['template_loads'][key] = cf.Future()
+        else:
+            service['template_cache_stats']['hits'] += 1
+    if pending_load is not None:
+        return pending_load.result()
+    # Load without holding the lock, so requests for other meshes are not blocked.
+    try:
+        with stage('service.load_mesh'):
+            vert_coords, faces, _, meta_data = bl.subject(subject_id, subjects_dir=subjects_dir, surf=surf, hemi=hemi, load_morphometry_data=False)
+    except Exception as err:
+        with service['lock']:
+            del service['template_loads'][key]
+        own_load.set_exception(err)
+        raise
+    mesh = (vert_coords, faces, meta_data)
+    with service['lock']:
+        service['template_cache'][key] = mesh
+        while len(service['template_cache']) > service['template_cache_size']:
+            service['template_cache'].popitem(last=False)
+        del service['template_loads'][key]
+    own_load.set_result(mesh)
+    return mesh
+
+
+def get_request_value(service, request, key):
+    """
+    Return a parameter of a request, or its default value.
+    """
+    if key == 'subjects_dir' and request.get('subjects_dir') is None:
+        return service['subjects_dir']
+    return request.get(key, REQUEST_DEFAULTS.get(key))
+
+
+def check_request(service, request):
+    """
+    Check that a request is valid, before it is queued.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    request: dictionary
+        The request. Must contain the keys 'command' (one of `SERVICE_COMMANDS`) and 'subject'. Render requests must contain the key 'measure', export requests the keys 'mode', 'data' and 'output_file'. The optional keys and their defaults are listed in `REQUEST_DEFAULTS`.
+
+    Raises
+    ------
+    ValueError
+        If the request is invalid.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("ERROR: request must be a JSON object, but is '%s'." % type(request).__name__)
+    command = request.get('command')
+    if command not in SERVICE_COMMANDS:
+        raise ValueError("ERROR: command must be one of %s, but is '%s'." % (str(SERVICE_COMMANDS), command))
+    required_keys = ['subject', 'measure'] if command == 'render' else ['subject', 'mode', 'data', 'output_file']
+    for key in required_keys:
+        if not request.get(key):
+            raise ValueError("ERROR: %s request is missing the parameter '%s'." % (command, key))
+    if get_request_value(service, request, 'subjects_dir') is None:
+        raise ValueError("ERROR: request is missing the parameter 'subjects_dir' and the service has no default subjects_dir.")
+    # These values are used as keys of the mesh cache and passed to brainload, so they must be strings.
+    for key in ('subject', 'subjects_dir', 'surface', 'hemi', 'average_subject'):
+        value = get_request_value(service, request, key)
+        if not isinstance(value, _STRING_TYPES):
+            raise ValueError("ERROR: %s must be a string, but is a '%s'." % (key, type(value).__name__))
+    if get_request_value(service, request, 'hemi') not in ('lh', 'rh', 'both'):
+        raise ValueError("ERROR: hemi must be one of ('lh', 'rh', 'both'), but is '%s'." % get_request_value(service, request, 'hemi'))
+    if command == 'export' and request['mode'] not in ('morphometry', 'atlas', 'label'):
+        raise ValueError("ERROR: mode must be one of ('morphometry', 'atlas', 'label'), but is '%s'." % request['mode'])
+    value_range = request.get('value_range')
+    if value_range is not None:
+        if not isinstance(value_range, (list, tuple)) or len(value_range) != 2:
+            raise ValueError("ERROR: value_range must be a list of 2 numbers, but is '%s'." % str(value_range))
+        try:
+            [float(value) for value in value_range]
+        except (TypeError, ValueError):
+            raise ValueError("ERROR: value_range must be a list of 2 numbers, but is '%s'." % str(value_range))
+
+
+def submit_request(service, request):
+    """
+    Queue a request.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    request: dictionary
+        The request, see `check_request`.
+
+    Returns
+    -------
+    future or None
+        A future for the result of the request, see `process_request`. None if the request was rejected because max_queue requests are already queued or in progress.
+
+    Raises
+    ------
+    ValueError
+        If the request is invalid.
+    """
+    check_request(service, request)
+    with service['lock']:
+        if service['num_pending'] >= service['max_queue']:
+            service['counts']['rejected'] += 1
+            return None
+        service['num_pending'] += 1
+    future = service['worker_executor'].submit(process_request, service, request, time.time())
+    future.add_done_callback(lambda done_future: _request_done(service, done_future))
+    return future
+
+
+def _request_done(service, future):
+    """
+    Update the counters when a request is done.
+    """
+    with service['lock']:
+        service['num_pending'] -= 1
+        if future.exception() is None:
+            service['counts']['completed'] += 1
+        else:
+            service['counts']['failed'] += 1
+
+
+def process_request(service, request, submit_time=None):
+    """
+    Process a request. Runs in a worker thread.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    request: dictionary
+        The request, see `check_request`.
+
+    submit_time: float or None, optional
+        When the request was queued, as returned by `time.time`. Used to measure the queue latency. Defaults to None, which means now.
+
+    Returns
+    -------
+    dictionary
+        The result. Contains the keys 'command', 'subject', 'output_file' and 'timings', which maps the stages in `SERVICE_STAGES` to their latency in seconds. The stage 'render_wait' is the time the request waited for the render thread, which renders one request at a time. Export requests have no render stages. If a render request contains no 'output_file', the key 'image' holds the image encoded in PNG format instead.
+    """
+    start = time.time()
+    timings = {'queue': start - submit_time if submit_time is not None else 0.0}
+    if request['command'] == 'render':
+        result = _process_render_request(service, request, timings)
+    else:
+        result = _process_export_request(service, request, timings)
+    timings['total'] = time.time() - (submit_time if submit_time is not None else start)
+    with service['lock']:
+        for stage_name, seconds in timings.items():
+            service['latencies'][stage_name].append(seconds)
+    result.update({'command': request['command'], 'subject': request['subject'], 'timings': timings})
+    return result
+
+
+def _load_mesh(service, request, mesh_subject_id):
+    return get_template_mesh(service, get_request_value(service, request, 'subjects_dir'), mesh_subject_id, surf=get_request_value(service, request, 'surface'), hemi=get_request_value(service, request, 'hemi'))
+
+
+def _process_render_request(service, request, timings):
+    """
+    Load, render and write the morphometry data of a subject.
+    """
+    subjects_dir = get_request_value(service, request, 'subjects_dir')
+    hemi = get_request_value(service, request, 'hemi')
+    surf = get_request_value(service, request, 'surface')
+    common_subject_mode = get_request_value(service, request, 'common_subject_mode')
+    start = time.time()
+    with stage('service.load'):
+        if common_subject_mode:
+            vert_coords, faces, meta_data = _load_mesh(service, request, get_request_value(service, request, 'average_subject'))
+            morphometry_data = bl.subject_data_standard(request['subject'], subjects_dir, request['measure'], hemi, get_request_value(service, request, 'fwhm'), average_subject=get_request_value(service, request, 'average_subject'), surf=surf)[0]
+        else:
+            vert_coords, faces, meta_data = _load_mesh(service, request, request['subject'])
+            morphometry_data = bl.subject_data_native(request['subject'], subjects_dir, request['measure'], hemi, surf=surf)[0]
+        morphometry_data = as_float_data(morphometry_data)
+        value_range = get_request_value(service, request, 'value_range')
+        if value_range is not None:
+            morphometry_data = np.clip(morphometry_data, float(value_range[0]), float(value_range[1]))
+        elif service['clip_percentiles'] is not None and not get_request_value(service, request, 'no_clip'):
+            lower_value, upper_value = np.percentile(morphometry_data, service['clip_percentiles'])
+            morphometry_data = np.clip(morphometry_data, float(lower_value), float(upper_value))
+    timings['load'] = time.time() - start
+
+    start = time.time()
+    image, render_seconds = service['render_executor'].submit(_render, service, vert_coords, faces, morphometry_data, value_range).result()
+    timings['render'] = render_seconds
+    timings['render_wait'] = time.time() - start - render_seconds
+
+    start = time.time()
+    result = {'output_file': get_request_value(service, request, 'output_file')}
+    with stage('service.write'):
+        if result['output_file'] is None:
+            image_buffer = io.BytesIO()
+            matplotlib.image.imsave(image_buffer, image, format='png')
+            result['image'] = image_buffer.getvalue()
+        else:
+            matplotlib.image.imsave(result['output_file'], image)
+    timings['write'] = time.time() - start
+    return result
+
+
+def _render(service, vert_coords, faces, morphometry_data, value_range):
+    """
+    Render morphometry data into the figure of the service and return a screenshot and the render time. Runs in the render thread.
+    """
+    start = time.time()
+    with stage('service.render'):
+        displayed = service['displayed']
+        displayed['surface'] = _show_subject_data(service['fig'], displayed['surface'], displayed['faces'], vert_coords, faces, morphometry_data, service['colormap'], value_range)
+        displayed['faces'] = faces
+        image = mlab.screenshot(figure=service['fig'], mode='rgb', antialiased=False)
+    return image, time.time() - start
+
+
+def _process_export_request(service, request, timings):
+    """
+    Load and export the mesh of a subject. Nothing is rendered.
+    """
+    mode = request['mode']
+    common_subject_mode = get_request_value(service, request, 'common_subject_mode') and mode == 'morphometry'
+    start = time.time()
+    with stage('service.load'):
+        mesh = _load_mesh(service, request, get_request_value(service, request, 'average_subject') if common_subject_mode else request['subject'])
+        clip_percentiles = None if get_request_value(service, request, 'no_clip') else service['clip_percentiles']
+        vert_coords, faces, export_args = load_export_data(request['subject'], get_request_value(service, request, 'subjects_dir'), mode, request['data'], hemi=get_request_value(service, request, 'hemi'), surf=get_request_value(service, request, 'surface'), common_subject_mode=common_subject_mode, fwhm=get_request_value(service, request, 'fwhm'), average_subject=get_request_value(service, request, 'average_subject'), clip_percentiles=clip_percentiles, boundaries=get_request_value(service, request, 'boundaries'), colormap_name=service['export_colormap'], mesh=mesh)
+    timings['load'] = time.time() - start
+
+    start = time.time()
+    with stage('service.write'):
+        export_mesh_to_file(request['output_file'], vert_coords, faces, **export_args)
+    timings['write'] = time.time() - start
+    return {'output_file': request['output_file']}
+
+
+def get_service_metrics(service):
+    """
+    Return the request counts and latency statistics of a render service.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    Returns
+    -------
+    dictionary
+        Contains the request counts ('completed', 'failed', 'rejected' and 'pending'), the template cache statistics, the uptime in seconds and, under 'latency', the count, mean, median, 95th percentile and maximum in seconds of each stage in `SERVICE_STAGES` over the most recent requests. All values can be serialized to JSON.
+    """
+    with service['lock']:
+        metrics = dict(service['counts'])
+        metrics['pending'] = service['num_pending']
+        metrics['workers'] = service['num_workers']
+        metrics['max_queue'] = service['max_queue']
+        metrics['template_cache'] = {'meshes': len(service['template_cache']), 'hits': service['template_cache_stats']['hits'], 'misses': service['template_cache_stats']['misses']}
+        latencies = dict((stage_name, np.array(service['latencies'][stage_name], dtype=np.float64)) for stage_name in SERVICE_STAGES)
+    metrics['uptime_seconds'] = time.time() - service['start_time']
+    metrics['latency'] = {}
+    for stage_name in SERVICE_STAGES:
+        samples = latencies[stage_name]
+        if samples.size == 0:
+            metrics['latency'][stage_name] = {'count': 0}
+        else:
+            p50, p95 = np.percentile(samples, [50, 95])
+            metrics['latency'][stage_name] = {'count': int(samples.size), 'mean': float(np.mean(samples)), 'p50': float(p50), 'p95': float(p95), 'max': float(np.max(samples))}
+    return metrics
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _get_request_handler(service, verbose=False):
+    """
+    Return an HTTP request handler class that passes requests to a render service.
+    """
+    class RenderRequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send_json(200, get_service_metrics(service))
+            elif self.path == '/status':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': "ERROR: unknown path '%s'." % self.path})
+
+        def do_POST(self):
+            command = self.path.strip('/')
+            if command not in SERVICE_COMMANDS:
+                self._send_json(404, {'error': "ERROR: unknown path '%s'." % self.path})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+                if isinstance(request, dict):
+                    request['command'] = command
+                future = submit_request(service, request)
+            except ValueError as err:
+                self._send_json(400, {'error': str(err)})
+                return
+            if future is None:
+                self._send_json(503, {'error': "ERROR: the render queue is full, try again later."})
+                return
+            try:
+                result = future.result()
+            except (IOError, OSError) as err:
+                self._send_json(404, {'error': str(err)})
+                return
+            except Exception as err:
+                self._send_json(500, {'error': str(err)})
+                return
+            if 'image' in result:
+                image = result.pop('image')
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(image)))
+                self.send_header('X-Render-Timings', json.dumps(result['timings']))
+                self.end_headers()
+                self.wfile.write(image)
+            else:
+                self._send_json(200, result)
+
+        def _send_json(self, status, content):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if verbose:
+                BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    return RenderRequestHandler
+
+
+def start_server(service, host='127.0.0.1', port=8642, verbose=False):
+    """
+    Create an HTTP server for a render service.
+
+    The server accepts JSON requests with POST on the paths '/render' and '/export', see `check_request` (the command is taken from the path). Render requests without an 'output_file' are answered with the image in PNG format, all others with the JSON result of `process_request`. GET on '/metrics' returns the `get_service_metrics`, GET on '/status' can be used as a health check. Each connection is handled in its own thread, the requests are then queued for the worker threads of the service. If the queue is full, the server answers with status 503.
+
+    Parameters
+    ----------
+    service: dictionary
+        The service state, as returned by `new_service`.
+
+    host: string, optional
+        The address to listen on. Defaults to '127.0.0.1', which only accepts local connections. The service has no authentication, and requests can write files anywhere the service user can, so do not make it reachable from other machines.
+
+    port: int, optional
+        The port to listen on. Defaults to 8642. Use 0 to pick a free port.
+
+    verbose: bool, optional
+        Whether to log every request to stderr. Defaults to False.
+
+    Returns
+    -------
+    server
+        The HTTP server. Call its `serve_forever` method to run it, and `shutdown` from another thread to stop it. The port it listens on is `server.server_address[1]`.
+
+    Examples
+    --------
+    >>> server = start_server(new_service(subjects_dir))
+    >>> server.serve_forever()
+
+    And on the client side:
+
+    $ curl -d '{"subject": "subject1", "measure": "thickness"}' http://127.0.0.1:8642/render > subject1.png
+    """
+    return _ThreadingHTTPServer((host, port), _get_request_handler(service, verbose=verbose))
@@ -0,0 +1,285 @@
+"""
+Multi-measure sessions for brainview.
+
+A session shows several morphometry measures of one subject, e.g., thickness, area and volume, on a single mesh. The surface is loaded once and the measures are loaded concurrently. Switching between measures only replaces the scalars of the existing mayavi surface, so neither the mesh nor the scene has to be rebuilt.
+"""
+from __future__ import print_function
+import os
+import collections
+import numpy as np
+import brainload as bl
+from .profiling import stage
+from .export import as_float_data
+from .lod import set_surface_lod, lod_vertex_data
+
+try:
+    import concurrent.futures as cf     # Python 3
+except ImportError:
+    cf = None
+
+
+def load_measures(subject_id, subjects_dir, measures, hemi='both', surf='white', common_subject_mode=False, fwhm='10', average_subject='fsaverage', num_workers=None):
+    """
+    Load several morphometry measures of a subject concurrently.
+
+    Parameters
+    ----------
+    subject_id: string
+        The subject identifier.
+
+    subjects_dir: string
+        The directory containing the subject.
+
+    measures: list of strings
+        The measures to load, e.g., ['thickness', 'area'].
+
+    hemi: string, optional
+        The hemisphere, one of 'lh', 'rh' or 'both'. Defaults to 'both'.
+
+    surf: string, optional
+        The surface the measures were computed on. Defaults to 'white'.
+
+    common_subject_mode: bool, optional
+        Whether to load the data mapped to the common subject, see `brainload.subject_data_standard`. Defaults to False, which loads the native space data.
+
+    fwhm, average_subject: optional
+        Passed on to `brainload.subject_data_standard`. Ignored unless common_subject_mode is True.
+
+    num_workers: int or None, optional
+        The number of loader threads. Defaults to None, which uses one thread per measure.
+
+    Returns
+    -------
+    collections.OrderedDict
+        Maps each measure to its data, a numpy 1D float array. The order is the order of the measures list.
+
+    Examples
+    --------
+    >>> measure_data = load_measures('subject1', subjects_dir, ['thickness', 'area', 'volume'])
+    """
+    def load(measure):
+        with stage('session.load_measure'):
+            if common_subject_mode:
+                morphometry_data, meta_data = bl.subject_data_standard(subject_id, subjects_dir, measure, hemi, fwhm, average_subject=average_subject, surf=surf)
+            else:
+                morphometry_data, meta_data = bl.subject_data_native(subject_id, subjects_dir, measure, hemi, surf=surf)
+        return as_float_data(morphometry_data)
+
+    if cf is None or len(measures) < 2 or num_workers == 1:
+        loaded = [load(measure) for measure in measures]
+    else:
+        with cf.ThreadPoolExecutor(max_workers=num_workers or len(measures)) as executor:
+            loaded = list(executor.map(load, measures))
+    return collections.OrderedDict(zip(measures, loaded))
+
+
+def compute_clip_ranges(measure_data, lower=5, upper=95):
+    """
+    Compute the display range of each measure from percentiles.
+
+    Parameters
+    ----------
+    measure_data: dictionary
+        Maps measures to their data, as returned by `load_measures`.
+
+    lower: int, optional
+        The lower percentile. Defaults to 5.
+
+    upper: int, optional
+        The upper percentile. Defaults to 95.
+
+    Returns
+    -------
+    collections.OrderedDict
+        Maps each measure to a tuple (lower_value, upper_value).
+    """
+    clip_ranges = collections.OrderedDict()
+    with stage('session.clip_ranges'):
+        for measure, data in measure_data.items():
+            lower_value, upper_value = np.percentile(data, [lower, upper])
+            clip_ranges[measure] = (lower_value, upper_value)
+    return clip_ranges
+
+
+def create_measure_session(surface, vert_coords, faces, measure_data, clip_ranges=None):
+    """
+    Create a session for switching between measures on a surface.
+
+    Parameters
+    ----------
+    surface: mayavi.modules.surface.Surface
+        The surface the measures are displayed on, e.g., as returned by `brain_morphometry_view`.
+
+    vert_coords, faces:
+        The full resolution mesh of the surface.
+
+    measure_data: dictionary
+        Maps measures to their data, as returned by `load_measures`. The first measure is considered the current one.
+
+    clip_ranges: dictionary or None, optional
+        Maps measures to their display range, as returned by `compute_clip_ranges`. Values are clipped to the range. Defaults to None, which displays the full range of each measure.
+
+    Returns
+    -------
+    dictionary
+        The session state. Pass it to `show_measure`, `cycle_measure` and `add_measure_key_bindings`.
+
+    Examples
+    --------
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, measure_data['thickness'])
+    >>> session = create_measure_session(surface, vert_coords, faces, measure_data, compute_clip_ranges(measure_data))
+    >>> for measure in session['measures']:
+    ...     show_measure(session, measure)
+    ...     mlab.savefig(measure_output_file('brain.png', measure))
+    """
+    return {'surface': surface, 'vert_coords': vert_coords, 'faces': faces, 'measures': list(measure_data.keys()), 'data': measure_data, 'clip_ranges': clip_ranges, 'current': 0, 'lod': None}
+
+
+def get_display_data(session, measure):
+    """
+    Return the data of a measure as it is displayed, i.e., clipped to its range.
+
+    Returns
+    -------
+    numpy 1D float array
+        The clipped data for the full resolution mesh.
+    """
+    data = session['data'][measure]
+    if session['clip_ranges'] is not None:
+        data = np.clip(data, session['clip_ranges'][measure][0], session['clip_ranges'][measure][1])
+    return data
+
+
+def show_measure(session, measure):
+    """
+    Display another measure of the session.
+
+    Replaces the scalars of the session surface in place and adjusts the color map range to the new data.
+
+    Parameters
+    ----------
+    session: dictionary
+        The session, as returned by `create_measure_session`.
+
+    measure: string
+        The measure to display. Must be one of the session measures.
+    """
+    if measure not in session['data']:
+        raise ValueError("ERROR: Measure '%s' not loaded in this session, available measures are: %s." % (measure, ", ".join(session['measures'])))
+    with stage('session.show_measure'):
+        scalars = get_display_data(session, measure)
+        if session['lod'] is not None:
+            scalars = lod_vertex_data(session['lod'], scalars)
+        surface = session['surface']
+        surface.mlab_source.scalars = scalars
+        lut_manager = surface.module_manager.scalar_lut_manager
+        lut_manager.use_default_range = False
+        lut_manager.data_range = np.array([np.min(scalars), np.max(scalars)])
+        lut_manager.data_name = measure
+    session['current'] = session['measures'].index(measure)
+
+
+def cycle_measure(session, step=1):
+    """
+    Display the next (or previous) measure of the session.
+
+    Parameters
+    ----------
+    session: dictionary
+        The session, as returned by `create_measure_session`.
+
+    step: int, optional
+        How many measures to move forward. Use -1 for the previous one. Wraps around at the ends. Defaults to 1.
+
+    Returns
+    -------
+    string
+        The measure that is now displayed.
+    """
+    measure = session['measures'][(session['current'] + step) % len(session['measures'])]
+    show_measure(session, measure)
+    return measure
+
+
+def set_session_lod(session, target_num_verts):
+    """
+    Display a decimated mesh for the session surface, see `brainview.lod.set_surface_lod`.
+
+    Measures displayed later with `show_measure` are carried over to the decimated mesh automatically.
+
+    Returns
+    -------
+    dictionary
+        The level of detail that is now displayed.
+    """
+    lod = set_surface_lod(session['surface'], session['vert_coords'], session['faces'], target_num_verts)
+    if lod['vert_coords'] is not session['vert_coords']:
+        session['lod'] = lod
+    return lod
+
+
+def add_measure_key_bindings(fig, session, next_key='n', previous_key='b', verbose=True):
+    """
+    Switch between the session measures with keyboard shortcuts in an interactive figure.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The mayavi figure.
+
+    session: dictionary
+        The session, as returned by `create_measure_session`.
+
+    next_key: string, optional
+        The key that displays the next measure. Defaults to 'n'.
+
+    previous_key: string, optional
+        The key that displays the previous measure. Defaults to 'b'.
+
+    verbose: bool, optional
+        Whether to print the name of the new measure when switching. Defaults to True.
+
+    Returns
+    -------
+    int or None
+        The observer id, or None if the figure has no interactor.
+    """
+    interactor = fig.scene.interactor
+    if interactor is None:
+        return None
+
+    def on_key_press(obj, event):
+        key = obj.GetKeySym()
+        if key in (next_key, previous_key):
+            measure = cycle_measure(session, 1 if key == next_key else -1)
+            fig.scene.render()
+            if verbose:
+                print("Displaying measure %s." % measure)
+
+    return interactor.add_observer('KeyPressEvent', on_key_press)
+
+
+def measure_output_file(filename, measure):
+    """
+    Return the output file name for one measure of a session.
+
+    Parameters
+    ----------
+    filename: string
+        The base file name, e.g., 'brain.png'.
+
+    measure: string
+        The measure.
+
+    Returns
+    -------
+    string
+        The file name with the measure inserted before the file extension.
+
+    Examples
+    --------
+    >>> measure_output_file('/tmp/brain.png', 'thickness')
+    '/tmp/brain_thickness.png'
+    """
+    base, extension = os.path.splitext(filename)
+    return "%s_%s%s" % (base, measure, extension)
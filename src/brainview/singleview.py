@@ -6,16 +6,83 @@ These functions provide a single view, i.e., the scene is visible from a single
 from __future__ import print_function
 import numpy as np
 import brainload as bl
-import brainload.spatial as st
 import mayavi.mlab as mlab
+from mayavi.tools.sources import MTriangularMeshSource
+from tvtk.api import tvtk
+from .profiling import stage
+from .topology import parcel_boundaries
+from .colors import has_colormap, colormap_lut, annotation_lut
+from .labelset import labelset_vertex_colors
 
 
 
 
 
+def _get_points_array(vert_coords):
+    """
+    Return the vertex coordinates as a C-contiguous float32 array of shape (n_verts, 3).
+
+    VTK stores points as float32 by default and uses an array with this layout without a copy. Arrays that already have it are returned as they are, so callers that render the same mesh many times should convert it once.
+    """
+    return np.ascontiguousarray(vert_coords, dtype=np.float32)
+
+
+class _PointsMeshSource(MTriangularMeshSource):
+    """
+    A triangular mesh source that is built from a single (n_verts, 3) array of points.
+
+    The mlab triangular mesh source combines separate x, y and z arrays into a new float64 array of points every time it is reset. This source passes a float32 points array to VTK as it is instead, see `_get_points_array`. The x, y and z traits are views into the points, so code written for the `mlab_source` of a surface created by `mlab.triangular_mesh` (e.g., setting the scalars or calling reset) works unchanged.
+    """
+
+    def reset(self, **traits):
+        """
+        Create the dataset, or replace the data of the existing one. Accepts the points, or x, y and z, and the triangles and scalars.
+        """
+        if 'points' not in traits and any(axis in traits for axis in ('x', 'y', 'z')):
+            traits['points'] = np.column_stack([traits.get(axis, getattr(self, axis)) for axis in ('x', 'y', 'z')])
+        if 'points' in traits:
+            points = _get_points_array(traits.pop('points'))
+            traits.update(x=points[:, 0], y=points[:, 1], z=points[:, 2])
+            self.trait_set(trait_change_notify=False, points=points, **traits)
+        else:
+            self.trait_set(trait_change_notify=False, **traits)
+        points = self.points
+        triangles = self.triangles
+        if triangles.shape[1] != 3:
+            raise ValueError("ERROR: triangles must have shape (n_faces, 3), but has shape %s." % str(triangles.shape))
+        if triangles.size > 0 and (triangles.min() < 0 or triangles.max() >= points.shape[0]):
+            raise ValueError("ERROR: triangles must be indices into the %d points, but range is %d..%d." % (points.shape[0], triangles.min(), triangles.max()))
+
+        new_dataset = self.dataset is None
+        dataset = tvtk.PolyData() if new_dataset else self.dataset
+        # Remove the old cells before the points are replaced, so they never refer to points that do not exist.
+        dataset.polys = None
+        dataset.points = points
+        dataset.polys = triangles
+
+        scalars = self.scalars
+        if scalars is None or ('scalars' not in traits and scalars.shape[0] != points.shape[0]):
+            # Like mlab.triangular_mesh, color by the z coordinate if no scalars are given. The scalars can also be RGBA colors of shape (n_verts, 4), see `brain_rgba_view`.
+            scalars = np.ascontiguousarray(points[:, 2])
+            self.trait_set(trait_change_notify=False, scalars=scalars)
+        if scalars.shape[0] != points.shape[0]:
+            raise ValueError("ERROR: scalars must contain one value per point (%d), but contain %d." % (points.shape[0], scalars.shape[0]))
+        if not scalars.flags.contiguous:
+            scalars = scalars.copy()
+            self.trait_set(trait_change_notify=False, scalars=scalars)
+        dataset.point_data.scalars = scalars
+        dataset.point_data.scalars.name = 'scalars'
+
+        self.dataset = dataset
+        if not new_dataset:
+            self.update()
+
+
 def _get_surface_from_mlab_triangular_mesh(vert_coords, faces, **kwargs):
     """
-    Creates a mayavi mesh from the vert_coords and faces. All extra arguments are passed to the mlab.triangular_mesh call.
+    Creates a mayavi mesh from the vert_coords and faces. All extra arguments are passed to the mlab.pipeline.surface call, they are the same as for mlab.triangular_mesh.
+
+    The vertex coordinates are passed to VTK as a single float32 points array, see `_PointsMeshSource`, instead of being split into x, y and z arrays. The surface has an `mlab_source` like one created with mlab.triangular_mesh.
 
     Returns
     -------
@@ -23,10 +90,19 @@ def _get_surface_from_mlab_triangular_mesh(vert_coords, faces, **kwargs):
 
     Examples
     --------
-    my_mesh = _get_mayavi_mesh(vert_coords, faces, scalars=morphometry_data, color=(1, 0, 0))
+    my_mesh = _get_surface_from_mlab_triangular_mesh(vert_coords, faces, scalars=morphometry_data, color=(1, 0, 0))
     """
-    x, y, z = st.coords_a2s(vert_coords)
-    mayavi_mesh = mlab.triangular_mesh(x, y, z, faces, **kwargs)
+    with stage('singleview.triangular_mesh'):
+        source = _PointsMeshSource()
+        source.reset(points=vert_coords, triangles=np.asarray(faces), scalars=kwargs.pop('scalars', None))
+        dataset_kwargs = {'name': kwargs.pop('name', 'TriangularMeshSource')}
+        if 'figure' in kwargs:
+            dataset_kwargs['figure'] = kwargs['figure']
+        data_source = mlab.pipeline.add_dataset(source.dataset, **dataset_kwargs)
+        source.m_data = data_source
+        # Smooth shading needs the vertex normals, mlab.triangular_mesh computes them in the same way.
+        normals = mlab.pipeline.poly_data_normals(data_source, **dict((key, kwargs[key]) for key in ('figure', ) if key in kwargs))
+        mayavi_mesh = mlab.pipeline.surface(normals, **kwargs)
     return mayavi_mesh
 
 
@@ -72,14 +148,14 @@ def brain_label_view(fig, vert_coords, faces, verts_in_label):
     """
     num_verts = vert_coords.shape[0]
     num_verts_in_label = len(verts_in_label)
-    # create fake morphometry data from the label: set all values for vertices in the label to 1.0, the rest to 0.0
-    label_map = np.zeros((num_verts), dtype=float)
-    label_map[verts_in_label] = 1.0
+    # create fake morphometry data from the label: set all values for vertices in the label to 1, the rest to 0
+    label_map = np.zeros((num_verts), dtype=np.uint8)
+    label_map[verts_in_label] = 1
     return brain_morphometry_view(fig, vert_coords, faces, label_map)
 
 
 
-def brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names):
+def brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names, draw_boundaries=False, boundary_color=(0.0, 0.0, 0.0)):
     """
     View the vertices which are part of an annotation using the annotation colors.
 
@@ -105,6 +181,12 @@ def brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label
     label_names: list of strings
        The names of the labels. The length of the list is n_labels.
 
+    draw_boundaries: bool, optional
+        Whether to draw the borders between the regions as lines on top of the surface, see `brain_boundary_overlay`. Defaults to False.
+
+    boundary_color: tuple of 3 floats, optional
+        The RGB color of the boundary lines, each value in range 0.0 to 1.0. Defaults to black. Ignored unless draw_boundaries is True.
+
     Returns
     -------
     surface: mayavi.modules.surface.Surface
@@ -127,23 +209,134 @@ def brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label
     """
     num_verts = vert_coords.shape[0]
     num_labels = len(label_names)
-    label_map = np.zeros((num_verts), dtype=float)
-    lut = np.ones((num_labels, 4), dtype=int)       # create color lookup table
-    for idx, value in enumerate(label_names):
-        label_map[vertex_labels == idx] = (idx + 1.0)
-        lut[idx, 0:3] = label_colors[idx][0:3]      # Set RGB values.
-        lut[idx, 3] = 255 - label_colors[idx][3]    # Set alpha channel: this is stored as a transparency in the source data, so we convert it to alpha.
+    with stage('singleview.atlas_label_map'):
+        label_map, lut = _get_atlas_label_map_and_lut(num_verts, vertex_labels, label_colors, num_labels)
     surf = brain_morphometry_view(fig, vert_coords, faces, label_map)
 
-    lut_manager = surf.module_manager.scalar_lut_manager
-    lut_manager.lut.table = lut         # use our lut
+    with stage('singleview.atlas_lut'):
+        lut_manager = surf.module_manager.scalar_lut_manager
+        lut_manager.lut.table = lut         # use our lut
+
+        fig.render()
+        mlab.draw()
 
-    fig.render()
-    mlab.draw()
+    if draw_boundaries:
+        boundary_vertices, boundary_edges = parcel_boundaries(faces, vertex_labels)
+        brain_boundary_overlay(fig, vert_coords, boundary_edges, color=boundary_color)
     return surf
 
 
-def brain_morphometry_view(fig, vert_coords, faces, morphometry_data, **kwargs):
+def brain_boundary_overlay(fig, vert_coords, boundary_edges, color=(0.0, 0.0, 0.0), line_width=2.0):
+    """
+    Draw region boundaries as lines on top of a surface.
+
+    Draw the given mesh edges as lines, e.g., the borders between the regions of a brain atlas on top of a morphometry data view. All lines are drawn as a single line object, so this is fast even for many edges.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The figure the lines should be added to
+
+    vert_coords: 2D numpy array of shape (n_verts, 3)
+        The vertex coordinates of the mesh.
+
+    boundary_edges: 2D numpy int array of shape (n_edges, 2)
+        The edges to draw, as pairs of indices into vert_coords. Typically from `brainview.topology.parcel_boundaries`.
+
+    color: tuple of 3 floats, optional
+        The RGB color of the lines, each value in range 0.0 to 1.0. Defaults to black.
+
+    line_width: float, optional
+        The width of the lines in pixels. Defaults to 2.0.
+
+    Returns
+    -------
+    surface: mayavi.modules.surface.Surface or None
+        The line object, or None if there are no boundary edges.
+
+    Examples
+    --------
+    Draw the borders of the regions of the Desikan atlas on top of thickness data:
+
+    >>> vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot(subject, subjects_dir, 'aparc')
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data)
+    >>> boundary_vertices, boundary_edges = bv.topology.parcel_boundaries(faces, vertex_labels)
+    >>> lines = bv.brain_boundary_overlay(fig, vert_coords, boundary_edges)
+    """
+    if boundary_edges.shape[0] == 0:
+        return None
+    with stage('singleview.boundary_overlay'):
+        # Only the vertices on the boundary are passed to the pipeline, so the edges get re-indexed into that subset.
+        used_verts, edges = np.unique(boundary_edges, return_inverse=True)
+        # The vertices are also drawn as points, which closes the small gaps where thick lines meet.
+        dataset = tvtk.PolyData(points=_get_points_array(vert_coords[used_verts]), verts=np.arange(used_verts.shape[0]).reshape((-1, 1)), lines=edges.reshape((-1, 2)))
+        source = mlab.pipeline.add_dataset(dataset, name='BoundaryLines', figure=fig)
+        lines = mlab.pipeline.surface(source, color=color, line_width=line_width, figure=fig)
+        lines.actor.property.lighting = False
+        # Move coincident polygons behind the lines, otherwise the surface they lie on hides them in parts.
+        lines.actor.mapper.resolve_coincident_topology = 'polygon_offset'
+    return lines
+
+
+def _get_atlas_label_map_and_lut(num_verts, vertex_labels, label_colors, num_labels):
+    """
+    Compute the scalar label map and the color lookup table for an atlas view.
+
+    Parameters
+    ----------
+    num_verts: int
+        The number of vertices of the mesh.
+
+    vertex_labels: ndarray, shape (n_vertices,)
+        The label index for each vertex, -1 for vertices without a label. See `brain_atlas_view`.
+
+    label_colors: ndarray, shape (n_labels, 4)
+        RGBT colortable array. See `brain_atlas_view`.
+
+    num_labels: int
+        The number of labels.
+
+    Returns
+    -------
+    label_map: ndarray, shape (n_vertices,)
+        The scalar value to display for each vertex: the label index plus one, or 0 for vertices without a label. The dtype is the smallest unsigned integer type that can hold all values, see `_get_compact_label_dtype`.
+
+    lut: ndarray of dtype uint8, shape (n_labels, 4)
+        The RGBA color lookup table.
+    """
+    vertex_labels = np.asarray(vertex_labels)
+    label_map = np.zeros((num_verts), dtype=_get_compact_label_dtype(num_labels))
+    has_label = (vertex_labels >= 0) & (vertex_labels < num_labels)
+    label_map[has_label] = vertex_labels[has_label] + 1
+    lut = annotation_lut(np.asarray(label_colors)[:num_labels])
+    return label_map, lut
+
+
+def _get_compact_label_dtype(max_value):
+    """
+    Return the smallest unsigned integer dtype that can hold all values from 0 to max_value.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def _get_compact_scalars(scalars):
+    """
+    Return the per-vertex scalars in a representation VTK accepts, avoiding a copy if possible.
+
+    Float32, float64 and integer arrays are passed through unchanged. Boolean arrays are reinterpreted as uint8 without a copy. Anything else (e.g., float16 or lists) is converted to float64.
+    """
+    scalars = np.asarray(scalars)
+    if scalars.dtype == np.bool_:
+        return scalars.view(np.uint8)
+    if scalars.dtype in (np.float32, np.float64) or np.issubdtype(scalars.dtype, np.integer):
+        return scalars
+    return scalars.astype(np.float64)
+
+
+def brain_morphometry_view(fig, vert_coords, faces, morphometry_data, boundary_labels=None, boundary_color=(0.0, 0.0, 0.0), **kwargs):
     """
     Create a surface from the mesh and morphometry data.
 
@@ -161,10 +354,16 @@ def brain_morphometry_view(fig, vert_coords, faces, morphometry_data, **kwargs):
         An array of 3-faces, i.e., each face has to consists of 3 vertices. The 3 vertices are indices into the vert_coords array.
 
     morphometry_data: 1D numpy array of shape (n_verts, )
-        Assigns a scalar value to each vertex.
+        Assigns a scalar value to each vertex. Float32, float64 and integer arrays are passed to VTK without a copy, so use float32 or small integer types to save memory for large meshes.
+
+    boundary_labels: 1D numpy array of shape (n_verts, ) or None, optional
+        If given, the borders between the regions defined by these per-vertex labels are drawn on top of the data, see `brain_boundary_overlay`. Typically the vertex_labels of an atlas. Defaults to None, which draws no borders.
+
+    boundary_color: tuple of 3 floats, optional
+        The RGB color of the boundary lines, each value in range 0.0 to 1.0. Defaults to black. Ignored unless boundary_labels is given.
 
     kwargs: extra keyword arguments
-        Will be passed on to the call to the `mlab.triangular_mesh` function from Mayavi.
+        Will be passed on to the call to the `mlab.triangular_mesh` function from Mayavi. If a matplotlib colormap is given as colormap, its lookup table from `brainview.colors.colormap_lut` is used, which is also used for exported meshes. Other colormaps are passed on to Mayavi.
 
     Returns
     -------
@@ -185,8 +384,112 @@ def brain_morphometry_view(fig, vert_coords, faces, morphometry_data, **kwargs):
 
     This will get you a view of the morphometry data on the brain mesh of the subject.
     """
-    morphometry_data = morphometry_data.astype(float)
-    return _get_surface_from_mlab_triangular_mesh(vert_coords, faces, scalars=morphometry_data, **kwargs)
+    morphometry_data = _get_compact_scalars(morphometry_data)
+    colormap_name = kwargs.get('colormap', None)
+    surface = _get_surface_from_mlab_triangular_mesh(vert_coords, faces, scalars=morphometry_data, **kwargs)
+    if morphometry_data.dtype == np.uint8:
+        # VTK displays unsigned char scalars as colors by default, make sure they are mapped through the lookup table like all others.
+        surface.actor.mapper.color_mode = 'map_scalars'
+    if colormap_name is not None and has_colormap(colormap_name):
+        # Mayavi has set up the colormap by name, replace its table with the one used for export. Mayavi rebuilds the table from the name if settings like the number of colors change.
+        surface.module_manager.scalar_lut_manager.load_lut_from_list((colormap_lut(colormap_name) / 255.0).tolist())
+    if boundary_labels is not None:
+        boundary_vertices, boundary_edges = parcel_boundaries(faces, boundary_labels)
+        brain_boundary_overlay(fig, vert_coords, boundary_edges, color=boundary_color)
+    return surface
+
+
+def brain_rgba_view(fig, vert_coords, faces, vertex_colors, boundary_labels=None, boundary_color=(0.0, 0.0, 0.0), **kwargs):
+    """
+    Create a surface that displays precomputed vertex colors.
+
+    The colors are displayed as they are, without a colormap. Use this to render colors computed with `brainview.colors.scalars_to_colors` or `brainview.export.atlas_vertex_colors`, which can be exported with `brainview.export_mesh_to_file` as well.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The figure the surface should be added to
+
+    vert_coords: 2D numpy array of shape (n_verts, 3)
+        An array of vertex corrdinates. Each vertex position is identified by an x, y, and z coordinate.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        An array of 3-faces, i.e., each face has to consists of 3 vertices. The 3 vertices are indices into the vert_coords array.
+
+    vertex_colors: 2D numpy array of shape (n_verts, 4)
+        The RGBA color of each vertex, 0..255 per channel. Arrays of dtype uint8 are passed to VTK without a copy. To display new colors later, use `surface.mlab_source.reset(scalars=new_vertex_colors)`.
+
+    boundary_labels, boundary_color: optional
+        See `brain_morphometry_view`.
+
+    kwargs: extra keyword arguments
+        Will be passed on to the call to the `mlab.triangular_mesh` function from Mayavi.
+
+    Returns
+    -------
+    surface: mayavi.modules.surface.Surface
+        The resulting surface.
+
+    Examples
+    --------
+    Compute the colors of thickness data once, then display and export them:
+
+    >>> vertex_colors = bv.colors.scalars_to_colors(morphometry_data, 'viridis', clip_percentiles=(5, 95))
+    >>> surface = bv.brain_rgba_view(fig, vert_coords, faces, vertex_colors)
+    >>> bv.export_mesh_to_file('brain.ply', vert_coords, faces, vertex_colors=vertex_colors)
+    """
+    vertex_colors = np.ascontiguousarray(vertex_colors, dtype=np.uint8)
+    if vertex_colors.ndim != 2 or vertex_colors.shape[1] != 4:
+        raise ValueError("ERROR: vertex_colors must have shape (n_verts, 4), but has shape %s." % str(vertex_colors.shape))
+    surface = _get_surface_from_mlab_triangular_mesh(vert_coords, faces, scalars=vertex_colors, **kwargs)
+    surface.actor.mapper.color_mode = 'direct_scalars'
+    if boundary_labels is not None:
+        boundary_vertices, boundary_edges = parcel_boundaries(faces, boundary_labels)
+        brain_boundary_overlay(fig, vert_coords, boundary_edges, color=boundary_color)
+    return surface
+
+
+def brain_labelset_view(fig, vert_coords, faces, labelset, label_colors=None, background_color=(255, 255, 255, 255), overlap_color=None, **kwargs):
+    """
+    View many labels at once on a single surface.
+
+    All labels of a label set are displayed by one surface, each in its own color. Vertices in several labels are displayed in a mix of the colors of their labels, so overlaps are visible.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The figure the surface should be added to
+
+    vert_coords: 2D numpy array of shape (n_verts, 3)
+        An array of vertex corrdinates. Each vertex position is identified by an x, y, and z coordinate.
+
+    faces: 2D numpy array of shape (n_faces, 3)
+        An array of 3-faces, i.e., each face has to consists of 3 vertices. The 3 vertices are indices into the vert_coords array.
+
+    labelset: dictionary
+        The labels, see `brainview.labelset.load_labelset`.
+
+    label_colors, background_color, overlap_color: optional
+        See `brainview.labelset.labelset_vertex_colors`.
+
+    kwargs: extra keyword arguments
+        Passed on to `brain_rgba_view`.
+
+    Returns
+    -------
+    surface: mayavi.modules.surface.Surface
+        The resulting surface.
+
+    Examples
+    --------
+    >>> vert_coords, faces, morphometry_data, meta_data = bl.subject(subject, subjects_dir=subjects_dir, load_morphometry_data=False)
+    >>> labelset = bv.labelset.load_labelset(subject, subjects_dir, ['roi1', 'roi2', 'cortex'], meta_data)
+    >>> surface = bv.brain_labelset_view(fig, vert_coords, faces, labelset)
+    """
+    if labelset['num_verts'] != vert_coords.shape[0]:
+        raise ValueError("ERROR: The label set is for %d vertices, but the mesh has %d." % (labelset['num_verts'], vert_coords.shape[0]))
+    vertex_colors = labelset_vertex_colors(labelset, label_colors=label_colors, background_color=background_color, overlap_color=overlap_color)
+    return brain_rgba_view(fig, vert_coords, faces, vertex_colors, **kwargs)
 
 
 def export_figure(fig_handle, export_file_name_with_extension, silent=False, **kwargs):
@@ -218,7 +521,8 @@ def export_figure(fig_handle, export_file_name_with_extension, silent=False, **k
     """
     if not silent:
         print("Exporting scene to file '%s'." % export_file_name_with_extension)
-    mlab.savefig(export_image_file, figure=fig_handle, **kwargs)
+    with stage('singleview.savefig'):
+        mlab.savefig(export_file_name_with_extension, figure=fig_handle, **kwargs)
 
 
 def show():
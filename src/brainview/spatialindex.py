@@ -0,0 +1,204 @@
+"""
+Spatial index functions for brainview.
+
+These functions map coordinates, e.g., the position of a peak activation or an electrode, to the vertices of a brain mesh. They use a KD-tree over the vertex coordinates that is built once per vert_coords array and cached, so each query takes logarithmic time instead of a scan over all vertices. The index is also used to report the vertex under the mouse in interactive views.
+"""
+from __future__ import print_function
+import numpy as np
+import scipy.spatial
+from .profiling import stage
+from .topology import _get_topology_cache
+
+
+def get_spatial_index(vert_coords):
+    """
+    Get the KD-tree for the vertices of a mesh, using the cache if possible.
+
+    The vert_coords array must not be modified in place after it has been used with the functions in this module, otherwise the cached index is outdated.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates.
+
+    Returns
+    -------
+    scipy.spatial.cKDTree
+        The spatial index.
+    """
+    cache = _get_topology_cache(vert_coords)
+    if 'kdtree' not in cache:
+        with stage('spatialindex.build'):
+            cache['kdtree'] = scipy.spatial.cKDTree(np.asarray(vert_coords, dtype=np.float64))
+    return cache['kdtree']
+
+
+def nearest_vertices(vert_coords, query_coords, max_distance=np.inf):
+    """
+    Find the mesh vertices closest to the given coordinates.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates of the mesh.
+
+    query_coords: array-like of shape (3, ) or (num_queries, 3)
+        The coordinates to look up, in the same coordinate system as the mesh (e.g., RAS for FreeSurfer surfaces).
+
+    max_distance: float, optional
+        Only vertices within this distance are reported. Defaults to infinity.
+
+    Returns
+    -------
+    vertex_indices: int or numpy 1D int array of length num_queries
+        The index of the closest vertex for each query, or -1 if there is no vertex within max_distance. A single int for a single query.
+
+    distances: float or numpy 1D float array of length num_queries
+        The distance to the closest vertex, or infinity if there is no vertex within max_distance.
+
+    Examples
+    --------
+    Find the vertices closest to 2 electrode positions:
+
+    >>> vertex_indices, distances = nearest_vertices(vert_coords, [[-42.0, 10.5, 33.0], [40.1, 12.0, 30.2]])
+    """
+    query_coords = np.asarray(query_coords, dtype=np.float64)
+    with stage('spatialindex.query'):
+        distances, vertex_indices = get_spatial_index(vert_coords).query(query_coords, distance_upper_bound=max_distance)
+    vertex_indices = np.where(np.isfinite(distances), vertex_indices, -1)
+    if query_coords.ndim == 1:
+        return int(vertex_indices), float(distances)
+    return vertex_indices, distances
+
+
+def vertices_in_radius(vert_coords, center_coords, radius):
+    """
+    Find all mesh vertices within a radius around the given coordinates.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates of the mesh.
+
+    center_coords: array-like of shape (3, ) or (num_queries, 3)
+        The center coordinates.
+
+    radius: float
+        The radius, in the units of the coordinates.
+
+    Returns
+    -------
+    numpy 1D int array, or list of numpy 1D int arrays
+        The sorted indices of the vertices within the radius. A list with one array per query if several center coordinates were given.
+
+    Examples
+    --------
+    Compute the mean thickness in a sphere of 10 mm around a peak:
+
+    >>> region = vertices_in_radius(vert_coords, [-42.0, 10.5, 33.0], 10.0)
+    >>> print(np.mean(morphometry_data[region]))
+    """
+    center_coords = np.asarray(center_coords, dtype=np.float64)
+    with stage('spatialindex.query'):
+        results = get_spatial_index(vert_coords).query_ball_point(center_coords, radius)
+    if center_coords.ndim == 1:
+        return np.array(sorted(results), dtype=np.int64)
+    return [np.array(sorted(result), dtype=np.int64) for result in results]
+
+
+def describe_vertex(vertex_index, vert_coords, morphometry_data=None, vertex_labels=None, label_names=None):
+    """
+    Return a short description of a vertex, including its label and data value.
+
+    Parameters
+    ----------
+    vertex_index: int
+        The vertex index.
+
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates of the mesh.
+
+    morphometry_data: numpy 1D array of length num_verts or None, optional
+        If given, the data value of the vertex is included.
+
+    vertex_labels: numpy 1D int array of length num_verts or None, optional
+        If given, the label of the vertex is included. The label is reported by name if label_names is given, otherwise by index.
+
+    label_names: list of strings or None, optional
+        The names of the labels, see `brainload.annot`.
+
+    Returns
+    -------
+    string
+        The description, e.g., "Vertex 1234 at (-41.20, 10.80, 32.50): label superiorfrontal, value 2.514".
+    """
+    x, y, z = vert_coords[vertex_index]
+    description = "Vertex %d at (%.2f, %.2f, %.2f)" % (vertex_index, x, y, z)
+    details = []
+    if vertex_labels is not None:
+        label = int(vertex_labels[vertex_index])
+        if label < 0:
+            details.append("no label")
+        elif label_names is not None:
+            details.append("label %s" % label_names[label])
+        else:
+            details.append("label %d" % label)
+    if morphometry_data is not None:
+        details.append("value %g" % morphometry_data[vertex_index])
+    if details:
+        description += ": " + ", ".join(details)
+    return description
+
+
+def add_vertex_picker(fig, vert_coords, morphometry_data=None, vertex_labels=None, label_names=None, callback=None):
+    """
+    Report the vertex under the mouse when the user clicks on a mesh in an interactive figure.
+
+    Registers a mayavi pick callback on the figure. The picked position is mapped to the closest vertex of the full resolution mesh with the spatial index, so this also works if a decimated mesh is displayed (see `brainview.lod`). Picking requires an interactive figure, it has no effect in offscreen mode.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The mayavi figure.
+
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates of the full resolution mesh.
+
+    morphometry_data, vertex_labels, label_names:
+        Optional per-vertex data and labels to report, see `describe_vertex`.
+
+    callback: callable or None, optional
+        Called with the arguments (vertex_index, description) for each pick. Defaults to None, which prints the description to stdout.
+
+    Returns
+    -------
+    picker or None
+        The mayavi picker object, or None if the figure is not interactive.
+
+    Examples
+    --------
+    >>> surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data)
+    >>> picker = add_vertex_picker(fig, vert_coords, morphometry_data=morphometry_data)
+    >>> bv.show()           # Left-click on the brain to print vertex id and value.
+    """
+    get_spatial_index(vert_coords)      # Build the index now, so the first click is fast.
+    try:
+        return fig.on_mouse_pick(_vertex_pick_callback(vert_coords, morphometry_data, vertex_labels, label_names, callback), type='cell')
+    except KeyError:
+        return None     # Offscreen figures have no interactor, so mayavi cannot register the picker.
+
+
+def _vertex_pick_callback(vert_coords, morphometry_data, vertex_labels, label_names, callback):
+    """
+    Create the function that is called by mayavi when the user picks a point, see `add_vertex_picker`.
+    """
+    def on_pick(picker):
+        if picker.cell_id < 0:
+            return      # Clicked on the background.
+        vertex_index, distance = nearest_vertices(vert_coords, picker.pick_position)
+        description = describe_vertex(vertex_index, vert_coords, morphometry_data=morphometry_data, vertex_labels=vertex_labels, label_names=label_names)
+        if callback is None:
+            print(description)
+        else:
+            callback(vertex_index, description)
+    return on_pick
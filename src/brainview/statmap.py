@@ -0,0 +1,235 @@
+"""
+Functions to display thresholded statistical maps on brain surface meshes.
+
+In a statistical map, e.g., of t values on fsaverage, usually only a small part of the vertices passes the threshold. These functions color only the supra-threshold vertices and display them over precomputed background colors. The vertices are sorted by their absolute value once, so when the threshold changes, only the colors of the vertices that cross it are computed and written.
+"""
+from __future__ import print_function
+import numpy as np
+from .profiling import stage
+from .colors import scalars_to_colors
+from .singleview import brain_rgba_view
+
+DEFAULT_BACKGROUND_COLOR = (200, 200, 200, 255)
+
+
+def binary_background_colors(data, low_color=(200, 200, 200, 255), high_color=(130, 130, 130, 255)):
+    """
+    Compute two-tone background colors, e.g., from curvature.
+
+    Parameters
+    ----------
+    data: 1D numpy array of shape (n_verts, )
+        The data, e.g., the curvature, which is positive in sulci and negative on gyri.
+
+    low_color: tuple of 4 ints, optional
+        The RGBA color of vertices with values <= 0. Defaults to light gray.
+
+    high_color: tuple of 4 ints, optional
+        The RGBA color of vertices with values > 0. Defaults to dark gray.
+
+    Returns
+    -------
+    ndarray of dtype uint8, shape (n_verts, 4)
+        The RGBA color of each vertex.
+
+    Examples
+    --------
+    >>> curv = bl.subject_data_native('fsaverage', subjects_dir, 'curv', 'both')[0]
+    >>> background_colors = binary_background_colors(curv)
+    """
+    lut = np.array([low_color, high_color], dtype=np.uint8)
+    return lut[(np.asarray(data) > 0).astype(np.uint8)]
+
+
+def brain_statmap_view(fig, vert_coords, faces, stat_data, threshold, background_colors=None, positive_colormap='autumn', negative_colormap='winter', data_range=None, boundary_labels=None, **kwargs):
+    """
+    Display a statistical map, coloring only the vertices whose absolute value reaches the threshold.
+
+    Positive and negative values are colored with separate colormaps, by their absolute value. All other vertices show the background colors.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The figure the surface should be added to.
+
+    vert_coords, faces: numpy arrays
+        The mesh, see `brainview.brain_morphometry_view`.
+
+    stat_data: 1D numpy array of shape (n_verts, )
+        The statistical map, e.g., t values or signed -log10(p) values. NaN values never pass the threshold.
+
+    threshold: float
+        Vertices whose absolute value is at least this are colored. Can be changed later with `set_statmap_threshold`.
+
+    background_colors: 2D numpy array of shape (n_verts, 4) or None, optional
+        The RGBA color of each vertex below the threshold, e.g., from `binary_background_colors`. Defaults to None, which uses light gray for all vertices.
+
+    positive_colormap, negative_colormap: string or None, optional
+        The matplotlib colormaps for positive and negative values. If negative_colormap is None, only positive values are colored. Default to 'autumn' (red to yellow) and 'winter' (blue to green).
+
+    data_range: tuple of 2 floats or None, optional
+        The absolute values mapped to the first and last color of the colormaps. It does not change with the threshold, so the color of a vertex never depends on the threshold. Defaults to None, which uses the initial threshold and the maximal absolute value.
+
+    boundary_labels: 1D numpy array of shape (n_verts, ) or None, optional
+        See `brainview.brain_morphometry_view`.
+
+    kwargs: extra keyword arguments
+        Passed on to `brainview.brain_rgba_view`.
+
+    Returns
+    -------
+    dictionary
+        The stat map. Contains the keys 'surface', 'stat_data', 'vertex_colors' (the color buffer that VTK displays), 'background_colors', 'threshold', 'data_range', 'num_supra_threshold' (the number of colored vertices) and the sort order used to find the vertices that cross a new threshold.
+
+    Examples
+    --------
+    >>> statmap = brain_statmap_view(fig, vert_coords, faces, t_values, 3.0, background_colors=binary_background_colors(curv))
+    >>> set_statmap_threshold(statmap, 4.5)        # only recolors the vertices with 3.0 <= abs(t) < 4.5
+    """
+    stat_data = np.asarray(stat_data, dtype=np.float64)
+    num_verts = stat_data.shape[0]
+    with stage('statmap.prepare'):
+        # The key by which vertices are compared to the threshold. Vertices that are never colored get -inf.
+        magnitude = np.abs(stat_data)
+        if negative_colormap is None:
+            magnitude[stat_data < 0] = -np.inf
+        magnitude[np.isnan(magnitude)] = -np.inf
+        order = np.argsort(magnitude, kind='mergesort')
+        sorted_magnitude = magnitude[order]
+        if background_colors is None:
+            background_colors = np.empty((num_verts, 4), dtype=np.uint8)
+            background_colors[:] = DEFAULT_BACKGROUND_COLOR
+        background_colors = np.asarray(background_colors, dtype=np.uint8)
+        if background_colors.shape != (num_verts, 4):
+            raise ValueError("ERROR: background_colors must have shape (%d, 4), but has shape %s." % (num_verts, str(background_colors.shape)))
+        if data_range is None:
+            max_magnitude = float(sorted_magnitude[-1]) if num_verts > 0 and np.isfinite(sorted_magnitude[-1]) else float(threshold)
+            data_range = (float(threshold), max(max_magnitude, float(threshold)))
+    statmap = {'stat_data': stat_data, 'order': order, 'sorted_magnitude': sorted_magnitude, 'background_colors': background_colors, 'vertex_colors': background_colors.copy(), 'positive_colormap': positive_colormap, 'negative_colormap': negative_colormap, 'data_range': data_range, 'threshold': np.inf, 'num_supra_threshold': 0, 'surface': None}
+    _update_statmap_colors(statmap, threshold)
+    statmap['surface'] = brain_rgba_view(fig, vert_coords, faces, statmap['vertex_colors'], boundary_labels=boundary_labels, **kwargs)
+    return statmap
+
+
+def set_statmap_threshold(statmap, threshold):
+    """
+    Change the threshold of a stat map.
+
+    Only the vertices whose absolute value lies between the old and the new threshold are recolored: they get their color from the colormap if the threshold was lowered, or their background color if it was raised.
+
+    Parameters
+    ----------
+    statmap: dictionary
+        The stat map, as returned by `brain_statmap_view`.
+
+    threshold: float
+        The new threshold.
+
+    Returns
+    -------
+    int
+        The number of vertices whose color changed.
+    """
+    num_changed = _update_statmap_colors(statmap, threshold)
+    if num_changed > 0:
+        source = statmap['surface'].mlab_source
+        source.dataset.point_data.scalars.modified()
+        source.update()
+    return num_changed
+
+
+def get_statmap_mask(statmap):
+    """
+    Return which vertices pass the current threshold of a stat map.
+
+    Parameters
+    ----------
+    statmap: dictionary
+        The stat map, as returned by `brain_statmap_view`.
+
+    Returns
+    -------
+    1D numpy bool array of shape (n_verts, )
+        Whether each vertex is colored.
+    """
+    mask = np.zeros(statmap['stat_data'].shape, dtype=bool)
+    mask[statmap['order'][statmap['order'].shape[0] - statmap['num_supra_threshold']:]] = True
+    return mask
+
+
+def add_statmap_key_bindings(fig, statmap, step=0.5, raise_key='bracketright', lower_key='bracketleft', verbose=True):
+    """
+    Raise and lower the threshold of a stat map with keyboard shortcuts in an interactive figure.
+
+    Parameters
+    ----------
+    fig: figure handle
+        The mayavi figure.
+
+    statmap: dictionary
+        The stat map, as returned by `brain_statmap_view`.
+
+    step: float, optional
+        The amount by which the threshold changes per key press. Defaults to 0.5.
+
+    raise_key, lower_key: string, optional
+        The key symbols that raise and lower the threshold. Default to 'bracketright' and 'bracketleft', the ']' and '[' keys. Note that the mayavi scene uses the '+' and '-' keys to zoom, so they never reach the observer.
+
+    verbose: bool, optional
+        Whether to print the new threshold. Defaults to True.
+
+    Returns
+    -------
+    int or None
+        The observer id, or None if the figure has no interactor.
+    """
+    interactor = fig.scene.interactor
+    if interactor is None:
+        return None
+
+    def on_key_press(obj, event):
+        key = obj.GetKeySym()
+        if key in (raise_key, lower_key):
+            threshold = statmap['threshold'] + (step if key == raise_key else -step)
+            set_statmap_threshold(statmap, threshold)
+            fig.scene.render()
+            if verbose:
+                print("Threshold %g: %d vertices colored." % (threshold, statmap['num_supra_threshold']))
+
+    return interactor.add_observer('KeyPressEvent', on_key_press)
+
+
+def _update_statmap_colors(statmap, threshold):
+    """
+    Write the colors of the vertices that cross the threshold into the color buffer of a stat map. Returns the number of changed vertices.
+    """
+    threshold = float(threshold)
+    sorted_magnitude = statmap['sorted_magnitude']
+    num_verts = sorted_magnitude.shape[0]
+    old_start = num_verts - statmap['num_supra_threshold']
+    new_start = int(np.searchsorted(sorted_magnitude, threshold, side='left'))
+    with stage('statmap.update_colors'):
+        if new_start < old_start:
+            # Lowered: color the vertices that now pass.
+            changed = statmap['order'][new_start:old_start]
+            statmap['vertex_colors'][changed] = _statmap_vertex_colors(statmap, changed)
+        else:
+            # Raised: restore the background of the vertices that no longer pass.
+            changed = statmap['order'][old_start:new_start]
+            statmap['vertex_colors'][changed] = statmap['background_colors'][changed]
+    statmap['threshold'] = threshold
+    statmap['num_supra_threshold'] = num_verts - new_start
+    return changed.shape[0]
+
+
+def _statmap_vertex_colors(statmap, vertices):
+    """
+    Compute the colormap colors of the given supra-threshold vertices of a stat map.
+    """
+    values = statmap['stat_data'][vertices]
+    colors = np.empty((vertices.shape[0], 4), dtype=np.uint8)
+    positive = values >= 0
+    colors[positive] = scalars_to_colors(values[positive], statmap['positive_colormap'], data_range=statmap['data_range'])
+    if not np.all(positive):
+        colors[~positive] = scalars_to_colors(-values[~positive], statmap['negative_colormap'], data_range=statmap['data_range'])
+    return colors
@@ -0,0 +1,327 @@
+"""
+Mesh topology functions for brainview.
+
+These functions work on the neighborhood structure of a mesh, i.e., on which vertices are connected by edges. The vertex adjacency is stored as a sparse SciPy CSR matrix that is built once per faces array and cached, so that repeated operations on the same mesh (like smoothing several measures) do not pay for it again.
+"""
+import weakref
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+from .profiling import stage
+
+# Cache for per-mesh data. Maps the id of an array (usually faces) to a tuple (weak reference to the array, dictionary of cached items).
+_TOPOLOGY_CACHE = {}
+
+
+def _get_topology_cache(faces):
+    """
+    Return the dictionary of cached items for a faces array.
+
+    The cache entry is tied to the identity of the faces array and dropped when the array is garbage collected. The faces array must not be modified in place after it has been used with the functions in this module, otherwise the cached data is outdated. Other modules use this with other mesh arrays as well, e.g., the spatial index is cached for the vert_coords array.
+    """
+    key = id(faces)
+    entry = _TOPOLOGY_CACHE.get(key)
+    if entry is not None and entry[0]() is faces:
+        return entry[1]
+    try:
+        faces_ref = weakref.ref(faces, lambda ref, key=key: _TOPOLOGY_CACHE.pop(key, None))
+    except TypeError:
+        return {}       # Not weak-referencable (e.g., a list), so do not cache anything.
+    items = {}
+    _TOPOLOGY_CACHE[key] = (faces_ref, items)
+    return items
+
+
+def clear_topology_cache():
+    """
+    Remove all cached mesh topology data.
+    """
+    _TOPOLOGY_CACHE.clear()
+
+
+def mesh_adjacency(faces, num_verts=None):
+    """
+    Compute the vertex adjacency matrix of a mesh.
+
+    Compute the symmetric vertex adjacency matrix of a triangular mesh. The result is cached per faces array, so calling this again with the same faces array is free.
+
+    Parameters
+    ----------
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    num_verts: int or None, optional
+        The number of vertices of the mesh. Defaults to None, which uses the maximal vertex index in faces plus one. Pass the real number if the mesh may contain unused vertices at the end.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix of shape (num_verts, num_verts)
+        The adjacency matrix. Entry (i, j) is 1 if the vertices i and j share an edge, and 0 otherwise. The diagonal is 0.
+
+    Examples
+    --------
+    >>> faces = np.array([[0, 1, 2], [0, 2, 3]])
+    >>> adjacency = mesh_adjacency(faces)
+    >>> print(adjacency[0].indices)
+    [1 2 3]
+    """
+    if num_verts is None:
+        num_verts = int(faces.max()) + 1
+    cache = _get_topology_cache(faces)
+    key = ('adjacency', num_verts)
+    if key not in cache:
+        with stage('topology.adjacency'):
+            faces = np.asarray(faces, dtype=np.int64)
+            rows = np.concatenate((faces[:, 0], faces[:, 1], faces[:, 2], faces[:, 1], faces[:, 2], faces[:, 0]))
+            cols = np.concatenate((faces[:, 1], faces[:, 2], faces[:, 0], faces[:, 0], faces[:, 1], faces[:, 2]))
+            adjacency = sp.csr_matrix((np.ones(rows.shape[0], dtype=np.float64), (rows, cols)), shape=(num_verts, num_verts))
+            adjacency.sum_duplicates()
+            adjacency.data[:] = 1.0     # An edge shared by 2 faces was counted twice.
+            cache[key] = adjacency
+    return cache[key]
+
+
+def vertex_degrees(faces, num_verts=None):
+    """
+    Compute the number of neighbors of each vertex.
+
+    Parameters
+    ----------
+    faces, num_verts:
+        See `mesh_adjacency`.
+
+    Returns
+    -------
+    numpy 1D int array of length num_verts
+        The number of vertices connected to each vertex by an edge.
+    """
+    return np.diff(mesh_adjacency(faces, num_verts=num_verts).indptr)
+
+
+def mesh_components(faces, num_verts=None):
+    """
+    Compute the connected components of a mesh.
+
+    For a mesh of both hemispheres loaded with brainload, there are usually 2 components. The result is cached per faces array.
+
+    Parameters
+    ----------
+    faces, num_verts:
+        See `mesh_adjacency`.
+
+    Returns
+    -------
+    num_components: int
+        The number of connected components.
+
+    component_labels: numpy 1D int array of length num_verts
+        The component index of each vertex.
+    """
+    adjacency = mesh_adjacency(faces, num_verts=num_verts)
+    cache = _get_topology_cache(faces)
+    key = ('components', adjacency.shape[0])
+    if key not in cache:
+        with stage('topology.components'):
+            cache[key] = csgraph.connected_components(adjacency, directed=False)
+    return cache[key]
+
+
+def mesh_edges(faces):
+    """
+    Compute the unique undirected edges of a mesh.
+
+    The result is cached per faces array.
+
+    Parameters
+    ----------
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    Returns
+    -------
+    numpy 2D int array of shape (num_edges, 2)
+        The edges as pairs of vertex indices. The smaller index comes first in each pair.
+
+    Examples
+    --------
+    >>> print(mesh_edges(np.array([[0, 1, 2], [0, 2, 3]])).tolist())
+    [[0, 1], [0, 2], [0, 3], [1, 2], [2, 3]]
+    """
+    cache = _get_topology_cache(faces)
+    if 'edges' not in cache:
+        with stage('topology.edges'):
+            faces = np.asarray(faces, dtype=np.int64)
+            edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+            edges.sort(axis=1)
+            # Encode each edge as a single integer, which is much faster to make unique than rows.
+            stride = int(faces.max()) + 1
+            keys = np.unique(edges[:, 0] * stride + edges[:, 1])
+            cache['edges'] = np.column_stack((keys // stride, keys % stride))
+    return cache['edges']
+
+
+def parcel_boundaries(faces, vertex_labels):
+    """
+    Find the boundaries between differently labeled regions of a mesh.
+
+    Find all mesh edges that connect two vertices with different labels, e.g., the borders between the regions of a brain atlas. This is a single vectorized pass over the edge list of the mesh.
+
+    Parameters
+    ----------
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    vertex_labels: numpy 1D array of length num_verts
+        The label of each vertex, e.g., from `brainload.annot`. Any values that can be compared for equality can be used, vertices without a label (-1 in brainload) simply form a region of their own.
+
+    Returns
+    -------
+    boundary_vertices: numpy 1D bool array of length num_verts
+        Whether a vertex is part of a boundary edge, i.e., has a neighbor with a different label.
+
+    boundary_edges: numpy 2D int array of shape (num_boundary_edges, 2)
+        The edges that connect vertices with different labels.
+
+    Examples
+    --------
+    >>> vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', subjects_dir, 'aparc')
+    >>> boundary_vertices, boundary_edges = parcel_boundaries(faces, vertex_labels)
+    """
+    vertex_labels = np.asarray(vertex_labels)
+    edges = mesh_edges(faces)
+    with stage('topology.parcel_boundaries'):
+        boundary_edges = edges[vertex_labels[edges[:, 0]] != vertex_labels[edges[:, 1]]]
+        boundary_vertices = np.zeros((vertex_labels.shape[0], ), dtype=bool)
+        boundary_vertices[boundary_edges.ravel()] = True
+    return boundary_vertices, boundary_edges
+
+
+def _smoothing_operator(faces, num_verts):
+    """
+    Return the cached sparse nearest neighbor averaging operator for a mesh.
+
+    Row i of the operator has the weight 1 / (degree_i + 1) for vertex i and each of its neighbors, so multiplying it with a data vector replaces each value with the mean over the vertex and its neighbors.
+    """
+    cache = _get_topology_cache(faces)
+    key = ('smoothing_operator', num_verts)
+    if key not in cache:
+        adjacency = mesh_adjacency(faces, num_verts=num_verts)
+        with stage('topology.smoothing_operator'):
+            operator = (adjacency + sp.identity(num_verts, format='csr')).tocsr()
+            operator = sp.diags(1.0 / np.diff(operator.indptr)).dot(operator).tocsr()
+            cache[key] = operator
+    return cache[key]
+
+
+def smooth_data(faces, data, num_iterations):
+    """
+    Smooth per-vertex data by iterative nearest neighbor averaging.
+
+    In each iteration, the value at each vertex is replaced with the mean of the values at the vertex itself and its direct neighbors. This is the same scheme FreeSurfer uses for surface smoothing. Each iteration is a single sparse matrix-vector product.
+
+    Parameters
+    ----------
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    data: numpy 1D array of length num_verts or 2D array of shape (num_verts, n)
+        The per-vertex data. For 2D data, each column is smoothed independently.
+
+    num_iterations: int
+        The number of smoothing iterations. 0 returns an unsmoothed copy of the data.
+
+    Returns
+    -------
+    numpy float array with the same shape as data
+        The smoothed data.
+
+    Examples
+    --------
+    >>> smoothed = smooth_data(faces, morphometry_data, 10)
+    """
+    data = np.asarray(data)
+    if num_iterations < 0:
+        raise ValueError("ERROR: num_iterations must not be negative, but is %d." % num_iterations)
+    operator = _smoothing_operator(faces, data.shape[0])
+    smoothed = np.array(data, dtype=np.float64)
+    with stage('topology.smooth'):
+        for _ in range(num_iterations):
+            smoothed = operator.dot(smoothed)
+    return smoothed
+
+
+def mesh_area(vert_coords, faces):
+    """
+    Compute the total surface area of a triangular mesh.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates.
+
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    Returns
+    -------
+    float
+        The total area, in squared units of the coordinates.
+    """
+    v0 = vert_coords[faces[:, 0]]
+    cross = np.cross(vert_coords[faces[:, 1]] - v0, vert_coords[faces[:, 2]] - v0)
+    return 0.5 * np.sum(np.sqrt(np.sum(cross * cross, axis=1)))
+
+
+def fwhm_to_num_iterations(vert_coords, faces, fwhm):
+    """
+    Compute the number of nearest neighbor smoothing iterations that approximate a Gaussian kernel.
+
+    Uses the same approximation as FreeSurfer's `MRISfwhm2niters`, which depends on the average area per vertex of the mesh. Use the white surface for the same results as FreeSurfer.
+
+    Parameters
+    ----------
+    vert_coords: numpy 2D float array of shape (num_verts, 3)
+        The vertex coordinates.
+
+    faces: numpy 2D int array of shape (num_faces, 3)
+        The vertex indices of the triangles.
+
+    fwhm: float
+        The full width at half maximum of the Gaussian kernel, in the units of the coordinates (mm for FreeSurfer surfaces).
+
+    Returns
+    -------
+    int
+        The number of iterations for `smooth_data`.
+    """
+    avg_vertex_area = mesh_area(vert_coords, faces) / vert_coords.shape[0]
+    gstd = fwhm / np.sqrt(np.log(256.0))
+    return int(np.floor(1.14 * (4.0 * np.pi * gstd * gstd) / (7.0 * avg_vertex_area) + 0.5))
+
+
+def smooth_data_fwhm(vert_coords, faces, data, fwhm):
+    """
+    Smooth per-vertex data with an approximate Gaussian kernel of the given FWHM.
+
+    Runs `smooth_data` with the number of iterations computed by `fwhm_to_num_iterations`.
+
+    Parameters
+    ----------
+    vert_coords, faces, fwhm:
+        See `fwhm_to_num_iterations`.
+
+    data: numpy 1D or 2D array
+        See `smooth_data`.
+
+    Returns
+    -------
+    numpy float array with the same shape as data
+        The smoothed data.
+
+    Examples
+    --------
+    >>> import brainload as bl
+    >>> vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1')
+    >>> smoothed = smooth_data_fwhm(vert_coords, faces, morphometry_data, 10.0)
+    """
+    return smooth_data(faces, data, fwhm_to_num_iterations(vert_coords, faces, fwhm))
@@ -0,0 +1,466 @@
+"""
+Vector graphics export of brain mesh projections.
+
+These functions write 2D projections of a mesh (see `brainview.export.get_mesh_projection`) to compact SVG and PDF files, e.g., for journal figures. Writing every triangle of a 300,000 vertex mesh is slow and results in huge files, so only the faces that are visible from the view are kept: faces pointing away from the viewer are removed, and faces hidden behind other parts of the surface are found with a depth buffer. Adjacent faces of the same color, like the regions of an atlas, are then merged into one outline. All of this is done with numpy, nothing is rendered.
+"""
+import zlib
+import numpy as np
+from .profiling import stage
+from .colors import scalars_to_colors, get_data_range
+from .export import clip_data_at_percentiles, mark_boundary_vertex_colors, projection_face_colors
+
+
+def visible_faces(projected, resolution=(1600, 1200), depth_tolerance=0.01, cull_occluded=True):
+    """
+    Determine which faces of a projection are visible.
+
+    A face is visible if it points towards the viewer and, unless cull_occluded is False, if it is not hidden by other faces. Occlusion is tested with a depth buffer of the given resolution: a face is visible if it is the closest face at one of the pixel centers it covers, within the depth tolerance. Faces that cover no pixel center are tested at their center pixel, and are also visible if all their vertices belong to visible faces, so no holes appear between visible faces. The spherical projection is flat, so all of its faces are visible.
+
+    Parameters
+    ----------
+    projected: dictionary
+        The projection, see `brainview.export.project_mesh`.
+
+    resolution: tuple of 2 ints, optional
+        The maximal width and height of the depth buffer in pixels. Use about twice the size of the output image. For meshes with few faces, a coarser buffer with about 8 pixels per face is used. Defaults to (1600, 1200).
+
+    depth_tolerance: float, optional
+        The depth difference, relative to the depth range of the mesh, up to which a face still counts as the closest one. Defaults to 0.01.
+
+    cull_occluded: bool, optional
+        Whether to remove the faces hidden by other faces. Defaults to True. If False, only the faces pointing away from the viewer are removed.
+
+    Returns
+    -------
+    1D numpy bool array of shape (n_faces, )
+        Whether each face of the projection is visible, in the order of projected['faces'].
+    """
+    coords, faces, depth = projected['coords'], projected['faces'], projected['depth']
+    if projected['projection'] == 'spherical' or faces.shape[0] == 0:
+        return np.ones((faces.shape[0], ), dtype=bool)
+    with stage('vectorexport.cull'):
+        # The faces of the surface are oriented counter-clockwise when seen from outside, so faces pointing away from the viewer have a negative area in the image.
+        face_coords = coords[faces]
+        visible = _signed_areas(face_coords) > 0
+        if not cull_occluded:
+            return visible
+        front_faces = np.flatnonzero(visible)
+        # Occlusion details smaller than a face do not matter, so a few pixels per face are enough. This keeps the number of samples low for coarse meshes.
+        pixel_budget = min(resolution[0] * resolution[1], 8 * front_faces.shape[0])
+        grid_scale = min(1.0, np.sqrt(float(pixel_budget) / (resolution[0] * resolution[1])))
+        pixel_coords, grid_shape = _to_pixels(coords, (max(int(resolution[0] * grid_scale), 2), max(int(resolution[1] * grid_scale), 2)))
+        depth_buffer = np.full((grid_shape[0] * grid_shape[1], ), np.inf)
+        for chunk in _chunks(front_faces):
+            face_index, pixels, sample_depth = _face_samples(pixel_coords, depth, faces[chunk], grid_shape)
+            np.minimum.at(depth_buffer, pixels, sample_depth)
+        tolerance = depth_tolerance * max(float(np.ptp(depth)), 1e-12)
+        visible[:] = False
+        sampled = np.zeros((faces.shape[0], ), dtype=bool)
+        for chunk in _chunks(front_faces):
+            face_index, pixels, sample_depth = _face_samples(pixel_coords, depth, faces[chunk], grid_shape)
+            sampled[chunk[np.unique(face_index)]] = True
+            visible[chunk[np.unique(face_index[sample_depth <= depth_buffer[pixels] + tolerance])]] = True
+        vertex_visible = np.zeros((coords.shape[0], ), dtype=bool)
+        vertex_visible[faces[visible]] = True
+        unsampled = front_faces[~sampled[front_faces]]
+        center = pixel_coords[faces[unsampled]].mean(axis=1)
+        center_pixels = np.clip(np.floor(center[:, 1]).astype(np.int64), 0, grid_shape[1] - 1) * grid_shape[0] + np.clip(np.floor(center[:, 0]).astype(np.int64), 0, grid_shape[0] - 1)
+        visible[unsampled] = np.all(vertex_visible[faces[unsampled]], axis=1) | (depth[faces[unsampled]].mean(axis=1) <= depth_buffer[center_pixels] + tolerance)
+    return visible
+
+
+def _signed_areas(face_coords):
+    """
+    Return twice the signed area of 2D triangles, given as an array of shape (n, 3, 2).
+    """
+    edge1 = face_coords[:, 1] - face_coords[:, 0]
+    edge2 = face_coords[:, 2] - face_coords[:, 0]
+    return edge1[:, 0] * edge2[:, 1] - edge2[:, 0] * edge1[:, 1]
+
+
+def _to_pixels(coords, resolution):
+    """
+    Scale 2D coordinates to a pixel grid of at most the given resolution, keeping the aspect ratio. Returns the scaled coordinates and the grid shape (width, height).
+    """
+    lower = coords.min(axis=0)
+    extent = np.maximum(coords.max(axis=0) - lower, 1e-12)
+    scale = min((resolution[0] - 1) / extent[0], (resolution[1] - 1) / extent[1])
+    pixel_coords = (coords - lower) * scale
+    grid_shape = (int(np.ceil(extent[0] * scale)) + 1, int(np.ceil(extent[1] * scale)) + 1)
+    return pixel_coords, grid_shape
+
+
+def _chunks(indices, chunk_size=50000):
+    """
+    Split an index array into chunks, to limit the memory used for the pixel samples.
+    """
+    return [indices[start:start + chunk_size] for start in range(0, indices.shape[0], chunk_size)]
+
+
+def _face_samples(pixel_coords, depth, faces, grid_shape):
+    """
+    Compute the depth of faces at the centers of the pixels they cover.
+
+    Returns the face (index into faces), the pixel (flat index into the grid) and the depth of each sample.
+    """
+    width, height = grid_shape
+    face_coords = pixel_coords[faces]
+    face_depth = depth[faces]
+    num_faces = faces.shape[0]
+    # The pixel centers are at (i + 0.5, j + 0.5). Enumerate the centers in the bounding box of each face.
+    x_start = np.ceil(face_coords[:, :, 0].min(axis=1) - 0.5).astype(np.int64)
+    x_stop = np.floor(face_coords[:, :, 0].max(axis=1) - 0.5).astype(np.int64)
+    y_start = np.ceil(face_coords[:, :, 1].min(axis=1) - 0.5).astype(np.int64)
+    y_stop = np.floor(face_coords[:, :, 1].max(axis=1) - 0.5).astype(np.int64)
+    num_x = np.maximum(x_stop - x_start + 1, 0)
+    num_samples = num_x * np.maximum(y_stop - y_start + 1, 0)
+    face_index = np.repeat(np.arange(num_faces), num_samples)
+    offsets = np.arange(face_index.shape[0]) - np.repeat(np.cumsum(num_samples) - num_samples, num_samples)
+    sample_x = x_start[face_index] + offsets % np.maximum(num_x[face_index], 1)
+    sample_y = y_start[face_index] + offsets // np.maximum(num_x[face_index], 1)
+    # Barycentric coordinates of the pixel centers.
+    corners = face_coords[face_index]
+    area = _signed_areas(corners)
+    area[area == 0] = 1e-12
+    point_x, point_y = sample_x + 0.5, sample_y + 0.5
+    weight1 = ((corners[:, 2, 0] - corners[:, 1, 0]) * (point_y - corners[:, 1, 1]) - (corners[:, 2, 1] - corners[:, 1, 1]) * (point_x - corners[:, 1, 0])) / area
+    weight2 = ((corners[:, 0, 0] - corners[:, 2, 0]) * (point_y - corners[:, 2, 1]) - (corners[:, 0, 1] - corners[:, 2, 1]) * (point_x - corners[:, 2, 0])) / area
+    weight3 = 1.0 - weight1 - weight2
+    inside = (weight1 >= -1e-9) & (weight2 >= -1e-9) & (weight3 >= -1e-9)
+    sample_depth = (np.column_stack((weight1, weight2, weight3)) * face_depth[face_index]).sum(axis=1)
+    pixels = np.clip(sample_y, 0, height - 1) * width + np.clip(sample_x, 0, width - 1)
+    return face_index[inside], pixels[inside], sample_depth[inside]
+
+
+def merge_faces(faces, face_colors):
+    """
+    Merge adjacent faces of the same color into regions.
+
+    The outline of each region is computed from the edges that are not shared by 2 faces of the same color. The outlines keep the orientation of the faces, so holes in a region run the other way round than its outer border, and the regions are drawn correctly with the nonzero fill rule.
+
+    Parameters
+    ----------
+    faces: 2D numpy int array of shape (n_faces, 3)
+        The faces. They must all have the same orientation in the image, e.g., the visible faces of a projection.
+
+    face_colors: 2D numpy array of shape (n_faces, 4)
+        The RGBA color of each face.
+
+    Returns
+    -------
+    list of tuples
+        One tuple (color, loops) per color: the RGBA color as a tuple of 4 ints and the outlines of all regions of that color, as a list of 1D numpy int arrays of vertex indices. Each loop is closed, i.e., its last vertex is connected to its first one.
+    """
+    if faces.shape[0] == 0:
+        return []
+    with stage('vectorexport.merge'):
+        colors, color_index = np.unique(np.asarray(face_colors, dtype=np.uint8), axis=0, return_inverse=True)
+        color_index = color_index.ravel()
+        num_verts = int(faces.max()) + 1
+        starts = faces.ravel()
+        ends = faces[:, [1, 2, 0]].ravel()
+        edge_colors = np.repeat(color_index, 3).astype(np.int64)
+        # Sum the directions of each undirected edge per color: edges inside a region are used once in each direction and cancel out.
+        lower, upper = np.minimum(starts, ends).astype(np.int64), np.maximum(starts, ends).astype(np.int64)
+        keys = (edge_colors * num_verts + lower) * num_verts + upper
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        net_direction = np.bincount(inverse.ravel(), weights=np.where(starts < ends, 1.0, -1.0)).astype(np.int64)
+        border = net_direction != 0
+        repeats = np.abs(net_direction[border])
+        unique_keys, net_direction = np.repeat(unique_keys[border], repeats), np.repeat(net_direction[border], repeats)
+        edge_colors = unique_keys // (num_verts * num_verts)
+        lower = (unique_keys // num_verts) % num_verts
+        upper = unique_keys % num_verts
+        edge_starts = np.where(net_direction > 0, lower, upper)
+        edge_ends = np.where(net_direction > 0, upper, lower)
+        # Each vertex of an outline has as many incoming as outgoing edges of the same color, so sorting both by (color, vertex) pairs each incoming edge with an outgoing one.
+        outgoing = np.lexsort((edge_starts, edge_colors))
+        incoming = np.lexsort((edge_ends, edge_colors))
+        next_edge = np.empty_like(outgoing)
+        next_edge[incoming] = outgoing
+        loop_edges, loop_lengths = _cycles(next_edge)
+        loop_colors = edge_colors[loop_edges[np.cumsum(loop_lengths) - loop_lengths]]
+        # Group the loops by color.
+        loop_order = np.argsort(loop_colors, kind='mergesort')
+        loop_starts = np.cumsum(loop_lengths) - loop_lengths
+        loops = [edge_starts[loop_edges[loop_starts[loop_idx]:loop_starts[loop_idx] + loop_lengths[loop_idx]]] for loop_idx in loop_order]
+        color_changes = np.flatnonzero(np.diff(loop_colors[loop_order])) + 1
+        regions = []
+        for first, last in zip(np.concatenate(([0], color_changes)), np.concatenate((color_changes, [loop_order.shape[0]]))):
+            regions.append((tuple(int(channel) for channel in colors[loop_colors[loop_order[first]]]), loops[first:last]))
+    return regions
+
+
+def _cycles(next_element):
+    """
+    Split a permutation into its cycles.
+
+    Returns the elements in the order of their cycles, one cycle after the other, and the length of each cycle.
+    """
+    num_elements = next_element.shape[0]
+    # Label each cycle with its smallest element by pointer jumping: after k steps, each label is the minimum over the next 2^k elements.
+    labels = np.arange(num_elements)
+    jump = next_element.copy()
+    while True:
+        new_labels = np.minimum(labels, labels[jump])
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        jump = jump[jump]
+    first_elements = np.flatnonzero(labels == np.arange(num_elements))
+    cycle_lengths = np.bincount(labels, minlength=num_elements)[first_elements]
+    cycle_starts = np.cumsum(cycle_lengths) - cycle_lengths
+    # Walk all cycles at the same time, dropping the finished ones.
+    ordered = np.empty((num_elements, ), dtype=np.intp)
+    active = np.arange(first_elements.shape[0])
+    current = first_elements
+    step = 0
+    while active.shape[0] > 0:
+        ordered[cycle_starts[active] + step] = current
+        step += 1
+        unfinished = cycle_lengths[active] > step
+        active = active[unfinished]
+        current = next_element[current[unfinished]]
+    return ordered, cycle_lengths
+
+
+def _face_regions(faces, face_colors):
+    """
+    Return the faces as regions, in the given order, in the format of `merge_faces`. Consecutive faces of the same color share a region.
+    """
+    face_colors = np.asarray(face_colors, dtype=np.uint8)
+    if faces.shape[0] == 0:
+        return []
+    color_changes = np.flatnonzero(np.any(face_colors[1:] != face_colors[:-1], axis=1)) + 1
+    return [(tuple(int(channel) for channel in face_colors[first]), list(faces[first:last])) for first, last in zip(np.concatenate(([0], color_changes)), np.concatenate((color_changes, [faces.shape[0]])))]
+
+
+def _region_points(coords, loops, scale):
+    """
+    Convert the loops of a region to integer coordinates in units of 1 / scale, without consecutive duplicates.
+
+    Returns the coordinates as a flat list of strings (x and y alternating) and the number of points of each loop. Loops with fewer than 3 points left are dropped.
+    """
+    loop_lengths = np.array([loop.shape[0] for loop in loops], dtype=np.intp)
+    points = np.round(coords[np.concatenate(loops)] * scale).astype(np.int64)
+    loop_ends = np.cumsum(loop_lengths)
+    loop_starts = loop_ends - loop_lengths
+    # Compare each point with its predecessor in the loop, the predecessor of the first point is the last one.
+    previous = np.roll(points, 1, axis=0)
+    previous[loop_starts] = points[loop_ends - 1]
+    keep = np.any(points != previous, axis=1)
+    loop_ids = np.repeat(np.arange(loop_lengths.shape[0]), loop_lengths)
+    loop_lengths = np.bincount(loop_ids[keep], minlength=loop_lengths.shape[0])
+    valid = loop_lengths >= 3
+    keep &= valid[loop_ids]
+    return list(map(str, points[keep].ravel().tolist())), loop_lengths[valid]
+
+
+def svg_string(regions, coords, size, background_color=(255, 255, 255, 255), precision=1):
+    """
+    Create an SVG document from colored regions.
+
+    Parameters
+    ----------
+    regions: list of tuples
+        The regions, see `merge_faces`.
+
+    coords: 2D numpy array of shape (n_verts, 2)
+        The image coordinates of the vertices, already scaled to the image size, with y up.
+
+    size: tuple of 2 ints
+        The width and height of the image.
+
+    background_color: tuple of 4 ints or None, optional
+        The RGBA background color. Defaults to white. If None, the background is transparent.
+
+    precision: int, optional
+        The number of decimals of the coordinates. They are written as integers in a view box scaled by 10^precision, which is shorter. Defaults to 1.
+
+    Returns
+    -------
+    string
+        The SVG document.
+    """
+    scale = 10 ** precision
+    # SVG has y down.
+    coords = np.column_stack((coords[:, 0], size[1] - coords[:, 1]))
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">' % (size[0], size[1], size[0] * scale, size[1] * scale)]
+    if background_color is not None:
+        lines.append('<rect width="100%%" height="100%%" fill="#%02x%02x%02x"%s/>' % (background_color[0], background_color[1], background_color[2], _svg_opacity(background_color[3])))
+    # Draw the outline in the fill color as well, otherwise antialiasing leaves thin gaps between neighboring regions.
+    lines.append('<g stroke-width="%g" stroke-linejoin="round">' % (0.5 * scale))
+    for color, loops in regions:
+        if not loops:
+            continue
+        values, loop_lengths = _region_points(coords, loops, scale)
+        path_parts = []
+        position = 0
+        for loop_length in loop_lengths.tolist():
+            path_parts.append("M" + " ".join(values[position:position + 2 * loop_length]) + "Z")
+            position += 2 * loop_length
+        if path_parts:
+            hex_color = "#%02x%02x%02x" % color[0:3]
+            lines.append('<path fill="%s" stroke="%s"%s d="%s"/>' % (hex_color, hex_color, _svg_opacity(color[3]), "".join(path_parts)))
+    lines.append('</g>')
+    lines.append('</svg>')
+    return "\n".join(lines) + "\n"
+
+
+def _svg_opacity(alpha):
+    if alpha >= 255:
+        return ""
+    return ' opacity="%.3g"' % (alpha / 255.0)
+
+
+def pdf_bytes(regions, coords, size, background_color=(255, 255, 255, 255), precision=1):
+    """
+    Create a single page PDF document from colored regions.
+
+    The page size is the image size in points. The drawing commands are compressed. Transparency is supported with one graphics state per alpha value.
+
+    Parameters
+    ----------
+    regions, coords, size, background_color, precision:
+        See `svg_string`.
+
+    Returns
+    -------
+    bytes
+        The PDF document.
+    """
+    scale = 10 ** precision
+    alphas = sorted(set([color[3] for color, loops in regions if color[3] < 255] + ([background_color[3]] if background_color is not None and background_color[3] < 255 else [])))
+    commands = []
+    if background_color is not None:
+        commands.append("%s%.4g %.4g %.4g rg 0 0 %d %d re f" % (_pdf_alpha(background_color[3]), background_color[0] / 255.0, background_color[1] / 255.0, background_color[2] / 255.0, size[0], size[1]))
+    # Switch to integer coordinates, like in the SVG output.
+    commands.append("%g 0 0 %g 0 0 cm %g w 1 j" % (1.0 / scale, 1.0 / scale, 0.5 * scale))
+    for color, loops in regions:
+        if not loops:
+            continue
+        values, loop_lengths = _region_points(coords, loops, scale)
+        path_parts = []
+        position = 0
+        for loop_length in loop_lengths.tolist():
+            point_strings = [values[idx] + " " + values[idx + 1] for idx in range(position, position + 2 * loop_length, 2)]
+            path_parts.append(point_strings[0] + " m " + " l ".join(point_strings[1:]) + " l h")
+            position += 2 * loop_length
+        if path_parts:
+            rgb = "%.4g %.4g %.4g" % (color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
+            # Fill and stroke with the nonzero winding rule, like the SVG output.
+            commands.append("%s%s rg %s RG %s B" % (_pdf_alpha(color[3]), rgb, rgb, " ".join(path_parts)))
+    content = zlib.compress("\n".join(commands).encode('ascii'))
+    ext_g_states = " ".join(["/GS%d << /ca %.4g /CA %.4g >>" % (alpha, alpha / 255.0, alpha / 255.0) for alpha in alphas])
+    resources = ("<< /ExtGState << %s >> >>" % ext_g_states) if alphas else "<< >>"
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>", ("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R /Resources %s >>" % (size[0], size[1], resources)).encode('ascii'), ("<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)).encode('ascii') + content + b"\nendstream"]
+    document = b"%PDF-1.4\n"
+    offsets = []
+    for obj_idx, obj in enumerate(objects):
+        offsets.append(len(document))
+        document += ("%d 0 obj\n" % (obj_idx + 1)).encode('ascii') + obj + b"\nendobj\n"
+    xref_offset = len(document)
+    document += ("xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)).encode('ascii')
+    document += "".join(["%010d 00000 n \n" % offset for offset in offsets]).encode('ascii')
+    document += ("trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)).encode('ascii')
+    return document
+
+
+def _pdf_alpha(alpha):
+    if alpha >= 255:
+        return ""
+    return "/GS%d gs " % alpha
+
+
+def export_vector_graphics(filename, projected, morphometry_data=None, colormap_name='viridis', colormap_adjust_alpha_to=-1, clip_data_perc=None, vertex_colors=None, boundary_vertices=None, boundary_color=(0, 0, 0, 255), size=(800, 600), background_color=(255, 255, 255, 255), face_color_mode='mean', cull=True, merge=True, precision=1):
+    """
+    Export a 2D projection of a mesh to a compact SVG or PDF file.
+
+    Only the visible faces are written, see `visible_faces`. Faces are grouped by color, and adjacent faces of the same color are merged into one outline, see `merge_faces`.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the output file. The extension determines the format: '.svg' or '.pdf'.
+
+    projected: dictionary
+        The projection, as returned by `brainview.export.get_mesh_projection`.
+
+    morphometry_data, colormap_name, colormap_adjust_alpha_to, clip_data_perc, vertex_colors, boundary_vertices, boundary_color: optional
+        The colors, see `brainview.export.export_mesh_to_file`. For morphometry data, each face gets the color of the mean value of its vertices, so there are at most as many colors as the colormap has, and neighboring faces with similar values are merged. If neither morphometry_data nor vertex_colors is given, the mesh is drawn in light gray.
+
+    size: tuple of 2 ints, optional
+        The width and height of the image, in pixels for SVG and in points for PDF. Defaults to (800, 600).
+
+    background_color: tuple of 4 ints or None, optional
+        The RGBA background color. Defaults to white. If None, the background is transparent.
+
+    face_color_mode: string, optional
+        How the colors of faces are computed from the vertex_colors, see `brainview.export.projection_face_colors`. Use 'majority' for atlases and labels, so the faces on region borders do not get mixed colors. Defaults to 'mean'.
+
+    cull: bool, optional
+        Whether to remove faces that are not visible. Defaults to True. If False, all faces are written one by one, from back to front, and merge is ignored.
+
+    merge: bool, optional
+        Whether to merge adjacent faces of the same color. Defaults to True.
+
+    precision: int, optional
+        The number of decimals of the coordinates in the file. Defaults to 1.
+
+    Returns
+    -------
+    dictionary
+        Statistics with the keys 'num_faces' (of the projection), 'num_visible_faces', 'num_colors' and 'num_loops' (the number of outlines written).
+
+    Examples
+    --------
+    >>> projected = bex.get_mesh_projection(vert_coords, faces, 'lateral', hemi='lh')
+    >>> vertex_labels, label_colors, label_names, _ = bl.annot(subject_id, subjects_dir, 'aparc', hemi='lh', orig_ids=False)
+    >>> export_vector_graphics('aparc_lateral.pdf', projected, vertex_colors=bex.atlas_vertex_colors(vertex_labels, label_colors), face_color_mode='majority')
+    """
+    export_format = filename.lower().rsplit('.', 1)[-1]
+    if export_format not in ('svg', 'pdf'):
+        raise ValueError("ERROR: The file extension for vector graphics must be one of ('.svg', '.pdf'), but file name is '%s'." % filename)
+    faces = projected['faces']
+    num_verts = projected['coords'].shape[0]
+    visible = visible_faces(projected, resolution=(2 * size[0], 2 * size[1])) if cull else np.ones((faces.shape[0], ), dtype=bool)
+    visible_projection = dict(projected)
+    visible_projection['faces'] = faces[visible]
+    with stage('vectorexport.colors'):
+        if vertex_colors is None and morphometry_data is not None:
+            if clip_data_perc is not None:
+                morphometry_data = clip_data_at_percentiles(morphometry_data, clip_data_perc[0], clip_data_perc[1])
+            face_data = np.asarray(morphometry_data, dtype=np.float64)[visible_projection['faces']].mean(axis=1)
+            face_colors = scalars_to_colors(face_data, colormap_name, data_range=get_data_range(morphometry_data), alpha=colormap_adjust_alpha_to)
+            if boundary_vertices is not None:
+                on_boundary = np.any(np.asarray(boundary_vertices, dtype=bool)[visible_projection['faces']], axis=1)
+                face_colors[on_boundary] = boundary_color
+        else:
+            if vertex_colors is None:
+                vertex_colors = np.full((num_verts, 4), 200, dtype=np.uint8)
+                vertex_colors[:, 3] = 255
+            if boundary_vertices is not None:
+                vertex_colors = mark_boundary_vertex_colors(vertex_colors, boundary_vertices, boundary_color=boundary_color)
+            face_colors = projection_face_colors(visible_projection, vertex_colors, mode=face_color_mode)
+    # Scale the projection to the image, centered, keeping the aspect ratio.
+    coords = projected['coords']
+    if visible_projection['faces'].shape[0] > 0:
+        used = np.unique(visible_projection['faces'])
+        lower, upper = coords[used].min(axis=0), coords[used].max(axis=0)
+    else:
+        lower, upper = np.zeros((2, )), np.ones((2, ))
+    extent = np.maximum(upper - lower, 1e-12)
+    scale = min(size[0] / extent[0], size[1] / extent[1])
+    image_coords = (coords - lower) * scale + (np.array(size, dtype=np.float64) - extent * scale) / 2.0
+    if cull and merge:
+        regions = merge_faces(visible_projection['faces'], face_colors)
+    else:
+        regions = _face_regions(visible_projection['faces'], face_colors)
+    with stage('vectorexport.write'):
+        if export_format == 'svg':
+            with open(filename, "w") as svg_file:
+                svg_file.write(svg_string(regions, image_coords, size, background_color=background_color, precision=precision))
+        else:
+            with open(filename, "wb") as pdf_file:
+                pdf_file.write(pdf_bytes(regions, image_coords, size, background_color=background_color, precision=precision))
+    return {'num_faces': faces.shape[0], 'num_visible_faces': int(np.count_nonzero(visible)), 'num_colors': len(set([color for color, loops in regions])), 'num_loops': sum([len(loops) for color, loops in regions])}
@@ -0,0 +1,23 @@
+# Shared fixtures for the brainview unit tests.
+
+import pytest
+import numpy as np
+
+
+def _grid_mesh(size=20, offset=0.0, waves=False):
+    # A square grid of size x size vertices with spacing 1 in the z=0 plane, shifted by offset along the x axis and split into triangles. With waves, the z coordinate follows a sine wave along the x axis.
+    x, y = np.meshgrid(np.arange(size, dtype=float), np.arange(size, dtype=float))
+    z = np.sin(x.ravel() / 3.0) if waves else np.zeros((size * size, ))
+    vert_coords = np.column_stack((x.ravel() + offset, y.ravel(), z))
+    idx = np.arange(size * size).reshape((size, size))
+    lower_left, lower_right, upper_left, upper_right = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel(), idx[1:, :-1].ravel(), idx[1:, 1:].ravel()
+    faces = np.vstack((np.column_stack((lower_left, lower_right, upper_right)), np.column_stack((lower_left, upper_right, upper_left))))
+    return vert_coords, faces
+
+
+@pytest.fixture
+def grid_mesh():
+    """
+    Return a function that creates a synthetic grid mesh: call it with the keyword arguments size, offset and waves, it returns the vertex coordinates and faces.
+    """
+    return _grid_mesh
@@ -4,6 +4,10 @@
 
 import os
 import pytest
+import tempfile
+import shutil
+import numpy as np
+import brainload as bl
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
@@ -50,3 +54,67 @@ def test_atlasviewer_annot_aparc_nonverbose(script_runner):
     assert not 'Loading atlas aparc for subject subject1 from subjects dir' in ret.stdout
     assert not 'displaying on surface white for hemisphere both' in ret.stdout
     assert ret.stderr == ''
+
+
+def test_atlasviewer_annot_aparc_export_colors(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    export_file = os.path.join(tmp_dir, 'atlas.ply')
+    image_file = os.path.join(tmp_dir, 'atlas.png')
+    ret = script_runner.run('atlasviewer', 'subject1', 'atlas', 'aparc', '-d', TEST_DATA_DIR, '-o', image_file, '-x', export_file)
+    assert ret.success
+    assert 'Exporting brain mesh to file' in ret.stdout
+    with open(export_file) as ply_file:
+        assert 'property uchar red' in ply_file.read()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_atlasviewer_annot_aparc_boundaries(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    export_file = os.path.join(tmp_dir, 'atlas.ply')
+    image_file = os.path.join(tmp_dir, 'atlas.png')
+    ret = script_runner.run('atlasviewer', 'subject1', 'atlas', 'aparc', '-d', TEST_DATA_DIR, '-b', '-o', image_file, '-x', export_file)
+    assert ret.success
+    assert os.path.isfile(image_file)
+    with open(export_file) as ply_file:
+        assert '0 0 0 255' in ply_file.read()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_atlasviewer_annot_aparc_parcel_measure(script_runner):
+    ret = script_runner.run('atlasviewer', 'subject1', 'atlas', 'aparc', '-d', TEST_DATA_DIR, '-m', 'thickness', '-t', 'median', '-v')
+    assert ret.success
+    assert 'Aggregated measure thickness within' in ret.stdout
+    assert 'using the median' in ret.stdout
+
+
+def test_atlasviewer_annot_aparc_parcel_measure_export_unlabeled(script_runner):
+    vertex_labels = bl.annot('subject1', TEST_DATA_DIR, 'aparc', hemi='both', orig_ids=False)[0]
+    if not np.any(vertex_labels < 0):
+        pytest.skip("Test data has no vertices outside the regions of atlas 'aparc'.")
+    tmp_dir = tempfile.mkdtemp()
+    export_file = os.path.join(tmp_dir, 'parcels.ply')
+    ret = script_runner.run('atlasviewer', 'subject1', 'atlas', 'aparc', '-d', TEST_DATA_DIR, '-m', 'thickness', '-o', os.path.join(tmp_dir, 'parcels.png'), '-x', export_file)
+    assert ret.success
+    with open(export_file) as ply_file:
+        lines = ply_file.read().splitlines()
+    header_end = lines.index('end_header') + 1
+    vertex_colors = np.array([line.split()[3:7] for line in lines[header_end:header_end + vertex_labels.shape[0]]], dtype=int)
+    # Vertices outside all regions get the background color, which no region has.
+    assert np.all(vertex_colors[vertex_labels < 0] == 255)
+    assert not np.any(np.all(vertex_colors[vertex_labels >= 0] == 255, axis=1))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_atlasviewer_labels_roi1_roi2(script_runner):
+    ret = script_runner.run('atlasviewer', 'subject1', 'labels', 'roi1,roi2,cortex', '-d', TEST_DATA_DIR, '-v')
+    assert ret.success
+    assert 'Loading 3 labels for subject subject1 from subjects dir' in ret.stdout
+    assert 'roi1: ' in ret.stdout
+    assert 'vertices are in at least one label' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_atlasviewer_labels_empty(script_runner):
+    ret = script_runner.run('atlasviewer', 'subject1', 'labels', ',', '-d', TEST_DATA_DIR)
+    assert not ret.success
+    assert "no label names given in ','" in ret.stderr
@@ -0,0 +1,100 @@
+# Brainview unit tests for the batch module.
+
+import os
+import time
+import tempfile
+import shutil
+import threading
+import pytest
+import numpy as np
+import matplotlib.image
+import brainview.batch as bb
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def test_prefetch_keeps_order_and_loads_ahead():
+    loader_threads = []
+    def load(item):
+        loader_threads.append(threading.current_thread())
+        return item * 2
+    stats = bb.new_batch_stats()
+    results = list(bb.prefetch(range(5), load, num_prefetch=2, stats=stats))
+    assert results == [(0, 0), (1, 2), (2, 4), (3, 6), (4, 8)]
+    assert stats['load']['items'] == 5
+    assert threading.current_thread() not in loader_threads
+
+
+def test_prefetch_in_calling_thread():
+    results = list(bb.prefetch(['a', 'b'], lambda item: item.upper(), num_prefetch=0))
+    assert results == [('a', 'A'), ('b', 'B')]
+
+
+def test_prefetch_reraises_load_errors():
+    def load(item):
+        if item == 1:
+            raise IOError("missing file")
+        return item
+    results = bb.prefetch(range(3), load)
+    assert next(results) == (0, 0)
+    with pytest.raises(IOError):
+        next(results)
+
+
+def test_image_writer():
+    tmp_dir = tempfile.mkdtemp()
+    stats = bb.new_batch_stats()
+    writer = bb.start_image_writer(queue_size=1, stats=stats)
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    image[:, :, 0] = 255
+    filenames = [os.path.join(tmp_dir, 'image%d.png' % idx) for idx in range(3)]
+    for filename in filenames:
+        bb.write_image_async(writer, filename, image)
+        assert len(writer['pending']) <= 1
+    assert bb.stop_image_writer(writer) == filenames
+    assert stats['write']['items'] == 3
+    written = matplotlib.image.imread(filenames[2])
+    assert written.shape[:2] == (20, 30)
+    assert written[0, 0, 0] == 1.0
+    shutil.rmtree(tmp_dir)
+
+
+def test_image_writer_invalid_queue_size():
+    with pytest.raises(ValueError) as exc_info:
+        bb.start_image_writer(queue_size=0)
+    assert 'queue_size must be at least 1' in str(exc_info.value)
+
+
+def test_format_batch_stats():
+    stats = bb.new_batch_stats()
+    stats['render'] = {'items': 4, 'busy_seconds': 2.0}
+    stats['write'] = {'items': 4, 'busy_seconds': 1.0}
+    stats['total_seconds'] = 4.0
+    text = bb.format_batch_stats(stats)
+    assert 'render       4 items in    2.000 s busy,     2.00 items/s' in text
+    assert 'total        4 items in    4.000 s wall,     1.00 items/s' in text
+
+
+def test_batch_render_native():
+    tmp_dir = tempfile.mkdtemp()
+    output_files, stats = bb.batch_render(['subject1', 'subject1'], TEST_DATA_DIR, 'thickness', tmp_dir, size=(200, 150))
+    assert output_files == [os.path.join(tmp_dir, 'subject1_thickness.png')] * 2
+    assert stats['load']['items'] == 2
+    assert stats['render']['items'] == 2
+    assert stats['write']['items'] == 2
+    image = matplotlib.image.imread(output_files[0])
+    assert image.shape[:2] == (150, 200)
+    shutil.rmtree(tmp_dir)
+
+
+def test_cohort_value_range_and_shared_range_render():
+    tmp_dir = tempfile.mkdtemp()
+    value_range = bb.cohort_value_range(['subject1', 'subject1'], TEST_DATA_DIR, 'thickness', clip_percentiles=(0, 100))
+    assert value_range[0] < value_range[1]
+    output_files, stats = bb.batch_render(['subject1'], TEST_DATA_DIR, 'thickness', tmp_dir, size=(200, 150), value_range=(0.0, 10.0))
+    assert len(output_files) == 1
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,65 @@
+# Tests for the brainbatch script.
+#
+# These tests require the package `pytest-console-scripts`.
+
+import os
+import pytest
+import tempfile
+import shutil
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+def test_brainbatch_help(script_runner):
+    ret = script_runner.run('brainbatch', '--help')
+    assert ret.success
+    assert 'usage' in ret.stdout
+    assert 'Render brain morphometry data of many subjects to image files' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_brainbatch_native(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    subjects_file = os.path.join(tmp_dir, 'subjects.txt')
+    with open(subjects_file, 'w') as sf:
+        sf.write("subject1\n")
+    ret = script_runner.run('brainbatch', 'thickness', '-d', TEST_DATA_DIR, '-l', subjects_file, '-o', tmp_dir, '-v')
+    assert ret.success
+    assert 'Rendering measure thickness of surface white for hemisphere both for 1 subjects' in ret.stdout
+    assert 'Wrote 1 image files' in ret.stdout
+    assert 'render' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness.png'))
+    shutil.rmtree(tmp_dir)
+
+
+def test_brainbatch_montage_only(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    subjects_file = os.path.join(tmp_dir, 'subjects.txt')
+    with open(subjects_file, 'w') as sf:
+        sf.write("subject1\nsubject1\nsubject1\n")
+    ret = script_runner.run('brainbatch', 'thickness', '-d', TEST_DATA_DIR, '-l', subjects_file, '-o', tmp_dir, '-g', '2x1', '--montage-step', '4', '--montage-only')
+    assert ret.success
+    assert 'Wrote 2 image files' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'montage_thickness_000.png'))
+    assert os.path.isfile(os.path.join(tmp_dir, 'montage_thickness_001.png'))
+    assert not os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness.png'))
+    shutil.rmtree(tmp_dir)
+
+
+def test_brainbatch_invalid_montage_grid(script_runner):
+    ret = script_runner.run('brainbatch', 'thickness', '-d', TEST_DATA_DIR, '-g', 'large')
+    assert not ret.success
+    assert 'must have the format' in ret.stderr
+
+
+def test_brainbatch_shared_range(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    subjects_file = os.path.join(tmp_dir, 'subjects.txt')
+    with open(subjects_file, 'w') as sf:
+        sf.write("subject1\n")
+    ret = script_runner.run('brainbatch', 'thickness', '-d', TEST_DATA_DIR, '-l', subjects_file, '-o', tmp_dir, '-u', '-v')
+    assert ret.success
+    assert 'Computing shared color range from percentiles 5 and 95 of the values of all 1 subjects.' in ret.stdout
+    assert 'Using shared color range' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness.png'))
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,68 @@
+# Tests for the brainexport script.
+#
+# These tests require the package `pytest-console-scripts`.
+
+import os
+import sys
+import subprocess
+import pytest
+import tempfile
+import shutil
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+def test_brainexport_help(script_runner):
+    ret = script_runner.run('brainexport', '--help')
+    assert ret.success
+    assert 'usage' in ret.stdout
+    assert 'Export brain meshes colored by morphometry, atlas or label data to mesh files' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_brainexport_no_subjects(script_runner):
+    ret = script_runner.run('brainexport', 'morphometry', 'thickness', '-d', TEST_DATA_DIR)
+    assert not ret.success
+    assert 'no subjects given' in ret.stderr
+
+
+def test_brainexport_morphometry(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    ret = script_runner.run('brainexport', 'morphometry', 'thickness', 'subject1', '-d', TEST_DATA_DIR, '-o', tmp_dir, '-v')
+    assert ret.success
+    assert 'Exporting morphometry thickness on surface white for hemisphere both for 1 subjects' in ret.stdout
+    assert 'Exported 1 meshes' in ret.stdout
+    output_file = os.path.join(tmp_dir, 'subject1_thickness.ply')
+    assert os.path.isfile(output_file)
+    with open(output_file) as fh:
+        assert fh.readline().strip() == 'ply'
+    shutil.rmtree(tmp_dir)
+
+
+def test_brainexport_does_not_import_rendering_stack():
+    code = "import sys; import brainview.brainexport; print('mayavi' in sys.modules or 'vtk' in sys.modules or 'tvtk' in sys.modules)"
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.decode().strip() == 'False'
+
+
+def test_brainexport_projections(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    ret = script_runner.run('brainexport', 'morphometry', 'thickness', 'subject1', '-d', TEST_DATA_DIR, '-o', tmp_dir, '-j', 'lateral,spherical', '-t', 'png')
+    assert ret.success
+    assert 'Exported 2 projections of 1 meshes' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness_lateral.png'))
+    assert os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness_spherical.png'))
+    shutil.rmtree(tmp_dir)
+    ret = script_runner.run('brainexport', 'morphometry', 'thickness', 'subject1', '-d', TEST_DATA_DIR, '-t', 'svg')
+    assert not ret.success
+    assert 'requires argument -j/--projection' in ret.stderr
+
+
+def test_brainexport_atlas_vector_projection(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    ret = script_runner.run('brainexport', 'atlas', 'aparc', 'subject1', '-d', TEST_DATA_DIR, '-o', tmp_dir, '-j', 'lateral', '-t', 'pdf')
+    assert ret.success
+    output_file = os.path.join(tmp_dir, 'subject1_aparc_lateral.pdf')
+    with open(output_file, 'rb') as fh:
+        assert fh.read(8) == b'%PDF-1.4'
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,49 @@
+# Tests for the braingroup script.
+#
+# These tests require the package `pytest-console-scripts`.
+
+import os
+import pytest
+import tempfile
+import shutil
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+def test_braingroup_help(script_runner):
+    ret = script_runner.run('braingroup', '--help')
+    assert ret.success
+    assert 'usage' in ret.stdout
+    assert 'Compute vertex-wise statistics for a group of subjects' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_braingroup_stats(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    ret = script_runner.run('braingroup', 'stats', 'thickness', '-d', TEST_DATA_DIR, '-q', '5,50,95', '-o', tmp_dir, '-v')
+    assert ret.success
+    assert 'Verbosity' in ret.stdout
+    assert 'Computing group statistics for measure thickness' in ret.stdout
+    assert 'Wrote 6 group maps' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'group', 'surf', 'lh.thickness_p50.fwhm10.fsaverage.mgh'))
+    assert os.path.isfile(os.path.join(tmp_dir, 'group', 'surf', 'rh.thickness_mean.fwhm10.fsaverage.mgh'))
+    assert ret.stderr == ''
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_braingroup_stack_and_stats_from_stack(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    stack_file = os.path.join(tmp_dir, 'thickness_stack.npy')
+    subjects_file = os.path.join(tmp_dir, 'subjects.txt')
+    with open(subjects_file, 'w') as sf:
+        sf.write("subject1\n")
+    ret = script_runner.run('braingroup', 'stack', 'thickness', '-d', TEST_DATA_DIR, '-l', subjects_file, '-o', stack_file)
+    assert ret.success
+    assert 'Wrote data stack for' in ret.stdout
+    assert os.path.isfile(stack_file)
+    assert os.path.isfile(os.path.join(tmp_dir, 'thickness_stack.json'))
+    ret = script_runner.run('braingroup', 'stats', 'thickness', '-d', TEST_DATA_DIR, '-k', stack_file, '-o', tmp_dir)
+    assert ret.success
+    assert 'Wrote 3 group maps' in ret.stdout
+    assert ret.stderr == ''
+    shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,51 @@
+# Tests for the brainjobs script.
+#
+# These tests require the package `pytest-console-scripts`.
+
+import os
+import pytest
+import tempfile
+import shutil
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+
+def _write_manifest(tmp_dir, text):
+    manifest_file = os.path.join(tmp_dir, 'manifest.ini')
+    with open(manifest_file, 'w') as fh:
+        fh.write(text)
+    return manifest_file
+
+
+def test_brainjobs_help(script_runner):
+    ret = script_runner.run('brainjobs', '--help')
+    assert ret.success
+    assert 'usage' in ret.stdout
+    assert 'Run the brain export and render jobs described in a manifest file' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_brainjobs_invalid_manifest(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    manifest_file = _write_manifest(tmp_dir, "[batch]\nsubjects = subject1\n\n[job snaps]\ndata = thickness\nviews = sideways\n")
+    ret = script_runner.run('brainjobs', manifest_file)
+    assert not ret.success
+    assert "Invalid view 'sideways' in job 'snaps'" in ret.stderr
+    shutil.rmtree(tmp_dir)
+
+
+def test_brainjobs_export_and_render(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    manifest_file = _write_manifest(tmp_dir, "[figure]\nwidth = 200\nheight = 150\n\n[batch]\nsubjects_dir = %s\noutput_dir = %s\nsubjects = subject1\nnum_workers = 2\n\n[job snaps]\ndata = thickness\nviews = lateral, 3d\n\n[job meshes]\ndata = thickness\noutputs = ply\n" % (TEST_DATA_DIR, tmp_dir))
+    ret = script_runner.run('brainjobs', manifest_file, '-n')
+    assert ret.success
+    assert 'Scheduled 2 jobs: 1 mesh loads, 1 data loads, 1 projections and 1 renders for 3 output files.' in ret.stdout
+    assert not os.path.isfile(os.path.join(tmp_dir, 'subject1_thickness.ply'))
+    ret = script_runner.run('brainjobs', manifest_file, '-v')
+    assert ret.success
+    assert 'Processed morphometry thickness of subject subject1 for 3 outputs.' in ret.stdout
+    assert 'Wrote 3 files.' in ret.stdout
+    for output_file in ('subject1_thickness.ply', 'subject1_thickness_lateral.png', 'subject1_thickness_3d.png'):
+        assert os.path.isfile(os.path.join(tmp_dir, output_file))
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,19 @@
+# Tests for the brainviewd script.
+#
+# These tests require the package `pytest-console-scripts`.
+
+import os
+import pytest
+
+def test_brainviewd_help(script_runner):
+    ret = script_runner.run('brainviewd', '--help')
+    assert ret.success
+    assert 'usage' in ret.stdout
+    assert 'Run a local service that renders brain' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_brainviewd_invalid_workers(script_runner):
+    ret = script_runner.run('brainviewd', '-w', '0')
+    assert not ret.success
+    assert 'must be at least 1' in ret.stderr
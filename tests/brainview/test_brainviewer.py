@@ -91,3 +91,84 @@ def test_brainviewer_export_mesh(script_runner):
     assert 'Exporting brain mesh to file' in ret.stdout
     assert ret.stderr == ''
     shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_brainviewer_profile(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    profile_file = os.path.join(tmp_dir, 'profile.json')
+    image_file = os.path.join(tmp_dir, 'brain.png')
+    ret = script_runner.run('brainviewer', 'subject1' , '-d', TEST_DATA_DIR, '-m',  'curv', '-o', image_file, '-p', profile_file)
+    assert ret.success
+    assert 'Profiling information written to file' in ret.stdout
+    assert os.path.isfile(profile_file)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_brainviewer_data_stack(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    stack_file = os.path.join(tmp_dir, 'thickness_stack.npy')
+    subjects_file = os.path.join(tmp_dir, 'subjects.txt')
+    with open(subjects_file, 'w') as sf:
+        sf.write("subject1\n")
+    ret = script_runner.run('braingroup', 'stack', 'thickness', '-d', TEST_DATA_DIR, '-l', subjects_file, '-o', stack_file)
+    assert ret.success
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-k', stack_file, '-o', os.path.join(tmp_dir, 'brain.png'), '-v')
+    assert ret.success
+    assert 'Loading data for subject subject1 from data stack' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'brain.png'))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_brainviewer_smooth(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '--smooth', '5', '-v')
+    assert ret.success
+    assert 'Smoothing morphometry data with fwhm 5 on surface white' in ret.stdout
+    assert ret.stderr == ''
+
+
+def test_brainviewer_boundaries(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '-b', 'aparc', '-v')
+    assert ret.success
+    assert 'Loading atlas aparc for subject subject1 to draw region borders.' in ret.stdout
+
+
+def test_brainviewer_measures(script_runner):
+    tmp_dir = tempfile.mkdtemp()
+    outputfile = os.path.join(tmp_dir, 'brain.png')
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '--measures', 'thickness,area', '-o', outputfile, '-v')
+    assert ret.success
+    assert 'Loaded 2 measures: thickness, area.' in ret.stdout
+    assert os.path.isfile(os.path.join(tmp_dir, 'brain_thickness.png'))
+    assert os.path.isfile(os.path.join(tmp_dir, 'brain_area.png'))
+    assert not os.path.isfile(outputfile)
+    shutil.rmtree(tmp_dir)
+
+
+def test_brainviewer_measures_not_allowed_with_measure(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '--measures', 'thickness,area')
+    assert not ret.success
+    assert 'not allowed with argument -m/--measure' in ret.stderr
+
+
+def test_brainviewer_hemi_gap(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '--hemi-gap', '10', '-v')
+    assert ret.success
+    assert 'Displaying hemispheres side by side with a gap of 10 mm' in ret.stdout
+
+
+def test_brainviewer_hemi_gap_requires_both_hemis(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '-e', 'lh', '--hemi-gap', '10')
+    assert not ret.success
+    assert "requires '-e both'" in ret.stderr
+
+
+def test_brainviewer_threshold(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '-m', 'thickness', '--threshold', '2.5', '-v')
+    assert ret.success
+    assert 'Displaying statistical map thresholded at 2.5' in ret.stdout
+
+
+def test_brainviewer_threshold_not_allowed_with_measures(script_runner):
+    ret = script_runner.run('brainviewer', 'subject1', '-d', TEST_DATA_DIR, '--measures', 'thickness,area', '--threshold', '2.5')
+    assert not ret.success
+    assert 'argument --threshold: not allowed with argument --measures' in ret.stderr
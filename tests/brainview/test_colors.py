@@ -0,0 +1,60 @@
+# Brainview unit tests for the colors module.
+
+import pytest
+import numpy as np
+import brainload.meshexport as me
+import brainview.colors as bc
+
+
+def test_colormap_lut_is_cached_and_read_only():
+    lut = bc.colormap_lut('viridis')
+    assert lut.shape == (256, 4)
+    assert lut.dtype == np.uint8
+    assert lut[0].tolist() == [68, 1, 84, 255]
+    assert bc.colormap_lut('viridis') is lut
+    assert not lut.flags.writeable
+    assert bc.colormap_lut('viridis', num_colors=8).shape == (8, 4)
+
+
+def test_colormap_lut_unknown_colormap():
+    assert not bc.has_colormap('no_such_colormap')
+    with pytest.raises(ValueError) as exc_info:
+        bc.colormap_lut('no_such_colormap')
+    assert "Unknown colormap 'no_such_colormap'" in str(exc_info.value)
+
+
+def test_annotation_lut_converts_transparency_to_alpha():
+    label_colors = np.array([[25, 5, 25, 0, 1639705], [25, 100, 40, 55, 2647065]])
+    assert bc.annotation_lut(label_colors).tolist() == [[25, 5, 25, 255], [25, 100, 40, 200]]
+
+
+def test_get_data_range():
+    data = np.array([np.nan, 1.0, 2.0, 3.0, 4.0, 5.0])
+    assert bc.get_data_range(data) == (1.0, 5.0)
+    assert bc.get_data_range(data, clip_percentiles=(25, 75)) == (2.0, 4.0)
+    assert bc.get_data_range(np.array([np.nan])) == (0.0, 0.0)
+
+
+def test_scalars_to_lut_indices():
+    data = np.array([-1.0, 0.0, 0.5, 0.999, 1.0, 2.0, np.nan])
+    assert bc.scalars_to_lut_indices(data, (0.0, 1.0), num_colors=4).tolist() == [0, 0, 2, 3, 3, 3, 0]
+    assert bc.scalars_to_lut_indices(data, (1.0, 1.0), num_colors=4).tolist() == [0] * 7
+
+
+def test_scalars_to_colors_matches_matplotlib():
+    data = np.random.RandomState(0).randn(1000)
+    vertex_colors = bc.scalars_to_colors(data, 'viridis')
+    assert vertex_colors.dtype == np.uint8
+    assert np.all(vertex_colors == me.scalars_to_colors_matplotlib(data, 'viridis'))
+
+
+def test_scalars_to_colors_range_threshold_alpha_and_nan():
+    data = np.array([0.0, 0.1, 1.0, 2.0, np.nan])
+    lut = bc.colormap_lut('cool')
+    vertex_colors = bc.scalars_to_colors(data, 'cool', data_range=(0.0, 1.0), threshold=0.5, alpha=100)
+    assert vertex_colors[0].tolist() == [255, 255, 255, 255]
+    assert vertex_colors[1].tolist() == [255, 255, 255, 255]
+    assert vertex_colors[2].tolist() == lut[255, 0:3].tolist() + [100]
+    assert vertex_colors[3].tolist() == lut[255, 0:3].tolist() + [100]
+    assert vertex_colors[4].tolist() == [0, 0, 0, 0]
+    assert bc.colormap_lut('cool')[0, 3] == 255
@@ -0,0 +1,114 @@
+# Brainview unit tests for the datastack module.
+
+import os
+import json
+import pytest
+import tempfile
+import shutil
+import numpy as np
+import brainload as bl
+import brainview.datastack as bds
+import brainview.groupstats as bgs
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def _write_stack(tmp_dir, data, subjects, hemi='both', num_lh=None):
+    stack_file = os.path.join(tmp_dir, 'stack.npy')
+    np.save(stack_file, data.astype(np.float32))
+    index = {'format_version': bds.DATA_STACK_FORMAT_VERSION, 'subjects': subjects, 'num_verts': data.shape[1], 'measure': 'thickness', 'hemi': hemi, 'fwhm': '10', 'average_subject': 'fsaverage', 'surf': 'white'}
+    if num_lh is not None:
+        index['lh.num_data_points'] = num_lh
+    with open(bds.get_index_file_name(stack_file), 'w') as index_file:
+        json.dump(index, index_file)
+    return stack_file
+
+
+def test_get_index_file_name():
+    assert bds.get_index_file_name('/tmp/thickness_stack.npy') == '/tmp/thickness_stack.json'
+
+
+def test_load_data_stack_and_slice():
+    tmp_dir = tempfile.mkdtemp()
+    data = np.arange(12).reshape((3, 4))
+    stack_file = _write_stack(tmp_dir, data, ['s1', 's2', 's3'], num_lh=1)
+    stack = bds.load_data_stack(stack_file)
+    assert isinstance(stack['data'], np.memmap)
+    assert stack['data'].dtype == np.float32
+    assert stack['subjects'] == ['s1', 's2', 's3']
+    assert bds.get_subject_data(stack, 's2').tolist() == [4, 5, 6, 7]
+    assert bds.get_subject_data(stack, 's2', hemi='lh').tolist() == [4]
+    assert bds.get_subject_data(stack, 's2', hemi='rh').tolist() == [5, 6, 7]
+    assert bds.get_subjects_data(stack, ['s3', 's1']).tolist() == [[8, 9, 10, 11], [0, 1, 2, 3]]
+    assert bds.get_vertex_data(stack, 2).tolist() == [2, 6, 10]
+    assert bds.get_vertex_data(stack, [0, 3]).shape == (3, 2)
+    del stack
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_get_subject_data_raises_on_unknown_subject():
+    tmp_dir = tempfile.mkdtemp()
+    stack = bds.load_data_stack(_write_stack(tmp_dir, np.zeros((2, 3)), ['s1', 's2']))
+    with pytest.raises(ValueError) as exc_info:
+        bds.get_subject_data(stack, 'nosuchsubject')
+    assert 'not found in data stack' in str(exc_info.value)
+    with pytest.raises(ValueError) as exc_info:
+        bds.get_subjects_data(stack, ['s1', 'nosuchsubject'])
+    assert 'nosuchsubject' in str(exc_info.value)
+    del stack
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_get_hemi_slice_raises_on_wrong_hemi():
+    tmp_dir = tempfile.mkdtemp()
+    stack = bds.load_data_stack(_write_stack(tmp_dir, np.zeros((2, 3)), ['s1', 's2'], hemi='lh'))
+    assert bds.get_hemi_slice(stack, 'lh') == slice(None)
+    with pytest.raises(ValueError) as exc_info:
+        bds.get_hemi_slice(stack, 'rh')
+    assert 'Cannot get data for hemisphere' in str(exc_info.value)
+    del stack
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_load_data_stack_raises_without_index_file():
+    tmp_dir = tempfile.mkdtemp()
+    stack_file = os.path.join(tmp_dir, 'stack.npy')
+    np.save(stack_file, np.zeros((2, 3), dtype=np.float32))
+    with pytest.raises(ValueError) as exc_info:
+        bds.load_data_stack(stack_file)
+    assert 'Index file' in str(exc_info.value)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_iter_stack_rows_feeds_group_stats():
+    tmp_dir = tempfile.mkdtemp()
+    np.random.seed(0)
+    data = np.random.normal(2.5, 0.5, (10, 20))
+    stack = bds.load_data_stack(_write_stack(tmp_dir, data, ['s%d' % i for i in range(10)]))
+    rows = list(bds.iter_stack_rows(stack, chunk_size=3))
+    assert len(rows) == 10
+    assert np.allclose(rows[9], data[9])
+    maps = bgs.accumulate_group_stats(bds.iter_stack_rows(stack, chunk_size=4))
+    assert np.allclose(maps['mean'], np.mean(data.astype(np.float32), axis=0))
+    subset_rows = list(bds.iter_stack_rows(stack, subjects_list=['s5', 's1']))
+    assert np.allclose(subset_rows[0], data[5])
+    del stack
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_build_data_stack():
+    tmp_dir = tempfile.mkdtemp()
+    stack_file = os.path.join(tmp_dir, 'thickness_stack.npy')
+    index = bds.build_data_stack(stack_file, ['subject1'], TEST_DATA_DIR, 'thickness')
+    assert index['subjects'] == ['subject1']
+    assert os.path.isfile(bds.get_index_file_name(stack_file))
+    stack = bds.load_data_stack(stack_file)
+    morphometry_data, meta_data = bl.subject_data_standard('subject1', TEST_DATA_DIR, 'thickness', 'both', '10')
+    assert stack['data'].shape == (1, morphometry_data.shape[0])
+    assert np.allclose(bds.get_subject_data(stack, 'subject1'), morphometry_data.astype(np.float32))
+    del stack
+    shutil.rmtree(tmp_dir, ignore_errors=True)
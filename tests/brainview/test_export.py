@@ -108,3 +108,133 @@ def test_clip_data_at_percentiles():
     assert data.shape == clipped.shape
     assert np.min(clipped) > 20.0
     assert np.max(clipped) < 80.0
+
+
+def test_clip_data_at_percentiles_keeps_float32():
+    data = np.linspace(0.0, 100.0, 101).astype(np.float32)
+    clipped = be.clip_data_at_percentiles(data)
+    assert clipped.dtype == np.float32
+    assert clipped.min() == pytest.approx(5.0)
+
+
+def test_as_float_data():
+    data = np.arange(5, dtype=np.float32)
+    assert be.as_float_data(data) is data
+    data = np.arange(5, dtype=np.float64)
+    assert be.as_float_data(data) is data
+    converted = be.as_float_data(np.arange(5, dtype=np.int32))
+    assert converted.dtype == np.float64
+    assert np.array_equal(converted, [0.0, 1.0, 2.0, 3.0, 4.0])
+
+
+def test_atlas_vertex_colors():
+    vertex_labels = np.array([0, 1, -1, 1])
+    label_colors = np.array([[10, 20, 30, 0, 111], [40, 50, 60, 55, 222]])
+    vertex_colors = be.atlas_vertex_colors(vertex_labels, label_colors, unlabeled_color=(1, 2, 3, 4))
+    assert vertex_colors.shape == (4, 4)
+    assert vertex_colors.dtype == np.uint8
+    assert list(vertex_colors[0]) == [10, 20, 30, 255]
+    assert list(vertex_colors[1]) == [40, 50, 60, 200]     # alpha is 255 - transparency
+    assert list(vertex_colors[2]) == [1, 2, 3, 4]
+    assert list(vertex_colors[3]) == [40, 50, 60, 200]
+
+
+def test_atlas_vertex_colors_raises_on_invalid_labels():
+    label_colors = np.array([[10, 20, 30, 0, 111], [40, 50, 60, 55, 222]])
+    with pytest.raises(ValueError) as exc_info:
+        be.atlas_vertex_colors(np.array([0, 2]), label_colors)
+    assert 'vertex_labels must be in range' in str(exc_info.value)
+
+
+def test_label_vertex_colors():
+    vertex_colors = be.label_vertex_colors(4, np.array([1, 3]), label_color=(255, 0, 0, 255), background_color=(9, 9, 9, 255))
+    assert vertex_colors.shape == (4, 4)
+    assert list(vertex_colors[0]) == [9, 9, 9, 255]
+    assert list(vertex_colors[1]) == [255, 0, 0, 255]
+    assert list(vertex_colors[3]) == [255, 0, 0, 255]
+
+
+def test_get_export_string_ply_with_given_vertex_colors():
+    vertex_coords = np.array([[1.5, 1.5, 1.5], [2.5, 2.5, 2.5], [3.5, 3.5, 3.5]])
+    faces = np.array([[0, 1, 2]])
+    vertex_colors = np.array([[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]], dtype=np.uint8)
+    export_str = be._get_export_string('ply', vertex_coords, faces, None, 'viridis', -1, vertex_colors=vertex_colors)
+    assert 'property uchar red' in export_str
+    assert '5 6 7 8' in export_str
+
+
+def test_mark_boundary_vertex_colors():
+    vertex_colors = np.array([[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]], dtype=np.uint8)
+    marked = be.mark_boundary_vertex_colors(vertex_colors, np.array([False, True, False]), boundary_color=(0, 0, 0, 255))
+    assert list(marked[1]) == [0, 0, 0, 255]
+    assert list(marked[0]) == [1, 2, 3, 4]
+    assert list(vertex_colors[1]) == [5, 6, 7, 8]      # input is not modified
+
+
+def test_get_export_string_ply_with_boundary_vertices():
+    vertex_coords = np.array([[1.5, 1.5, 1.5], [2.5, 2.5, 2.5], [3.5, 3.5, 3.5]])
+    faces = np.array([[0, 1, 2]])
+    export_str = be._get_export_string('ply', vertex_coords, faces, None, 'viridis', -1, boundary_vertices=np.array([False, True, False]), boundary_color=(1, 2, 3, 255))
+    assert 'property uchar red' in export_str
+    assert '1 2 3 255' in export_str
+    assert '255 255 255 255' in export_str
+
+
+def _octahedron():
+    vert_coords = np.array([[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]], dtype=float)
+    faces = np.array([[0, 2, 4], [2, 1, 4], [1, 3, 4], [3, 0, 4], [2, 0, 5], [1, 2, 5], [3, 1, 5], [0, 3, 5]])
+    return vert_coords, faces
+
+
+def test_project_mesh_lateral_views():
+    vert_coords, faces = _octahedron()
+    lh_projection = be.project_mesh(vert_coords, faces, 'lateral', hemi='lh')
+    # The lh is seen from the left: anterior (+y) is on the left, the vertex at -x is closest to the viewer.
+    assert np.allclose(lh_projection['coords'][2], [-1, 0])
+    assert np.allclose(lh_projection['coords'][4], [0, 1])
+    assert np.argmin(lh_projection['depth']) == 1
+    # The faces are ordered back to front, so the last ones contain the closest vertex.
+    assert np.all(np.any(lh_projection['faces'][-4:] == 1, axis=1))
+    rh_projection = be.project_mesh(vert_coords, faces, 'lateral', hemi='rh')
+    assert np.allclose(rh_projection['coords'][2], [1, 0])
+    assert np.argmin(rh_projection['depth']) == 0
+    with pytest.raises(ValueError):
+        be.project_mesh(vert_coords, faces, 'sideways')
+
+
+def test_project_mesh_both_hemispheres():
+    vert_coords, faces = _octahedron()
+    both_coords = np.vstack((vert_coords - [2, 0, 0], vert_coords + [2, 0, 0]))
+    both_faces = np.vstack((faces, faces + 6))
+    projection = be.project_mesh(both_coords, both_faces, 'spherical', hemi='both', num_lh_verts=6)
+    lh_x, rh_x = projection['coords'][:6, 0], projection['coords'][6:, 0]
+    assert rh_x.min() > lh_x.max()
+    # The spherical projection puts the lateral vertex in the middle and cuts at the medial vertex.
+    assert np.allclose(projection['coords'][1], [0, 0])
+    assert projection['faces'].shape[0] < both_faces.shape[0]
+    with pytest.raises(ValueError):
+        be.project_mesh(both_coords, both_faces, 'lateral', hemi='both')
+
+
+def test_get_mesh_projection_is_cached():
+    vert_coords, faces = _octahedron()
+    projection = be.get_mesh_projection(vert_coords, faces, 'dorsal')
+    assert be.get_mesh_projection(vert_coords, faces, 'dorsal') is projection
+    assert be.get_mesh_projection(vert_coords, faces, 'ventral') is not projection
+    assert be.get_mesh_projection(vert_coords.copy(), faces, 'dorsal') is not projection
+
+
+def test_export_projection_to_file(tmpdir):
+    vert_coords, faces = _octahedron()
+    projection = be.get_mesh_projection(vert_coords, faces, 'lateral')
+    morphometry_data = np.arange(6, dtype=float)
+    for extension in ('png', 'svg', 'ply'):
+        filename = os.path.join(str(tmpdir), 'lateral.%s' % extension)
+        be.export_projection_to_file(filename, projection, morphometry_data=morphometry_data, size=(100, 80))
+        assert os.path.getsize(filename) > 0
+    with open(os.path.join(str(tmpdir), 'lateral.ply')) as fh:
+        assert fh.readline().strip() == 'ply'
+    face_colors = be.projection_face_colors(projection, be.label_vertex_colors(6, [1]))
+    assert face_colors.shape == (8, 4)
+    with pytest.raises(ValueError):
+        be.export_projection_to_file(os.path.join(str(tmpdir), 'lateral.jpg'), projection)
@@ -0,0 +1,156 @@
+# Brainview unit tests for the groupstats module.
+
+import os
+import pytest
+import tempfile
+import shutil
+import numpy as np
+import nibabel as nib
+import brainview.groupstats as bgs
+
+
+def _random_group_data(num_subjects=20, num_verts=50, seed=0):
+    np.random.seed(seed)
+    return np.random.normal(2.5, 0.5, (num_subjects, num_verts))
+
+
+def test_welford_matches_numpy():
+    data = _random_group_data()
+    state = bgs.welford_init(data.shape[1])
+    for subject_data in data:
+        bgs.welford_update(state, subject_data)
+    mean, std, count = bgs.welford_finalize(state)
+    assert np.allclose(mean, np.mean(data, axis=0))
+    assert np.allclose(std, np.std(data, axis=0, ddof=1))
+    assert np.all(count == data.shape[0])
+
+
+def test_welford_ignores_nan_values():
+    data = _random_group_data(num_subjects=5, num_verts=3)
+    data[0, 1] = np.nan
+    state = bgs.welford_init(3)
+    for subject_data in data:
+        bgs.welford_update(state, subject_data)
+    mean, std, count = bgs.welford_finalize(state)
+    assert count.tolist() == [5, 4, 5]
+    assert np.allclose(mean, np.nanmean(data, axis=0))
+    assert np.allclose(std, np.nanstd(data, axis=0, ddof=1))
+
+
+def test_welford_merge_equals_single_pass():
+    data = _random_group_data()
+    state_a = bgs.welford_init(data.shape[1])
+    state_b = bgs.welford_init(data.shape[1])
+    for subject_data in data[:7]:
+        bgs.welford_update(state_a, subject_data)
+    for subject_data in data[7:]:
+        bgs.welford_update(state_b, subject_data)
+    mean, std, count = bgs.welford_finalize(bgs.welford_merge(state_a, state_b))
+    assert np.allclose(mean, np.mean(data, axis=0))
+    assert np.allclose(std, np.std(data, axis=0, ddof=1))
+    assert np.all(count == data.shape[0])
+
+
+def test_histogram_sketch_quantiles_approximate_percentiles():
+    data = _random_group_data(num_subjects=500)
+    sketch = bgs.histogram_sketch_init(data.shape[1], (0.0, 5.0), num_bins=100)
+    for subject_data in data:
+        bgs.histogram_sketch_update(sketch, subject_data)
+    quantiles = bgs.histogram_sketch_quantiles(sketch, [0.05, 0.5, 0.95])
+    assert quantiles.shape == (3, data.shape[1])
+    expected = np.percentile(data, [5, 50, 95], axis=0)
+    bin_width = 5.0 / 100
+    assert np.all(np.abs(quantiles - expected) < 2 * bin_width)
+
+
+def test_histogram_sketch_merge_adds_counts():
+    data = _random_group_data()
+    sketch_a = bgs.histogram_sketch_init(data.shape[1], (0.0, 5.0))
+    sketch_b = bgs.histogram_sketch_init(data.shape[1], (0.0, 5.0))
+    for subject_data in data[:10]:
+        bgs.histogram_sketch_update(sketch_a, subject_data)
+    for subject_data in data[10:]:
+        bgs.histogram_sketch_update(sketch_b, subject_data)
+    merged = bgs.histogram_sketch_merge(sketch_a, sketch_b)
+    assert np.all(merged['counts'].sum(axis=1) == data.shape[0])
+
+
+def test_histogram_sketch_merge_raises_on_different_range():
+    sketch_a = bgs.histogram_sketch_init(10, (0.0, 5.0))
+    sketch_b = bgs.histogram_sketch_init(10, (0.0, 6.0))
+    with pytest.raises(ValueError) as exc_info:
+        bgs.histogram_sketch_merge(sketch_a, sketch_b)
+    assert 'same range' in str(exc_info.value)
+
+
+def test_histogram_sketch_init_raises_on_invalid_range():
+    with pytest.raises(ValueError) as exc_info:
+        bgs.histogram_sketch_init(10, (5.0, 5.0))
+    assert 'upper > lower' in str(exc_info.value)
+
+
+def test_accumulate_group_stats():
+    data = _random_group_data()
+    maps = bgs.accumulate_group_stats(iter(data), quantiles=[0.5, 0.025])
+    assert sorted(maps.keys()) == ['count', 'mean', 'p2.5', 'p50', 'std']
+    assert np.allclose(maps['mean'], np.mean(data, axis=0))
+    assert maps['p50'].shape == (data.shape[1], )
+
+
+def test_accumulate_group_stats_raises_without_data():
+    with pytest.raises(ValueError) as exc_info:
+        bgs.accumulate_group_stats(iter([]))
+    assert 'No subject data' in str(exc_info.value)
+
+
+def test_quantile_map_name():
+    assert bgs.quantile_map_name(0.5) == 'p50'
+    assert bgs.quantile_map_name(0.05) == 'p5'
+    assert bgs.quantile_map_name(0.025) == 'p2.5'
+
+
+def test_write_group_maps():
+    tmp_dir = tempfile.mkdtemp()
+    maps = {'mean': np.arange(10, dtype=np.float64), 'std': np.ones((10, ))}
+    meta_data = {'hemi': 'both', 'lh.num_data_points': 4}
+    written_files = bgs.write_group_maps(maps, meta_data, tmp_dir, 'group', 'thickness')
+    assert len(written_files) == 4
+    lh_mean_file = os.path.join(tmp_dir, 'group', 'surf', 'lh.thickness_mean.fwhm10.fsaverage.mgh')
+    rh_mean_file = os.path.join(tmp_dir, 'group', 'surf', 'rh.thickness_mean.fwhm10.fsaverage.mgh')
+    assert lh_mean_file in written_files
+    assert np.allclose(nib.load(lh_mean_file).get_fdata().ravel(), [0, 1, 2, 3])
+    assert np.allclose(nib.load(rh_mean_file).get_fdata().ravel(), [4, 5, 6, 7, 8, 9])
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_quantile_sketch_streaming_accuracy():
+    rng = np.random.RandomState(42)
+    sketch = bgs.quantile_sketch_init(k=512)
+    all_values = []
+    for _ in range(20):
+        data = rng.normal(2.5, 0.5, size=20000)
+        all_values.append(data)
+        bgs.quantile_sketch_update(sketch, data)
+    all_values = np.concatenate(all_values)
+    assert sketch['count'] == all_values.shape[0]
+    assert sum(level.shape[0] for level in sketch['levels']) < 3 * 512
+    quantiles = [0.05, 0.5, 0.95]
+    estimates = bgs.quantile_sketch_quantiles(sketch, quantiles)
+    ranks = [np.mean(all_values < estimate) for estimate in estimates]
+    assert np.allclose(ranks, quantiles, atol=0.01)
+    assert np.array_equal(bgs.quantile_sketch_quantiles(sketch, [0.0, 1.0]), [all_values.min(), all_values.max()])
+
+
+def test_quantile_sketch_merge_and_edge_cases():
+    sketch_a = bgs.quantile_sketch_init(k=64)
+    sketch_b = bgs.quantile_sketch_init(k=64)
+    bgs.quantile_sketch_update(sketch_a, np.arange(0, 5000, dtype=float))
+    bgs.quantile_sketch_update(sketch_b, np.array([np.nan, np.inf]))
+    bgs.quantile_sketch_update(sketch_b, np.arange(5000, 10000, dtype=float))
+    merged = bgs.quantile_sketch_merge(sketch_a, sketch_b)
+    assert merged['count'] == 10000
+    median = bgs.quantile_sketch_quantiles(merged, [0.5])[0]
+    assert abs(median - 5000.0) < 500.0
+    assert np.all(np.isnan(bgs.quantile_sketch_quantiles(bgs.quantile_sketch_init(), [0.5])))
+    with pytest.raises(ValueError):
+        bgs.quantile_sketch_init(k=1)
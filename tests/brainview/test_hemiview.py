@@ -0,0 +1,91 @@
+# Brainview unit tests for the hemiview module.
+
+import pytest
+import numpy as np
+import mayavi.mlab as mlab
+import brainview.hemiview as bhv
+
+mlab.options.offscreen = True
+
+
+@pytest.fixture
+def both_hemis_mesh(grid_mesh):
+    # Two overlapping grids, concatenated like the meshes returned by brainload for hemi 'both'.
+    lh_vert_coords, lh_faces = grid_mesh(size=10, offset=0.0)
+    rh_vert_coords, rh_faces = grid_mesh(size=10, offset=5.0)
+    vert_coords = np.vstack((lh_vert_coords, rh_vert_coords))
+    faces = np.vstack((lh_faces, rh_faces + lh_vert_coords.shape[0]))
+    meta_data = {'lh.num_vertices': lh_vert_coords.shape[0], 'lh.num_faces': lh_faces.shape[0]}
+    return vert_coords, faces, meta_data
+
+
+def test_split_hemispheres(both_hemis_mesh):
+    vert_coords, faces, meta_data = both_hemis_mesh
+    hemispheres = bhv.split_hemispheres(vert_coords, faces, meta_data)
+    assert hemispheres['lh']['vert_coords'].shape == (100, 3)
+    assert hemispheres['rh']['vert_coords'].shape == (100, 3)
+    assert np.shares_memory(hemispheres['rh']['vert_coords'], vert_coords)
+    assert hemispheres['rh']['faces'].min() == 0
+    assert hemispheres['rh']['faces'].max() == 99
+    assert np.all(hemispheres['rh']['vert_coords'][hemispheres['rh']['faces']] == vert_coords[faces[162:]])
+
+
+def test_split_hemispheres_raises_on_mismatching_meta_data(both_hemis_mesh):
+    vert_coords, faces, meta_data = both_hemis_mesh
+    with pytest.raises(ValueError) as exc_info:
+        bhv.split_hemispheres(vert_coords, faces, {'lh.num_vertices': 50, 'lh.num_faces': 162})
+    assert 'do not match 50 lh vertices' in str(exc_info.value)
+    with pytest.raises(ValueError):
+        bhv.split_hemispheres(vert_coords, faces, {})
+
+
+def test_brain_hemisphere_view_shares_buffers(both_hemis_mesh):
+    vert_coords, faces, meta_data = both_hemis_mesh
+    data = vert_coords[:, 0].copy()
+    fig = mlab.figure(size=(200, 150))
+    scene = bhv.brain_hemisphere_view(fig, vert_coords, faces, data, meta_data)
+    assert scene['vert_coords'].dtype == np.float32
+    assert not np.shares_memory(scene['data'], data)
+    for hemi in bhv.HEMIS:
+        dataset = scene['surfaces'][hemi].mlab_source.dataset
+        assert np.shares_memory(dataset.points.to_array(), scene['vert_coords'])
+        assert np.shares_memory(dataset.point_data.scalars.to_array(), scene['data'])
+    assert scene['data_range'] == (0.0, 14.0)
+    mlab.close(fig)
+
+
+def test_set_scene_data(both_hemis_mesh):
+    vert_coords, faces, meta_data = both_hemis_mesh
+    data = vert_coords[:, 0].copy()
+    fig = mlab.figure(size=(200, 150))
+    scene = bhv.brain_hemisphere_view(fig, vert_coords, faces, data, meta_data)
+    new_data = np.arange(200, dtype=float)
+    bhv.set_scene_data(scene, new_data, data_range=(10.0, 150.0))
+    assert np.all(scene['surfaces']['rh'].mlab_source.dataset.point_data.scalars.to_array() == new_data[100:])
+    assert np.all(data == vert_coords[:, 0])
+    assert tuple(scene['surfaces']['lh'].module_manager.scalar_lut_manager.data_range) == (10.0, 150.0)
+    with pytest.raises(ValueError):
+        bhv.set_scene_data(scene, new_data[:10])
+    mlab.close(fig)
+
+
+def test_set_hemisphere_gap_and_visible(both_hemis_mesh):
+    vert_coords, faces, meta_data = both_hemis_mesh
+    fig = mlab.figure(size=(200, 150))
+    scene = bhv.brain_hemisphere_view(fig, vert_coords, faces, vert_coords[:, 1], meta_data)
+    offsets = bhv.set_hemisphere_gap(scene, 2.0)
+    assert offsets['lh'] == (-3.0, 0.0, 0.0)
+    assert offsets['rh'] == (3.0, 0.0, 0.0)
+    lh_bounds = scene['surfaces']['lh'].actor.actor.bounds
+    rh_bounds = scene['surfaces']['rh'].actor.actor.bounds
+    assert rh_bounds[0] - lh_bounds[1] == pytest.approx(2.0)
+    displayed_coords = bhv.get_displayed_coords(scene)
+    assert displayed_coords[:100, 0].max() == pytest.approx(lh_bounds[1])
+    assert displayed_coords[100:, 0].min() == pytest.approx(rh_bounds[0])
+    assert scene['vert_coords'][:100, 0].max() == 9.0
+    bhv.set_hemisphere_visible(scene, 'rh', False)
+    assert not scene['surfaces']['rh'].visible
+    assert scene['surfaces']['lh'].visible
+    with pytest.raises(ValueError):
+        bhv.set_hemisphere_visible(scene, 'both', False)
+    mlab.close(fig)
@@ -0,0 +1,92 @@
+# Brainview unit tests for the jobs module.
+
+import os
+import sys
+import tempfile
+import shutil
+import subprocess
+import pytest
+import brainview.jobs as bjobs
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def _write_manifest(tmp_dir, text):
+    manifest_file = os.path.join(tmp_dir, 'manifest.ini')
+    with open(manifest_file, 'w') as fh:
+        fh.write(text)
+    return bjobs.read_manifest(manifest_file)
+
+
+def test_read_manifest_overrides_config():
+    tmp_dir = tempfile.mkdtemp()
+    manifest = _write_manifest(tmp_dir, "[figure]\nwidth = 320\n\n[job snaps]\ndata = thickness\n")
+    assert manifest.getint('figure', 'width') == 320
+    assert manifest.getint('figure', 'height') == 600
+    assert manifest.has_section('batch')
+    shutil.rmtree(tmp_dir)
+    with pytest.raises(ValueError) as exc_info:
+        bjobs.read_manifest(os.path.join(tmp_dir, 'manifest.ini'))
+    assert 'does not exist' in str(exc_info.value)
+
+
+def test_expand_and_schedule_jobs_share_loads():
+    tmp_dir = tempfile.mkdtemp()
+    manifest = _write_manifest(tmp_dir, "[batch]\nsubjects_dir = /data\noutput_dir = /out\nsubjects = s1, s2\n\n[job snaps]\ndata = thickness, area\ncommon_subject_mode = true\nviews = lateral, medial, 3d\noutputs = png, svg\n\n[job meshes]\ndata = thickness\ncommon_subject_mode = true\n\n[job atlas]\nmode = atlas\ndata = aparc\nsubjects = s1\nviews = lateral\noutputs = pdf\n")
+    tasks = bjobs.expand_jobs(manifest)
+    assert len(tasks) == 2 * 2 + 2 + 1
+    assert [output_file['file'] for output_file in tasks[0]['output_files']] == ['/out/s1_thickness_lateral.png', '/out/s1_thickness_lateral.svg', '/out/s1_thickness_medial.png', '/out/s1_thickness_medial.svg', '/out/s1_thickness_3d.png']
+    assert tasks[4]['output_files'] == [{'view': None, 'format': 'ply', 'file': '/out/s1_thickness.ply'}]
+
+    loads = bjobs.schedule_jobs(tasks)
+    # The mesh export of a measure shares the load of its snapshots, and all subjects share the mesh of fsaverage.
+    assert [(load['subject'], load['data']) for load in loads] == [('s1', 'thickness'), ('s1', 'area'), ('s2', 'thickness'), ('s2', 'area'), ('s1', 'aparc')]
+    assert loads[0]['mesh_key'] == ('/data', 'fsaverage', 'white', 'both')
+    assert loads[4]['mesh_key'] == ('/data', 's1', 'white', 'both')
+    assert len(loads[0]['outputs']) == 6
+    stats = bjobs.schedule_summary(loads)
+    assert stats == {'num_jobs': 3, 'num_mesh_loads': 2, 'num_data_loads': 5, 'num_projections': 3, 'num_renders': 4, 'num_outputs': 23}
+    assert bjobs.format_job_stats(stats) == "3 jobs: 2 mesh loads, 5 data loads, 3 projections and 4 renders for 23 output files."
+    shutil.rmtree(tmp_dir)
+
+
+def test_expand_jobs_errors():
+    tmp_dir = tempfile.mkdtemp()
+    invalid_jobs = [("[job a]\ndata = thickness\nviews = sideways\n", "Invalid view 'sideways'"),
+                    ("[job a]\ndata = thickness\noutputs = svg\n", "requires option 'views'"),
+                    ("[job a]\nmode = atlas\ndata = aparc\nviews = 3d\n", "requires mode 'morphometry'"),
+                    ("[job a]\nmode = volume\ndata = aparc\n", "must be one of"),
+                    ("[job a]\nviews = lateral\n", "has no option 'data'"),
+                    ("[job a]\ndata = thickness\n\n[job b]\ndata = thickness\n", "both write file"),
+                    ("[figure]\nwidth = 320\n", "contains no jobs")]
+    for job_text, message in invalid_jobs:
+        manifest = _write_manifest(tmp_dir, "[batch]\nsubjects = s1\n\n" + job_text)
+        with pytest.raises(ValueError) as exc_info:
+            bjobs.expand_jobs(manifest)
+        assert message in str(exc_info.value)
+    shutil.rmtree(tmp_dir)
+
+
+def test_run_jobs_exports_meshes_and_projections():
+    tmp_dir = tempfile.mkdtemp()
+    manifest = _write_manifest(tmp_dir, "[figure]\nwidth = 200\nheight = 150\n\n[batch]\nsubjects_dir = %s\noutput_dir = %s\nsubjects = subject1\nnum_workers = 2\n\n[job meshes]\ndata = thickness, area\n\n[job snaps]\ndata = thickness\nviews = lateral, spherical\noutputs = png, svg\n\n[job atlas]\nmode = atlas\ndata = aparc\nviews = lateral\noutputs = png\nboundaries = true\n" % (TEST_DATA_DIR, tmp_dir))
+    output_files, stats = bjobs.run_jobs(manifest)
+    expected_files = ['subject1_thickness.ply', 'subject1_area.ply', 'subject1_thickness_lateral.png', 'subject1_thickness_lateral.svg', 'subject1_thickness_spherical.png', 'subject1_thickness_spherical.svg', 'subject1_aparc_lateral.png']
+    assert sorted(output_files) == sorted([os.path.join(tmp_dir, output_file) for output_file in expected_files])
+    for output_file in output_files:
+        assert os.path.isfile(output_file)
+    assert stats['num_mesh_loads'] == 1
+    assert stats['num_data_loads'] == 3
+    assert stats['num_renders'] == 0
+    assert stats['total_seconds'] > 0
+    shutil.rmtree(tmp_dir)
+
+
+def test_jobs_does_not_import_rendering_stack():
+    code = "import sys; import brainview.jobs; print('mayavi' in sys.modules or 'vtk' in sys.modules or 'tvtk' in sys.modules)"
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.decode().strip() == 'False'
@@ -0,0 +1,82 @@
+# Brainview unit tests for the labelset module.
+
+import os
+import pytest
+import numpy as np
+import brainload as bl
+import brainview.labelset as bls
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def _labelset(num_labels=10):
+    # Label i contains the vertices i..i+4 of a mesh with 20 vertices, so neighboring labels overlap.
+    return bls.new_labelset(20, [np.arange(i, i + 5) for i in range(num_labels)], ['label%d' % i for i in range(num_labels)])
+
+
+def test_new_labelset_packs_membership():
+    labelset = _labelset()
+    assert labelset['bits'].shape == (20, 2)
+    assert labelset['sizes'].tolist() == [5] * 10
+    assert np.all(bls.label_mask(labelset, 'label9') == np.isin(np.arange(20), np.arange(9, 14)))
+    assert bls.vertex_label_names(labelset, 9) == ['label5', 'label6', 'label7', 'label8', 'label9']
+    assert bls.vertex_label_names(labelset, 19) == []
+    with pytest.raises(ValueError):
+        bls.new_labelset(20, [np.arange(18, 21)], ['label0'])
+    with pytest.raises(ValueError):
+        bls.new_labelset(20, [np.arange(3), np.arange(4)], ['label0', 'label0'])
+    with pytest.raises(ValueError):
+        bls.label_mask(labelset, 'nosuchlabel')
+
+
+def test_labelset_set_operations():
+    labelset = _labelset()
+    assert np.flatnonzero(bls.labelset_union(labelset, ['label0', 'label9'])).tolist() == [0, 1, 2, 3, 4, 9, 10, 11, 12, 13]
+    assert np.flatnonzero(bls.labelset_intersection(labelset, ['label2', 'label5', 'label8'])).tolist() == []
+    assert np.flatnonzero(bls.labelset_intersection(labelset, ['label2', 'label5'])).tolist() == [5, 6]
+    assert np.count_nonzero(bls.labelset_union(labelset)) == 14
+    assert bls.membership_counts(labelset).tolist() == [1, 2, 3, 4, 5, 5, 5, 5, 5, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0, 0]
+
+
+def test_overlap_counts():
+    labelset = _labelset()
+    overlaps = bls.overlap_counts(labelset)
+    expected = np.maximum(5 - np.abs(np.subtract.outer(np.arange(10), np.arange(10))), 0)
+    assert np.all(overlaps == expected)
+
+
+def test_labelset_vertex_colors():
+    labelset = bls.new_labelset(6, [np.array([0, 1, 2]), np.array([2, 3])], ['a', 'b'])
+    label_colors = np.array([[255, 0, 0, 255], [0, 0, 255, 255]])
+    vertex_colors = bls.labelset_vertex_colors(labelset, label_colors=label_colors, background_color=(1, 2, 3, 4))
+    assert vertex_colors.tolist() == [[255, 0, 0, 255], [255, 0, 0, 255], [128, 0, 128, 255], [0, 0, 255, 255], [1, 2, 3, 4], [1, 2, 3, 4]]
+    vertex_colors = bls.labelset_vertex_colors(labelset, label_colors=label_colors, overlap_color=(0, 0, 0, 255))
+    assert vertex_colors[2].tolist() == [0, 0, 0, 255]
+    many_labels = bls.new_labelset(20, [np.array([i % 20]) for i in range(30)], ['label%d' % i for i in range(30)])
+    assert bls.labelset_vertex_colors(many_labels).shape == (20, 4)
+    with pytest.raises(ValueError):
+        bls.labelset_vertex_colors(labelset, label_colors=label_colors[:1])
+
+
+def test_labelset_vertex_colors_no_labels():
+    labelset = bls.new_labelset(4, [], [])
+    vertex_colors = bls.labelset_vertex_colors(labelset, background_color=(1, 2, 3, 4))
+    assert vertex_colors.tolist() == [[1, 2, 3, 4]] * 4
+
+
+def test_load_labelset_matches_single_labels():
+    vert_coords, faces, _, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, load_morphometry_data=False)
+    meta_data_before = dict(meta_data)
+    label_names = ['roi1', 'roi2', 'cortex']
+    labelset = bls.load_labelset('subject1', TEST_DATA_DIR, label_names, meta_data)
+    assert meta_data == meta_data_before
+    assert labelset['num_verts'] == vert_coords.shape[0]
+    for label_name in label_names:
+        verts_in_label = bl.label('subject1', TEST_DATA_DIR, label_name, meta_data=dict(meta_data))[0]
+        assert np.all(np.flatnonzero(bls.label_mask(labelset, label_name)) == np.unique(verts_in_label))
+    lh_labelset = bls.load_labelset('subject1', TEST_DATA_DIR, label_names, meta_data, hemi='lh', num_workers=1)
+    assert lh_labelset['num_verts'] == meta_data['lh.num_vertices']
@@ -0,0 +1,100 @@
+# Brainview unit tests for the lod module.
+
+import os
+import pytest
+import numpy as np
+import mayavi.mlab as mlab
+import brainload as bl
+import brainview as bv
+import brainview.lod as blod
+
+mlab.options.offscreen = True
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def test_decimate_mesh(grid_mesh):
+    vert_coords, faces = grid_mesh(size=40)
+    lod = blod.decimate_mesh(vert_coords, faces, 400)
+    num_coarse_verts = lod['vert_coords'].shape[0]
+    assert 200 < num_coarse_verts < 800
+    assert lod['vertex_mapping'].shape == (vert_coords.shape[0], )
+    assert lod['representative_vertices'].shape == (num_coarse_verts, )
+    assert lod['faces'].max() < num_coarse_verts
+    assert np.all(lod['vertex_mapping'][lod['representative_vertices']] == np.arange(num_coarse_verts))
+    assert np.all(lod['faces'][:, 0] != lod['faces'][:, 1])
+
+
+def test_decimate_mesh_returns_small_mesh_unchanged(grid_mesh):
+    vert_coords, faces = grid_mesh(size=5)
+    lod = blod.decimate_mesh(vert_coords, faces, 100)
+    assert lod['vert_coords'] is vert_coords
+    assert lod['faces'] is faces
+
+
+def test_decimate_mesh_does_not_merge_components(grid_mesh):
+    vert_coords_a, faces_a = grid_mesh(size=20)
+    vert_coords_b, faces_b = grid_mesh(size=20, offset=19.5)       # overlaps with the first grid
+    vert_coords = np.vstack((vert_coords_a, vert_coords_b))
+    faces = np.vstack((faces_a, faces_b + vert_coords_a.shape[0]))
+    lod = blod.decimate_mesh(vert_coords, faces, 100)
+    coarse_a = set(lod['vertex_mapping'][:vert_coords_a.shape[0]])
+    coarse_b = set(lod['vertex_mapping'][vert_coords_a.shape[0]:])
+    assert len(coarse_a & coarse_b) == 0
+
+
+def test_decimate_mesh_raises_on_invalid_target(grid_mesh):
+    vert_coords, faces = grid_mesh(size=5)
+    with pytest.raises(ValueError) as exc_info:
+        blod.decimate_mesh(vert_coords, faces, 0)
+    assert 'must be positive' in str(exc_info.value)
+
+
+def test_get_lod_is_cached(grid_mesh):
+    vert_coords, faces = grid_mesh(size=40)
+    assert blod.get_lod(vert_coords, faces, 400) is blod.get_lod(vert_coords, faces, 400)
+    assert blod.get_lod(vert_coords, faces, 400) is not blod.get_lod(vert_coords, faces, 300)
+    assert blod.get_lod(vert_coords, faces, 400) is not blod.get_lod(vert_coords.copy(), faces, 400)
+
+
+def test_lod_vertex_data(grid_mesh):
+    vert_coords, faces = grid_mesh(size=40)
+    lod = blod.decimate_mesh(vert_coords, faces, 400)
+    data = np.full((vert_coords.shape[0], ), 3.0)
+    assert np.allclose(blod.lod_vertex_data(lod, data), 3.0)
+    labels = (vert_coords[:, 0] > 20).astype(int)
+    coarse_labels = blod.lod_vertex_data(lod, labels, mode='representative')
+    assert set(coarse_labels.tolist()) == set([0, 1])
+    with pytest.raises(ValueError) as exc_info:
+        blod.lod_vertex_data(lod, data, mode='max')
+    assert 'mode must be one of' in str(exc_info.value)
+
+
+def test_lod_vertex_data_parcel_values(grid_mesh):
+    # Parcel values are constant within each region and NaN outside all regions, e.g., on the medial wall.
+    vert_coords, faces = grid_mesh(size=40)
+    lod = blod.decimate_mesh(vert_coords, faces, 400)
+    parcel_data = np.where(vert_coords[:, 0] > 20, 2.0, 1.0)
+    parcel_data[vert_coords[:, 1] < 5] = np.nan
+    coarse_data = blod.lod_vertex_data(lod, parcel_data, mode='representative')
+    assert set(coarse_data[np.isfinite(coarse_data)].tolist()) == set([1.0, 2.0])
+    assert np.count_nonzero(np.isnan(coarse_data)) == np.count_nonzero(np.isnan(parcel_data[lod['representative_vertices']]))
+    # The mean blends neighboring regions into values that belong to no region.
+    mean_data = blod.lod_vertex_data(lod, parcel_data)
+    assert not set(mean_data[np.isfinite(mean_data)].tolist()) <= set([1.0, 2.0])
+
+
+def test_set_surface_lod():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR)
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data)
+    data_range = surface.module_manager.scalar_lut_manager.data_range.copy()
+    target_num_verts = vert_coords.shape[0] // 4
+    lod = blod.set_surface_lod(surface, vert_coords, faces, target_num_verts)
+    assert lod['vert_coords'].shape[0] < vert_coords.shape[0]
+    assert surface.mlab_source.scalars.shape == (lod['vert_coords'].shape[0], )
+    assert np.allclose(surface.module_manager.scalar_lut_manager.data_range, data_range)
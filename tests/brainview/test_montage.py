@@ -0,0 +1,58 @@
+# Brainview unit tests for the montage module.
+
+import os
+import tempfile
+import shutil
+import pytest
+import numpy as np
+import matplotlib.image
+import brainview.montage as bmon
+
+
+def _image(value, width=40, height=30):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def test_parse_grid():
+    assert bmon.parse_grid('8x6') == (8, 6)
+    assert bmon.parse_grid('3X2') == (3, 2)
+    with pytest.raises(ValueError):
+        bmon.parse_grid('8')
+    with pytest.raises(ValueError):
+        bmon.parse_grid('0x2')
+
+
+def test_montage_pages_are_streamed():
+    written = {}
+    write_function = lambda filename, image: written.__setitem__(filename, image)
+    montage = bmon.new_montage('page_%d.png', (40, 30), num_columns=2, num_rows=2, tile_step=2, label_height=0)
+    assert montage['page'].shape == (30, 40, 3)
+    for idx in range(5):
+        bmon.add_montage_tile(montage, _image(idx * 10), write_function=write_function)
+    assert list(written.keys()) == ['page_0.png']
+    page = written['page_0.png']
+    assert page[0, 0, 0] == 0
+    assert page[0, 20, 0] == 10
+    assert page[15, 0, 0] == 20
+    assert page[15, 20, 0] == 30
+    assert bmon.finish_montage(montage, write_function=write_function) == ['page_0.png', 'page_1.png']
+    last_page = written['page_1.png']
+    assert last_page[0, 0, 0] == 40
+    assert last_page[0, 20, 0] == 255       # Empty tiles have the background color.
+
+
+def test_montage_labels_and_file_output():
+    tmp_dir = tempfile.mkdtemp()
+    montage = bmon.new_montage(os.path.join(tmp_dir, 'qc_%03d.png'), (40, 30), num_columns=3, num_rows=1, label_height=20)
+    bmon.add_montage_tile(montage, _image(255), label='subject1')
+    pages = bmon.finish_montage(montage)
+    assert pages == [os.path.join(tmp_dir, 'qc_000.png')]
+    page = matplotlib.image.imread(pages[0])
+    assert page.shape[:2] == (50, 120)
+    assert np.any(page[30:, :40, :3] < 0.5)     # The label is drawn in black below the first tile.
+    assert np.all(page[30:, 40:, :3] == 1.0)
+    shutil.rmtree(tmp_dir)
+
+
+def test_get_montage_output_pattern():
+    assert bmon.get_montage_output_pattern('/tmp/images', 'thickness') == '/tmp/images/montage_thickness_%03d.png'
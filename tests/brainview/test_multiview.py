@@ -22,3 +22,13 @@ def test_brain_multi_view_gets_created():
     fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
     surface = mv.multi_view(fig, vert_coords, faces, morphometry_data)
     assert type(fig) == mayavi.core.scene.Scene
+
+
+def test_brain_multi_view_shares_mesh_data():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR)
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    meshes = mv.multi_view(fig, vert_coords, faces, morphometry_data)
+    assert meshes[0].parent.parent is meshes[1].parent.parent
+    assert meshes[0].actor.actor.orientation[0] == pytest.approx(90.0)
+    assert tuple(meshes[1].actor.actor.position) == (200.0, 0.0, 0.0)
+    mlab.close(fig)
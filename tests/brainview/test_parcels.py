@@ -0,0 +1,95 @@
+# Brainview unit tests for the parcels module.
+
+import os
+import pytest
+import numpy as np
+import brainload as bl
+import brainview.parcels as bp
+import brainview.colors as bc
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def test_parcel_aggregate_mean_count_sum():
+    data = np.array([1.0, 2.0, 3.0, 10.0, 20.0, 5.0])
+    vertex_labels = np.array([0, 0, 0, 2, 2, -1])
+    assert np.allclose(bp.parcel_aggregate(data, vertex_labels, 3, stat='mean'), [2.0, np.nan, 15.0], equal_nan=True)
+    assert bp.parcel_aggregate(data, vertex_labels, 3, stat='count').tolist() == [3, 0, 2]
+    assert np.allclose(bp.parcel_aggregate(data, vertex_labels, 3, stat='sum'), [6.0, 0.0, 30.0])
+
+
+def test_parcel_aggregate_median():
+    data = np.array([5.0, 1.0, 3.0, 10.0, 20.0, 7.0, 8.0, 1.0])
+    vertex_labels = np.array([0, 0, 0, 1, 1, -1, 1, 1])
+    assert np.allclose(bp.parcel_aggregate(data, vertex_labels, 3, stat='median'), [3.0, 9.0, np.nan], equal_nan=True)
+
+
+def test_parcel_aggregate_ignores_nan_values():
+    data = np.array([1.0, np.nan, 3.0])
+    vertex_labels = np.array([0, 0, 0])
+    assert np.allclose(bp.parcel_aggregate(data, vertex_labels, 1), [2.0])
+    assert bp.parcel_aggregate(data, vertex_labels, 1, stat='count').tolist() == [2]
+
+
+def test_parcel_aggregate_stacked_data():
+    np.random.seed(0)
+    data = np.random.rand(4, 30)
+    vertex_labels = np.random.randint(-1, 5, size=30)
+    for stat in ('mean', 'median', 'count'):
+        stacked = bp.parcel_aggregate(data, vertex_labels, 5, stat=stat)
+        assert stacked.shape == (4, 5)
+        for row in range(4):
+            assert np.allclose(stacked[row], bp.parcel_aggregate(data[row], vertex_labels, 5, stat=stat), equal_nan=True)
+
+
+def test_parcel_aggregate_raises_on_invalid_input():
+    with pytest.raises(ValueError) as exc_info:
+        bp.parcel_aggregate(np.zeros((3, )), np.array([0, 1, 2]), 3, stat='mode')
+    assert 'stat must be one of' in str(exc_info.value)
+    with pytest.raises(ValueError) as exc_info:
+        bp.parcel_aggregate(np.zeros((3, )), np.array([0, 1, 3]), 3)
+    assert 'must be smaller than the number of labels' in str(exc_info.value)
+    with pytest.raises(ValueError) as exc_info:
+        bp.parcel_aggregate(np.zeros((4, )), np.array([0, 1, 2]), 3)
+    assert 'vertex labels' in str(exc_info.value)
+
+
+def test_parcel_stats():
+    result = bp.parcel_stats(np.array([1.0, 3.0, 4.0]), np.array([0, 0, 1]), ['a', 'b'])
+    assert result['label_names'] == ['a', 'b']
+    assert np.allclose(result['mean'], [2.0, 4.0])
+    assert np.allclose(result['median'], [2.0, 4.0])
+    assert result['count'].tolist() == [2, 1]
+
+
+def test_parcel_values_to_vertices():
+    vertex_labels = np.array([1, 0, -1, 1])
+    assert bp.parcel_values_to_vertices(np.array([5.0, 7.0]), vertex_labels, fill_value=0.0).tolist() == [7.0, 5.0, 0.0, 7.0]
+    stacked = bp.parcel_values_to_vertices(np.array([[5.0, 7.0], [1.0, 2.0]]), vertex_labels)
+    assert stacked.shape == (2, 4)
+    assert np.isnan(stacked[1, 2])
+    assert stacked[1].tolist()[:2] == [2.0, 1.0]
+
+
+def test_parcel_values_to_vertices_unlabeled_vertices_get_nan_color():
+    # The lowest region value must not be used for vertices outside all regions, they get the NaN color instead.
+    vertex_labels = np.array([1, 0, -1, 1, -1])
+    vertex_data = bp.parcel_values_to_vertices(np.array([5.0, 7.0]), vertex_labels)
+    assert np.isnan(vertex_data[vertex_labels < 0]).all()
+    vertex_colors = bc.scalars_to_colors(vertex_data, 'viridis', nan_color=(255, 255, 255, 255))
+    assert vertex_colors[2].tolist() == [255, 255, 255, 255]
+    assert vertex_colors[1].tolist() != vertex_colors[2].tolist()
+    assert vertex_colors[1].tolist() == bc.scalars_to_colors(np.array([5.0, 7.0]), 'viridis')[0].tolist()
+
+
+def test_parcel_aggregate_on_subject_atlas():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR)
+    vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', TEST_DATA_DIR, 'aparc')
+    region_means = bp.parcel_aggregate(morphometry_data, vertex_labels, len(label_names))
+    assert region_means.shape == (len(label_names), )
+    first_label = vertex_labels[vertex_labels >= 0][0]
+    assert region_means[first_label] == pytest.approx(np.mean(morphometry_data[vertex_labels == first_label]))
@@ -0,0 +1,107 @@
+# Brainview unit tests for the profiling module.
+
+import os
+import sys
+import json
+import time
+import tempfile
+import shutil
+import pytest
+import brainview.profiling as bp
+
+
+def test_stage_does_nothing_without_session():
+    bp.stop_profiling()     # make sure no session is left over from other tests
+    assert bp.is_profiling() == False
+    with bp.stage('some_stage'):
+        x = 1
+    assert bp.stop_profiling() is None
+
+
+def test_stages_are_recorded_in_order():
+    bp.start_profiling()
+    assert bp.is_profiling() == True
+    with bp.stage('load'):
+        time.sleep(0.01)
+    with bp.stage('render'):
+        pass
+    with bp.stage('load'):
+        pass
+    report = bp.stop_profiling()
+    assert bp.is_profiling() == False
+    assert [s['name'] for s in report['stages']] == ['load', 'render']
+    load_stage = report['stages'][0]
+    assert load_stage['calls'] == 2
+    assert load_stage['total_seconds'] >= 0.01
+    assert load_stage['max_seconds'] <= load_stage['total_seconds']
+    assert report['total_seconds'] >= load_stage['total_seconds']
+    assert 'cprofile' not in report
+
+
+def test_nested_stages_are_named_by_path():
+    bp.start_profiling()
+    with bp.stage('mesh'):
+        with bp.stage('singleview.triangular_mesh'):
+            pass
+    report = bp.stop_profiling()
+    assert [s['name'] for s in report['stages']] == ['mesh', 'mesh/singleview.triangular_mesh']
+
+
+def test_profiled_decorator():
+    @bp.profiled('test.double')
+    def double(x):
+        """Double it."""
+        return x * 2
+    bp.start_profiling()
+    assert double(3) == 6
+    report = bp.stop_profiling()
+    assert report['stages'][0]['name'] == 'test.double'
+    assert double.__name__ == 'double'
+    assert double.__doc__ == 'Double it.'
+
+
+def test_cprofile_entries():
+    bp.start_profiling(use_cprofile=True)
+    with bp.stage('work'):
+        sorted(range(1000), reverse=True)
+    report = bp.stop_profiling(num_cprofile_entries=5)
+    assert 'cprofile' in report
+    assert len(report['cprofile']) <= 5
+    assert 'cumulative_seconds' in report['cprofile'][0]
+
+
+def test_start_profiling_discards_active_cprofile_session():
+    bp.start_profiling(use_cprofile=True)
+    discarded_profiler = bp._session['cprofile']
+    bp.start_profiling(use_cprofile=True)
+    with bp.stage('work'):
+        sorted(range(1000), reverse=True)
+    report = bp.stop_profiling()
+    assert 'cprofile' in report
+    assert [stage_info['name'] for stage_info in report['stages']] == ['work']
+    # The profiler of the discarded session was stopped, so it can be enabled again.
+    discarded_profiler.enable()
+    discarded_profiler.disable()
+    assert sys.getprofile() is None
+
+
+def test_get_peak_rss_kb():
+    peak = bp.get_peak_rss_kb()
+    if peak is not None:
+        assert peak > 0
+
+
+def test_stop_profiling_to_file():
+    tmp_dir = tempfile.mkdtemp()
+    profile_file = os.path.join(tmp_dir, 'profile.json')
+    bp.start_profiling()
+    with bp.stage('load'):
+        pass
+    report = bp.stop_profiling_to_file(profile_file, command=['brainviewer', 'subject1'])
+    with open(profile_file) as json_file:
+        written = json.load(json_file)
+    assert written['command'] == ['brainviewer', 'subject1']
+    assert written['stages'][0]['name'] == 'load'
+    assert 'total' in bp.format_profile_report(report)
+    assert bp.stop_profiling_to_file(profile_file) is None
+    shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,150 @@
+# Brainview unit tests for the service module.
+
+import os
+import json
+import tempfile
+import shutil
+import threading
+import pytest
+import numpy as np
+import matplotlib.image
+import brainview.service as bs
+
+try:
+    from urllib.request import urlopen, Request     # Python 3
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, Request, HTTPError
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+@pytest.fixture
+def service():
+    service = bs.new_service(subjects_dir=TEST_DATA_DIR, num_workers=2, size=(200, 150))
+    yield service
+    bs.stop_service(service)
+
+
+@pytest.fixture
+def server_url(service):
+    server = bs.start_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _post(url, content):
+    return urlopen(Request(url, data=json.dumps(content).encode('utf-8')))
+
+
+def test_check_request_rejects_invalid_requests(service):
+    with pytest.raises(ValueError) as exc_info:
+        bs.check_request(service, {'command': 'draw', 'subject': 'subject1'})
+    assert 'command must be one of' in str(exc_info.value)
+    with pytest.raises(ValueError) as exc_info:
+        bs.check_request(service, {'command': 'render', 'subject': 'subject1'})
+    assert "missing the parameter 'measure'" in str(exc_info.value)
+    with pytest.raises(ValueError) as exc_info:
+        bs.check_request(service, {'command': 'export', 'subject': 'subject1', 'mode': 'surface', 'data': 'aparc', 'output_file': 'x.ply'})
+    assert 'mode must be one of' in str(exc_info.value)
+    bs.check_request(service, {'command': 'render', 'subject': 'subject1', 'measure': 'thickness'})
+
+
+def test_check_request_rejects_malformed_values(service):
+    render_request = {'command': 'render', 'subject': 'subject1', 'measure': 'thickness'}
+    malformed_values = [('value_range', 5, 'value_range must be a list of 2 numbers'),
+                        ('value_range', [1.0], 'value_range must be a list of 2 numbers'),
+                        ('value_range', ['a', 'b'], 'value_range must be a list of 2 numbers'),
+                        ('value_range', [1.0, None], 'value_range must be a list of 2 numbers'),
+                        ('subject', ['subject1'], "subject must be a string, but is a 'list'"),
+                        ('surface', {'name': 'white'}, "surface must be a string, but is a 'dict'"),
+                        ('hemi', 1, "hemi must be a string, but is a 'int'"),
+                        ('subjects_dir', 42, "subjects_dir must be a string, but is a 'int'")]
+    for key, value, message in malformed_values:
+        request = dict(render_request)
+        request[key] = value
+        with pytest.raises(ValueError) as exc_info:
+            bs.check_request(service, request)
+        assert message in str(exc_info.value)
+    bs.check_request(service, dict(render_request, value_range=[1, "3.5"]))
+
+
+def test_submit_request_rejects_when_queue_is_full(service):
+    service['max_queue'] = 0
+    assert bs.submit_request(service, {'command': 'render', 'subject': 'subject1', 'measure': 'thickness'}) is None
+    metrics = bs.get_service_metrics(service)
+    assert metrics['rejected'] == 1
+    assert metrics['pending'] == 0
+    assert metrics['latency']['total'] == {'count': 0}
+
+
+def test_template_cache_reuses_and_evicts_meshes(service):
+    service['template_cache_size'] = 1
+    first = bs.get_template_mesh(service, TEST_DATA_DIR, 'subject1')
+    assert bs.get_template_mesh(service, TEST_DATA_DIR, 'subject1')[1] is first[1]
+    bs.get_template_mesh(service, TEST_DATA_DIR, 'subject1', hemi='lh')
+    assert bs.get_template_mesh(service, TEST_DATA_DIR, 'subject1')[1] is not first[1]
+    metrics = bs.get_service_metrics(service)
+    assert metrics['template_cache'] == {'meshes': 1, 'hits': 1, 'misses': 3}
+
+
+def test_template_cache_loads_mesh_once_for_concurrent_requests(service):
+    meshes = []
+    threads = [threading.Thread(target=lambda: meshes.append(bs.get_template_mesh(service, TEST_DATA_DIR, 'subject1'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(meshes) == 4
+    assert all(mesh[1] is meshes[0][1] for mesh in meshes)
+    metrics = bs.get_service_metrics(service)
+    assert metrics['template_cache'] == {'meshes': 1, 'hits': 3, 'misses': 1}
+    assert service['template_loads'] == {}
+    with pytest.raises(Exception):
+        bs.get_template_mesh(service, TEST_DATA_DIR, 'nosuchsubject')
+    assert service['template_loads'] == {}
+
+
+def test_render_and_export_requests(service):
+    tmp_dir = tempfile.mkdtemp()
+    image_file = os.path.join(tmp_dir, 'subject1_thickness.png')
+    futures = [bs.submit_request(service, {'command': 'render', 'subject': 'subject1', 'measure': 'thickness', 'output_file': image_file}), bs.submit_request(service, {'command': 'render', 'subject': 'subject1', 'measure': 'area'}), bs.submit_request(service, {'command': 'export', 'subject': 'subject1', 'mode': 'morphometry', 'data': 'thickness', 'output_file': os.path.join(tmp_dir, 'subject1_thickness.ply')})]
+    results = [future.result() for future in futures]
+    assert results[0]['output_file'] == image_file
+    assert matplotlib.image.imread(image_file).shape[:2] == (150, 200)
+    assert results[1]['image'].startswith(b'\x89PNG')
+    assert os.path.isfile(results[2]['output_file'])
+    assert 'render' not in results[2]['timings']
+    metrics = bs.get_service_metrics(service)
+    assert metrics['completed'] == 3
+    assert metrics['template_cache']['hits'] == 2
+    assert metrics['latency']['render']['count'] == 2
+    assert metrics['latency']['total']['count'] == 3
+    shutil.rmtree(tmp_dir)
+
+
+def test_server_status_and_errors(server_url):
+    assert json.loads(urlopen(server_url + '/status').read().decode('utf-8')) == {'status': 'ok'}
+    metrics = json.loads(urlopen(server_url + '/metrics').read().decode('utf-8'))
+    assert metrics['workers'] == 2
+    with pytest.raises(HTTPError) as exc_info:
+        _post(server_url + '/render', {'measure': 'thickness'})
+    assert exc_info.value.code == 400
+    with pytest.raises(HTTPError) as exc_info:
+        _post(server_url + '/draw', {})
+    assert exc_info.value.code == 404
+
+
+def test_server_render_returns_png(server_url):
+    response = _post(server_url + '/render', {'subject': 'subject1', 'measure': 'thickness'})
+    assert response.headers['Content-Type'] == 'image/png'
+    assert 'render' in json.loads(response.headers['X-Render-Timings'])
+    assert response.read().startswith(b'\x89PNG')
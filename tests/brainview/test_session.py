@@ -0,0 +1,97 @@
+# Brainview unit tests for the session module.
+
+import os
+import pytest
+import numpy as np
+import mayavi.mlab as mlab
+import brainload as bl
+import brainview as bv
+import brainview.session as bvs
+
+mlab.options.offscreen = True
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def test_load_measures_concurrently_matches_sequential():
+    measures = ['thickness', 'area', 'curv']
+    measure_data = bvs.load_measures('subject1', TEST_DATA_DIR, measures)
+    assert list(measure_data.keys()) == measures
+    for measure in measures:
+        expected, meta_data = bl.subject_data_native('subject1', TEST_DATA_DIR, measure, 'both')
+        # The data is not upcast, float32 data stays float32.
+        assert measure_data[measure].dtype == expected.dtype
+        assert np.array_equal(measure_data[measure], expected)
+    sequential = bvs.load_measures('subject1', TEST_DATA_DIR, measures, num_workers=1)
+    assert np.array_equal(sequential['area'], measure_data['area'])
+
+
+def test_compute_clip_ranges():
+    measure_data = {'a': np.arange(101, dtype=float), 'b': np.arange(101, dtype=float) * 2.0}
+    clip_ranges = bvs.compute_clip_ranges(measure_data, lower=10, upper=90)
+    assert clip_ranges['a'] == pytest.approx((10.0, 90.0))
+    assert clip_ranges['b'] == pytest.approx((20.0, 180.0))
+
+
+def test_measure_output_file():
+    assert bvs.measure_output_file('/tmp/brain.png', 'thickness') == '/tmp/brain_thickness.png'
+    assert bvs.measure_output_file('brain', 'area') == 'brain_area'
+
+
+def _session():
+    vert_coords = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]])
+    faces = np.array([[0, 1, 2], [1, 3, 2]])
+    measure_data = {'a': np.array([0.0, 1.0, 2.0, 3.0]), 'b': np.array([10.0, 20.0, 30.0, 400.0])}
+    measure_data = bvs.collections.OrderedDict(sorted(measure_data.items()))
+    clip_ranges = {'a': (0.0, 3.0), 'b': (10.0, 30.0)}
+    fig = mlab.figure()
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, measure_data['a'])
+    return bvs.create_measure_session(surface, vert_coords, faces, measure_data, clip_ranges=clip_ranges), fig
+
+
+def test_show_measure_swaps_scalars_in_place():
+    session, fig = _session()
+    surface = session['surface']
+    source = surface.mlab_source
+    bvs.show_measure(session, 'b')
+    assert surface.mlab_source is source
+    assert np.array_equal(surface.mlab_source.scalars, [10.0, 20.0, 30.0, 30.0])
+    assert surface.module_manager.scalar_lut_manager.data_range.tolist() == [10.0, 30.0]
+    assert session['current'] == 1
+    mlab.close(fig)
+
+
+def test_cycle_measure_wraps_around():
+    session, fig = _session()
+    assert bvs.cycle_measure(session) == 'b'
+    assert bvs.cycle_measure(session) == 'a'
+    assert bvs.cycle_measure(session, step=-1) == 'b'
+    mlab.close(fig)
+
+
+def test_show_measure_unknown_measure_raises():
+    session, fig = _session()
+    with pytest.raises(ValueError) as exc_info:
+        bvs.show_measure(session, 'volume')
+    assert 'not loaded in this session' in str(exc_info.value)
+    mlab.close(fig)
+
+
+def test_add_measure_key_bindings():
+    session, fig = _session()
+    observer_id = bvs.add_measure_key_bindings(fig, session, verbose=False)
+    interactor = fig.scene.interactor
+    if interactor is None:
+        assert observer_id is None
+    else:
+        interactor.key_sym = 'n'
+        interactor.invoke_event('KeyPressEvent')
+        assert session['current'] == 1
+        interactor.key_sym = 'b'
+        interactor.invoke_event('KeyPressEvent')
+        assert session['current'] == 0
+    mlab.close(fig)
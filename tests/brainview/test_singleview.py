@@ -4,6 +4,8 @@ import numpy as np
 import mayavi.mlab as mlab
 import brainload as bl
 import brainview as bv
+import brainview.singleview
+import brainview.labelset as bls
 import mayavi
 
 mlab.options.offscreen = True
@@ -41,3 +43,120 @@ def test_brain_atlas_view_gets_created():
     fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
     surface = bv.brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names)
     assert type(fig) == mayavi.core.scene.Scene
+
+
+def test_brain_atlas_view_with_boundaries_gets_created():
+    vert_coords, faces, morphometry_data, morphometry_meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, load_morphometry_data=False)
+    vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', TEST_DATA_DIR, 'aparc')
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    surface = bv.brain_atlas_view(fig, vert_coords, faces, vertex_labels, label_colors, label_names, draw_boundaries=True)
+    assert type(fig) == mayavi.core.scene.Scene
+
+
+def test_brain_morphometry_view_with_boundaries_gets_created():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR)
+    vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', TEST_DATA_DIR, 'aparc')
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data, boundary_labels=vertex_labels, boundary_color=(1.0, 0.0, 0.0))
+    assert type(fig) == mayavi.core.scene.Scene
+
+
+def test_brain_boundary_overlay_without_edges():
+    vert_coords = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    assert bv.brain_boundary_overlay(fig, vert_coords, np.zeros((0, 2), dtype=int)) is None
+
+
+def test_atlas_label_map_and_lut_are_compact():
+    vertex_labels = np.array([0, 2, -1, 1, 2])
+    label_colors = np.array([[10, 20, 30, 0, 1], [40, 50, 60, 0, 2], [70, 80, 90, 55, 3]])
+    label_map, lut = bv.singleview._get_atlas_label_map_and_lut(5, vertex_labels, label_colors, 3)
+    assert label_map.dtype == np.uint8
+    assert label_map.tolist() == [1, 3, 0, 2, 3]
+    assert lut.dtype == np.uint8
+    assert lut.tolist() == [[10, 20, 30, 255], [40, 50, 60, 255], [70, 80, 90, 200]]
+
+
+def test_atlas_label_map_uses_uint16_for_many_labels():
+    label_map, lut = bv.singleview._get_atlas_label_map_and_lut(3, np.array([0, 299, -1]), np.zeros((300, 5), dtype=int), 300)
+    assert label_map.dtype == np.uint16
+    assert label_map.tolist() == [1, 300, 0]
+
+
+def test_compact_scalars_avoid_copies():
+    data32 = np.arange(5, dtype=np.float32)
+    assert bv.singleview._get_compact_scalars(data32) is data32
+    mask = np.array([True, False, True])
+    compact_mask = bv.singleview._get_compact_scalars(mask)
+    assert compact_mask.dtype == np.uint8
+    assert np.shares_memory(compact_mask, mask)
+    assert bv.singleview._get_compact_scalars(np.ones(3, dtype=np.float16)).dtype == np.float64
+
+
+def test_brain_morphometry_view_maps_uint8_scalars_through_lut():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, load_morphometry_data=False)
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    label_map = np.zeros((vert_coords.shape[0], ), dtype=np.uint8)
+    label_map[:100] = 1
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, label_map)
+    assert surface.mlab_source.scalars.dtype == np.uint8
+    assert surface.actor.mapper.color_mode == 'map_scalars'
+    mlab.close(fig)
+
+
+def test_surface_shares_float32_points_with_vtk():
+    vert_coords = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+    faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3]])
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, np.arange(4, dtype=np.float32))
+    source = surface.mlab_source
+    assert source.points is vert_coords
+    assert np.shares_memory(source.dataset.points.to_array(), vert_coords)
+    assert source.z.tolist() == [0.0, 0.0, 0.0, 1.0]
+    # Float64 coordinates are converted once, and reset accepts both points and x, y and z like mlab.triangular_mesh.
+    source.reset(points=vert_coords.astype(np.float64) * 2, triangles=faces[:2], scalars=np.ones(4))
+    assert source.points.dtype == np.float32
+    assert source.dataset.number_of_polys == 2
+    source.reset(x=np.zeros(4), y=np.ones(4), z=np.arange(4.0))
+    assert source.points[:, 2].tolist() == [0.0, 1.0, 2.0, 3.0]
+    with pytest.raises(ValueError) as exc_info:
+        source.reset(triangles=np.array([[0, 1, 4]]))
+    assert 'must be indices into the 4 points' in str(exc_info.value)
+    mlab.close(fig)
+
+
+def test_brain_morphometry_view_uses_colormap_lut():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, measure='thickness')
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    surface = bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data, colormap='jet')
+    assert np.all(surface.module_manager.scalar_lut_manager.lut.table.to_array() == bv.colors.colormap_lut('jet'))
+    mlab.close(fig)
+
+
+def test_brain_rgba_view_renders_like_morphometry_view():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, measure='thickness')
+    fig = mlab.figure(bgcolor=(1, 1, 1), size=(200, 150))
+    bv.brain_morphometry_view(fig, vert_coords, faces, morphometry_data, colormap='cool')
+    expected_image = mlab.screenshot(figure=fig, mode='rgb', antialiased=False)
+    mlab.close(fig)
+    vertex_colors = bv.scalars_to_colors(morphometry_data, 'cool')
+    fig = mlab.figure(bgcolor=(1, 1, 1), size=(200, 150))
+    surface = bv.brain_rgba_view(fig, vert_coords, faces, vertex_colors)
+    assert np.shares_memory(surface.mlab_source.dataset.point_data.scalars.to_array(), vertex_colors)
+    assert surface.actor.mapper.color_mode == 'direct_scalars'
+    image = mlab.screenshot(figure=fig, mode='rgb', antialiased=False)
+    assert np.all(image == expected_image)
+    with pytest.raises(ValueError):
+        bv.brain_rgba_view(fig, vert_coords, faces, vertex_colors[:, 0:3])
+    mlab.close(fig)
+
+
+def test_brain_labelset_view():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, load_morphometry_data=False)
+    labelset = bls.load_labelset('subject1', TEST_DATA_DIR, ['roi1', 'roi2', 'cortex'], meta_data)
+    fig = mlab.figure(bgcolor=(1, 1, 1), size=(200, 150))
+    surface = bv.brain_labelset_view(fig, vert_coords, faces, labelset)
+    assert np.all(surface.mlab_source.dataset.point_data.scalars.to_array() == bls.labelset_vertex_colors(labelset))
+    with pytest.raises(ValueError):
+        bv.brain_labelset_view(fig, vert_coords[:10], faces, labelset)
+    mlab.close(fig)
@@ -0,0 +1,61 @@
+# Brainview unit tests for the spatialindex module.
+
+import pytest
+import numpy as np
+import brainview.spatialindex as bsi
+
+VERT_COORDS = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0], [1.0, 1.0, 0.0]])
+
+
+class FakePicker(object):
+    def __init__(self, cell_id, pick_position):
+        self.cell_id = cell_id
+        self.pick_position = pick_position
+
+
+def test_get_spatial_index_is_cached():
+    vert_coords = VERT_COORDS.copy()
+    assert bsi.get_spatial_index(vert_coords) is bsi.get_spatial_index(vert_coords)
+
+
+def test_nearest_vertices_single_query():
+    vertex_index, distance = bsi.nearest_vertices(VERT_COORDS, [9.0, 0.5, 0.0])
+    assert vertex_index == 1
+    assert distance == pytest.approx(np.sqrt(1.25))
+
+
+def test_nearest_vertices_batch_query_with_max_distance():
+    vertex_indices, distances = bsi.nearest_vertices(VERT_COORDS, [[0.9, 0.9, 0.0], [0.0, 9.0, 0.0], [50.0, 50.0, 50.0]], max_distance=5.0)
+    assert vertex_indices.tolist() == [3, 2, -1]
+    assert np.isinf(distances[2])
+
+
+def test_vertices_in_radius():
+    assert bsi.vertices_in_radius(VERT_COORDS, [0.0, 0.0, 0.0], 2.0).tolist() == [0, 3]
+    results = bsi.vertices_in_radius(VERT_COORDS, [[0.0, 0.0, 0.0], [10.0, 10.0, 0.0]], 2.0)
+    assert len(results) == 2
+    assert results[1].tolist() == []
+
+
+def test_describe_vertex():
+    vertex_labels = np.array([0, 1, -1, 1])
+    assert bsi.describe_vertex(1, VERT_COORDS) == "Vertex 1 at (10.00, 0.00, 0.00)"
+    assert bsi.describe_vertex(1, VERT_COORDS, morphometry_data=np.array([1.0, 2.5, 3.0, 4.0]), vertex_labels=vertex_labels, label_names=['a', 'b']) == "Vertex 1 at (10.00, 0.00, 0.00): label b, value 2.5"
+    assert bsi.describe_vertex(2, VERT_COORDS, vertex_labels=vertex_labels) == "Vertex 2 at (0.00, 10.00, 0.00): no label"
+    assert bsi.describe_vertex(3, VERT_COORDS, vertex_labels=vertex_labels) == "Vertex 3 at (1.00, 1.00, 0.00): label 1"
+
+
+def test_vertex_pick_callback():
+    picked = []
+    on_pick = bsi._vertex_pick_callback(VERT_COORDS, None, None, None, lambda vertex_index, description: picked.append(vertex_index))
+    on_pick(FakePicker(5, np.array([0.1, 9.5, 0.0])))
+    on_pick(FakePicker(-1, np.array([0.0, 0.0, 0.0])))      # background, ignored
+    assert picked == [2]
+
+
+
+def test_add_vertex_picker_offscreen():
+    import mayavi.mlab as mlab
+    mlab.options.offscreen = True
+    fig = mlab.figure(bgcolor=(0, 0, 0), size=(800, 600))
+    assert bsi.add_vertex_picker(fig, VERT_COORDS.copy()) is None
@@ -0,0 +1,74 @@
+# Brainview unit tests for the statmap module.
+
+import pytest
+import numpy as np
+import mayavi.mlab as mlab
+import brainview.colors as bc
+import brainview.statmap as bsm
+
+mlab.options.offscreen = True
+
+
+def _stat_data(num_verts):
+    stat_data = np.random.RandomState(0).randn(num_verts) * 2.0
+    stat_data[5] = np.nan
+    return stat_data
+
+
+def test_binary_background_colors():
+    background_colors = bsm.binary_background_colors(np.array([-0.5, 0.0, 0.3]))
+    assert background_colors.tolist() == [[200, 200, 200, 255], [200, 200, 200, 255], [130, 130, 130, 255]]
+
+
+def test_brain_statmap_view_colors_only_supra_threshold_vertices(grid_mesh):
+    vert_coords, faces = grid_mesh(waves=True)
+    stat_data = _stat_data(vert_coords.shape[0])
+    fig = mlab.figure(size=(200, 150))
+    statmap = bsm.brain_statmap_view(fig, vert_coords, faces, stat_data, 3.0)
+    mask = bsm.get_statmap_mask(statmap)
+    assert np.all(mask == (np.abs(stat_data) >= 3.0))
+    assert statmap['num_supra_threshold'] == np.sum(mask)
+    assert np.shares_memory(statmap['surface'].mlab_source.dataset.point_data.scalars.to_array(), statmap['vertex_colors'])
+    vertex_colors = statmap['vertex_colors']
+    assert np.all(vertex_colors[~mask] == bsm.DEFAULT_BACKGROUND_COLOR)
+    positive = mask & (stat_data > 0)
+    negative = mask & (stat_data < 0)
+    assert np.all(vertex_colors[positive] == bc.scalars_to_colors(stat_data[positive], 'autumn', data_range=statmap['data_range']))
+    assert np.all(vertex_colors[negative] == bc.scalars_to_colors(-stat_data[negative], 'winter', data_range=statmap['data_range']))
+    mlab.close(fig)
+
+
+def test_set_statmap_threshold_only_updates_crossing_vertices(grid_mesh):
+    vert_coords, faces = grid_mesh(waves=True)
+    stat_data = _stat_data(vert_coords.shape[0])
+    fig = mlab.figure(size=(200, 150))
+    statmap = bsm.brain_statmap_view(fig, vert_coords, faces, stat_data, 3.0)
+    image_before = mlab.screenshot(figure=fig, mode='rgb', antialiased=False)
+    num_changed = bsm.set_statmap_threshold(statmap, 2.0)
+    assert num_changed == np.sum((np.abs(stat_data) >= 2.0) & (np.abs(stat_data) < 3.0))
+    assert bsm.set_statmap_threshold(statmap, 2.0) == 0
+    image = mlab.screenshot(figure=fig, mode='rgb', antialiased=False)
+    # The result is the same as displaying the map at the new threshold with the same colors from the start.
+    fig_expected = mlab.figure(size=(200, 150))
+    expected = bsm.brain_statmap_view(fig_expected, vert_coords, faces, stat_data, 2.0, data_range=statmap['data_range'])
+    assert np.all(statmap['vertex_colors'] == expected['vertex_colors'])
+    assert np.all(image == mlab.screenshot(figure=fig_expected, mode='rgb', antialiased=False))
+    assert np.any(image != image_before)
+    bsm.set_statmap_threshold(statmap, 10.0)
+    assert statmap['num_supra_threshold'] == 0
+    assert np.all(statmap['vertex_colors'] == statmap['background_colors'])
+    mlab.close(fig)
+    mlab.close(fig_expected)
+
+
+def test_brain_statmap_view_one_sided_and_background(grid_mesh):
+    vert_coords, faces = grid_mesh(waves=True)
+    stat_data = _stat_data(vert_coords.shape[0])
+    background_colors = bsm.binary_background_colors(vert_coords[:, 2])
+    fig = mlab.figure(size=(200, 150))
+    statmap = bsm.brain_statmap_view(fig, vert_coords, faces, stat_data, 1.0, background_colors=background_colors, negative_colormap=None)
+    assert np.all(bsm.get_statmap_mask(statmap) == (stat_data >= 1.0))
+    assert np.all(statmap['vertex_colors'][stat_data < 1.0] == background_colors[stat_data < 1.0])
+    with pytest.raises(ValueError):
+        bsm.brain_statmap_view(fig, vert_coords, faces, stat_data, 1.0, background_colors=background_colors[:10])
+    mlab.close(fig)
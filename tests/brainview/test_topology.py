@@ -0,0 +1,129 @@
+# Brainview unit tests for the topology module.
+
+import os
+import pytest
+import numpy as np
+import brainload as bl
+import brainview as bv
+import brainview.topology as bt
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(THIS_DIR, os.pardir, 'test_data')
+
+# Respect the environment variable BRAINVIEW_TEST_DATA_DIR if it is set. If not, fall back to default.
+TEST_DATA_DIR = os.getenv('BRAINVIEW_TEST_DATA_DIR', TEST_DATA_DIR)
+
+
+def _two_triangles():
+    # A square in the z=0 plane, split into 2 triangles that share the edge 0-2.
+    vert_coords = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=float)
+    faces = np.array([[0, 1, 2], [0, 2, 3]])
+    return vert_coords, faces
+
+
+def test_mesh_adjacency():
+    vert_coords, faces = _two_triangles()
+    adjacency = bt.mesh_adjacency(faces)
+    assert adjacency.shape == (4, 4)
+    dense = adjacency.toarray()
+    assert np.array_equal(dense, dense.T)
+    assert dense.tolist() == [[0, 1, 1, 1], [1, 0, 1, 0], [1, 1, 0, 1], [1, 0, 1, 0]]
+
+
+def test_mesh_adjacency_with_unused_vertices():
+    vert_coords, faces = _two_triangles()
+    adjacency = bt.mesh_adjacency(faces, num_verts=6)
+    assert adjacency.shape == (6, 6)
+    assert bt.vertex_degrees(faces, num_verts=6).tolist() == [3, 2, 3, 2, 0, 0]
+
+
+def test_mesh_adjacency_is_cached():
+    vert_coords, faces = _two_triangles()
+    assert bt.mesh_adjacency(faces) is bt.mesh_adjacency(faces)
+    assert bt.mesh_adjacency(faces) is not bt.mesh_adjacency(faces.copy())
+
+
+def test_smooth_data():
+    vert_coords, faces = _two_triangles()
+    data = np.array([4.0, 0.0, 0.0, 0.0])
+    assert np.allclose(bt.smooth_data(faces, data, 0), data)
+    assert np.allclose(bt.smooth_data(faces, data, 1), [1.0, 4.0 / 3, 1.0, 4.0 / 3])
+    assert np.allclose(bt.smooth_data(faces, data, 2), bt.smooth_data(faces, bt.smooth_data(faces, data, 1), 1))
+
+
+def test_smooth_data_keeps_constant_data_and_supports_2d_data():
+    vert_coords, faces = _two_triangles()
+    data = np.column_stack((np.full((4, ), 2.5), np.arange(4.0)))
+    smoothed = bt.smooth_data(faces, data, 5)
+    assert smoothed.shape == (4, 2)
+    assert np.allclose(smoothed[:, 0], 2.5)
+
+
+def test_smooth_data_raises_on_negative_iterations():
+    vert_coords, faces = _two_triangles()
+    with pytest.raises(ValueError) as exc_info:
+        bt.smooth_data(faces, np.zeros((4, )), -1)
+    assert 'must not be negative' in str(exc_info.value)
+
+
+def test_mesh_area():
+    vert_coords, faces = _two_triangles()
+    assert bt.mesh_area(vert_coords, faces) == pytest.approx(1.0)
+
+
+def test_fwhm_to_num_iterations():
+    vert_coords, faces = _two_triangles()
+    # Average vertex area is 0.25, so 1.14 * 4 * pi * (5 / sqrt(log(256)))^2 / (7 * 0.25) = 36.9...
+    assert bt.fwhm_to_num_iterations(vert_coords, faces, 5.0) == 37
+    assert bt.fwhm_to_num_iterations(vert_coords, faces, 0.0) == 0
+
+
+def test_smooth_data_fwhm_on_subject():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR)
+    smoothed = bv.smooth_data_fwhm(vert_coords, faces, morphometry_data, 5.0)
+    assert smoothed.shape == morphometry_data.shape
+    assert np.std(smoothed) < np.std(morphometry_data)
+
+
+def test_mesh_edges():
+    vert_coords, faces = _two_triangles()
+    assert bt.mesh_edges(faces).tolist() == [[0, 1], [0, 2], [0, 3], [1, 2], [2, 3]]
+    assert bt.mesh_edges(faces) is bt.mesh_edges(faces)
+
+
+def test_parcel_boundaries():
+    vert_coords, faces = _two_triangles()
+    boundary_vertices, boundary_edges = bt.parcel_boundaries(faces, np.array([0, 0, 1, 1]))
+    assert boundary_vertices.tolist() == [True, True, True, True]
+    assert boundary_edges.tolist() == [[0, 2], [0, 3], [1, 2]]
+
+
+def test_parcel_boundaries_single_region_has_no_boundary():
+    vert_coords, faces = _two_triangles()
+    boundary_vertices, boundary_edges = bt.parcel_boundaries(faces, np.array([3, 3, 3, 3]))
+    assert not np.any(boundary_vertices)
+    assert boundary_edges.shape == (0, 2)
+
+
+def test_parcel_boundaries_with_unlabeled_vertices():
+    vert_coords, faces = _two_triangles()
+    boundary_vertices, boundary_edges = bt.parcel_boundaries(faces, np.array([-1, 2, 2, 2]))
+    assert boundary_vertices.tolist() == [True, True, True, True]
+    assert sorted(boundary_edges.tolist()) == [[0, 1], [0, 2], [0, 3]]
+
+
+def test_parcel_boundaries_on_subject_atlas():
+    vert_coords, faces, morphometry_data, meta_data = bl.subject('subject1', subjects_dir=TEST_DATA_DIR, load_morphometry_data=False)
+    vertex_labels, label_colors, label_names, atlas_meta_data = bl.annot('subject1', TEST_DATA_DIR, 'aparc')
+    boundary_vertices, boundary_edges = bt.parcel_boundaries(faces, vertex_labels)
+    assert boundary_vertices.shape == (vert_coords.shape[0], )
+    assert boundary_edges.shape[0] > 0
+    assert np.all(vertex_labels[boundary_edges[:, 0]] != vertex_labels[boundary_edges[:, 1]])
+
+
+def test_mesh_components():
+    vert_coords, faces = _two_triangles()
+    two_squares = np.vstack((faces, faces + 4))
+    num_components, component_labels = bt.mesh_components(two_squares)
+    assert num_components == 2
+    assert component_labels.tolist() == [0, 0, 0, 0, 1, 1, 1, 1]
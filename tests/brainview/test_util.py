@@ -38,6 +38,13 @@ def test_get_default_config():
     assert cfg.has_section('mesh') == True
 
 
+def test_get_default_config_clip_percentiles():
+    cfg = ut.get_default_config()
+    for section in ['mesh', 'meshexport']:
+        assert cfg.getint(section, 'clip_values_lower') == 5
+        assert cfg.getint(section, 'clip_values_upper') == 95
+
+
 def test_get_config_from_file():
     cfg_file = os.path.join(TEST_DATA_DIR, 'brainviewrc')
     cfg = ut.get_config_from_file(cfg_file)
@@ -0,0 +1,74 @@
+# Brainview unit tests for the vectorexport module.
+
+import os
+import zlib
+import pytest
+import numpy as np
+import brainview.export as be
+import brainview.vectorexport as bve
+
+
+def _stacked_squares():
+    # Two squares of 2 faces each, facing the viewer of the 'posterior' view, the second one 5 units behind the first and half as large.
+    square = np.array([[0, 0, 0], [0, 0, 4], [4, 0, 0], [4, 0, 4]], dtype=float)
+    vert_coords = np.vstack((square, square * [0.5, 1, 0.5] + [1, 5, 1]))
+    faces = np.array([[0, 2, 1], [2, 3, 1], [4, 6, 5], [6, 7, 5]])
+    return vert_coords, faces
+
+
+def test_visible_faces_culls_back_facing_and_occluded_faces():
+    vert_coords, faces = _stacked_squares()
+    projection = be.project_mesh(vert_coords, faces, 'posterior')
+    assert np.all(bve._signed_areas(projection['coords'][projection['faces']]) > 0)
+    visible = bve.visible_faces(projection, resolution=(100, 100))
+    # The small square is behind the large one.
+    assert sorted(projection['faces'][visible][:, 0].tolist()) == [0, 2]
+    assert np.all(bve.visible_faces(projection, cull_occluded=False))
+    # Seen from the other side, all faces point away from the viewer.
+    assert not np.any(bve.visible_faces(be.project_mesh(vert_coords, faces, 'anterior')))
+
+
+def test_merge_faces_merges_regions_of_the_same_color():
+    vert_coords, faces = _stacked_squares()
+    red, blue = (255, 0, 0, 255), (0, 0, 255, 255)
+    regions = bve.merge_faces(faces, np.array([red, red, blue, red]))
+    assert [color for color, loops in regions] == [blue, red]
+    assert [len(loops) for color, loops in regions] == [1, 2]
+    # The 2 red faces of the large square are merged into one outline with its 4 corners.
+    assert sorted([sorted(loop.tolist()) for loop in regions[1][1]]) == [[0, 1, 2, 3], [5, 6, 7]]
+
+
+def test_merge_faces_keeps_holes():
+    # A 3x3 grid of squares with the center square in another color: the outer region has a hole.
+    x, y = np.meshgrid(np.arange(4), np.arange(4))
+    idx = np.arange(16).reshape((4, 4))
+    faces = np.vstack((np.column_stack((idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel(), idx[1:, 1:].ravel())), np.column_stack((idx[:-1, :-1].ravel(), idx[1:, 1:].ravel(), idx[1:, :-1].ravel()))))
+    face_colors = np.zeros((18, 4), dtype=np.uint8)
+    face_colors[[4, 13]] = 255
+    regions = bve.merge_faces(faces, face_colors)
+    black_loops = regions[0][1]
+    assert len(black_loops) == 2
+    assert sorted([loop.shape[0] for loop in black_loops]) == [4, 12]
+
+
+def test_export_vector_graphics(tmpdir):
+    vert_coords, faces = _stacked_squares()
+    projection = be.project_mesh(vert_coords, faces, 'posterior')
+    vertex_colors = be.label_vertex_colors(8, [0, 1, 2, 3])
+    svg_file = os.path.join(str(tmpdir), 'squares.svg')
+    stats = bve.export_vector_graphics(svg_file, projection, vertex_colors=vertex_colors, size=(200, 200))
+    assert stats == {'num_faces': 4, 'num_visible_faces': 2, 'num_colors': 1, 'num_loops': 1}
+    with open(svg_file) as svg:
+        svg_text = svg.read()
+    assert svg_text.count('<path') == 1
+    assert 'fill="#ff0000"' in svg_text
+    pdf_file = os.path.join(str(tmpdir), 'squares.pdf')
+    be.export_projection_to_file(pdf_file, projection, morphometry_data=np.arange(8, dtype=float), size=(200, 200))
+    with open(pdf_file, 'rb') as pdf:
+        pdf_bytes = pdf.read()
+    assert pdf_bytes.startswith(b'%PDF-1.4')
+    assert pdf_bytes.rstrip().endswith(b'%%EOF')
+    content = zlib.decompress(pdf_bytes[pdf_bytes.index(b'stream\n') + 7:pdf_bytes.index(b'\nendstream')]).decode('ascii')
+    assert content.count(' B') == 2       # One path per face color.
+    with pytest.raises(ValueError):
+        bve.export_vector_graphics(os.path.join(str(tmpdir), 'squares.eps'), projection)